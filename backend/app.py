@@ -3,27 +3,37 @@
 Flask API Server สำหรับระบบ POS ร้านอาหาร
 """
 
-from flask import Flask, request, jsonify, render_template, send_from_directory, send_file, session, redirect, url_for
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory, send_file, session, redirect, url_for, stream_with_context
 from flask_cors import CORS
 import os
 import json
 import uuid
+import time
 import qrcode
 import glob
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import pytz
 from werkzeug.utils import secure_filename
 from PIL import Image
-from database import DatabaseManager
+from database import DatabaseManager, TABLE_TRANSITIONS, date_range_predicate, get_thai_datetime
 from models import *
 from utils.qr_generator import QRGenerator
 from utils.promptpay import PromptPayGenerator
 from utils.google_sheets import GoogleSheetsManager
-
-# เพิ่ม logging สำหรับ debug
+from utils.sales_report import SalesReportGenerator
+from utils import diagnostics
+from utils.event_bus import EventBus, format_sse
+from utils.single_flight import SingleFlight
+from utils.outbox import OutboxWorker
+from utils.sheets_client import sheets_client
+from new_google_sheets_sync import format_stats as sheets_format_stats
+
+# ตั้งค่า logging (ระดับ / sampling / trace ต่อโต๊ะหรือเซสชัน) จาก environment variables
 import logging
-logging.basicConfig(level=logging.DEBUG)
+diagnostics.configure_from_env()
+logging.basicConfig(level=diagnostics.config.level)
+log = diagnostics.get_logger('pos.app')
 
 # ฟังก์ชันสำหรับจัดการเวลาท้องถิ่นของไทย
 def get_thai_datetime():
@@ -35,7 +45,7 @@ def get_thai_datetime_iso():
     """ได้รับเวลาปัจจุบันในโซนเวลาไทยในรูปแบบ ISO"""
     return get_thai_datetime().isoformat()
 
-print("[STARTUP] Loading Flask app from backend/app.py")
+log.info('[STARTUP] Loading Flask app from backend/app.py')
 
 app = Flask(__name__, 
             template_folder='../frontend',
@@ -45,45 +55,69 @@ CORS(app)
 # Set secret key for session management
 app.secret_key = 'your-secret-key-change-this-in-production'
 
-# Set Flask app logger to DEBUG level
-app.logger.setLevel(logging.DEBUG)
+# ใช้ระดับ log เดียวกับระบบ POS
+app.logger.setLevel(diagnostics.config.level)
 
-print("[STARTUP] Flask app initialized successfully")
+log.info('[STARTUP] Flask app initialized successfully')
 
-# เพิ่ม middleware สำหรับ debug requests
+# เริ่ม trace id ของแต่ละคำขอ (เปิด log ทุกระดับถ้าเป็นโต๊ะ/เซสชันที่ตั้งไว้ หรือส่ง header X-Debug-Trace)
 @app.before_request
-def log_request_info():
-    print(f"[MIDDLEWARE] {request.method} {request.url}")
-    print(f"[MIDDLEWARE] PATH: {request.path}")
-    print(f"[MIDDLEWARE] ARGS: {request.args}")
-    print(f"[MIDDLEWARE] ALL REQUESTS: {request.method} {request.path}")
-    if 'payment-complete' in request.path:
-        print(f"[PAYMENT-COMPLETE] Request detected: {request.method} {request.path}")
-        print(f"[PAYMENT-COMPLETE] URGENT: This is a payment request!")
-    if request.method == 'POST':
-        print(f"[POST-REQUEST] POST request detected: {request.path}")
-    app.logger.debug(f"DEBUG REQUEST: {request.method} {request.url}")
-    app.logger.debug(f"DEBUG REQUEST PATH: {request.path}")
-    app.logger.debug(f"DEBUG REQUEST ARGS: {request.args}")
+def begin_request_trace():
+    table_id = session_id = None
+    if diagnostics.has_trace_targets():
+        body = request.get_json(silent=True) if request.is_json else None
+        body = body if isinstance(body, dict) else {}
+        view_args = request.view_args or {}
+        table_id = view_args.get('table_id') or request.args.get('table_id') or body.get('table_id')
+        session_id = request.args.get('session_id') or body.get('session_id')
+    diagnostics.begin_request(table_id, session_id, force_trace=request.headers.get('X-Debug-Trace') == '1')
+    log.debug('%s %s args=%s', request.method, request.path, request.args)
+
+@app.teardown_request
+def end_request_trace(exc):
+    diagnostics.end_request()
 
 @app.after_request
 def after_request(response):
     """Add cache control headers to prevent browser caching"""
     # ป้องกันการ cache สำหรับ API endpoints
-    if request.path.startswith('/api/'):
+    trace_id = diagnostics.current_trace_id()
+    if trace_id:
+        response.headers['X-Trace-Id'] = trace_id
+    # endpoint ที่มี ETag (ดู conditional_get) ให้ browser เก็บไว้และตรวจสอบใหม่ทุกครั้ง ส่วนอื่นห้าม cache
+    if request.path.startswith('/api/') and 'ETag' not in response.headers:
         response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
         response.headers['Pragma'] = 'no-cache'
         response.headers['Expires'] = '0'
     return response
 
 # Initialize components
-# ใช้ absolute path เพื่อให้แน่ใจว่าจะเชื่อมต่อกับฐานข้อมูลที่ถูกต้อง
-db_path = os.path.join(os.path.dirname(__file__), "..", "pos_database.db")
+# ใช้ absolute path เพื่อให้แน่ใจว่าจะเชื่อมต่อกับฐานข้อมูลที่ถูกต้อง (กำหนด POS_DB_PATH เพื่อใช้ไฟล์อื่น)
+db_path = os.environ.get('POS_DB_PATH') or os.path.join(os.path.dirname(__file__), "..", "pos_database.db")
 db = DatabaseManager(db_path)
+sales_report = SalesReportGenerator(db)
+event_bus = EventBus()
+# ช่วงเวลาส่ง keep-alive และอายุสูงสุดของการเชื่อมต่อ SSE (วินาที)
+SSE_HEARTBEAT_SECONDS = 15
+SSE_MAX_DURATION = 300
 qr_gen = QRGenerator()
 promptpay_gen = PromptPayGenerator()
 sheets_manager = GoogleSheetsManager()
 
+# ส่งงานใน sheets_outbox ไปยัง Google Sheets ด้วย worker ชุดเดียว (ไม่แย่งทรัพยากรกับการบันทึกออเดอร์)
+# ใช้ worker เดียวเพราะ sync_order_to_new_format หาแถวว่างถัดไปจากชีต การเขียนพร้อมกันจะเขียนทับแถวกัน
+SHEETS_OUTBOX_WORKERS = 1
+sheets_outbox_worker = OutboxWorker(
+    claim=db.claim_sheets_outbox,
+    handle=db.send_sheets_outbox_entry,
+    complete=db.complete_sheets_outbox,
+    fail=db.fail_sheets_outbox,
+    wakeup=db.sheets_outbox_ready,
+    workers=SHEETS_OUTBOX_WORKERS,
+    name='sheets-outbox'
+)
+sheets_outbox_worker.start()
+
 # Global variables
 active_sessions = {}  # เก็บ session ที่ active
 
@@ -98,6 +132,81 @@ def require_login(f):
     decorated_function.__name__ = f.__name__
     return decorated_function
 
+# เวอร์ชันของข้อมูลเก็บในหน่วยความจำและเริ่มนับใหม่ทุกครั้งที่รีสตาร์ท จึงใส่ epoch ของโปรเซสไว้ใน ETag ด้วย
+ETAG_EPOCH = uuid.uuid4().hex[:8]
+
+def conditional_get(name, version_source):
+    """Decorator สำหรับ GET ที่รองรับ ETag / Last-Modified ตามเวอร์ชันข้อมูลในหน่วยความจำ
+
+    version_source คืนค่าอ็อบเจ็กต์ที่มี version และ modified_at (เช่น db.menu_cache, db.table_version)
+    ถ้า If-None-Match (หรือ If-Modified-Since) ตรงกับเวอร์ชันปัจจุบัน จะตอบ 304 โดยไม่เรียก view และไม่ query SQLite
+    """
+    def decorator(f):
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET':
+                return f(*args, **kwargs)
+            # อ่านเวอร์ชันก่อนสร้างข้อมูล ถ้ามีการแก้ไขระหว่างนั้น ETag จะเก่ากว่าข้อมูลและคำขอถัดไปจะได้ข้อมูลใหม่
+            source = version_source()
+            etag = f'{name}-{ETAG_EPOCH}-{source.version}'
+            last_modified = datetime.fromtimestamp(int(source.modified_at), timezone.utc)
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                since = request.if_modified_since
+                not_modified = since is not None and since >= last_modified
+            if not_modified:
+                response = Response(status=304)
+            else:
+                response = app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        decorated_function.__name__ = f.__name__
+        return decorated_function
+    return decorator
+
+# รวมคำขออ่านที่เหมือนกันซึ่งเข้ามาพร้อมกัน ปรับ window ได้ด้วย system_config 'read_coalesce_window_ms' (0 = รวมเฉพาะคำขอที่ซ้อนกัน)
+READ_COALESCE_CONFIG_KEY = 'read_coalesce_window_ms'
+READ_COALESCE_WINDOW_MS = 250
+read_coalescer = SingleFlight(READ_COALESCE_WINDOW_MS / 1000)
+
+def apply_read_coalesce_config():
+    """อ่าน window ของการรวมคำขอจาก system_config"""
+    try:
+        window_ms = int(db.get_config(READ_COALESCE_CONFIG_KEY) or READ_COALESCE_WINDOW_MS)
+    except (TypeError, ValueError):
+        window_ms = READ_COALESCE_WINDOW_MS
+    read_coalescer.window = max(window_ms, 0) / 1000
+
+apply_read_coalesce_config()
+
+def coalesce_get(name, version_source):
+    """Decorator สำหรับ GET ที่ให้คำขอเหมือนกัน (path + query) ที่เข้ามาพร้อมกันใช้ response ชุดเดียวกัน
+
+    version_source คืนค่าเวอร์ชันของข้อมูลที่ endpoint ใช้ ซึ่งเป็นส่วนหนึ่งของ key (ต้องเปลี่ยนทุกครั้งที่ข้อมูลถูกเขียน
+    เช่น db.get_data_version() ไม่ใช่ id ของ event ที่บาง route ไม่ได้ส่ง) คำขอหลังการแก้ไขข้อมูลจึงไม่ได้ผลลัพธ์เก่าจาก window
+    ใช้ร่วมกับ conditional_get โดยวางไว้ด้านใน
+    """
+    def decorator(f):
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET':
+                return f(*args, **kwargs)
+
+            def render():
+                response = app.make_response(f(*args, **kwargs))
+                return response.status_code, response.get_data(), response.mimetype
+
+            status, body, mimetype = read_coalescer.do(
+                name, (request.full_path, version_source()), render,
+                shareable=lambda result: result[0] == 200)
+            return Response(body, status=status, mimetype=mimetype)
+        decorated_function.__name__ = f.__name__
+        return decorated_function
+    return decorator
+
 # กำหนดค่าสำหรับการอัปโหลดไฟล์
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'frontend', 'images', 'menu')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'svg'}
@@ -141,13 +250,13 @@ def order_page():
     
     # Debug: ตรวจสอบไฟล์ template
     template_path = os.path.join(app.template_folder, 'order.html')
-    print(f"[DEBUG] Template path: {template_path}")
-    print(f"[DEBUG] Template exists: {os.path.exists(template_path)}")
+    log.debug('Template path: %s', template_path)
+    log.debug('Template exists: %s', os.path.exists(template_path))
     if os.path.exists(template_path):
         with open(template_path, 'r', encoding='utf-8') as f:
             content = f.read()
-            print(f"[DEBUG] Template file size: {len(content)} characters")
-            print(f"[DEBUG] Contains callStaffModal: {'callStaffModal' in content}")
+            log.debug('Template file size: %s characters', len(content))
+            log.debug('Contains callStaffModal: %s', 'callStaffModal' in content)
     
     return render_template('order.html', table_id=table_id, session_id=session_id)
 
@@ -184,7 +293,7 @@ def get_promptpay_settings():
             'value': promptpay_value
         })
     except Exception as e:
-        app.logger.error(f"Error getting PromptPay settings: {e}")
+        log.error('Error getting PromptPay settings: %s', e)
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/api/settings/promptpay', methods=['POST'])
@@ -203,7 +312,7 @@ def save_promptpay_settings():
 
         return jsonify({'success': True, 'message': 'บันทึกข้อมูล PromptPay สำเร็จ'})
     except Exception as e:
-        app.logger.error(f"Error saving PromptPay settings: {e}")
+        log.error('Error saving PromptPay settings: %s', e)
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/api/promptpay/generate-qr', methods=['POST'])
@@ -242,7 +351,7 @@ def generate_promptpay_qr():
         })
         
     except Exception as e:
-        app.logger.error(f"Error generating PromptPay QR: {e}")
+        log.error('Error generating PromptPay QR: %s', e)
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/api/promptpay/current-settings', methods=['GET'])
@@ -259,7 +368,7 @@ def get_current_promptpay_settings():
             'message': f'ปัจจุบันใช้ {promptpay_type}: {promptpay_value}'
         })
     except Exception as e:
-        app.logger.error(f"Error getting current PromptPay settings: {e}")
+        log.error('Error getting current PromptPay settings: %s', e)
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/api/settings/sheets', methods=['POST'])
@@ -304,9 +413,68 @@ def save_google_sheets_settings():
         })
         
     except Exception as e:
-        app.logger.error(f"Error saving Google Sheets settings: {e}")
+        log.error('Error saving Google Sheets settings: %s', e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/settings/sheets/outbox', methods=['GET'])
+def get_sheets_outbox_status():
+    """สถานะคิวซิงค์ Google Sheets: ความลึก, lag, งานที่ล้มเหลว, dead-letter, การใช้ API client ซ้ำ และจำนวนคำขอจัดรูปแบบชีต"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': {
+                'queue': db.get_sheets_outbox_stats(),
+                'worker': sheets_outbox_worker.stats(),
+                'client': sheets_client.stats(),
+                'formatting': dict(sheets_format_stats)
+            }
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/settings/sheets/rebuild', methods=['POST'])
+def rebuild_sheets_orders():
+    """สร้างชีต Orders ใหม่ทั้งหมดจากฐานข้อมูล (ปกติส่งออกเฉพาะออเดอร์ที่เปลี่ยน)"""
+    try:
+        if not db.enqueue_sheets_rebuild():
+            return jsonify({
+                'success': False,
+                'error': 'ไม่สามารถเพิ่มงานสร้างชีตใหม่ได้ (ตรวจสอบว่าเปิดใช้งาน Google Sheets แล้ว)'
+            }), 400
+        return jsonify({
+            'success': True,
+            'message': 'เพิ่มงานสร้างชีตใหม่ลงคิวแล้ว'
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/settings/sheets/outbox/retry', methods=['POST'])
+def retry_sheets_outbox():
+    """นำงานใน dead-letter กลับเข้าคิว {outbox_ids: [...]} (ไม่ระบุ = ทั้งหมด)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        retried = db.retry_dead_sheets_outbox(data.get('outbox_ids'))
+        if retried < 0:
+            return jsonify({
+                'success': False,
+                'error': 'ไม่สามารถนำงานกลับเข้าคิวได้'
+            }), 500
+        return jsonify({
+            'success': True,
+            'data': {'retried': retried}
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/api/settings/sheets/test', methods=['POST'])
 def test_google_sheets_connection():
     """ทดสอบการเชื่อมต่อ Google Sheets"""
@@ -327,23 +495,42 @@ def test_google_sheets_connection():
             }), 500
             
     except Exception as e:
-        app.logger.error(f"Error testing Google Sheets connection: {e}")
+        log.error('Error testing Google Sheets connection: %s', e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/tables', methods=['GET'])
+@conditional_get('tables', lambda: db.table_version)
+@coalesce_get('tables', lambda: db.table_version.version)
 def get_tables():
     """ดึงข้อมูลโต๊ะทั้งหมด"""
     try:
         tables = db.get_all_tables()
         return jsonify(tables)
     except Exception as e:
-        print(f"[ERROR] get_all_tables failed: {str(e)}")
-        print(f"[ERROR] Exception type: {type(e).__name__}")
+        log.error('get_all_tables failed: %s', str(e))
+        log.error('Exception type: %s', type(e).__name__)
         import traceback
-        print(f"[ERROR] Traceback: {traceback.format_exc()}")
+        log.error('Traceback: %s', traceback.format_exc())
         return jsonify([]), 500
 
+@app.route('/api/floor', methods=['GET'])
+@coalesce_get('floor', lambda: (db.get_data_version(), db.menu_cache.version))
+def get_floor_plan():
+    """ดึงข้อมูลโต๊ะทั้งหมดพร้อมรายการอาหารและยอดรวมของเซสชันปัจจุบันในคำขอเดียว (สำหรับหน้าผังโต๊ะ)"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': db.get_floor_plan()
+        })
+    except Exception as e:
+        log.error('get_floor_plan failed: %s', str(e))
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/api/tables/<int:table_id>', methods=['GET'])
+@conditional_get('tables', lambda: db.table_version)
 def get_table(table_id):
     """ดึงข้อมูลโต๊ะเดียว"""
     try:
@@ -359,10 +546,10 @@ def get_table(table_id):
                 'error': f'ไม่พบโต๊ะหมายเลข {table_id}'
             }), 404
     except Exception as e:
-        print(f"[ERROR] Exception in get_all_orders: {str(e)}")
-        print(f"[ERROR] Exception type: {type(e).__name__}")
+        log.error('Exception in get_all_orders: %s', str(e))
+        log.error('Exception type: %s', type(e).__name__)
         import traceback
-        print(f"[ERROR] Traceback: {traceback.format_exc()}")
+        log.error('Traceback: %s', traceback.format_exc())
         return jsonify({
             'success': False,
             'error': str(e)
@@ -376,9 +563,16 @@ def update_table_status(table_id):
         status = data.get('status')
         session_id = data.get('session_id')
         
-        success = db.update_table_status(table_id, status, session_id)
+        if status not in TABLE_TRANSITIONS:
+            return jsonify({
+                'success': False,
+                'error': f'สถานะโต๊ะไม่ถูกต้อง: {status}'
+            }), 400
         
-        if success:
+        result = db.transition_table(table_id, status, session_id)
+        
+        if result['success']:
+            publish_table_event(table_id)
             return jsonify({
                 'success': True,
                 'message': 'อัปเดตสถานะโต๊ะสำเร็จ'
@@ -386,8 +580,8 @@ def update_table_status(table_id):
         else:
             return jsonify({
                 'success': False,
-                'error': 'ไม่สามารถอัปเดตสถานะโต๊ะได้'
-            }), 500
+                'error': result['error'] or 'ไม่สามารถอัปเดตสถานะโต๊ะได้'
+            }), 404 if result['previous'] is None else 409
             
     except Exception as e:
         return jsonify({
@@ -420,6 +614,7 @@ def add_table():
         success = db.add_table(table_id, table_name)
         
         if success:
+            publish_table_event(table_id)
             return jsonify({
                 'success': True,
                 'message': f'เพิ่มโต๊ะ {table_name} สำเร็จ',
@@ -456,6 +651,7 @@ def delete_table(table_id):
         success = db.delete_table(table_id)
         
         if success:
+            publish_table_event(table_id)
             return jsonify({
                 'success': True,
                 'message': f'ลบโต๊ะ {table["table_name"]} สำเร็จ'
@@ -482,14 +678,15 @@ def generate_table_qr(table_id):
         if table and table.get('session_id') and table.get('status') == 'occupied':
             # ใช้ session_id เดิมถ้าโต๊ะมีเซสชั่นอยู่แล้ว
             session_id = table['session_id']
-            print(f"[DEBUG] Using existing session_id: {session_id} for table {table_id}")
+            log.debug('Using existing session_id: %s for table %s', session_id, table_id)
         else:
             # สร้าง session_id ใหม่สำหรับลูกค้า
             session_id = str(uuid.uuid4())
-            print(f"[DEBUG] Creating new session_id: {session_id} for table {table_id}")
+            log.debug('Creating new session_id: %s for table %s', session_id, table_id)
             
             # อัปเดตสถานะโต๊ะเป็น occupied และกำหนด session_id
-            db.update_table_status(table_id, 'occupied', session_id)
+            if db.update_table_status(table_id, 'occupied', session_id):
+                publish_table_event(table_id)
         
         domain = db.get_config('domain_url') or 'http://localhost:5000'
         qr_url = f"{domain}/order?table={table_id}&session={session_id}"
@@ -511,43 +708,43 @@ def generate_table_qr(table_id):
         }), 500
 
 @app.route('/api/menu/categories', methods=['GET'])
+@conditional_get('catalog', lambda: db.menu_cache)
+@coalesce_get('menu_categories', lambda: db.menu_cache.version)
 def get_menu_categories():
     """ดึงหมวดหมู่เมนู"""
     try:
-        print("[DEBUG] Getting menu categories...")
-        print(f"[DEBUG] db object type: {type(db)}")
-        print(f"[DEBUG] db object: {db}")
-        print(f"[DEBUG] Calling db.get_menu_categories()...")
         categories = db.get_menu_categories()
-        print(f"[DEBUG] get_menu_categories returned: {categories}")
-        print(f"[DEBUG] Found {len(categories)} categories")
+        log.debug('get_menu_categories returned: %s', categories)
+        log.debug('Found %s categories', len(categories))
         if categories:
-            print(f"[DEBUG] First category: {categories[0]}")
+            log.debug('First category: %s', categories[0])
         return jsonify(categories)
     except Exception as e:
-        print(f"[DEBUG] Error getting categories: {e}")
+        log.error('Error getting categories: %s', e)
         import traceback
-        print(f"[DEBUG] Traceback: {traceback.format_exc()}")
+        log.error('Traceback: %s', traceback.format_exc())
         return jsonify([]), 500
 
 
 
 @app.route('/api/menu/items', methods=['GET', 'POST'])
+@conditional_get('catalog', lambda: db.menu_cache)
+@coalesce_get('menu_items', lambda: db.menu_cache.version)
 def handle_menu_items():
     """จัดการเมนูอาหาร - GET: ดึงเมนู, POST: เพิ่มเมนู"""
     if request.method == 'GET':
         try:
             category_id = request.args.get('category_id')
-            print(f"[DEBUG] get_menu_items called with category_id: {category_id}")
+            log.debug('get_menu_items called with category_id: %s', category_id)
             items = db.get_menu_items(int(category_id) if category_id else None)
-            print(f"[DEBUG] Retrieved {len(items)} items from database")
-            print(f"[DEBUG] First 2 items: {items[:2] if items else 'No items'}")
+            log.debug('Retrieved %s items from database', len(items))
+            log.debug('First 2 items: %s', items[:2] if items else 'No items')
             return jsonify({
                 'success': True,
                 'data': items
             })
         except Exception as e:
-            print(f"[ERROR] get_menu_items error: {str(e)}")
+            log.error('get_menu_items error: %s', str(e))
             return jsonify({
                 'success': False,
                 'error': str(e)
@@ -585,26 +782,29 @@ def handle_menu_items():
             }), 500
 
 @app.route('/api/menu/items/all', methods=['GET'])
+@conditional_get('catalog', lambda: db.menu_cache)
+@coalesce_get('menu_items_all', lambda: db.menu_cache.version)
 def handle_all_menu_items():
     """ดึงเมนูอาหารทั้งหมด รวมถึงรายการที่ไม่พร้อมจำหน่าย (สำหรับหน้าจัดการเมนู)"""
     try:
         category_id = request.args.get('category_id')
-        print(f"[DEBUG] get_all_menu_items called with category_id: {category_id}")
+        log.debug('get_all_menu_items called with category_id: %s', category_id)
         items = db.get_all_menu_items(int(category_id) if category_id else None)
-        print(f"[DEBUG] Retrieved {len(items)} items from database (including unavailable)")
-        print(f"[DEBUG] First 2 items: {items[:2] if items else 'No items'}")
+        log.debug('Retrieved %s items from database (including unavailable)', len(items))
+        log.debug('First 2 items: %s', items[:2] if items else 'No items')
         return jsonify({
             'success': True,
             'data': items
         })
     except Exception as e:
-        print(f"[ERROR] get_all_menu_items error: {str(e)}")
+        log.error('get_all_menu_items error: %s', str(e))
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
 @app.route('/api/menu/category/<int:category_id>', methods=['GET'])
+@conditional_get('catalog', lambda: db.menu_cache)
 def get_menu_by_category(category_id):
     """ดึงเมนูอาหารตามหมวดหมู่"""
     try:
@@ -698,8 +898,7 @@ def delete_menu_category(category_id):
 @app.route('/api/menu/categories/<int:category_id>/move-up', methods=['POST'])
 def move_category_up(category_id):
     """เลื่อนหมวดหมู่ขึ้น"""
-    print(f"[DEBUG] move_category_up called with category_id={category_id}")
-    app.logger.debug(f"[DEBUG] move_category_up called with category_id={category_id}")
+    log.debug('move_category_up called with category_id=%s', category_id)
     try:
         success = db.move_category_up(category_id)
         
@@ -723,8 +922,7 @@ def move_category_up(category_id):
 @app.route('/api/menu/categories/<int:category_id>/move-down', methods=['POST'])
 def move_category_down(category_id):
     """เลื่อนหมวดหมู่ลง"""
-    print(f"[DEBUG] move_category_down called with category_id={category_id}")
-    app.logger.debug(f"[DEBUG] move_category_down called with category_id={category_id}")
+    log.debug('move_category_down called with category_id=%s', category_id)
     try:
         success = db.move_category_down(category_id)
         
@@ -750,8 +948,8 @@ def update_menu_item(item_id):
     """อัปเดตเมนูอาหาร"""
     try:
         data = request.get_json()
-        print(f"DEBUG: Received data for item {item_id}: {data}")
-        print(f"DEBUG: food_option_type value: {data.get('food_option_type', 'none')}")
+        log.debug('Received data for item %s: %s', item_id, data)
+        log.debug('food_option_type value: %s', data.get('food_option_type', 'none'))
         
         success = db.update_menu_item(
             item_id,
@@ -765,7 +963,7 @@ def update_menu_item(item_id):
             data.get('food_option_type', 'none')
         )
         
-        print(f"DEBUG: Update result: {success}")
+        log.debug('Update result: %s', success)
         
         if success:
             return jsonify({
@@ -809,15 +1007,16 @@ def delete_menu_item(item_id):
 
 # === Option Values Management ===
 @app.route('/api/option-values', methods=['GET'])
+@conditional_get('catalog', lambda: db.menu_cache)
 def get_option_values():
     """ดึงค่าตัวเลือกทั้งหมดหรือตามประเภท"""
     try:
         option_type = request.args.get('option_type')
-        app.logger.info(f"DEBUG API: Getting option values for type: {option_type}")
+        log.debug('Getting option values for type: %s', option_type)
         option_values = db.get_option_values(option_type)
-        app.logger.info(f"DEBUG API: Retrieved {len(option_values)} option values")
+        log.debug('Retrieved %s option values', len(option_values))
         for option in option_values:
-            app.logger.info(f"DEBUG API: Option {option['option_value_id']}: name='{option['name']}', additional_price={option['additional_price']}")
+            log.debug("Option %s: name='%s', additional_price=%s", option['option_value_id'], option['name'], option['additional_price'])
         return jsonify({
             'success': True,
             'data': option_values
@@ -863,7 +1062,7 @@ def update_option_value(option_value_id):
     """อัปเดตค่าตัวเลือก"""
     try:
         data = request.get_json()
-        print(f"DEBUG: Updating option_value_id {option_value_id} with data: {data}")
+        log.debug('Updating option_value_id %s with data: %s', option_value_id, data)
         success = db.update_option_value(
             option_value_id,
             data.get('name'),
@@ -871,7 +1070,7 @@ def update_option_value(option_value_id):
             data.get('is_default'),
             data.get('sort_order')
         )
-        print(f"DEBUG: Update result: {success}")
+        log.debug('Update result: %s', success)
         
         if success:
             return jsonify({
@@ -942,6 +1141,7 @@ def set_default_option_value():
 
 # === Option Types Management ===
 @app.route('/api/option-types', methods=['GET'])
+@conditional_get('catalog', lambda: db.menu_cache)
 def get_option_types():
     """ดึงประเภทตัวเลือกทั้งหมด"""
     try:
@@ -1058,113 +1258,78 @@ def create_order():
     """สร้างออเดอร์ใหม่"""
     try:
         data = request.get_json()
-        print(f"[DEBUG] create_order: Received data: {data}")
         table_id = int(data['table_id'])
         items = data['items']  # [{'item_id': 1, 'quantity': 2, 'customer_request': ''}]
-        print(f"[DEBUG] create_order: table_id={table_id}, items={items}")
+        log.debug('create_order: table_id=%s, items=%s', table_id, items)
         
         # สร้าง session_id ใหม่หรือใช้ที่มีอยู่
         session_id = data.get('session_id') or str(uuid.uuid4())
         
-        # ตรวจสอบว่ามี order active หรือ pending อยู่หรือไม่
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT order_id FROM orders 
-            WHERE table_id = ? AND session_id = ? AND status IN ('active', 'pending')
-            ORDER BY created_at DESC LIMIT 1
-        ''', (table_id, session_id))
-        existing_order = cursor.fetchone()
-        conn.close()
-        
-        if existing_order:
-            # ใช้ order_id ที่มีอยู่และยังไม่เสร็จสิ้น
-            order_id = existing_order[0]
-        else:
-            # สร้าง order ใหม่
-            order_id = db.create_order(table_id, session_id)
-            if not order_id:
-                raise Exception("ไม่สามารถสร้างออเดอร์ได้")
-        
-        # เพิ่มรายการอาหาร
-        print(f"[DEBUG] create_order: Processing {len(items)} items for order_id {order_id}")
-        print(f"[DEBUG] create_order: Full request data: {data}")
+        # เตรียมรายการอาหารทั้งหมด (ราคา / จำนวนถูกตรวจสอบใน add_order_items แยกตามรายการ)
+        order_lines = []
+        unavailable = []
+        log.debug('create_order: Processing %s items for table %s', len(items), table_id)
         for item in items:
-            print(f"[DEBUG] create_order: Processing item: {item}")
-            print(f"[DEBUG] create_order: Item keys: {list(item.keys())}")
-            print(f"[DEBUG] create_order: selected_option value: {item.get('selected_option')}")
-            print(f"[DEBUG] create_order: note value: {item.get('note')}")
-            print(f"[DEBUG] create_order: customer_request value: {item.get('customer_request')}")
-            
-            # ดึงข้อมูลเมนูจากฐานข้อมูลเสมอเพื่อใช้ในการแสดงข้อผิดพลาด
-            menu_items = db.get_menu_items()
-            menu_item = next((m for m in menu_items if m['item_id'] == item['item_id']), None)
-            
-            if not menu_item:
-                print(f"[ERROR] create_order: Menu item with ID {item['item_id']} not found!")
+            # ดึงข้อมูลเมนูจากแคช (ค้นหาตาม ID โดยตรง) เฉพาะเมนูที่เปิดขายอยู่
+            menu_item = db.get_menu_item(item.get('item_id'))
+            
+            if not menu_item or menu_item['is_available'] != 1:
+                log.error('create_order: Menu item with ID %s not found!', item.get('item_id'))
+                unavailable.append(str(item.get('item_id')))
                 continue
             
             # ใช้ราคาที่ frontend ส่งมา (รวมตัวเลือกพิเศษแล้ว) หรือดึงจากฐานข้อมูลถ้าไม่มี
             if 'price' in item and item['price'] is not None:
-                unit_price = float(item['price'])
-                print(f"[DEBUG] create_order: Using price from frontend: {unit_price}")
+                unit_price = item['price']
             else:
-                unit_price = float(menu_item['price'])
-                print(f"[DEBUG] create_order: Using price from database: {unit_price}")
+                unit_price = menu_item['price']
             
             # รับค่า selected_option และ notes จาก frontend และรวมเป็น customer_request
             selected_option = item.get('selected_option', '')
             notes = item.get('notes', '') or item.get('note', '')  # รองรับทั้ง 'notes' และ 'note'
             
-            print(f"[DEBUG] create_order: Raw item data: {item}")
-            print(f"[DEBUG] create_order: selected_option='{selected_option}', notes='{notes}'")
-            
             # รวม selected_option และ notes เป็น customer_request
             customer_request_parts = []
             if selected_option:
                 customer_request_parts.append(selected_option)
-                print(f"[DEBUG] create_order: Added selected_option to parts: '{selected_option}'")
             if notes:
                 customer_request_parts.append(notes)
-                print(f"[DEBUG] create_order: Added notes to parts: '{notes}'")
             
             customer_request = ' | '.join(customer_request_parts) if customer_request_parts else ''
-            print(f"[DEBUG] create_order: Final customer_request: '{customer_request}'")
-                
-            print(f"[DEBUG] create_order: Adding order item - order_id: {order_id}, item_id: {item['item_id']}, quantity: {item['quantity']}, price: {unit_price}, customer_request: '{customer_request}'")
-            
-            print(f"[DEBUG] create_order: About to call add_order_item with customer_request: '{customer_request}'")
-            success = db.add_order_item(
-                order_id,
-                item['item_id'],
-                item['quantity'],
-                unit_price,
-                customer_request
-            )
-            print(f"[DEBUG] create_order: add_order_item returned: {success}")
-            
-            # ตรวจสอบทันทีหลังจากเพิ่ม
-            import sqlite3
-            try:
-                conn = sqlite3.connect('pos_database.db')
-                cursor = conn.cursor()
-                cursor.execute('SELECT customer_request FROM order_items WHERE order_id = ? ORDER BY order_item_id DESC LIMIT 1', (order_id,))
-                result = cursor.fetchone()
-                if result:
-                    print(f"[DEBUG] create_order: Verified in DB - customer_request: '{result[0]}'")
-                else:
-                    print(f"[DEBUG] create_order: No item found in DB for order_id: {order_id}")
-                conn.close()
-            except Exception as e:
-                print(f"[DEBUG] create_order: DB verification error: {e}")
-            
-            print(f"[DEBUG] create_order: add_order_item result: {success}")
-            
-            if not success:
-                raise Exception(f"ไม่สามารถเพิ่มรายการ {menu_item['name']} ได้")
+            log.debug("create_order: Adding order item - item_id: %s, quantity: %s, price: %s, customer_request: '%s'", item.get('item_id'), item.get('quantity'), unit_price, customer_request)
+            
+            order_lines.append({
+                'item_id': menu_item['item_id'],
+                'quantity': item.get('quantity'),
+                'unit_price': unit_price,
+                'customer_request': customer_request,
+                'name': menu_item['name']
+            })
+        
+        if unavailable:
+            return jsonify({
+                'success': False,
+                'error': f"ไม่พบเมนูหรือเมนูปิดขาย (รหัส {', '.join(unavailable)}) ไม่ได้บันทึกออเดอร์"
+            }), 400
+        
+        # หา/สร้างออเดอร์และบันทึกรายการอาหารใน transaction เดียว ตะกร้าที่ไม่ถูกต้องจะไม่เหลือออเดอร์ว่างค้างไว้
+        result = db.place_order(table_id, session_id, order_lines)
+        log.debug('create_order: place_order result: %s', result)
+        if not result['success']:
+            failed = [f"{order_lines[error['index']]['name']}: {error['error']}"
+                      for error in result['errors'] if error['index'] is not None]
+            if failed or not order_lines:
+                return jsonify({
+                    'success': False,
+                    'error': f"ไม่สามารถเพิ่มรายการ {', '.join(failed)} ได้" if failed else 'ไม่มีรายการอาหาร',
+                    'errors': result['errors']
+                }), 400
+            raise Exception("ไม่สามารถเพิ่มรายการอาหารได้")
+        order_id = result['order_id']
         
         # อัปเดตสถานะโต๊ะ
         db.update_table_status(table_id, 'occupied', session_id)
+        publish_order_event('order_created', order_id)
         
         # บันทึกการแจ้งเตือนสำหรับการสั่งอาหาร
         try:
@@ -1177,68 +1342,9 @@ def create_order():
                 'type': 'order',
                 'is_read': False
             }
-            db.save_notification(notification_data)
+            publish_notification(notification_data)
         except Exception as e:
-            print(f"Error saving order notification: {e}")
-        
-        # ซิงค์ข้อมูลไปยัง Google Sheets แบบ background (ไม่ให้ผู้ใช้รอ)
-        print(f"[DEBUG] เริ่มซิงค์ Google Sheets สำหรับออเดอร์ {order_id} แบบ background")
-        try:
-            from .new_google_sheets_sync import sync_order_to_new_format
-            import threading
-            
-            def sync_to_sheets_background():
-                try:
-                    # ดึงข้อมูลออเดอร์และรายการอาหาร
-                    order_data = {
-                        'order_id': order_id,
-                        'table_id': table_id,
-                        'session_id': session_id,
-                        'status': 'รอดำเนินการ',
-                        'created_at': get_thai_datetime().strftime('%Y-%m-%d %H:%M:%S')
-                    }
-                    
-                    # ดึงรายการอาหารในออเดอร์
-                    conn = db.get_connection()
-                    cursor = conn.cursor()
-                    cursor.execute('''
-                        SELECT mi.name as item_name, oi.quantity, oi.unit_price, 
-                               oi.total_price, oi.customer_request
-                        FROM order_items oi
-                        JOIN menu_items mi ON oi.item_id = mi.item_id
-                        WHERE oi.order_id = ?
-                    ''', (order_id,))
-                    
-                    order_items = []
-                    for row in cursor.fetchall():
-                        order_items.append({
-                            'item_name': row[0],
-                            'quantity': row[1],
-                            'unit_price': row[2],
-                            'total_price': row[3],
-                            'customer_request': row[4] or '',
-                            'special_options': ''  # สำหรับความเข้ากันได้
-                        })
-                    conn.close()
-                    
-                    # ซิงค์ไปยัง Google Sheets
-                    sync_success = sync_order_to_new_format(order_data, order_items)
-                    if sync_success:
-                        print(f"[Google Sheets] ซิงค์ออเดอร์ {order_id} สำเร็จ")
-                    else:
-                        print(f"[Google Sheets] ไม่สามารถซิงค์ออเดอร์ {order_id} ได้")
-                        
-                except Exception as sheets_error:
-                    print(f"[Google Sheets] เกิดข้อผิดพลาดในการซิงค์: {sheets_error}")
-            
-            # เรียกใช้ sync ใน background thread
-            sync_thread = threading.Thread(target=sync_to_sheets_background)
-            sync_thread.daemon = True
-            sync_thread.start()
-            print(f"[DEBUG] เริ่ม background sync thread สำหรับออเดอร์ {order_id}")
-                
-        except Exception as e:
-            print(f"[Google Sheets] เกิดข้อผิดพลาดในการเริ่ม background sync: {e}")
+            log.error('Error saving order notification: %s', e)
         
         return jsonify({
             'success': True,
@@ -1255,82 +1361,122 @@ def create_order():
             'error': str(e)
         }), 500
 
+# ออเดอร์ที่แสดงในหน้า admin (เฉพาะออเดอร์ที่มี session_id ตรงกับโต๊ะที่ยังมี session_id อยู่)
+ADMIN_ORDERS_SQL = """
+    SELECT DISTINCT o.order_id, o.table_id, o.session_id, o.status, 
+           o.created_at, t.table_name
+    FROM orders o
+    JOIN tables t ON o.table_id = t.table_id
+    WHERE o.status IN ('pending', 'accepted', 'completed', 'rejected', 'active')
+    AND t.session_id IS NOT NULL
+    AND o.session_id = t.session_id
+    {filter}
+    ORDER BY o.created_at DESC
+"""
+
+def format_admin_order(order_row, item_rows) -> dict:
+    """แปลงออเดอร์และรายการอาหารเป็นรูปแบบที่หน้า admin ใช้"""
+    items = []
+    total_amount = 0
+    for item_row in item_rows:
+        # ใช้ total_price ที่ frontend คำนวณแล้วรวม special options
+        item_total = item_row['total_price'] if item_row['total_price'] is not None else (item_row['quantity'] * item_row['unit_price'])
+        total_amount += item_total
+        items.append({
+            'name': item_row['item_name'],
+            'quantity': item_row['quantity'],
+            'price': item_row['unit_price'],
+            'total_price': item_total,
+            'customer_request': item_row['customer_request'] if item_row['customer_request'] else '',
+            'order_item_id': item_row['order_item_id'],
+            'status': item_row['status'] if item_row['status'] else 'pending'
+        })
+    
+    return {
+        'order_id': order_row['order_id'],
+        'table_id': order_row['table_id'],
+        'table_name': order_row['table_name'],
+        'session_id': order_row['session_id'],
+        'status': order_row['status'],
+        'created_at': order_row['created_at'],
+        'items': items,
+        'total_amount': total_amount
+    }
+
+def publish_order_event(event_type: str, order_id: int = None, order_item_id: int = None):
+    """ส่ง event ของออเดอร์หนึ่งรายการ (ข้อมูลล่าสุดแบบเดียวกับ /api/orders, order เป็น None ถ้าไม่แสดงแล้ว)"""
+    try:
+        if order_item_id is not None:
+            order_filter = 'AND o.order_id = (SELECT order_id FROM order_items WHERE order_item_id = ?)'
+            params = (order_item_id,)
+        else:
+            order_filter = 'AND o.order_id = ?'
+            params = (order_id,)
+        rows = db.get_orders_with_items(ADMIN_ORDERS_SQL.format(filter=order_filter), params, require_menu_item=True)
+        order = format_admin_order(*rows[0]) if rows else None
+        event_bus.publish(event_type, {
+            'order_id': order['order_id'] if order else order_id,
+            'order_item_id': order_item_id,
+            'order': order
+        })
+    except Exception as e:
+        log.error('Error publishing %s event: %s', event_type, e)
+
+def publish_table_event(table_id: int):
+    """ส่ง event เมื่อสถานะหรือเซสชันของโต๊ะเปลี่ยน (หน้า admin ซ่อนออเดอร์ที่ไม่ใช่เซสชันปัจจุบันของโต๊ะ, status เป็น None ถ้าโต๊ะถูกลบ)"""
+    try:
+        table = db.get_table_session(table_id)
+        event_bus.publish('table_updated', {
+            'table_id': table_id,
+            'status': table['status'] if table else None,
+            'session_id': table['session_id'] if table else None
+        })
+    except Exception as e:
+        log.error('Error publishing table_updated event: %s', e)
+
+def invalid_date_param(**params):
+    """ตรวจพารามิเตอร์วันที่ (YYYY-MM-DD) คืนค่า response 400 ถ้ารูปแบบไม่ถูกต้อง หรือ None ถ้าถูกต้องทั้งหมด"""
+    for name, value in params.items():
+        if not value:
+            continue
+        try:
+            datetime.strptime(value[:10], '%Y-%m-%d')
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': f'รูปแบบวันที่ของ {name} ไม่ถูกต้อง (ต้องเป็น YYYY-MM-DD)'
+            }), 400
+    return None
+
+def get_admin_orders(order_ids) -> dict:
+    """ข้อมูลล่าสุดของหลายออเดอร์แบบเดียวกับ /api/orders ในคิวรีเดียว ({order_id: order} เฉพาะออเดอร์ที่ยังแสดงอยู่)"""
+    order_ids = list(order_ids)
+    if not order_ids:
+        return {}
+    order_filter = f"AND o.order_id IN ({','.join('?' * len(order_ids))})"
+    rows = db.get_orders_with_items(ADMIN_ORDERS_SQL.format(filter=order_filter), order_ids, require_menu_item=True)
+    return {order['order_id']: order for order in (format_admin_order(*row) for row in rows)}
+
+def publish_notification(notification_data: dict) -> int:
+    """บันทึกการแจ้งเตือนลงฐานข้อมูลแล้วส่งไปยังหน้า admin ที่เชื่อมต่ออยู่"""
+    notification_id = db.save_notification(notification_data)
+    if notification_id:
+        notification = db.get_notification(notification_id)
+        if notification:
+            event_bus.publish('notification', notification)
+    return notification_id
+
 @app.route('/api/orders', methods=['GET'])
+@coalesce_get('orders', lambda: (db.get_data_version(), db.menu_cache.version))
 def get_all_orders():
     """ดึงรายการออเดอร์ทั้งหมด"""
     try:
-        print("[DEBUG] Starting get_all_orders function")
-        # ดึงออเดอร์ทั้งหมดจากฐานข้อมูล
-        conn = db.get_connection()
-        print("[DEBUG] Database connection established")
-        cursor = conn.cursor()
-        
-        # ดึงข้อมูลออเดอร์ทั้งหมด (เฉพาะออเดอร์ที่มี session_id ตรงกับโต๊ะที่ยังมี session_id อยู่)
-        print("[DEBUG] Executing main orders query")
-        cursor.execute("""
-            SELECT DISTINCT o.order_id, o.table_id, o.session_id, o.status, 
-                   o.created_at, t.table_name
-            FROM orders o
-            JOIN tables t ON o.table_id = t.table_id
-            WHERE o.status IN ('pending', 'accepted', 'completed', 'rejected', 'active')
-            AND t.session_id IS NOT NULL
-            AND o.session_id = t.session_id
-            ORDER BY o.created_at DESC
-        """)
-        print("[DEBUG] Main query executed successfully")
-        
-        orders = []
-        order_rows = cursor.fetchall()
-        print(f"[DEBUG] Found {len(order_rows)} orders")
-        
-        for i, order_row in enumerate(order_rows):
-            print(f"[DEBUG] Processing order {i+1}/{len(order_rows)}: {order_row}")
-            order_id = order_row[0]
-            
-            # ดึงรายการอาหารของแต่ละออเดอร์ (รวม total_price ที่คำนวณแล้วจาก frontend)
-            # ใช้ customer_request (แก้ไขจาก special_request)
-            print(f"[DEBUG] Executing order items query for order_id: {order_id}")
-            try:
-                cursor.execute("""
-                    SELECT mi.name, oi.quantity, oi.unit_price, oi.customer_request, oi.total_price, oi.order_item_id, oi.status
-                    FROM order_items oi
-                    JOIN menu_items mi ON oi.item_id = mi.item_id
-                    WHERE oi.order_id = ?
-                """, (order_id,))
-                print(f"[DEBUG] Order items query executed for order_id: {order_id}")
-                
-                items = []
-                total_amount = 0
-                for item_row in cursor.fetchall():
-                    # ใช้ total_price ที่ frontend คำนวณแล้วรวม special options
-                    item_total = item_row[4] if item_row[4] is not None else (item_row[1] * item_row[2])
-                    total_amount += item_total
-                    items.append({
-                        'name': item_row[0],
-                        'quantity': item_row[1],
-                        'price': item_row[2],
-                        'total_price': item_total,
-                        'customer_request': item_row[3] if item_row[3] else '',
-                        'order_item_id': item_row[5],
-                        'status': item_row[6] if item_row[6] else 'pending'
-                    })
-            except Exception as item_error:
-                print(f"[ERROR] Error processing order items for order_id {order_id}: {item_error}")
-                items = []
-                total_amount = 0
-            
-            orders.append({
-                'order_id': order_row[0],
-                'table_id': order_row[1],
-                'table_name': order_row[5],
-                'session_id': order_row[2],
-                'status': order_row[3],
-                'created_at': order_row[4],
-                'items': items,
-                'total_amount': total_amount
-            })
+        log.debug('Starting get_all_orders function')
+        # พร้อมรายการอาหารของทุกออเดอร์ในคิวรีเดียว
+        order_rows = db.get_orders_with_items(ADMIN_ORDERS_SQL.format(filter=''), require_menu_item=True)
+        log.debug('Found %s orders', len(order_rows))
         
-        conn.close()
+        orders = [format_admin_order(order_row, item_rows) for order_row, item_rows in order_rows]
         
         return jsonify({
             'success': True,
@@ -1343,6 +1489,136 @@ def get_all_orders():
             'error': str(e)
         }), 500
 
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """ส่งการเปลี่ยนแปลงของออเดอร์ การแจ้งเตือน และโต๊ะ แบบ Server-Sent Events"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    subscription = event_bus.subscribe(last_event_id)
+
+    def generate():
+        # ปิดการเชื่อมต่อเป็นระยะ ให้เบราว์เซอร์เชื่อมต่อใหม่ (พร้อม Last-Event-ID) เพื่อไม่ให้ thread ค้างตลอดไป
+        deadline = time.monotonic() + SSE_MAX_DURATION
+        try:
+            yield f"retry: 3000\nevent: hello\ndata: {json.dumps({'last_event_id': event_bus.last_event_id})}\n\n"
+            while time.monotonic() < deadline:
+                if subscription.overflowed:
+                    yield f"event: resync\ndata: {json.dumps({'last_event_id': event_bus.last_event_id})}\n\n"
+                    subscription.overflowed = False
+                event = subscription.get(timeout=SSE_HEARTBEAT_SECONDS)
+                if event is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield format_sse(event)
+        finally:
+            subscription.close()
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/events/poll', methods=['GET'])
+def poll_events():
+    """long-poll สำหรับเบราว์เซอร์ที่ใช้ EventSource ไม่ได้ (after = id ของ event ล่าสุดที่ได้รับ)"""
+    try:
+        after = request.args.get('after', type=int)
+        if after is None:
+            # ครั้งแรก: คืนค่าเฉพาะ id ล่าสุดเพื่อใช้เป็นจุดเริ่มต้น
+            return jsonify({
+                'success': True,
+                'data': {'events': [], 'last_event_id': event_bus.last_event_id, 'resync': False}
+            })
+        timeout = min(request.args.get('timeout', 25, type=float), 25)
+        return jsonify({
+            'success': True,
+            'data': event_bus.events_after(after, timeout)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    """แถวของออเดอร์ รายการอาหาร โต๊ะ และการแจ้งเตือนที่เปลี่ยนหลัง cursor (since)
+
+    ไม่ระบุ since = คืนค่าเฉพาะ cursor ปัจจุบัน (ใช้หลังโหลดข้อมูลทั้งหมดครั้งแรก)
+    """
+    try:
+        since = request.args.get('since', type=int)
+        if since is None:
+            return jsonify({
+                'success': True,
+                'data': {'cursor': db.get_change_cursor(), 'changes': {}, 'deleted': {},
+                         'has_more': False, 'resync': False}
+            })
+        limit = min(max(request.args.get('limit', db.CHANGE_FEED_LIMIT, type=int), 1), db.CHANGE_FEED_LIMIT)
+        return jsonify({
+            'success': True,
+            'data': db.get_changes(max(since, 0), limit)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/debug/db-pool', methods=['GET'])
+def debug_db_pool():
+    """ดูสถิติ connection pool แคชเมนู การรวมคำขออ่าน และค่า PRAGMA ของฐานข้อมูล"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': {
+                'pool': db.get_pool_stats(),
+                'menu_cache': db.get_menu_cache_stats(),
+                'read_coalescing': read_coalescer.stats(),
+                'pragmas': db.get_pragma_report(),
+                'schema_version': db.get_schema_version()
+            }
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/debug/logging', methods=['GET', 'POST'])
+def debug_logging():
+    """ดูหรือปรับระดับ log, sampling และโต๊ะ/เซสชันที่ต้องการ trace ขณะรัน"""
+    try:
+        if request.method == 'POST':
+            data = request.get_json() or {}
+            settings = diagnostics.configure_logging(
+                level=data.get('level'),
+                sample_rate=data.get('sample_rate'),
+                trace_tables=data.get('trace_tables'),
+                trace_sessions=data.get('trace_sessions')
+            )
+            logging.getLogger().setLevel(diagnostics.config.level)
+            app.logger.setLevel(diagnostics.config.level)
+            log.warning('Logging settings changed: %s', settings)
+        else:
+            settings = diagnostics.config.to_dict()
+        return jsonify({
+            'success': True,
+            'data': settings
+        })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/api/debug/orders', methods=['GET'])
 def debug_orders():
     """ตรวจสอบสถานะออเดอร์ในฐานข้อมูล"""
@@ -1384,20 +1660,17 @@ def debug_orders():
 @app.route('/api/tables/<int:table_id>/orders', methods=['GET'])
 def get_table_order_details(table_id):
     """ดึงประวัติการสั่งอาหารของโต๊ะ (แสดงรายการอาหารและสรุปราคา)"""
-    print(f"[FUNCTION] get_table_order_details called with table_id={table_id}")
-    app.logger.debug("=== FUNCTION get_table_order_details CALLED ===")
-    app.logger.debug(f"Table ID: {table_id}")
+    log.debug('get_table_order_details called with table_id=%s', table_id)
     try:
         session_id = request.args.get('session_id')
-        print(f"[DEBUG] get_table_order_details: Received session_id from request: {session_id}")
-        app.logger.debug(f"DEBUG API: get_table_order_details called with table_id={table_id}, session_id={session_id}")
+        log.debug('get_table_order_details: Received session_id from request: %s', session_id)
         
         # ดึงข้อมูลโต๊ะ
         table = db.get_table(table_id)
         if not table:
             return jsonify([]), 404
             
-        print(f"[DEBUG] get_table_order_details: Table session_id from database: {table.get('session_id')}")
+        log.debug('get_table_order_details: Table session_id from database: %s', table.get('session_id'))
         
         # ดึงออเดอร์ทั้งหมดของโต๊ะ โดยใช้ session_id เสมอ แม้จะเป็น None
         # ถ้า session_id เป็น None แต่ได้รับจาก query parameter ให้ใช้ session_id จากตาราง
@@ -1405,11 +1678,11 @@ def get_table_order_details(table_id):
             # ถ้ามีการส่ง session_id=null หรือ session_id= มาจาก frontend
             # ให้ใช้ session_id จากตาราง
             session_id = table.get('session_id')
-            print(f"[DEBUG] get_table_order_details: Using table's session_id instead: {session_id}")
+            log.debug("get_table_order_details: Using table's session_id instead: %s", session_id)
         
         orders = db.get_table_orders(table_id, session_id)
-        print(f"[DEBUG] get_table_order_details: Using session_id for query: {session_id}")
-        app.logger.debug(f"DEBUG API: orders returned from db.get_table_orders: {len(orders)} items")
+        log.debug('get_table_order_details: Using session_id for query: %s', session_id)
+        log.debug('orders returned from db.get_table_orders: %s items', len(orders))
         
         if not orders:
             # ส่งกลับโครงสร้างข้อมูลที่ถูกต้องแม้ไม่มีออเดอร์
@@ -1490,7 +1763,7 @@ def get_table_order_details(table_id):
             'order_count': len(menu_items)
         }
         
-        app.logger.debug(f"DEBUG API: Final response_data: {len(response_data['orders'])} orders")
+        log.debug('Final response_data: %s orders', len(response_data['orders']))
         
         return jsonify({
             'success': True,
@@ -1498,17 +1771,18 @@ def get_table_order_details(table_id):
         })
         
     except Exception as e:
-        app.logger.error(f"Error in get_table_order_details: {str(e)}")
+        log.error('Error in get_table_order_details: %s', str(e))
         return jsonify([]), 500
 
 @app.route('/api/tables/<int:table_id>/call', methods=['POST'])
 def call_staff(table_id):
     """เรียกพนักงาน"""
     try:
-        # อัปเดตสถานะโต๊ะเป็น calling
-        success = db.update_table_status(table_id, 'calling')
+        # อัปเดตสถานะโต๊ะเป็น calling (คง session_id เดิมไว้)
+        result = db.transition_table(table_id, 'calling')
         
-        if success:
+        if result['success']:
+            publish_table_event(table_id)
             return jsonify({
                 'success': True,
                 'message': f'เรียกพนักงานที่โต๊ะ {table_id} สำเร็จ'
@@ -1516,8 +1790,8 @@ def call_staff(table_id):
         else:
             return jsonify({
                 'success': False,
-                'error': 'ไม่สามารถเรียกพนักงานได้'
-            }), 500
+                'error': result['error'] or 'ไม่สามารถเรียกพนักงานได้'
+            }), 404 if result['previous'] is None else 409
             
     except Exception as e:
         return jsonify({
@@ -1569,13 +1843,14 @@ def checkout_table(table_id):
         # ออเดอร์จะถูกปิดเมื่อชำระเงินเสร็จสิ้นแล้ว
         
         # อัปเดตสถานะโต๊ะเป็นรอชำระเงิน แต่ยังคงใช้ session_id เดิม
-        db.update_table_status(table_id, 'waiting_payment', session_id)
+        if db.update_table_status(table_id, 'waiting_payment', session_id):
+            publish_table_event(table_id)
         
         # ส่งข้อมูลไป Google Sheets (ถ้าตั้งค่าไว้)
         try:
             sheets_manager.send_sales_data(receipt_data)
         except Exception as e:
-            print(f"Warning: Could not send to Google Sheets: {e}")
+            log.warning('Could not send to Google Sheets: %s', e)
         
         return jsonify({
             'success': True,
@@ -1679,7 +1954,7 @@ def get_table_order_summary(table_id):
         })
         
     except Exception as e:
-        app.logger.error(f"Error in get_table_order_summary: {str(e)}")
+        log.error('Error in get_table_order_summary: %s', str(e))
         return jsonify({
             'success': False,
             'error': str(e)
@@ -1688,7 +1963,6 @@ def get_table_order_summary(table_id):
 @app.route('/api/tables/<int:table_id>/update-orders', methods=['POST'])
 def update_table_orders(table_id):
     """อัปเดตออเดอร์ของโต๊ะ"""
-    conn = None
     try:
         data = request.get_json()
         session_id = data.get('session_id')
@@ -1719,91 +1993,18 @@ def update_table_orders(table_id):
         # เพราะอาจเป็นการลบรายการทั้งหมด ซึ่งก็เป็นการเปลี่ยนแปลงที่ถูกต้อง
         # ดังนั้นจะดำเนินการต่อเพื่อล้างออเดอร์ที่มีอยู่
         
-        # ใช้ transaction เพื่อให้การอัปเดตเป็น atomic operation
-        conn = db.get_connection()
-        cursor = conn.cursor()
+        # แทนที่รายการใน transaction เดียว (รวมการอัปเดตสรุปยอดขายของวันที่ปิดแล้ว)
+        result = db.replace_session_order_items(table_id, session_id, new_orders)
+        if result is None:
+            return jsonify({
+                'success': False,
+                'error': 'ไม่สามารถอัปเดตออเดอร์ได้'
+            }), 500
+        log.info('Successfully updated orders for table %s, session %s', table_id, session_id)
         
-        try:
-            # เริ่ม transaction
-            cursor.execute('BEGIN TRANSACTION')
-            
-            # ดึงออเดอร์ปัจจุบันของโต๊ะ
-            cursor.execute('''
-                SELECT order_id FROM orders 
-                WHERE table_id = ? AND session_id = ?
-            ''', (table_id, session_id))
-            
-            existing_order = cursor.fetchone()
-            
-            if existing_order:
-                # ถ้ามีออเดอร์อยู่แล้ว ให้ลบเฉพาะ order_items แล้วเพิ่มใหม่
-                order_id = existing_order['order_id']
-                
-                # ลบ order_items เดิม
-                cursor.execute('''
-                    DELETE FROM order_items 
-                    WHERE order_id = ?
-                ''', (order_id,))
-                
-                # ถ้าไม่มีรายการใหม่ ให้ลบ order record ด้วย
-                if not new_orders:
-                    print(f"[DEBUG] No new orders, deleting order record {order_id}")
-                    cursor.execute('''
-                        DELETE FROM orders 
-                        WHERE order_id = ?
-                    ''', (order_id,))
-                    order_id = None
-                
-            else:
-                # ถ้ายังไม่มีออเดอร์และมีรายการใหม่ ให้สร้างใหม่
-                if new_orders:
-                    cursor.execute('''
-                        INSERT INTO orders (table_id, session_id)
-                        VALUES (?, ?)
-                    ''', (table_id, session_id))
-                    order_id = cursor.lastrowid
-                    
-                    if not order_id:
-                        raise Exception('ไม่สามารถสร้างออเดอร์ได้')
-                else:
-                    # ไม่มีออเดอร์เดิมและไม่มีรายการใหม่ ไม่ต้องทำอะไร
-                    order_id = None
-            
-            # เพิ่มรายการอาหารใหม่ (ถ้ามี)
-            if new_orders and order_id:  # ตรวจสอบว่ามีรายการใหม่และมี order_id
-                print(f"[DEBUG] Processing {len(new_orders)} new orders")
-                for i, order_item in enumerate(new_orders):
-                    print(f"[DEBUG] Order item {i}: {order_item}")
-                    menu_id = order_item.get('menu_id')
-                    quantity = order_item.get('quantity', 1)
-                    price = order_item.get('price')
-                    customer_request = order_item.get('customer_request', '')
-                    status = order_item.get('status', 'pending')
-                    
-                    if not menu_id or not price:
-                        print(f"[DEBUG] Skipping item {i}: missing menu_id or price")
-                        continue
-                    
-                    total_price = order_item.get('total_price', price * quantity)
-                    print(f"[DEBUG] Inserting: order_id={order_id}, menu_id={menu_id}, quantity={quantity}, price={price}, total_price={total_price}, status={status}")
-                    cursor.execute('''
-                        INSERT INTO order_items (order_id, item_id, quantity, unit_price, total_price, customer_request, status)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                    ''', (order_id, menu_id, quantity, price, total_price, customer_request, status))
-            # หากไม่มีรายการใหม่ (new_orders ว่าง) order record จะถูกลบไปแล้ว
-            # ดังนั้นจะไม่มีข้อมูลออเดอร์เหลืออยู่
-            
-            # Commit transaction
-            conn.commit()
-            print(f"Successfully updated orders for table {table_id}, session {session_id}")
-            
-        except Exception as e:
-            # Rollback transaction on error
-            conn.rollback()
-            raise e
-        finally:
-            if conn:
-                conn.close()
+        if result['order_id'] is not None:
+            # ข้อมูลล่าสุดของออเดอร์ (order เป็น None ถ้าออเดอร์ถูกลบ)
+            publish_order_event('order_updated', result['order_id'])
         
         return jsonify({
             'success': True,
@@ -1811,13 +2012,7 @@ def update_table_orders(table_id):
         })
         
     except Exception as e:
-        print(f"Error updating table orders: {e}")
-        if conn:
-            try:
-                conn.rollback()
-                conn.close()
-            except:
-                pass
+        log.error('Error updating table orders: %s', e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -1826,18 +2021,19 @@ def update_table_orders(table_id):
 @app.route('/api/tables/<int:table_id>/payment-complete', methods=['POST'])
 def payment_complete(table_id):
     """ชำระเงินเสร็จสิ้น"""
-    print(f"[DEBUG] payment_complete function called with table_id: {table_id}")
+    log.debug('payment_complete function called with table_id: %s', table_id)
     try:
         # ดึงข้อมูลโต๊ะก่อนอัปเดตเพื่อเก็บ session_id เดิม
         table = db.get_table(table_id)
         session_id = table.get('session_id') if table else None
-        print(f"[DEBUG] payment_complete: Table {table_id} with session_id: {session_id}")
+        log.debug('payment_complete: Table %s with session_id: %s', table_id, session_id)
         
         # ใช้ transaction เดียวสำหรับการปิดออเดอร์และอัปเดตสถานะโต๊ะ
         success = db.complete_payment_transaction(table_id, session_id)
         
         if success:
-            print(f"[DEBUG] payment_complete: Table {table_id} payment completed successfully")
+            log.debug('payment_complete: Table %s payment completed successfully', table_id)
+            event_bus.publish('table_paid', {'table_id': table_id, 'session_id': session_id})
             return jsonify({
                 'success': True,
                 'message': f'ชำระเงินโต๊ะ {table_id} เสร็จสิ้น'
@@ -1849,12 +2045,30 @@ def payment_complete(table_id):
             }), 400
             
     except Exception as e:
-        print(f"[ERROR] payment_complete: {str(e)}")
+        log.error('payment_complete: %s', str(e))
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+def table_session_state(table_id: int, session_id: str):
+    """สถานะเซสชั่นของลูกค้าจากข้อมูลโต๊ะในหน่วยความจำ (None ถ้าไม่มีโต๊ะนี้)"""
+    table = db.get_table_session(table_id)
+    if table is None:
+        return None
+    current_session_id = table.get('session_id')
+    table_status = table.get('status')
+    # เซสชั่นไม่ถูกต้องหาก:
+    # 1. session_id เป็น None (ถูกปิดแล้ว)
+    # 2. session_id ไม่ตรงกัน
+    # 3. สถานะโต๊ะเป็น checkout
+    session_valid = (
+        current_session_id is not None and 
+        current_session_id == session_id and 
+        table_status != 'checkout'
+    )
+    return {'session_valid': session_valid, 'table_status': table_status}
+
 @app.route('/api/tables/<int:table_id>/session/check', methods=['GET'])
 def check_session_status(table_id):
     """ตรวจสอบสถานะเซสชั่นของโต๊ะ"""
@@ -1868,34 +2082,19 @@ def check_session_status(table_id):
                 'session_valid': False
             }), 400
         
-        # ดึงข้อมูลโต๊ะ
-        table = db.get_table(table_id)
+        state = table_session_state(table_id, session_id)
         
-        if not table:
+        if state is None:
             return jsonify({
                 'success': False,
                 'error': 'ไม่พบโต๊ะที่ระบุ',
                 'session_valid': False
             }), 404
         
-        # ตรวจสอบสถานะเซสชั่น
-        current_session_id = table.get('session_id')
-        table_status = table.get('status')
-        
-        # เซสชั่นไม่ถูกต้องหาก:
-        # 1. session_id เป็น None (ถูกปิดแล้ว)
-        # 2. session_id ไม่ตรงกัน
-        # 3. สถานะโต๊ะเป็น checkout
-        session_valid = (
-            current_session_id is not None and 
-            current_session_id == session_id and 
-            table_status != 'checkout'
-        )
-        
         return jsonify({
             'success': True,
-            'session_valid': session_valid,
-            'table_status': table_status,
+            'session_valid': state['session_valid'],
+            'table_status': state['table_status'],
             'message': 'ตรวจสอบสถานะเซสชั่นสำเร็จ'
         })
         
@@ -1906,20 +2105,56 @@ def check_session_status(table_id):
             'session_valid': False
         }), 500
 
+@app.route('/api/tables/<int:table_id>/session/events', methods=['GET'])
+def stream_session_events(table_id):
+    """ส่งสถานะเซสชั่นของโต๊ะให้หน้าสั่งอาหารของลูกค้าแบบ Server-Sent Events
+
+    ส่งสถานะปัจจุบันทันทีที่เชื่อมต่อ และส่งใหม่เมื่อสถานะเปลี่ยน (เช่น ปิดเซสชั่น เคลียร์โต๊ะ ชำระเงิน)
+    ปิดการเชื่อมต่อเมื่อเซสชั่นหมดอายุแล้ว
+    """
+    session_id = request.args.get('session_id')
+    if not session_id:
+        return jsonify({
+            'success': False,
+            'error': 'ไม่พบ session_id'
+        }), 400
+    if table_session_state(table_id, session_id) is None:
+        return jsonify({
+            'success': False,
+            'error': 'ไม่พบโต๊ะที่ระบุ'
+        }), 404
+
+    def generate():
+        deadline = time.monotonic() + SSE_MAX_DURATION
+        yield 'retry: 3000\n\n'
+        last_state = None
+        while time.monotonic() < deadline:
+            # อ่านเวอร์ชันก่อนสถานะ เพื่อไม่พลาดการเปลี่ยนแปลงที่เกิดระหว่างนั้น
+            version = db.table_version.version
+            state = table_session_state(table_id, session_id) or {'session_valid': False, 'table_status': None}
+            if state != last_state:
+                yield f"event: session\ndata: {json.dumps(state)}\n\n"
+                last_state = state
+            if not state['session_valid']:
+                break
+            if db.table_version.wait_for_change(version, SSE_HEARTBEAT_SECONDS) == version:
+                yield ': keep-alive\n\n'
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/api/tables/<int:table_id>/clear', methods=['POST'])
 def clear_table(table_id):
     """เคลียร์โต๊ะ"""
     try:
-        # ดึงข้อมูลโต๊ะก่อนเคลียร์เพื่อเก็บ session_id เดิม
-        table = db.get_table(table_id)
-        old_session_id = table.get('session_id') if table else None
-        print(f"[DEBUG] clear_table: Clearing table {table_id} with old session_id: {old_session_id}")
-        
-        # รีเซ็ตสถานะโต๊ะและล้างค่า session_id เป็น None อย่างชัดเจน
-        success = db.update_table_status(table_id, 'available', None)
-        print(f"[DEBUG] clear_table: Table {table_id} cleared, session_id set to None")
+        # รีเซ็ตสถานะโต๊ะและล้างค่า session_id (ได้ session_id เดิมจากการเปลี่ยนสถานะเดียวกัน)
+        result = db.transition_table(table_id, 'available', None)
         
-        if success:
+        if result['success']:
+            old_session_id = result['previous']['session_id']
+            log.debug('clear_table: Table %s cleared, old session_id: %s', table_id, old_session_id)
+            publish_table_event(table_id)
             return jsonify({
                 'success': True,
                 'message': f'เคลียร์โต๊ะ {table_id} สำเร็จ',
@@ -1928,8 +2163,8 @@ def clear_table(table_id):
         else:
             return jsonify({
                 'success': False,
-                'error': 'ไม่สามารถเคลียร์โต๊ะได้'
-            }), 500
+                'error': result['error'] or 'ไม่สามารถเคลียร์โต๊ะได้'
+            }), 404 if result['previous'] is None else 409
             
     except Exception as e:
         return jsonify({
@@ -1965,62 +2200,21 @@ def close_table_session(table_id):
                 'error': 'Session ID ไม่ถูกต้อง'
             }), 403
         
-        # บันทึกข้อมูลออเดอร์ลงในประวัติ (ถ้ามี)
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            # ดึงออเดอร์ทั้งหมดของเซสชั่นนี้
-            cursor.execute("""
-                SELECT o.order_id, o.table_id, o.session_id, o.status, o.created_at,
-                       oi.item_id, oi.quantity, oi.unit_price, oi.total_price, oi.customer_request,
-                       mi.name as item_name
-                FROM orders o
-                LEFT JOIN order_items oi ON o.order_id = oi.order_id
-                LEFT JOIN menu_items mi ON oi.item_id = mi.item_id
-                WHERE o.table_id = ? AND o.session_id = ?
-                ORDER BY o.created_at
-            """, (table_id, session_id))
-            
-            session_orders = cursor.fetchall()
-            
-            if session_orders:
-                # บันทึกลงในตาราง session_history (ถ้ามี)
-                # หรือเพียงแค่ลบออเดอร์ที่ยังไม่เสร็จสิ้น
-                
-                # ลบออเดอร์ที่ยังไม่เสร็จสิ้นออกจากระบบ
-                cursor.execute("""
-                    DELETE FROM order_items 
-                    WHERE order_id IN (
-                        SELECT order_id FROM orders 
-                        WHERE table_id = ? AND session_id = ? AND status != 'completed'
-                    )
-                """, (table_id, session_id))
-                
-                cursor.execute("""
-                    DELETE FROM orders 
-                    WHERE table_id = ? AND session_id = ? AND status != 'completed'
-                """, (table_id, session_id))
-            
-            # อัปเดตสถานะโต๊ะเป็น available และล้าง session_id
-            cursor.execute("""
-                UPDATE tables 
-                SET status = 'available', session_id = NULL 
-                WHERE table_id = ?
-            """, (table_id,))
-            
-            conn.commit()
-            
+        # ลบออเดอร์ที่ยังไม่เสร็จสิ้นและคืนโต๊ะเป็น available (ตรวจสอบ session_id อีกครั้งแบบ atomic)
+        result = db.close_table_session(table_id, session_id)
+        if not result['success']:
             return jsonify({
-                'success': True,
-                'message': f'ปิดเซสชั่น {session_id[:8]} ของโต๊ะ {table_id} เรียบร้อยแล้ว'
-            })
-            
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
+                'success': False,
+                'error': 'Session ID ไม่ถูกต้อง' if result['conflict'] else result['error']
+            }), 403 if result['conflict'] else 409
+        
+        # ออเดอร์ของเซสชันที่ปิดไม่แสดงในหน้า admin แล้ว (table_updated พร้อม session_id ใหม่)
+        publish_table_event(table_id)
+        
+        return jsonify({
+            'success': True,
+            'message': f'ปิดเซสชั่น {session_id[:8]} ของโต๊ะ {table_id} เรียบร้อยแล้ว'
+        })
         
     except Exception as e:
         return jsonify({
@@ -2051,6 +2245,8 @@ def update_config():
         
         for key, value in data.items():
             db.set_config(key, str(value))
+        if READ_COALESCE_CONFIG_KEY in data:
+            apply_read_coalesce_config()
         
         return jsonify({
             'success': True,
@@ -2099,7 +2295,8 @@ def generate_all_qr():
             session_id = str(uuid.uuid4())
             
             # อัปเดตสถานะโต๊ะเป็น occupied และกำหนด session_id
-            db.update_table_status(table_id, 'occupied', session_id)
+            if db.update_table_status(table_id, 'occupied', session_id):
+                publish_table_event(table_id)
             
             qr_url = f"{domain}/order?table={table_id}&session={session_id}"
             qr_code = qr_gen.generate_qr(qr_url)
@@ -2129,7 +2326,8 @@ def clear_all_tables():
         
         for table in tables:
             if table['status'] != 'available':
-                db.update_table_status(table['table_id'], 'available')
+                if db.update_table_status(table['table_id'], 'available'):
+                    publish_table_event(table['table_id'])
                 cleared_count += 1
         
         return jsonify({
@@ -2183,7 +2381,7 @@ def print_table_qr(table_id):
         domain = db.get_config('domain_url') or 'http://localhost:5000'
         qr_url = f"{domain}/order?table={table_id}&session={session_id}"
         
-        print(f"[DEBUG] Generating QR code for table {table_id} with URL: {qr_url}")
+        log.debug('Generating QR code for table %s with URL: %s', table_id, qr_url)
         
         # สร้าง QR Code ขนาดใหญ่สำหรับพิมพ์
         config = {
@@ -2196,16 +2394,16 @@ def print_table_qr(table_id):
         qr_code = qr_gen.generate_qr(qr_url, config)
         
         if not qr_code:
-            print(f"[ERROR] Failed to generate QR code for table {table_id}")
+            log.error('Failed to generate QR code for table %s', table_id)
             raise Exception("Failed to generate QR code")
         
         # ตรวจสอบว่า qr_code มีรูปแบบที่ถูกต้องหรือไม่
         if not qr_code.startswith('data:image/png;base64,'):
-            print(f"[ERROR] QR code data format is incorrect: {qr_code[:30]}...")
+            log.error('QR code data format is incorrect: %s...', qr_code[:30])
             raise Exception("QR code data format is incorrect")
             
-        print(f"[DEBUG] QR code generated successfully. Data length: {len(qr_code) if qr_code else 0}")
-        print(f"[DEBUG] QR code data prefix: {qr_code[:30]}...")
+        log.debug('QR code generated successfully. Data length: %s', len(qr_code) if qr_code else 0)
+        log.debug('QR code data prefix: %s...', qr_code[:30])
         
         # ตัด prefix 'data:image/png;base64,' ออกเพื่อส่งเฉพาะ base64 string
         # เนื่องจาก frontend จะเติม prefix นี้เอง
@@ -2227,12 +2425,32 @@ def print_table_qr(table_id):
             'error': str(e)
         }), 500
 
+@app.route('/api/kitchen/queue', methods=['GET'])
+def get_kitchen_queue():
+    """คิวรายการอาหารที่รอทำเรียงตามเวลาที่ควรเสร็จ กรองด้วย ?station=<category_id> และ ?status=pending|accepted"""
+    try:
+        station_id = request.args.get('station', type=int)
+        status = request.args.get('status')
+        limit = request.args.get('limit', type=int)
+        return jsonify({
+            'success': True,
+            'data': db.get_kitchen_queue(station_id=station_id, status=status, limit=limit),
+            'stations': db.get_kitchen_stations()
+        })
+    except Exception as e:
+        log.error('get_kitchen_queue failed: %s', str(e))
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/api/orders/<int:order_id>/accept', methods=['POST'])
 def accept_order(order_id):
     """รับออเดอร์"""
     try:
         success = db.update_order_status(order_id, 'accepted')
         if success:
+            publish_order_event('order_updated', order_id)
             return jsonify({
                 'success': True,
                 'message': 'รับออเดอร์เรียบร้อยแล้ว'
@@ -2252,32 +2470,13 @@ def accept_order(order_id):
 def reject_order(order_id):
     """ปฏิเสธออเดอร์และเปลี่ยนราคาเป็น 0"""
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        # เปลี่ยนสถานะออเดอร์เป็น rejected
-        cursor.execute('''
-            UPDATE orders 
-            SET status = 'rejected', updated_at = CURRENT_TIMESTAMP
-            WHERE order_id = ?
-        ''', (order_id,))
-        
-        # เปลี่ยนราคาของ order_items เป็น 0
-        cursor.execute('''
-            UPDATE order_items 
-            SET unit_price = 0, total_price = 0
-            WHERE order_id = ?
-        ''', (order_id,))
-        
-        # อัปเดต total_amount ของออเดอร์เป็น 0
-        cursor.execute('''
-            UPDATE orders 
-            SET total_amount = 0
-            WHERE order_id = ?
-        ''', (order_id,))
-        
-        conn.commit()
-        conn.close()
+        # เปลี่ยนสถานะเป็น rejected และราคาเป็น 0 (อัปเดตสรุปยอดขายใน transaction เดียวกัน)
+        if not db.reject_order(order_id):
+            return jsonify({
+                'success': False,
+                'error': 'ไม่พบออเดอร์ที่ระบุ หรือไม่สามารถปฏิเสธออเดอร์ได้'
+            }), 404
+        publish_order_event('order_updated', order_id)
         
         return jsonify({
             'success': True,
@@ -2305,12 +2504,68 @@ def get_order_items(order_id):
             'error': str(e)
         }), 500
 
+# สถานะที่ตั้งให้รายการออเดอร์ย่อยได้ผ่าน /api/order-items/status
+ORDER_ITEM_STATUSES = ('pending', 'accepted', 'completed', 'rejected')
+
+@app.route('/api/order-items/status', methods=['POST'])
+def update_order_items_status():
+    """เปลี่ยนสถานะรายการออเดอร์ย่อยหลายรายการในครั้งเดียว {order_item_ids: [...], status: 'accepted'}
+
+    คืนค่าข้อมูลล่าสุดของออเดอร์ที่เปลี่ยน (รูปแบบเดียวกับ /api/orders) เพื่อไม่ต้องโหลดรายการออเดอร์ใหม่
+    """
+    try:
+        data = request.get_json() or {}
+        status = data.get('status')
+        order_item_ids = data.get('order_item_ids')
+        if status not in ORDER_ITEM_STATUSES:
+            return jsonify({
+                'success': False,
+                'error': f'สถานะไม่ถูกต้อง (ต้องเป็น {", ".join(ORDER_ITEM_STATUSES)})'
+            }), 400
+        if not isinstance(order_item_ids, list) or not order_item_ids or \
+                not all(isinstance(item_id, int) and not isinstance(item_id, bool) for item_id in order_item_ids):
+            return jsonify({
+                'success': False,
+                'error': 'ต้องระบุ order_item_ids เป็นรายการตัวเลข'
+            }), 400
+
+        result = db.update_order_items_status(order_item_ids, status)
+        if result is None:
+            return jsonify({
+                'success': False,
+                'error': 'ไม่สามารถอัปเดตสถานะรายการได้'
+            }), 500
+
+        orders = get_admin_orders(result['order_ids'])
+        for order_id in result['order_ids']:
+            event_bus.publish('order_updated', {
+                'order_id': order_id,
+                'order_item_id': None,
+                'order': orders.get(order_id)
+            })
+        return jsonify({
+            'success': True,
+            'data': {
+                'updated': result['updated'],
+                'missing': result['missing'],
+                'order_ids': result['order_ids'],
+                'orders': [orders[order_id] for order_id in result['order_ids'] if order_id in orders]
+            }
+        })
+    except Exception as e:
+        log.error('update_order_items_status failed: %s', str(e))
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/api/order-items/<int:order_item_id>/accept', methods=['POST'])
 def accept_order_item(order_item_id):
     """รับรายการออเดอร์ย่อย"""
     try:
         success = db.update_order_item_status(order_item_id, 'accepted')
         if success:
+            publish_order_event('order_updated', order_item_id=order_item_id)
             return jsonify({
                 'success': True,
                 'message': 'รับรายการเรียบร้อยแล้ว'
@@ -2332,6 +2587,7 @@ def reject_order_item(order_item_id):
     try:
         success = db.update_order_item_status(order_item_id, 'rejected')
         if success:
+            publish_order_event('order_updated', order_item_id=order_item_id)
             return jsonify({
                 'success': True,
                 'message': 'ปฏิเสธรายการเรียบร้อยแล้ว'
@@ -2353,6 +2609,7 @@ def complete_order_item(order_item_id):
     try:
         success = db.update_order_item_status(order_item_id, 'completed')
         if success:
+            publish_order_event('order_updated', order_item_id=order_item_id)
             return jsonify({
                 'success': True,
                 'message': 'ทำเครื่องหมายรายการเสร็จสิ้นเรียบร้อยแล้ว'
@@ -2374,6 +2631,7 @@ def complete_order_endpoint(order_id):
     try:
         success = db.complete_order(order_id)
         if success:
+            publish_order_event('order_updated', order_id)
             return jsonify({
                 'success': True,
                 'message': 'ออเดอร์เสร็จสิ้นแล้ว'
@@ -2436,9 +2694,9 @@ def staff_request():
         
         # บันทึกการแจ้งเตือนลงฐานข้อมูล
         try:
-            db.save_notification(notification_data)
+            publish_notification(notification_data)
         except Exception as e:
-            print(f"Warning: Could not save notification to database: {e}")
+            log.warning('Could not save notification to database: %s', e)
         
         return jsonify({
             'success': True,
@@ -2501,9 +2759,9 @@ def item_request():
         
         # บันทึกการแจ้งเตือนลงฐานข้อมูล
         try:
-            db.save_notification(notification_data)
+            publish_notification(notification_data)
         except Exception as e:
-            print(f"Warning: Could not save notification to database: {e}")
+            log.warning('Could not save notification to database: %s', e)
         
         return jsonify({
             'success': True,
@@ -2544,9 +2802,9 @@ def order_request():
         
         # บันทึกการแจ้งเตือนลงฐานข้อมูล
         try:
-            db.save_notification(notification_data)
+            publish_notification(notification_data)
         except Exception as e:
-            print(f"Warning: Could not save notification to database: {e}")
+            log.warning('Could not save notification to database: %s', e)
         
         return jsonify({
             'success': True,
@@ -2587,9 +2845,9 @@ def check_bill_request():
         
         # บันทึกการแจ้งเตือนลงฐานข้อมูล
         try:
-            db.save_notification(notification_data)
+            publish_notification(notification_data)
         except Exception as e:
-            print(f"Warning: Could not save notification to database: {e}")
+            log.warning('Could not save notification to database: %s', e)
         
         return jsonify({
             'success': True,
@@ -2605,12 +2863,68 @@ def check_bill_request():
 
 @app.route('/api/notifications', methods=['GET'])
 def get_notifications():
-    """ดึงการแจ้งเตือนที่ยังไม่ได้อ่าน"""
+    """ดึงการแจ้งเตือนที่ยังไม่ได้อ่าน (?after_id= เฉพาะที่ใหม่กว่า id ที่มีอยู่แล้ว, ?limit=)"""
     try:
-        notifications = db.get_unread_notifications()
+        after_id = request.args.get('after_id', 0, type=int)
+        limit = request.args.get('limit', type=int)
+        notifications = db.get_unread_notifications(after_id, limit)
         return jsonify({
             'success': True,
-            'data': notifications
+            'data': notifications,
+            'unread_count': db.get_unread_notification_count()
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/notifications/unread-count', methods=['GET'])
+def get_unread_notification_count():
+    """จำนวนการแจ้งเตือนที่ยังไม่ได้อ่าน"""
+    return jsonify({
+        'success': True,
+        'data': {'unread_count': db.get_unread_notification_count()}
+    })
+
+@app.route('/api/notifications/read', methods=['POST'])
+def mark_notifications_read():
+    """ทำเครื่องหมายการแจ้งเตือนทั้งหมด (หรือถึง up_to_id) ว่าอ่านแล้วในคำขอเดียว"""
+    try:
+        data = request.get_json(silent=True) or {}
+        up_to_id = data.get('up_to_id')
+        marked = db.mark_notifications_read(int(up_to_id) if up_to_id is not None else None)
+        if marked < 0:
+            return jsonify({
+                'success': False,
+                'error': 'ไม่สามารถทำเครื่องหมายการแจ้งเตือนได้'
+            }), 500
+        return jsonify({
+            'success': True,
+            'data': {'marked': marked, 'unread_count': db.get_unread_notification_count()}
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/notifications/compact', methods=['POST'])
+def compact_notifications():
+    """ย้ายหรือลบการแจ้งเตือนที่อ่านแล้วและเก่ากว่าระยะเก็บรักษา (ตั้งค่าได้ใน system_config)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        retention_days = data.get('retention_days')
+        mode = data.get('mode')
+        if mode is not None and mode not in ('archive', 'purge'):
+            return jsonify({
+                'success': False,
+                'error': 'mode ต้องเป็น archive หรือ purge'
+            }), 400
+        result = db.compact_notifications(int(retention_days) if retention_days is not None else None, mode)
+        return jsonify({
+            'success': True,
+            'data': result
         })
     except Exception as e:
         return jsonify({
@@ -2770,9 +3084,9 @@ def get_current_orders():
         table_id = request.args.get('table_id')
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
-        
-        conn = db.get_connection()
-        cursor = conn.cursor()
+        date_error = invalid_date_param(start_date=start_date, end_date=end_date)
+        if date_error:
+            return date_error
         
         # สร้าง query สำหรับดึงคำสั่งซื้อปัจจุบัน
         query = """
@@ -2797,62 +3111,41 @@ def get_current_orders():
             query += " AND o.table_id = ?"
             params.append(table_id)
             
-        if start_date:
-            query += " AND DATE(o.created_at) >= ?"
-            params.append(start_date)
-            
-        if end_date:
-            query += " AND DATE(o.created_at) <= ?"
-            params.append(end_date)
+        if start_date or end_date:
+            date_clause, date_params = date_range_predicate('o.created_at', start_date, end_date)
+            query += date_clause
+            params.extend(date_params)
             
         query += " ORDER BY o.created_at DESC"
         
-        cursor.execute(query, params)
         orders = []
-        
-        for row in cursor.fetchall():
+        for row, item_rows in db.get_orders_with_items(query, params):
             order_data = {
-                'order_id': row[0],
-                'table_id': row[1],
-                'table_name': row[2],
-                'session_id': row[3],
-                'status': row[4],
-                'created_at': row[5],
-                'completed_at': row[6],
-                'total_amount': row[7]
+                'order_id': row['order_id'],
+                'table_id': row['table_id'],
+                'table_name': row['table_name'],
+                'session_id': row['session_id'],
+                'status': row['status'],
+                'created_at': row['created_at'],
+                'completed_at': row['completed_at'],
+                'total_amount': row['total_amount']
             }
             
-            # ดึงรายการอาหารของแต่ละออเดอร์
-            cursor.execute("""
-                SELECT 
-                    oi.item_id,
-                    mi.name as menu_name,
-                    oi.quantity,
-                    oi.unit_price,
-                    oi.customer_request,
-                    oi.status
-                FROM order_items oi
-                LEFT JOIN menu_items mi ON oi.item_id = mi.item_id
-                WHERE oi.order_id = ?
-            """, (row[0],))
-            
             items = []
-            for item_row in cursor.fetchall():
+            for item_row in item_rows:
                 items.append({
-                    'menu_item_id': item_row[0],
-                    'name': item_row[1],
-                    'quantity': item_row[2],
-                    'price': item_row[3],
-                    'customer_request': item_row[4],
-                    'status': item_row[5] if item_row[5] else 'pending',
-                    'total_price': item_row[2] * item_row[3]
+                    'menu_item_id': item_row['item_id'],
+                    'name': item_row['item_name'],
+                    'quantity': item_row['quantity'],
+                    'price': item_row['unit_price'],
+                    'customer_request': item_row['customer_request'],
+                    'status': item_row['status'] if item_row['status'] else 'pending',
+                    'total_price': item_row['quantity'] * item_row['unit_price']
                 })
             
             order_data['items'] = items
             orders.append(order_data)
         
-        conn.close()
-        
         return jsonify({
             'success': True,
             'data': orders
@@ -2871,9 +3164,9 @@ def get_order_history():
         table_id = request.args.get('table_id')
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
-        
-        conn = db.get_connection()
-        cursor = conn.cursor()
+        date_error = invalid_date_param(start_date=start_date, end_date=end_date)
+        if date_error:
+            return date_error
         
         # สร้าง query สำหรับดึงประวัติคำสั่งซื้อ
         query = """
@@ -2898,62 +3191,41 @@ def get_order_history():
             query += " AND oh.table_id = ?"
             params.append(table_id)
             
-        if start_date:
-            query += " AND DATE(oh.created_at) >= ?"
-            params.append(start_date)
-            
-        if end_date:
-            query += " AND DATE(oh.created_at) <= ?"
-            params.append(end_date)
+        if start_date or end_date:
+            date_clause, date_params = date_range_predicate('oh.created_at', start_date, end_date)
+            query += date_clause
+            params.extend(date_params)
             
         query += " ORDER BY oh.created_at DESC"
         
-        cursor.execute(query, params)
         orders = []
-        
-        for row in cursor.fetchall():
+        for row, item_rows in db.get_orders_with_items(query, params, history=True):
             order_data = {
-                'order_id': row[0],
-                'table_id': row[1],
-                'table_name': row[2],
-                'session_id': row[3],
-                'status': row[4],
-                'created_at': row[5],
-                'completed_at': row[6],
-                'total_amount': row[7]
+                'order_id': row['order_id'],
+                'table_id': row['table_id'],
+                'table_name': row['table_name'],
+                'session_id': row['session_id'],
+                'status': row['status'],
+                'created_at': row['created_at'],
+                'completed_at': row['completed_at'],
+                'total_amount': row['total_amount']
             }
             
-            # ดึงรายการอาหารของแต่ละออเดอร์
-            cursor.execute("""
-                SELECT 
-                    ohi.menu_item_id,
-                    mi.name as menu_name,
-                    ohi.quantity,
-                    ohi.price,
-                    ohi.customer_request,
-                    ohi.status
-                FROM order_history_items ohi
-                LEFT JOIN menu_items mi ON ohi.menu_item_id = mi.item_id
-                WHERE ohi.order_id = ?
-            """, (row[0],))
-            
             items = []
-            for item_row in cursor.fetchall():
+            for item_row in item_rows:
                 items.append({
-                    'menu_item_id': item_row[0],
-                    'name': item_row[1],
-                    'quantity': item_row[2],
-                    'price': item_row[3],
-                    'customer_request': item_row[4],
-                    'status': item_row[5] if item_row[5] else 'completed',
-                    'total_price': item_row[2] * item_row[3]
+                    'menu_item_id': item_row['menu_item_id'],
+                    'name': item_row['item_name'],
+                    'quantity': item_row['quantity'],
+                    'price': item_row['price'],
+                    'customer_request': item_row['customer_request'],
+                    'status': item_row['status'] if item_row['status'] else 'completed',
+                    'total_price': item_row['quantity'] * item_row['price']
                 })
             
             order_data['items'] = items
             orders.append(order_data)
         
-        conn.close()
-        
         return jsonify({
             'success': True,
             'data': orders
@@ -2976,6 +3248,9 @@ def export_order_history():
         table_id = request.args.get('table_id')
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
+        date_error = invalid_date_param(start_date=start_date, end_date=end_date)
+        if date_error:
+            return date_error
         
         conn = db.get_connection()
         cursor = conn.cursor()
@@ -3001,13 +3276,9 @@ def export_order_history():
             query += " AND o.table_id = ?"
             params.append(table_id)
             
-        if start_date:
-            query += " AND date(o.created_at) >= ?"
-            params.append(start_date)
-            
-        if end_date:
-            query += " AND date(o.created_at) <= ?"
-            params.append(end_date)
+        date_clause, date_params = date_range_predicate('o.created_at', start_date, end_date)
+        query += date_clause
+        params.extend(date_params)
             
         query += " ORDER BY o.created_at DESC"
         
@@ -3039,11 +3310,7 @@ def export_order_history():
         if table_id:
             items_query += " AND o.table_id = ?"
             
-        if start_date:
-            items_query += " AND date(o.created_at) >= ?"
-            
-        if end_date:
-            items_query += " AND date(o.created_at) <= ?"
+        items_query += date_clause
             
         items_query += ")"
         
@@ -3250,7 +3517,7 @@ def upload_menu_image():
                     try:
                         os.remove(old_file)
                     except Exception as e:
-                        print(f"ไม่สามารถลบไฟล์เดิม {old_file}: {e}")
+                        log.error('ไม่สามารถลบไฟล์เดิม %s: %s', old_file, e)
             
             # บันทึกไฟล์ชั่วคราว
             temp_file_path = os.path.join(UPLOAD_FOLDER, f"temp_{unique_filename}")
@@ -3298,9 +3565,9 @@ def upload_menu_image():
                             menu_item.get('preparation_time', 15)
                         )
                         if not success:
-                            print(f"ไม่สามารถอัปเดต image_url ในฐานข้อมูลสำหรับเมนู ID: {menu_id}")
+                            log.error('ไม่สามารถอัปเดต image_url ในฐานข้อมูลสำหรับเมนู ID: %s', menu_id)
                 except Exception as e:
-                    print(f"เกิดข้อผิดพลาดในการอัปเดตฐานข้อมูล: {e}")
+                    log.error('เกิดข้อผิดพลาดในการอัปเดตฐานข้อมูล: %s', e)
             
             return jsonify({
                 'success': True,
@@ -3332,6 +3599,9 @@ def get_dashboard_data():
         start_date = request.args.get('start')
         end_date = request.args.get('end')
         range_param = request.args.get('range')
+        date_error = invalid_date_param(start=start_date, end=end_date)
+        if date_error:
+            return date_error
         
         # Import datetime modules
         from datetime import date, timedelta
@@ -3358,23 +3628,7 @@ def get_dashboard_data():
             start_date = start_date_obj.strftime('%Y-%m-%d')
             end_date = today_date.strftime('%Y-%m-%d')
         
-        print(f"[DEBUG] Dashboard API called with range={range_param}, start={start_date}, end={end_date}")
-        
-        # ดึงข้อมูลจากฐานข้อมูล
-        orders = db.get_orders_by_date_range(start_date, end_date)
-        print(f"[DEBUG] Orders from get_orders_by_date_range({start_date}, {end_date}): {len(orders)}")
-        for i, order in enumerate(orders[:3]):  # แสดงแค่ 3 รายการแรก
-            print(f"[DEBUG] Order {i+1}: ID={order.get('order_id')}, status={order.get('status')}, amount={order.get('total_amount')}")
-        
-        # คำนวณข้อมูลสำหรับ dashboard
-        period_sales = 0
-        today_sales = 0
-        week_sales = 0
-        month_sales = 0
-        total_customers = 0
-        daily_sales = {}
-        category_sales = {}
-        top_items = []
+        log.debug('Dashboard API called with range=%s, start=%s, end=%s', range_param, start_date, end_date)
         
         # วันนี้
         today_date = date.today()
@@ -3388,71 +3642,34 @@ def get_dashboard_data():
         # เดือนนี้
         month_start = today_date.replace(day=1).strftime('%Y-%m-%d')
         
-        # ดึงข้อมูลสำหรับแต่ละช่วงเวลา
-        today_orders = db.get_orders_by_date_range(today_str, today_str)
-        week_orders = db.get_orders_by_date_range(week_start, week_end)
-        month_orders = db.get_orders_by_date_range(month_start, today_str)
-        
-        # คำนวณยอดขาย (รวมทุกสถานะยกเว้น rejected)
-        for order in today_orders:
-            if order.get('status') != 'rejected':
-                today_sales += order.get('total_amount', 0)
-                
-        for order in week_orders:
-            if order.get('status') != 'rejected':
-                week_sales += order.get('total_amount', 0)
-                
-        for order in month_orders:
-            if order.get('status') != 'rejected':
-                month_sales += order.get('total_amount', 0)
-        
-
+        # คำนวณยอดขายทุกช่วงเวลาในคิวรีเดียว (รวมทุกสถานะยกเว้น rejected)
+        totals = sales_report.window_totals({
+            'period': (start_date, end_date),
+            'today': (today_str, today_str),
+            'week': (week_start, week_end),
+            'month': (month_start, today_str)
+        })
+        period_sales = totals['period']['total']
+        today_sales = totals['today']['total']
+        week_sales = totals['week']['total']
+        month_sales = totals['month']['total']
+        total_customers = totals['period']['orders']
+        log.debug('Dashboard totals: %s', totals)
         
-        # ยอดขายในช่วงที่เลือก
-        for order in orders:
-            if order.get('status') != 'rejected':
-                period_sales += order.get('total_amount', 0)
-                total_customers += 1
-                
-                # จัดกลุ่มตามวันที่สำหรับ chart
-                order_date = order.get('created_at', '')[:10]  # YYYY-MM-DD
-                if order_date not in daily_sales:
-                    daily_sales[order_date] = {'sales': 0, 'orders': 0}
-                daily_sales[order_date]['sales'] += order.get('total_amount', 0)
-                daily_sales[order_date]['orders'] += 1
+        # จัดกลุ่มตามวันที่สำหรับ chart
+        daily_sales = sales_report.daily_sales(start_date, end_date)
         
         # สร้างข้อมูล mock สำหรับ category sales
+        category_sales = {}
         categories = db.get_menu_categories()
         for cat in categories:
             category_sales[cat['name']] = 0
         
         # ข้อมูล top items จากข้อมูลจริงในช่วงเวลาที่เลือก
         try:
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT mi.name, SUM(oi.quantity) as total_quantity, SUM(oi.total_price) as total_sales
-                FROM order_items oi
-                JOIN menu_items mi ON oi.item_id = mi.item_id
-                JOIN orders o ON oi.order_id = o.order_id
-                WHERE o.status != 'rejected'
-                AND DATE(o.created_at) BETWEEN ? AND ?
-                GROUP BY mi.item_id, mi.name
-                ORDER BY total_quantity DESC
-                LIMIT 5
-            """, (start_date, end_date))
-            
-            for row in cursor.fetchall():
-                top_items.append({
-                    'name': row['name'],
-                    'quantity': int(row['total_quantity']),
-                    'sales': float(row['total_sales']) if row['total_sales'] else 0
-                })
-            
-            conn.close()
+            top_items = sales_report.top_items(start_date, end_date, 5)
         except Exception as e:
-            print(f"[ERROR] Failed to get top items: {e}")
+            log.error('Failed to get top items: %s', e)
             # Fallback to empty list if query fails
             top_items = []
         
@@ -3469,15 +3686,15 @@ def get_dashboard_data():
             'monthlyTrend': []
         }
         
-        print(f"[DEBUG] ===== FINAL RESPONSE ===== {response_data}")
-        print(f"[DEBUG] ===== DASHBOARD API COMPLETED =====")
+        log.debug('===== FINAL RESPONSE ===== %s', response_data)
+        log.debug('===== DASHBOARD API COMPLETED =====')
         return jsonify({
             'success': True,
             'data': response_data
         })
         
     except Exception as e:
-        print(f"[ERROR] Dashboard API error: {e}")
+        log.error('Dashboard API error: %s', e)
         return jsonify({
             'success': False,
             'error': str(e),
@@ -3499,61 +3716,45 @@ def get_dashboard_data():
 def get_sales_summary():
     """API สำหรับข้อมูลสรุปยอดขาย"""
     try:
-        print("[DEBUG SALES] Sales summary API called")
+        log.debug('Sales summary API called')
         
         from datetime import date, timedelta
         today = date.today()
         today_str = today.strftime('%Y-%m-%d')
-        print(f"[DEBUG SALES] Today date: {today_str}")
+        log.debug('Today date: %s', today_str)
         
         # สัปดาห์นี้ (จันทร์ถึงอาทิตย์)
         days_since_monday = today.weekday()  # 0=จันทร์, 6=อาทิตย์
         week_start = (today - timedelta(days=days_since_monday)).strftime('%Y-%m-%d')
         week_end = (today + timedelta(days=6-days_since_monday)).strftime('%Y-%m-%d')
-        print(f"[DEBUG SALES] Week range: {week_start} to {week_end}")
+        log.debug('Week range: %s to %s', week_start, week_end)
         
         # เดือนนี้
         month_start = today.replace(day=1).strftime('%Y-%m-%d')
-        print(f"[DEBUG SALES] Month range: {month_start} to {today_str}")
-        
-        # ดึงข้อมูลจากฐานข้อมูล
-        today_orders = db.get_orders_by_date_range(today_str, today_str)
-        print(f"[DEBUG SALES] Today orders count: {len(today_orders)}")
-        
-        week_orders = db.get_orders_by_date_range(week_start, week_end)
-        print(f"[DEBUG SALES] Week orders count: {len(week_orders)}")
-        
-        month_orders = db.get_orders_by_date_range(month_start, today_str)
-        print(f"[DEBUG SALES] Month orders count: {len(month_orders)}")
-        
-        # ใช้วันที่เริ่มต้นที่เก่ามากเพื่อดึงออเดอร์ทั้งหมด
-        all_orders = db.get_orders_by_date_range('2020-01-01', today_str)
-        print(f"[DEBUG SALES] All orders count: {len(all_orders)}")
-        
-        # คำนวณยอดขาย (รวมทุกสถานะยกเว้น rejected)
-        today_completed = [o for o in today_orders if o.get('status') != 'rejected']
-        today_total = sum(order.get('total_amount', 0) for order in today_completed)
-        print(f"[DEBUG SALES] Today non-rejected orders: {len(today_completed)}, total: {today_total}")
-        
-        week_completed = [o for o in week_orders if o.get('status') != 'rejected']
-        week_total = sum(order.get('total_amount', 0) for order in week_completed)
-        print(f"[DEBUG SALES] Week non-rejected orders: {len(week_completed)}, total: {week_total}")
-        
-        month_completed = [o for o in month_orders if o.get('status') != 'rejected']
-        month_total = sum(order.get('total_amount', 0) for order in month_completed)
-        print(f"[DEBUG SALES] Month non-rejected orders: {len(month_completed)}, total: {month_total}")
+        log.debug('Month range: %s to %s', month_start, today_str)
+        
+        # คำนวณยอดขายทุกช่วงเวลาในคิวรีเดียว (รวมทุกสถานะยกเว้น rejected)
+        # ช่วง total ใช้วันที่เริ่มต้นที่เก่ามากเพื่อรวมออเดอร์ทั้งหมด
+        totals = sales_report.window_totals({
+            'today': (today_str, today_str),
+            'week': (week_start, week_end),
+            'month': (month_start, today_str),
+            'total': ('2020-01-01', today_str)
+        })
+        log.debug('Totals: %s', totals)
         
-        all_completed = [o for o in all_orders if o.get('status') != 'rejected']
-        total_total = sum(order.get('total_amount', 0) for order in all_completed)
-        print(f"[DEBUG SALES] All non-rejected orders: {len(all_completed)}, total: {total_total}")
+        today_total = totals['today']['total']
+        week_total = totals['week']['total']
+        month_total = totals['month']['total']
+        total_total = totals['total']['total']
         
         # นับจำนวน orders
-        today_orders_count = len([o for o in today_orders if o.get('status') != 'rejected'])
-        week_orders_count = len([o for o in week_orders if o.get('status') != 'rejected'])
-        month_orders_count = len([o for o in month_orders if o.get('status') != 'rejected'])
+        today_orders_count = totals['today']['orders']
+        week_orders_count = totals['week']['orders']
+        month_orders_count = totals['month']['orders']
         
         # นับจำนวน sessions (ใช้ table_id ที่ unique)
-        today_sessions = len(set(order.get('table_id') for order in today_orders if order.get('status') != 'rejected'))
+        today_sessions = totals['today']['sessions']
         
         response_data = {
             'success': True,
@@ -3577,11 +3778,11 @@ def get_sales_summary():
             }
         }
         
-        print(f"[DEBUG] Sales summary response: {response_data}")
+        log.debug('Sales summary response: %s', response_data)
         return jsonify(response_data)
         
     except Exception as e:
-        print(f"[ERROR] Sales summary API error: {e}")
+        log.error('Sales summary API error: %s', e)
         return jsonify({
             'success': False,
             'error': str(e),
@@ -3600,7 +3801,7 @@ def get_monthly_sales_summary():
         year = request.args.get('year')
         month = request.args.get('month')
         
-        print(f"[DEBUG] Monthly sales summary API called with year={year}, month={month}")
+        log.debug('Monthly sales summary API called with year=%s, month=%s', year, month)
         
         if not year or not month:
             return jsonify({'success': False, 'error': 'Missing year or month parameter'}), 400
@@ -3613,12 +3814,10 @@ def get_monthly_sales_summary():
         last_day = calendar.monthrange(int(year), int(month))[1]
         end_date = f"{year}-{month.zfill(2)}-{last_day:02d}"
         
-        # ดึงข้อมูลจากฐานข้อมูล
-        orders = db.get_orders_by_date_range(start_date, end_date)
-        
-        # คำนวณยอดขาย (รวมทุกสถานะยกเว้น rejected)
-        total = sum(order.get('total_amount', 0) for order in orders if order.get('status') != 'rejected')
-        sessions = len(set(order.get('table_id') for order in orders if order.get('status') != 'rejected'))
+        # คำนวณยอดขาย (รวมทุกสถานะยกเว้น rejected) จาก daily_sales_rollup + ข้อมูลดิบของวันนี้
+        summary = sales_report.range_summary(start_date, end_date)
+        total = summary['total']
+        sessions = summary['sessions']
         
         response_data = {
             'success': True,
@@ -3626,11 +3825,11 @@ def get_monthly_sales_summary():
             'sessions': sessions
         }
         
-        print(f"[DEBUG] Monthly sales summary response: {response_data}")
+        log.debug('Monthly sales summary response: %s', response_data)
         return jsonify(response_data)
         
     except Exception as e:
-        print(f"[ERROR] Monthly sales summary API error: {e}")
+        log.error('Monthly sales summary API error: %s', e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/sales-summary/custom', methods=['GET'])
@@ -3639,18 +3838,19 @@ def get_custom_sales_summary():
     try:
         start_date = request.args.get('startDate')
         end_date = request.args.get('endDate')
+        date_error = invalid_date_param(startDate=start_date, endDate=end_date)
+        if date_error:
+            return date_error
         
-        print(f"[DEBUG] Custom sales summary API called with startDate={start_date}, endDate={end_date}")
+        log.debug('Custom sales summary API called with startDate=%s, endDate=%s', start_date, end_date)
         
         if not start_date or not end_date:
             return jsonify({'success': False, 'error': 'Missing startDate or endDate parameter'}), 400
         
-        # ดึงข้อมูลจากฐานข้อมูล
-        orders = db.get_orders_by_date_range(start_date, end_date)
-        
-        # คำนวณยอดขาย (รวมทุกสถานะยกเว้น rejected)
-        total = sum(order.get('total_amount', 0) for order in orders if order.get('status') != 'rejected')
-        sessions = len(set(order.get('table_id') for order in orders if order.get('status') != 'rejected'))
+        # คำนวณยอดขาย (รวมทุกสถานะยกเว้น rejected) จาก daily_sales_rollup + ข้อมูลดิบของวันนี้
+        summary = sales_report.range_summary(start_date, end_date)
+        total = summary['total']
+        sessions = summary['sessions']
         
         response_data = {
             'success': True,
@@ -3658,11 +3858,11 @@ def get_custom_sales_summary():
             'sessions': sessions
         }
         
-        print(f"[DEBUG] Custom sales summary response: {response_data}")
+        log.debug('Custom sales summary response: %s', response_data)
         return jsonify(response_data)
         
     except Exception as e:
-        print(f"[ERROR] Custom sales summary API error: {e}")
+        log.error('Custom sales summary API error: %s', e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/sales-chart', methods=['GET'])
@@ -3671,27 +3871,10 @@ def get_sales_chart():
     try:
         days = request.args.get('days', 7, type=int)
         
-        # ดึงข้อมูลยอดขายตามวัน
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT DATE(created_at) as date, SUM(total_amount) as total
-            FROM orders 
-            WHERE status != 'rejected' 
-            AND DATE(created_at) >= DATE('now', '-{} days')
-            GROUP BY DATE(created_at)
-            ORDER BY date
-        """.format(days))
-        
-        sales_data = []
-        for row in cursor.fetchall():
-            sales_data.append({
-                'date': row['date'],
-                'total': float(row['total']) if row['total'] else 0
-            })
-        
-        conn.close()
+        # ดึงข้อมูลยอดขายตามวัน นับย้อนหลังจากวันนี้ตามเวลาไทย
+        # (วันที่ปิดแล้วอ่านจาก daily_sales_rollup วันนี้อ่านจากข้อมูลดิบ)
+        start_date = (get_thai_datetime() - timedelta(days=days)).strftime('%Y-%m-%d')
+        sales_data = sales_report.sales_chart(start_date)
         
         return jsonify({
             'success': True,
@@ -3699,7 +3882,7 @@ def get_sales_chart():
         })
         
     except Exception as e:
-        print(f"[ERROR] Sales chart API error: {e}")
+        log.error('Sales chart API error: %s', e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/top-items', methods=['GET'])
@@ -3708,29 +3891,7 @@ def get_top_items():
     try:
         limit = request.args.get('limit', 5, type=int)
         
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT mi.name, SUM(oi.quantity) as total_quantity, SUM(oi.total_price) as total_sales
-            FROM order_items oi
-            JOIN menu_items mi ON oi.item_id = mi.item_id
-            JOIN orders o ON oi.order_id = o.order_id
-            WHERE o.status != 'rejected'
-            GROUP BY mi.item_id, mi.name
-            ORDER BY total_quantity DESC
-            LIMIT ?
-        """, (limit,))
-        
-        top_items = []
-        for row in cursor.fetchall():
-            top_items.append({
-                'name': row['name'],
-                'quantity': int(row['total_quantity']),
-                'sales': float(row['total_sales']) if row['total_sales'] else 0
-            })
-        
-        conn.close()
+        top_items = sales_report.item_sales(limit)
         
         return jsonify({
             'success': True,
@@ -3738,35 +3899,14 @@ def get_top_items():
         })
         
     except Exception as e:
-        print(f"[ERROR] Top items API error: {e}")
+        log.error('Top items API error: %s', e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/category-chart', methods=['GET'])
 def get_category_chart():
     """ดึงข้อมูลกราฟยอดขายตามหมวดหมู่"""
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT mc.name as category_name, SUM(oi.total_price) as total_sales
-            FROM order_items oi
-            JOIN menu_items mi ON oi.item_id = mi.item_id
-            JOIN menu_categories mc ON mi.category_id = mc.category_id
-            JOIN orders o ON oi.order_id = o.order_id
-            WHERE o.status != 'rejected'
-            GROUP BY mc.category_id, mc.name
-            ORDER BY total_sales DESC
-        """)
-        
-        category_data = []
-        for row in cursor.fetchall():
-            category_data.append({
-                'category': row['category_name'],
-                'sales': float(row['total_sales']) if row['total_sales'] else 0
-            })
-        
-        conn.close()
+        category_data = sales_report.category_sales()
         
         return jsonify({
             'success': True,
@@ -3774,7 +3914,7 @@ def get_category_chart():
         })
         
     except Exception as e:
-        print(f"[ERROR] Category chart API error: {e}")
+        log.error('Category chart API error: %s', e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/restaurant-info', methods=['GET'])
@@ -3809,7 +3949,7 @@ def get_restaurant_info():
         })
         
     except Exception as e:
-        print(f"[ERROR] Restaurant info API error: {e}")
+        log.error('Restaurant info API error: %s', e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/restaurant-info', methods=['POST'])
@@ -3845,7 +3985,7 @@ def save_restaurant_info():
         })
         
     except Exception as e:
-        print(f"[ERROR] Save restaurant info API error: {e}")
+        log.error('Save restaurant info API error: %s', e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 # ==================== LOGIN API ====================
@@ -3869,7 +4009,7 @@ def login():
             session['username'] = username
             session['login_time'] = datetime.now().isoformat()
             
-            print(f"[LOGIN] User '{username}' logged in successfully")
+            log.info("[LOGIN] User '%s' logged in successfully", username)
             
             return jsonify({
                 'success': True,
@@ -3877,14 +4017,14 @@ def login():
                 'user': username
             })
         else:
-            print(f"[LOGIN] Failed login attempt for username: '{username}'")
+            log.info("[LOGIN] Failed login attempt for username: '%s'", username)
             return jsonify({
                 'success': False,
                 'message': 'ชื่อผู้ใช้หรือรหัสผ่านไม่ถูกต้อง'
             }), 401
             
     except Exception as e:
-        print(f"[ERROR] Login API error: {e}")
+        log.error('Login API error: %s', e)
         return jsonify({'success': False, 'message': 'เกิดข้อผิดพลาดในระบบ'}), 500
 
 @app.route('/api/logout', methods=['POST'])
@@ -3894,7 +4034,7 @@ def logout():
         username = session.get('username', 'Unknown')
         session.clear()
         
-        print(f"[LOGOUT] User '{username}' logged out")
+        log.info("[LOGOUT] User '%s' logged out", username)
         
         return jsonify({
             'success': True,
@@ -3902,7 +4042,7 @@ def logout():
         })
         
     except Exception as e:
-        print(f"[ERROR] Logout API error: {e}")
+        log.error('Logout API error: %s', e)
         return jsonify({'success': False, 'message': 'เกิดข้อผิดพลาดในระบบ'}), 500
 
 @app.route('/api/check-auth', methods=['GET'])
@@ -3923,7 +4063,7 @@ def check_auth():
             })
             
     except Exception as e:
-        print(f"[ERROR] Check auth API error: {e}")
+        log.error('Check auth API error: %s', e)
         return jsonify({'success': False, 'message': 'เกิดข้อผิดพลาดในระบบ'}), 500
 
 if __name__ == '__main__':
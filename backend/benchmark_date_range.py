@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+เปรียบเทียบความเร็วการกรองช่วงวันที่ระหว่าง DATE(created_at) BETWEEN ? AND ?
+กับเงื่อนไข half-open จาก date_range_predicate บนฐานข้อมูลจำลอง
+
+ใช้งาน: python benchmark_date_range.py [จำนวนออเดอร์ ...]   (ค่าเริ่มต้น 100000 1000000)
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from database import date_range_predicate
+from migrations import run_migrations
+
+def build_database(path: str, order_count: int):
+    """สร้างฐานข้อมูลจำลองที่มีออเดอร์กระจายตลอด 2 ปี"""
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.executescript('''
+        CREATE TABLE tables (table_id INTEGER PRIMARY KEY, table_name TEXT, status TEXT, session_id TEXT);
+        CREATE TABLE menu_items (item_id INTEGER PRIMARY KEY, name TEXT, price REAL);
+        CREATE TABLE menu_categories (category_id INTEGER PRIMARY KEY, name TEXT, sort_order INTEGER DEFAULT 0);
+        CREATE TABLE orders (order_id INTEGER PRIMARY KEY, table_id INTEGER, session_id TEXT,
+                             status TEXT, bill_status TEXT DEFAULT 'unchecked', total_amount REAL,
+                             created_at TIMESTAMP, completed_at TIMESTAMP);
+        CREATE TABLE order_items (order_item_id INTEGER PRIMARY KEY, order_id INTEGER, item_id INTEGER);
+        CREATE TABLE order_history_items (history_item_id INTEGER PRIMARY KEY, order_id INTEGER);
+        CREATE TABLE notifications (notification_id INTEGER PRIMARY KEY, is_read BOOLEAN, created_at TIMESTAMP);
+    ''')
+    conn.executemany('INSERT INTO tables VALUES (?, ?, ?, ?)',
+                     [(i, f'โต๊ะ {i}', 'available', None) for i in range(1, 21)])
+    start = datetime(2024, 1, 1)
+    span = int(timedelta(days=730).total_seconds())
+    rng = random.Random(42)
+    batch = []
+    for order_id in range(1, order_count + 1):
+        created = start + timedelta(seconds=rng.randrange(span))
+        batch.append((order_id, rng.randint(1, 20), f's{order_id}', 'completed',
+                      rng.randint(50, 2000), created.strftime('%Y-%m-%d %H:%M:%S')))
+        if len(batch) >= 50000:
+            conn.executemany('INSERT INTO orders (order_id, table_id, session_id, status, total_amount, created_at) '
+                             'VALUES (?, ?, ?, ?, ?, ?)', batch)
+            batch = []
+    if batch:
+        conn.executemany('INSERT INTO orders (order_id, table_id, session_id, status, total_amount, created_at) '
+                         'VALUES (?, ?, ?, ?, ?, ?)', batch)
+    with conn:
+        run_migrations(conn)
+    conn.execute('ANALYZE')
+    conn.commit()
+    return conn
+
+def time_query(conn: sqlite3.Connection, sql: str, params, repeat: int) -> float:
+    """เวลาเฉลี่ยต่อครั้ง (มิลลิวินาที)"""
+    conn.execute(sql, params).fetchall()  # warm up
+    began = time.perf_counter()
+    for _ in range(repeat):
+        conn.execute(sql, params).fetchall()
+    return (time.perf_counter() - began) * 1000 / repeat
+
+def run(order_count: int, repeat: int = 20):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    print(f"\n=== {order_count:,} orders ===")
+    conn = build_database(path, order_count)
+    ranges = [('1 day', '2025-03-15', '2025-03-15'),
+              ('7 days', '2025-03-10', '2025-03-16'),
+              ('30 days', '2025-03-01', '2025-03-30')]
+    base = '''
+        SELECT o.order_id, o.total_amount, o.created_at, t.table_name
+        FROM orders o JOIN tables t ON o.table_id = t.table_id
+        WHERE {where}
+        ORDER BY o.created_at DESC
+    '''
+    for label, start_date, end_date in ranges:
+        old_sql = base.format(where='DATE(o.created_at) BETWEEN ? AND ?')
+        old_ms = time_query(conn, old_sql, (start_date, end_date), repeat)
+        clause, params = date_range_predicate('o.created_at', start_date, end_date)
+        new_sql = base.format(where='1=1' + clause)
+        new_ms = time_query(conn, new_sql, params, repeat)
+        old_rows = conn.execute(old_sql, (start_date, end_date)).fetchall()
+        new_rows = conn.execute(new_sql, params).fetchall()
+        assert old_rows == new_rows, 'ผลลัพธ์ไม่ตรงกัน'
+        print(f"  {label:>8}: DATE() {old_ms:8.2f} ms | half-open {new_ms:8.2f} ms "
+              f"| x{old_ms / new_ms:6.1f} | rows {len(new_rows)}")
+    conn.close()
+    os.remove(path)
+
+if __name__ == '__main__':
+    counts = [int(arg) for arg in sys.argv[1:]] or [100000, 1000000]
+    for count in counts:
+        run(count)
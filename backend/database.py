@@ -7,19 +7,31 @@ Database Manager สำหรับระบบ POS ร้านอาหาร
 import sqlite3
 import os
 import json
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime, timezone, timedelta
 from typing import List, Dict, Optional, Tuple
 from models import Table, MenuCategory, MenuItem, Order, OrderItem, Receipt, SystemConfig
+from migrations import run_migrations, get_schema_version, check_query_plans, QueryPlanRegression, CHANGE_FEED_TABLES
+from utils.diagnostics import get_logger
+from utils.kitchen_queue import KitchenQueue, KITCHEN_ITEM_STATUSES, KITCHEN_ORDER_STATUSES
 import pytz
 
-# Import Google Sheets integration
+log = get_logger('pos.db')
+
+# Import Google Sheets integration (backend/ เป็น working directory เหมือนโมดูลอื่น จึงใช้ absolute import)
 try:
-    from .google_sheets import is_google_sheets_enabled
-    from .new_google_sheets_sync import sync_order_to_new_format
-except ImportError:
-    print("Warning: Google Sheets integration not available")
+    from google_sheets import is_google_sheets_enabled
+    from new_google_sheets_sync import sync_order_to_new_format, rebuild_orders_sheet
+except ImportError as e:
+    log.warning('Google Sheets integration not available: %s', e)
     def sync_order_to_new_format(*args, **kwargs):
         return False
+    def rebuild_orders_sheet(*args, **kwargs):
+        return False
     def is_google_sheets_enabled():
         return False
 
@@ -33,19 +45,514 @@ def get_thai_datetime_string():
     """ได้รับเวลาปัจจุบันในโซนเวลาไทยในรูปแบบ string"""
     return get_thai_datetime().strftime('%Y-%m-%d %H:%M:%S')
 
+def day_range_bounds(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    """แปลงช่วงวันที่ YYYY-MM-DD (รวมวันสุดท้าย) เป็นขอบเขตเวลาแบบ half-open [start, end) ในรูปแบบเดียวกับ get_thai_datetime_string"""
+    lower = upper = None
+    if start_date:
+        lower = datetime.strptime(start_date[:10], '%Y-%m-%d').strftime('%Y-%m-%d %H:%M:%S')
+    if end_date:
+        next_day = datetime.strptime(end_date[:10], '%Y-%m-%d') + timedelta(days=1)
+        upper = next_day.strftime('%Y-%m-%d %H:%M:%S')
+    return lower, upper
+
+def date_range_predicate(column: str, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Tuple[str, List[str]]:
+    """สร้างเงื่อนไข SQL ช่วงวันที่ที่ใช้ดัชนีของคอลัมน์ได้ (ไม่ครอบคอลัมน์ด้วย DATE())
+
+    คืนค่า (" AND col >= ? AND col < ?", params) เพื่อต่อท้าย WHERE ได้ทันที
+    """
+    lower, upper = day_range_bounds(start_date, end_date)
+    clause = ''
+    params = []
+    if lower:
+        clause += f" AND {column} >= ?"
+        params.append(lower)
+    if upper:
+        clause += f" AND {column} < ?"
+        params.append(upper)
+    return clause, params
+
+class OrderItemsRejected(Exception):
+    """รายการอาหารในคำสั่งซื้อไม่ถูกต้อง ใช้ยกเลิก transaction ของ DatabaseManager.place_order ทั้งหมด"""
+
+class PooledConnection:
+    """ตัวห่อ sqlite3.Connection ที่คืนการเชื่อมต่อกลับเข้าพูลเมื่อเรียก close()"""
+
+    def __init__(self, pool: 'ConnectionPool', conn: sqlite3.Connection):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._conn.__exit__(exc_type, exc_value, traceback)
+
+    def close(self):
+        """คืนการเชื่อมต่อกลับเข้าพูล (เรียกซ้ำได้)"""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn)
+
+    def __del__(self):
+        # กันกรณีโค้ดเดิมลืม close() ให้คืนการเชื่อมต่อเมื่อถูกเก็บกวาด
+        try:
+            self.close()
+        except Exception:
+            pass
+
+# ค่า PRAGMA เริ่มต้นที่ใช้กับทุกการเชื่อมต่อ (override ได้ผ่าน system_config)
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,      # มิลลิวินาที
+    'cache_size': -16000,      # ค่าติดลบ = KiB (ประมาณ 16MB)
+    'mmap_size': 67108864,     # 64MB
+    'temp_store': 'MEMORY'
+}
+
+# ค่าที่อนุญาตสำหรับ PRAGMA แบบข้อความ (PRAGMA ใช้ parameter binding ไม่ได้)
+PRAGMA_CHOICES = {
+    'journal_mode': ('WAL', 'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'OFF'),
+    'synchronous': ('OFF', 'NORMAL', 'FULL', 'EXTRA'),
+    'temp_store': ('DEFAULT', 'FILE', 'MEMORY')
+}
+
+def normalize_pragmas(overrides: Dict) -> Tuple[Dict, List[str]]:
+    """ตรวจสอบค่า PRAGMA ที่ตั้งมา คืนค่า (pragmas ที่ใช้ได้, รายการค่าที่ไม่ถูกต้อง)"""
+    pragmas = dict(DEFAULT_PRAGMAS)
+    errors = []
+    for name, raw in overrides.items():
+        if name not in DEFAULT_PRAGMAS or raw is None or str(raw).strip() == '':
+            continue
+        if name in PRAGMA_CHOICES:
+            value = str(raw).strip().upper()
+            if value not in PRAGMA_CHOICES[name]:
+                errors.append(f"{name}={raw}")
+                continue
+            pragmas[name] = value
+        else:
+            try:
+                pragmas[name] = int(str(raw).strip())
+            except ValueError:
+                errors.append(f"{name}={raw}")
+    return pragmas, errors
+
+class ConnectionPool:
+    """พูลการเชื่อมต่อ SQLite แบบจำกัดขนาด ใช้การเชื่อมต่อที่ตั้งค่าแล้วซ้ำข้ามคำขอ"""
+
+    def __init__(self, db_path: str, max_size: int = 8, pragmas: Optional[Dict] = None):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.pragmas = dict(pragmas or DEFAULT_PRAGMAS)
+        self._idle = queue.LifoQueue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.discarded = 0
+
+    def _create_connection(self) -> sqlite3.Connection:
+        """เปิดการเชื่อมต่อใหม่และตั้งค่าพื้นฐาน"""
+        pragmas = self.pragmas
+        conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                               timeout=pragmas['busy_timeout'] / 1000.0)
+        conn.row_factory = sqlite3.Row  # ให้ผลลัพธ์เป็น dict-like
+        self._apply_pragmas(conn, pragmas)
+        with self._lock:
+            self.created += 1
+        return conn
+
+    @staticmethod
+    def _apply_pragmas(conn: sqlite3.Connection, pragmas: Dict):
+        """ตั้งค่า PRAGMA ให้การเชื่อมต่อ (ค่าผ่านการตรวจสอบจาก normalize_pragmas แล้ว)"""
+        conn.execute(f"PRAGMA busy_timeout = {int(pragmas['busy_timeout'])}")
+        try:
+            conn.execute(f"PRAGMA journal_mode = {pragmas['journal_mode']}")
+        except sqlite3.OperationalError as e:
+            # เปลี่ยน journal mode ไม่ได้ขณะที่การเชื่อมต่ออื่นถือ lock อยู่ ใช้ค่าเดิมของไฟล์ไปก่อน
+            log.warning('cannot set journal_mode=%s: %s', pragmas['journal_mode'], e)
+        conn.execute(f"PRAGMA synchronous = {pragmas['synchronous']}")
+        conn.execute(f"PRAGMA cache_size = {int(pragmas['cache_size'])}")
+        conn.execute(f"PRAGMA mmap_size = {int(pragmas['mmap_size'])}")
+        conn.execute(f"PRAGMA temp_store = {pragmas['temp_store']}")
+
+    def configure(self, pragmas: Dict):
+        """เปลี่ยนค่า PRAGMA ของพูล การเชื่อมต่อที่ว่างอยู่จะถูกปิดเพื่อเปิดใหม่ด้วยค่าใหม่"""
+        self.pragmas = dict(pragmas)
+        self.close_all()
+
+    def _reset_after_fork(self):
+        """ทิ้งการเชื่อมต่อที่สืบทอดมาจาก process แม่ (เช่น gunicorn --preload)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._idle = queue.LifoQueue(maxsize=self.max_size)
+            self._pid = os.getpid()
+
+    def acquire(self) -> sqlite3.Connection:
+        """ยืมการเชื่อมต่อจากพูล หรือเปิดใหม่ถ้าพูลว่าง"""
+        self._reset_after_fork()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self.misses += 1
+            return self._create_connection()
+        with self._lock:
+            self.hits += 1
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        """คืนการเชื่อมต่อเข้าพูล ยกเลิก transaction ที่ค้างอยู่ก่อนเสมอ"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            # การเชื่อมต่อเสีย (transaction อาจยังค้างและถือ lock อยู่) ปิดทิ้ง ไม่นำกลับมาใช้
+            log.warning('Discarding pooled connection after failed rollback: %s', e)
+            self._discard(conn)
+            return
+        if self._pid != os.getpid():
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            self._discard(conn)
+
+    def _discard(self, conn: sqlite3.Connection):
+        """ปิดการเชื่อมต่อที่ไม่นำกลับเข้าพูล"""
+        with self._lock:
+            self.discarded += 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def close_all(self):
+        """ปิดการเชื่อมต่อที่ว่างอยู่ทั้งหมด"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+
+    def stats(self) -> Dict:
+        """สถิติการใช้งานพูล"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'max_size': self.max_size,
+                'idle': self._idle.qsize(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+                'created': self.created,
+                'discarded': self.discarded
+            }
+
+class VersionCounter:
+    """ตัวนับเวอร์ชันของข้อมูลในหน่วยความจำ เพิ่มค่าทุกครั้งที่ข้อมูลถูกแก้ไข ใช้สร้าง ETag / Last-Modified"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self.version = 0
+        self.modified_at = time.time()
+
+    def bump(self):
+        """เพิ่มเวอร์ชัน เรียกหลังจาก commit การแก้ไข"""
+        with self._lock:
+            self.version += 1
+            self.modified_at = time.time()
+            self._changed.notify_all()
+
+    def wait_for_change(self, version: int, timeout: float) -> int:
+        """รอจนเวอร์ชันเปลี่ยนจาก version หรือหมดเวลา คืนค่าเวอร์ชันปัจจุบัน"""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+# สถานะโต๊ะและการเปลี่ยนสถานะที่อนุญาต (สถานะเดิม -> สถานะใหม่)
+# 'checkout' เป็นสถานะเดิมของระบบรุ่นก่อน ยังอ่านได้แต่ไม่มีการเปลี่ยนเข้าสู่สถานะนี้แล้ว
+TABLE_TRANSITIONS = {
+    'available': {'available', 'occupied'},
+    'occupied': {'occupied', 'calling', 'waiting_payment', 'needs_clearing', 'available'},
+    'calling': {'calling', 'occupied', 'waiting_payment', 'needs_clearing', 'available'},
+    'waiting_payment': {'waiting_payment', 'occupied', 'calling', 'needs_clearing', 'available'},
+    'needs_clearing': {'needs_clearing', 'occupied', 'available'},
+    'checkout': {'occupied', 'needs_clearing', 'available'},
+}
+
+# ค่าเริ่มต้นของ session_id ใน transition_table: คง session_id เดิมไว้ / ไม่ตรวจสอบ session_id
+KEEP_SESSION = object()
+
+class TableStateMachine:
+    """แถวของตาราง tables ทั้งหมดในหน่วยความจำ (ข้อมูลหลักสำหรับการอ่าน) โดยมี SQLite เป็นที่เก็บถาวร
+
+    การเขียนทุกครั้งต้องถือ lock: ตรวจสอบการเปลี่ยนสถานะกับค่าในหน่วยความจำ เขียน SQLite แบบ compare-and-set
+    (UPDATE ... WHERE status/session_id เดิม) แล้วจึงเก็บแถวใหม่ด้วย store() ซึ่งเพิ่ม table_version
+    """
+
+    def __init__(self, loader, versions: VersionCounter):
+        self._loader = loader
+        self._versions = versions
+        self.lock = threading.RLock()
+        self._tables = None
+
+    def _ensure_loaded(self) -> Dict[int, Dict]:
+        if self._tables is None:
+            self._tables = self._loader()
+        return self._tables
+
+    def get(self, table_id: int) -> Optional[Dict]:
+        """สำเนาแถวของโต๊ะ (None ถ้าไม่มีโต๊ะนี้)"""
+        with self.lock:
+            row = self._ensure_loaded().get(table_id)
+            return dict(row) if row else None
+
+    def all(self) -> List[Dict]:
+        """สำเนาแถวของทุกโต๊ะ เรียงตาม table_id"""
+        with self.lock:
+            tables = self._ensure_loaded()
+            return [dict(tables[table_id]) for table_id in sorted(tables)]
+
+    def store(self, row: Dict):
+        """เก็บแถวที่เขียนลง SQLite แล้ว (เรียกหลัง commit ขณะถือ lock)"""
+        with self.lock:
+            self._ensure_loaded()[row['table_id']] = dict(row)
+        self._versions.bump()
+
+    def remove(self, table_id: int):
+        """ลบโต๊ะออกจากหน่วยความจำ (เรียกหลัง commit ขณะถือ lock)"""
+        with self.lock:
+            self._ensure_loaded().pop(table_id, None)
+        self._versions.bump()
+
+    def reload(self):
+        """โหลดใหม่ทั้งหมดจาก SQLite (เช่น หลังมีการแก้ไขตาราง tables จากนอกโปรเซส)"""
+        with self.lock:
+            self._tables = self._loader()
+        self._versions.bump()
+
+    @staticmethod
+    def check_transition(current: Optional[Dict], status: str, session_id,
+                         expected_status: str = None, expected_session_id=KEEP_SESSION) -> Optional[str]:
+        """ตรวจสอบการเปลี่ยนสถานะ คืนค่าข้อความผิดพลาด หรือ None ถ้าอนุญาต"""
+        if current is None:
+            return 'ไม่พบโต๊ะที่ระบุ'
+        if status not in TABLE_TRANSITIONS or status == 'checkout':
+            return f'สถานะโต๊ะไม่ถูกต้อง: {status}'
+        if expected_status is not None and current['status'] != expected_status:
+            return f"สถานะโต๊ะเปลี่ยนไปแล้ว (ปัจจุบัน: {current['status']})"
+        if expected_session_id is not KEEP_SESSION and current['session_id'] != expected_session_id:
+            return 'เซสชั่นของโต๊ะเปลี่ยนไปแล้ว'
+        if status not in TABLE_TRANSITIONS.get(current['status'], ()):
+            return f"ไม่สามารถเปลี่ยนสถานะโต๊ะจาก {current['status']} เป็น {status}"
+        if status == 'available' and session_id is not None:
+            return 'โต๊ะว่างต้องไม่มี session_id'
+        return None
+
+class MenuCatalogCache:
+    """แคชเมนู หมวดหมู่ และค่าตัวเลือกในหน่วยความจำ โหลดใหม่เมื่อถูก invalidate หลังการแก้ไข
+
+    version / modified_at ใช้เป็นเวอร์ชันของแคตตาล็อกสำหรับ ETag (เหมือน VersionCounter)
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self.version = 0
+        self.modified_at = time.time()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def snapshot(self) -> Dict:
+        """ข้อมูลเมนูชุดปัจจุบัน (โหลดจากฐานข้อมูลถ้ายังไม่มี)"""
+        with self._lock:
+            if self._snapshot is not None:
+                self.hits += 1
+                return self._snapshot
+            self.misses += 1
+            self._snapshot = self._loader()
+            return self._snapshot
+
+    def invalidate(self):
+        """ล้างแคช เรียกหลังจาก commit การแก้ไขเมนู/หมวดหมู่/ค่าตัวเลือก"""
+        with self._lock:
+            self._snapshot = None
+            self.version += 1
+            self.modified_at = time.time()
+            self.invalidations += 1
+
+    def stats(self) -> Dict:
+        """สถิติการใช้งานแคช"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'version': self.version,
+                'loaded': self._snapshot is not None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+                'invalidations': self.invalidations
+            }
+
 class DatabaseManager:
     """คลาสจัดการฐานข้อมูล SQLite"""
-    
-    def __init__(self, db_path: str = "pos_database.db"):
+
+    # คีย์ใน system_config สำหรับปรับค่า PRAGMA ของ SQLite
+    PRAGMA_CONFIG_KEYS = {
+        'sqlite_journal_mode': 'journal_mode',
+        'sqlite_synchronous': 'synchronous',
+        'sqlite_busy_timeout_ms': 'busy_timeout',
+        'sqlite_cache_size': 'cache_size',
+        'sqlite_mmap_size': 'mmap_size',
+        'sqlite_temp_store': 'temp_store'
+    }
+
+    def __init__(self, db_path: str = "pos_database.db", pool_size: int = 8):
         self.db_path = db_path
+        self.pool = ConnectionPool(db_path, max_size=pool_size)
+        self._local = threading.local()
+        self.menu_cache = MenuCatalogCache(self._load_menu_catalog)
+        # เวอร์ชันของข้อมูลโต๊ะ (สถานะ / เซสชัน) สำหรับ ETag ของ /api/tables
+        self.table_version = VersionCounter()
+        self.table_state = TableStateMachine(self._load_tables, self.table_version)
+        # คิวรายการอาหารของครัว (ปรับปรุงจาก change_log ดู get_kitchen_queue)
+        self.kitchen_queue = KitchenQueue()
+        self._change_log_lock = threading.Lock()
+        # เริ่มนับจากตอนสร้าง (ไม่บีบอัดระหว่าง init_database ก่อน migration) แล้วบีบอัดครั้งแรกหลังเริ่มระบบเสร็จ
+        self._change_log_compacted_at = time.monotonic()
+        # จำนวนการแจ้งเตือนที่ยังไม่อ่าน (นับจากฐานข้อมูลครั้งแรก แล้วปรับค่าตามการบันทึก/อ่าน)
+        self._notification_lock = threading.Lock()
+        self._unread_notifications = None
+        self._notifications_compacted_at = float('-inf')
+        # ตั้งค่าเมื่อมีงานใหม่ใน sheets_outbox เพื่อปลุก OutboxWorker
+        self.sheets_outbox_ready = threading.Event()
         self.init_database()
-    
-    def get_connection(self) -> sqlite3.Connection:
-        """สร้างการเชื่อมต่อฐานข้อมูล"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # ให้ผลลัพธ์เป็น dict-like
-        return conn
-    
+        self.apply_pragma_config()
+        self.recover_sheets_outbox()
+        self.compact_change_log()
+        self.print_pragma_report()
+
+    def get_connection(self) -> PooledConnection:
+        """ยืมการเชื่อมต่อฐานข้อมูลจากพูล (เรียก close() เพื่อคืนเข้าพูล)"""
+        return PooledConnection(self.pool, self.pool.acquire())
+
+    @contextmanager
+    def connection(self):
+        """ยืมการเชื่อมต่อสำหรับอ่านข้อมูล ถ้าอยู่ภายใน transaction() ของ thread เดียวกันจะใช้การเชื่อมต่อเดิม"""
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            yield held
+            return
+        conn = self.pool.acquire()
+        try:
+            yield conn
+        finally:
+            self.pool.release(conn)
+
+    @contextmanager
+    def transaction(self):
+        """เปิด transaction (BEGIN IMMEDIATE) commit เมื่อสำเร็จ และ rollback เมื่อเกิดข้อผิดพลาด
+
+        เรียกซ้อนกันใน thread เดียวกันได้ โดย transaction ด้านในจะรวมเข้ากับด้านนอก
+        """
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            yield held
+            return
+        conn = self.pool.acquire()
+        self._local.conn = conn
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            yield conn
+            conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._local.conn = None
+            self.pool.release(conn)
+        # trigger เพิ่มแถวใน change_log ทุกครั้งที่เขียน จึงบีบอัดเป็นระยะจากเส้นทางการเขียน (ไม่ขึ้นกับผู้อ่าน /api/changes)
+        self._maybe_compact_change_log()
+
+    def get_pool_stats(self) -> Dict:
+        """สถิติการใช้งานพูลการเชื่อมต่อ (hit/miss)"""
+        return self.pool.stats()
+
+    def get_menu_cache_stats(self) -> Dict:
+        """สถิติการใช้งานแคชเมนู (hit/miss)"""
+        return self.menu_cache.stats()
+
+    def apply_pragma_config(self) -> Dict:
+        """อ่านค่า PRAGMA จาก system_config แล้วใช้กับการเชื่อมต่อใหม่ของพูล"""
+        overrides = {}
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                placeholders = ','.join('?' * len(self.PRAGMA_CONFIG_KEYS))
+                cursor.execute(f'''
+                    SELECT config_key, config_value FROM system_config
+                    WHERE config_key IN ({placeholders})
+                ''', tuple(self.PRAGMA_CONFIG_KEYS))
+                for row in cursor.fetchall():
+                    overrides[self.PRAGMA_CONFIG_KEYS[row['config_key']]] = row['config_value']
+        except Exception as e:
+            log.error('Error loading SQLite PRAGMA config: %s', e)
+        pragmas, errors = normalize_pragmas(overrides)
+        for error in errors:
+            log.warning('ignoring invalid SQLite setting %s', error)
+        if pragmas != self.pool.pragmas:
+            self.pool.configure(pragmas)
+        return pragmas
+
+    def get_pragma_report(self) -> Dict:
+        """ค่า PRAGMA ที่มีผลจริงบนการเชื่อมต่อ เทียบกับค่าที่ตั้งไว้"""
+        with self.connection() as conn:
+            effective = {}
+            for name in DEFAULT_PRAGMAS:
+                row = conn.execute(f'PRAGMA {name}').fetchone()
+                effective[name] = row[0] if row else None
+        return {'configured': dict(self.pool.pragmas), 'effective': effective}
+
+    def print_pragma_report(self):
+        """พิมพ์สรุปค่า SQLite ที่ใช้งานอยู่ตอนเริ่มระบบ"""
+        try:
+            report = self.get_pragma_report()
+        except Exception as e:
+            log.error('Error reading SQLite PRAGMA report: %s', e)
+            return
+        log.info('SQLite settings for %s:', self.db_path)
+        for name, value in report['effective'].items():
+            log.info('  %s = %s (configured: %s)', name, value, report['configured'][name])
+
+    def check_query_plans(self, strict: bool = False) -> List[Dict]:
+        """ตรวจ EXPLAIN QUERY PLAN ของคิวรีหลัก แจ้งเตือนเสียงดังถ้ามีคิวรีที่กลับไป SCAN ทั้งตาราง"""
+        with self.connection() as conn:
+            regressions = check_query_plans(conn)
+        for regression in regressions:
+            log.warning('QUERY PLAN REGRESSION: %s -> %s', regression['query'], ' | '.join(regression['plan']))
+        if regressions and strict:
+            raise QueryPlanRegression(f"{len(regressions)} hot queries regressed to full table scans")
+        return regressions
+
+    def get_schema_version(self) -> int:
+        """เวอร์ชัน schema ปัจจุบันของฐานข้อมูล"""
+        with self.connection() as conn:
+            return get_schema_version(conn.cursor())
+
     def initialize_database(self):
         """สร้างตารางฐานข้อมูลเริ่มต้นและข้อมูลตัวอย่าง"""
         self.init_database()
@@ -56,259 +563,197 @@ class DatabaseManager:
     
     def init_database(self):
         """สร้างตารางฐานข้อมูลเริ่มต้น"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # ตารางโต๊ะ
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tables (
-                table_id INTEGER PRIMARY KEY,
-                table_name TEXT NOT NULL,
-                status TEXT DEFAULT 'available',
-                qr_code TEXT,
-                session_id TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # ตารางหมวดหมู่เมนู
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS menu_categories (
-                category_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                description TEXT,
-                is_active BOOLEAN DEFAULT 1,
-                sort_order INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # ตารางเมนูอาหาร
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS menu_items (
-                item_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                price REAL NOT NULL,
-                category_id INTEGER,
-                description TEXT,
-                image_url TEXT,
-                is_available BOOLEAN DEFAULT 1,
-                preparation_time INTEGER DEFAULT 15,
-                food_option_type TEXT DEFAULT 'none',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (category_id) REFERENCES menu_categories (category_id)
-            )
-        ''')
-        
-        # อัปเดตโครงสร้างตารางถ้าจำเป็น
-        try:
-            # ตรวจสอบว่ามีคอลัมน์ food_option_type หรือไม่
-            cursor.execute("PRAGMA table_info(menu_items)")
-            columns = [column[1] for column in cursor.fetchall()]
+        with self.transaction() as conn:
+            cursor = conn.cursor()
             
-            if 'food_option_type' not in columns:
-                # เพิ่มคอลัมน์ food_option_type
-                cursor.execute('ALTER TABLE menu_items ADD COLUMN food_option_type TEXT DEFAULT "none"')
-                
-                # อัปเดตข้อมูลเดิมจาก spice_options และ sweetness_options
-                cursor.execute('''
-                    UPDATE menu_items 
-                    SET food_option_type = CASE 
-                        WHEN spice_options IS NOT NULL AND spice_options != '' THEN 'spice'
-                        WHEN sweetness_options IS NOT NULL AND sweetness_options != '' THEN 'sweet'
-                        ELSE 'none'
-                    END
-                ''')
-                
-                # ลบคอลัมน์เก่า (SQLite ไม่รองรับ DROP COLUMN โดยตรง)
-                # เราจะปล่อยให้คอลัมน์เก่าอยู่เพื่อความปลอดภัย
+            # ตารางโต๊ะ
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS tables (
+                    table_id INTEGER PRIMARY KEY,
+                    table_name TEXT NOT NULL,
+                    status TEXT DEFAULT 'available',
+                    qr_code TEXT,
+                    session_id TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
             
-            # ตรวจสอบว่ามีคอลัมน์ sort_order ในตาราง menu_categories หรือไม่
-            cursor.execute("PRAGMA table_info(menu_categories)")
-            category_columns = [column[1] for column in cursor.fetchall()]
+            # ตารางหมวดหมู่เมนู
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS menu_categories (
+                    category_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    description TEXT,
+                    is_active BOOLEAN DEFAULT 1,
+                    sort_order INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
             
-            if 'sort_order' not in category_columns:
-                # เพิ่มคอลัมน์ sort_order
-                cursor.execute('ALTER TABLE menu_categories ADD COLUMN sort_order INTEGER DEFAULT 0')
-                
-                # อัปเดตลำดับเริ่มต้นตาม category_id
-                cursor.execute('''
-                    UPDATE menu_categories 
-                    SET sort_order = category_id * 10
-                    WHERE sort_order = 0 OR sort_order IS NULL
-                ''')
+            # ตารางเมนูอาหาร
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS menu_items (
+                    item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    price REAL NOT NULL,
+                    category_id INTEGER,
+                    description TEXT,
+                    image_url TEXT,
+                    is_available BOOLEAN DEFAULT 1,
+                    preparation_time INTEGER DEFAULT 15,
+                    food_option_type TEXT DEFAULT 'none',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (category_id) REFERENCES menu_categories (category_id)
+                )
+            ''')
             
-            # ตรวจสอบว่ามีคอลัมน์ bill_status ในตาราง orders หรือไม่
-            cursor.execute("PRAGMA table_info(orders)")
-            order_columns = [column[1] for column in cursor.fetchall()]
+            # ตารางออเดอร์
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS orders (
+                    order_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    table_id INTEGER,
+                    session_id TEXT,
+                    status TEXT DEFAULT 'active',
+                    bill_status TEXT DEFAULT 'unchecked',
+                    total_amount REAL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    completed_at TIMESTAMP,
+                    FOREIGN KEY (table_id) REFERENCES tables (table_id)
+                )
+            ''')
             
-            if 'bill_status' not in order_columns:
-                # เพิ่มคอลัมน์ bill_status
-                cursor.execute('ALTER TABLE orders ADD COLUMN bill_status TEXT DEFAULT "unchecked"')
-                
-                # อัปเดตข้อมูลเดิมให้มีสถานะ unchecked
-                cursor.execute('''
-                    UPDATE orders 
-                    SET bill_status = "unchecked"
-                    WHERE bill_status IS NULL
-                ''')
+            # ตารางรายการสั่งอาหาร
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS order_items (
+                    order_item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    order_id INTEGER,
+                    item_id INTEGER,
+                    quantity INTEGER NOT NULL,
+                    unit_price REAL NOT NULL,
+                    total_price REAL NOT NULL,
+                    customer_request TEXT,
+                    status TEXT DEFAULT 'pending',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (order_id) REFERENCES orders (order_id),
+                    FOREIGN KEY (item_id) REFERENCES menu_items (item_id)
+                )
+            ''')
             
-            # ตรวจสอบว่ามีคอลัมน์ checkout_at ในตาราง tables หรือไม่
-            cursor.execute("PRAGMA table_info(tables)")
-            table_columns = [column[1] for column in cursor.fetchall()]
+            # ตารางใบเสร็จ
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS receipts (
+                    receipt_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    order_id INTEGER,
+                    table_id INTEGER,
+                    total_amount REAL NOT NULL,
+                    payment_method TEXT DEFAULT 'promptpay',
+                    promptpay_qr TEXT,
+                    is_paid BOOLEAN DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    paid_at TIMESTAMP,
+                    FOREIGN KEY (order_id) REFERENCES orders (order_id),
+                    FOREIGN KEY (table_id) REFERENCES tables (table_id)
+                )
+            ''')
             
-            if 'checkout_at' not in table_columns:
-                # เพิ่มคอลัมน์ checkout_at สำหรับเก็บเวลาเช็คบิล
-                cursor.execute('ALTER TABLE tables ADD COLUMN checkout_at TIMESTAMP')
-                
-        except Exception as e:
-            print(f"Warning: Could not update table structure: {e}")
-        
-        # ตารางออเดอร์
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS orders (
-                order_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                table_id INTEGER,
-                session_id TEXT,
-                status TEXT DEFAULT 'active',
-                bill_status TEXT DEFAULT 'unchecked',
-                total_amount REAL DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                completed_at TIMESTAMP,
-                FOREIGN KEY (table_id) REFERENCES tables (table_id)
-            )
-        ''')
-        
-        # ตารางรายการสั่งอาหาร
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS order_items (
-                order_item_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                order_id INTEGER,
-                item_id INTEGER,
-                quantity INTEGER NOT NULL,
-                unit_price REAL NOT NULL,
-                total_price REAL NOT NULL,
-                customer_request TEXT,
-                status TEXT DEFAULT 'pending',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (order_id) REFERENCES orders (order_id),
-                FOREIGN KEY (item_id) REFERENCES menu_items (item_id)
-            )
-        ''')
-        
-        # ตารางใบเสร็จ
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS receipts (
-                receipt_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                order_id INTEGER,
-                table_id INTEGER,
-                total_amount REAL NOT NULL,
-                payment_method TEXT DEFAULT 'promptpay',
-                promptpay_qr TEXT,
-                is_paid BOOLEAN DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                paid_at TIMESTAMP,
-                FOREIGN KEY (order_id) REFERENCES orders (order_id),
-                FOREIGN KEY (table_id) REFERENCES tables (table_id)
-            )
-        ''')
-        
-        # ตารางประวัติคำสั่งซื้อ (order_history)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS order_history (
-                order_id INTEGER PRIMARY KEY,
-                table_id INTEGER,
-                session_id TEXT,
-                status TEXT DEFAULT 'completed',
-                total_amount REAL DEFAULT 0,
-                created_at TIMESTAMP,
-                completed_at TIMESTAMP,
-                FOREIGN KEY (table_id) REFERENCES tables (table_id)
-            )
-        ''')
-        
-        # ตารางรายการสินค้าในประวัติคำสั่งซื้อ (order_history_items)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS order_history_items (
-                history_item_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                order_id INTEGER,
-                menu_item_id INTEGER,
-                quantity INTEGER NOT NULL,
-                price REAL NOT NULL,
-                customer_request TEXT,
-                status TEXT DEFAULT 'completed',
-                FOREIGN KEY (order_id) REFERENCES order_history (order_id),
-                FOREIGN KEY (menu_item_id) REFERENCES menu_items (menu_item_id)
-            )
-        ''')
-        
-        # ตารางการตั้งค่าระบบ
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS system_config (
-                config_key TEXT PRIMARY KEY,
-                config_value TEXT,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # ตารางการแจ้งเตือน
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS notifications (
-                notification_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                table_id INTEGER,
-                message TEXT NOT NULL,
-                type TEXT NOT NULL,
-                is_read BOOLEAN DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                read_at TIMESTAMP,
-                FOREIGN KEY (table_id) REFERENCES tables (table_id)
-            )
-        ''')
-        
-        # ตารางประเภทตัวเลือก (option types)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS option_types (
-                option_type_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                key TEXT NOT NULL UNIQUE,
-                description TEXT,
-                is_active BOOLEAN DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # ตารางค่าตัวเลือก (option values)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS option_values (
-                option_value_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                option_type TEXT NOT NULL,
-                name TEXT NOT NULL,
-                additional_price DECIMAL(10,2) DEFAULT 0,
-                is_default BOOLEAN DEFAULT 0,
-                sort_order INTEGER DEFAULT 0,
-                is_active BOOLEAN DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # สร้างดัชนีสำหรับค้นหาเร็วขึ้น
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_option_types_key ON option_types(key)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_option_values_type ON option_values(option_type)')
+            # ตารางประวัติคำสั่งซื้อ (order_history)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS order_history (
+                    order_id INTEGER PRIMARY KEY,
+                    table_id INTEGER,
+                    session_id TEXT,
+                    status TEXT DEFAULT 'completed',
+                    total_amount REAL DEFAULT 0,
+                    created_at TIMESTAMP,
+                    completed_at TIMESTAMP,
+                    FOREIGN KEY (table_id) REFERENCES tables (table_id)
+                )
+            ''')
+            
+            # ตารางรายการสินค้าในประวัติคำสั่งซื้อ (order_history_items)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS order_history_items (
+                    history_item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    order_id INTEGER,
+                    menu_item_id INTEGER,
+                    quantity INTEGER NOT NULL,
+                    price REAL NOT NULL,
+                    customer_request TEXT,
+                    status TEXT DEFAULT 'completed',
+                    FOREIGN KEY (order_id) REFERENCES order_history (order_id),
+                    FOREIGN KEY (menu_item_id) REFERENCES menu_items (menu_item_id)
+                )
+            ''')
+            
+            # ตารางการตั้งค่าระบบ
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS system_config (
+                    config_key TEXT PRIMARY KEY,
+                    config_value TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # ตารางการแจ้งเตือน
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS notifications (
+                    notification_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    table_id INTEGER,
+                    message TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    is_read BOOLEAN DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    read_at TIMESTAMP,
+                    FOREIGN KEY (table_id) REFERENCES tables (table_id)
+                )
+            ''')
+            
+            # ตารางประเภทตัวเลือก (option types)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS option_types (
+                    option_type_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    key TEXT NOT NULL UNIQUE,
+                    description TEXT,
+                    is_active BOOLEAN DEFAULT 1,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # ตารางค่าตัวเลือก (option values)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS option_values (
+                    option_value_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    option_type TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    additional_price DECIMAL(10,2) DEFAULT 0,
+                    is_default BOOLEAN DEFAULT 0,
+                    sort_order INTEGER DEFAULT 0,
+                    is_active BOOLEAN DEFAULT 1,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # สร้างดัชนีสำหรับค้นหาเร็วขึ้น
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_option_types_key ON option_types(key)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_option_values_type ON option_values(option_type)')
+            
+            # อัปเดตโครงสร้างตารางและดัชนีด้วย migration ที่มีเวอร์ชัน
+            run_migrations(conn)
         
-        conn.commit()
-        conn.close()
+        # ตรวจว่าคิวรีหลักยังใช้ดัชนีอยู่ (ไม่ถดถอยเป็นการ SCAN ทั้งตาราง)
+        self.check_query_plans()
         
         # ตรวจสอบว่ามีข้อมูลโต๊ะหรือไม่ ถ้าไม่มีให้สร้างโต๊ะเริ่มต้น
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) as count FROM tables')
-        count = cursor.fetchone()['count']
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT COUNT(*) as count FROM tables')
+            count = cursor.fetchone()['count']
         
         if count == 0:
             # สร้างโต๊ะเริ่มต้น 10 โต๊ะ
@@ -349,9 +794,8 @@ class DatabaseManager:
 
     def save_setting(self, key: str, value: str):
         """บันทึกหรืออัปเดตการตั้งค่าใน system_config"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
+        with self.transaction() as conn:
+            cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO system_config (config_key, config_value, updated_at)
                 VALUES (?, ?, CURRENT_TIMESTAMP)
@@ -359,585 +803,810 @@ class DatabaseManager:
                     config_value = excluded.config_value,
                     updated_at = CURRENT_TIMESTAMP
             ''', (key, value))
-            conn.commit()
-        finally:
-            conn.close()
     
     # === Table Management ===
+    # การเขียนตาราง tables ทั้งหมดผ่าน table_state (ดู TableStateMachine) การอ่านใช้ข้อมูลในหน่วยความจำโดยไม่ query
+    def _load_tables(self) -> Dict[int, Dict]:
+        """โหลดทุกแถวของตาราง tables (สำหรับ TableStateMachine)"""
+        with self.connection() as conn:
+            rows = conn.execute('SELECT * FROM tables').fetchall()
+        return {row['table_id']: dict(row) for row in rows}
+
+    @staticmethod
+    def _select_table_row(cursor, table_id: int) -> Optional[Dict]:
+        cursor.execute('SELECT * FROM tables WHERE table_id = ?', (table_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+    def _write_table_status(self, cursor, current: Dict, status: str, session_id) -> Optional[Dict]:
+        """UPDATE สถานะโต๊ะแบบ compare-and-set กับค่าเดิมในหน่วยความจำ คืนค่าแถวใหม่ หรือ None ถ้าแถวในฐานข้อมูลไม่ตรงกับค่าเดิม"""
+        cursor.execute('''
+            UPDATE tables 
+            SET status = ?, session_id = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE table_id = ? AND status IS ? AND session_id IS ?
+        ''', (status, session_id, current['table_id'], current['status'], current['session_id']))
+        if cursor.rowcount != 1:
+            return None
+        return self._select_table_row(cursor, current['table_id'])
+
     def add_table(self, table_id: int, table_name: str) -> bool:
         """เพิ่มโต๊ะใหม่"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR IGNORE INTO tables (table_id, table_name)
-                VALUES (?, ?)
-            ''', (table_id, table_name))
-            conn.commit()
-            conn.close()
+            with self.table_state.lock:
+                with self.transaction() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute('''
+                        INSERT OR IGNORE INTO tables (table_id, table_name)
+                        VALUES (?, ?)
+                    ''', (table_id, table_name))
+                    row = self._select_table_row(cursor, table_id)
+                self.table_state.store(row)
             return True
         except Exception as e:
-            print(f"Error adding table: {e}")
+            log.error('Error adding table: %s', e)
             return False
     
     def get_all_tables(self) -> List[Dict]:
         """ดึงข้อมูลโต๊ะทั้งหมด"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM tables ORDER BY table_id')
-        tables = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return tables
+        return self.table_state.all()
     
     def get_table(self, table_id: int) -> Dict:
         """ดึงข้อมูลโต๊ะตาม ID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM tables WHERE table_id = ?', (table_id,))
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row:
-            return dict(row)
-        return None
-    
+        return self.table_state.get(table_id)
+
+    def get_table_session(self, table_id: int) -> Optional[Dict]:
+        """สถานะและ session_id ของโต๊ะจากหน่วยความจำ"""
+        return self.table_state.get(table_id)
+
+    def transition_table(self, table_id: int, status: str, session_id=KEEP_SESSION,
+                         expected_status: str = None, expected_session_id=KEEP_SESSION) -> Dict:
+        """เปลี่ยนสถานะโต๊ะแบบ atomic ตาม TABLE_TRANSITIONS
+
+        session_id: session ใหม่ (ไม่ระบุ = คงค่าเดิม)
+        expected_status / expected_session_id: เงื่อนไข compare-and-set ต้องตรงกับค่าปัจจุบันจึงจะเปลี่ยน
+        คืนค่า {'success': bool, 'table': แถวใหม่, 'previous': แถวเดิม, 'error': ข้อความ, 'conflict': True ถ้าสถานะเปลี่ยนไปก่อนแล้ว}
+        """
+        result = {'success': False, 'table': None, 'previous': None, 'error': None, 'conflict': False}
+        with self.table_state.lock:
+            current = self.table_state.get(table_id)
+            result['previous'] = current
+            new_session_id = current['session_id'] if current and session_id is KEEP_SESSION else session_id
+            error = self.table_state.check_transition(current, status, new_session_id, expected_status, expected_session_id)
+            if error:
+                result['error'] = error
+                result['conflict'] = current is not None and (
+                    (expected_status is not None and current['status'] != expected_status) or
+                    (expected_session_id is not KEEP_SESSION and current['session_id'] != expected_session_id))
+                return result
+            try:
+                with self.transaction() as conn:
+                    row = self._write_table_status(conn.cursor(), current, status, new_session_id)
+                if row is None:
+                    # แถวในฐานข้อมูลถูกแก้จากที่อื่น โหลดใหม่และให้ผู้เรียกลองอีกครั้ง
+                    self.table_state.reload()
+                    result.update({'error': 'สถานะโต๊ะเปลี่ยนไปแล้ว กรุณาลองใหม่', 'conflict': True})
+                    return result
+                self.table_state.store(row)
+            except Exception as e:
+                log.error('Error updating table status: %s', e)
+                result['error'] = str(e)
+                return result
+        log.debug("transition_table: table %s %s -> %s, session_id %s -> %s",
+                  table_id, current['status'], status, current['session_id'], new_session_id)
+        result.update({'success': True, 'table': dict(row)})
+        return result
+
     def update_table_status(self, table_id: int, status: str, session_id: str = None) -> bool:
-        """อัปเดตสถานะโต๊ะ"""
-        try:
-            # ดึงข้อมูลโต๊ะก่อนอัปเดตเพื่อเก็บ session_id เดิม
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT session_id FROM tables WHERE table_id = ?', (table_id,))
-            row = cursor.fetchone()
-            old_session_id = row['session_id'] if row else None
-            
-            print(f"[DEBUG] update_table_status: Updating table {table_id} from status to '{status}', session_id changing from '{old_session_id}' to '{session_id}'")
-            
-            # ถ้า session_id เป็น None ให้ล้างค่าในฐานข้อมูลอย่างชัดเจน
-            if session_id is None:
-                print(f"[DEBUG] update_table_status: Explicitly setting session_id to NULL for table {table_id}")
-            
-            cursor.execute('''
-                UPDATE tables 
-                SET status = ?, session_id = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE table_id = ?
-            ''', (status, session_id, table_id))
-            conn.commit()
-            conn.close()
-            return True
-        except Exception as e:
-            print(f"Error updating table status: {e}")
-            return False
+        """อัปเดตสถานะโต๊ะ (กำหนด session_id ตามที่ระบุ, None = ล้าง session)"""
+        result = self.transition_table(table_id, status, session_id)
+        if not result['success']:
+            log.warning('update_table_status: table %s -> %s rejected: %s', table_id, status, result['error'])
+        return result['success']
     
     def update_table_checkout_time(self, table_id: int) -> bool:
         """อัปเดตเวลาเช็คบิลของโต๊ะ"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE tables 
-                SET checkout_at = CURRENT_TIMESTAMP
-                WHERE table_id = ?
-            ''', (table_id,))
-            conn.commit()
-            conn.close()
+            with self.table_state.lock:
+                with self.transaction() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute('''
+                        UPDATE tables 
+                        SET checkout_at = CURRENT_TIMESTAMP
+                        WHERE table_id = ?
+                    ''', (table_id,))
+                    row = self._select_table_row(cursor, table_id)
+                if row:
+                    self.table_state.store(row)
             return True
         except Exception as e:
-            print(f"Error updating table checkout time: {e}")
+            log.error('Error updating table checkout time: %s', e)
             return False
     
     def delete_table(self, table_id: int) -> bool:
         """ลบโต๊ะ"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # ตรวจสอบว่าโต๊ะมีออเดอร์ที่ยังไม่เสร็จสิ้นหรือไม่
-            cursor.execute('''
-                SELECT COUNT(*) as count FROM orders 
-                WHERE table_id = ? AND status != 'completed'
-            ''', (table_id,))
-            count = cursor.fetchone()['count']
-            
-            if count > 0:
-                print(f"Cannot delete table {table_id}: {count} pending orders exist")
-                return False
-            
-            # ลบโต๊ะ
-            cursor.execute('DELETE FROM tables WHERE table_id = ?', (table_id,))
-            conn.commit()
-            conn.close()
-            return cursor.rowcount > 0
+            with self.table_state.lock:
+                with self.transaction() as conn:
+                    cursor = conn.cursor()
+                    
+                    # ตรวจสอบว่าโต๊ะมีออเดอร์ที่ยังไม่เสร็จสิ้นหรือไม่
+                    cursor.execute('''
+                        SELECT COUNT(*) as count FROM orders 
+                        WHERE table_id = ? AND status != 'completed'
+                    ''', (table_id,))
+                    count = cursor.fetchone()['count']
+                    
+                    if count > 0:
+                        log.info('Cannot delete table %s: %s pending orders exist', table_id, count)
+                        return False
+                    
+                    # ลบโต๊ะ
+                    cursor.execute('DELETE FROM tables WHERE table_id = ?', (table_id,))
+                    deleted = cursor.rowcount > 0
+                if deleted:
+                    self.table_state.remove(table_id)
+            return deleted
         except Exception as e:
-            print(f"Error deleting table: {e}")
+            log.error('Error deleting table: %s', e)
             return False
-    
+
+    def close_table_session(self, table_id: int, session_id: str) -> Dict:
+        """ปิดเซสชั่นของโต๊ะ: ลบออเดอร์ที่ยังไม่เสร็จสิ้นของเซสชั่น และคืนโต๊ะเป็น available ใน transaction เดียว
+
+        ทำได้เฉพาะเมื่อ session_id ยังเป็นเซสชั่นปัจจุบันของโต๊ะ คืนค่าแบบเดียวกับ transition_table
+        """
+        result = {'success': False, 'table': None, 'previous': None, 'error': None, 'conflict': False}
+        with self.table_state.lock:
+            current = self.table_state.get(table_id)
+            result['previous'] = current
+            error = self.table_state.check_transition(current, 'available', None, expected_session_id=session_id)
+            if error:
+                result.update({'error': error, 'conflict': current is not None and current['session_id'] != session_id})
+                return result
+            try:
+                with self.transaction() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute('''
+                        DELETE FROM order_items 
+                        WHERE order_id IN (
+                            SELECT order_id FROM orders 
+                            WHERE table_id = ? AND session_id = ? AND status != 'completed'
+                        )
+                    ''', (table_id, session_id))
+                    cursor.execute('''
+                        DELETE FROM orders 
+                        WHERE table_id = ? AND session_id = ? AND status != 'completed'
+                    ''', (table_id, session_id))
+                    row = self._write_table_status(cursor, current, 'available', None)
+                    if row is None:
+                        raise sqlite3.IntegrityError('table row changed outside the table state machine')
+                self.table_state.store(row)
+            except Exception as e:
+                log.error('Error closing table session: %s', e)
+                self.table_state.reload()
+                result['error'] = str(e)
+                return result
+        result.update({'success': True, 'table': dict(row)})
+        return result
+
     # === Menu Management ===
     def add_menu_category(self, name: str, description: str = "") -> int:
         """เพิ่มหมวดหมู่เมนู"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR IGNORE INTO menu_categories (name, description)
-                VALUES (?, ?)
-            ''', (name, description))
-            category_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT OR IGNORE INTO menu_categories (name, description)
+                    VALUES (?, ?)
+                ''', (name, description))
+                category_id = cursor.lastrowid
+            self.menu_cache.invalidate()
             return category_id
         except Exception as e:
-            print(f"Error adding menu category: {e}")
+            log.error('Error adding menu category: %s', e)
             return 0
     
+    # === Menu Catalog Cache ===
+    @staticmethod
+    def _format_option_value(row) -> Dict:
+        """แปลงแถว option_values เป็น dict สำหรับ API"""
+        return {
+            'option_value_id': row['option_value_id'],
+            'option_type': row['option_type'],
+            'name': row['name'],
+            'additional_price': float(row['additional_price']) if row['additional_price'] else 0,
+            'is_default': bool(row['is_default']),
+            'sort_order': row['sort_order'],
+            'is_active': bool(row['is_active']),
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at']
+        }
+
+    def _load_menu_catalog(self) -> Dict:
+        """โหลดเมนู หมวดหมู่ และค่าตัวเลือกทั้งหมดสำหรับ MenuCatalogCache"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT mi.*, mc.name as category_name
+                FROM menu_items mi
+                JOIN menu_categories mc ON mi.category_id = mc.category_id
+                ORDER BY mc.category_id, mi.name
+            ''')
+            items = [dict(row) for row in cursor.fetchall()]
+            cursor.execute('SELECT * FROM menu_categories WHERE is_active = 1 ORDER BY sort_order, name')
+            categories = [dict(row) for row in cursor.fetchall()]
+            cursor.execute('''
+                SELECT * FROM option_values
+                WHERE is_active = 1
+                ORDER BY option_type, sort_order, option_value_id
+            ''')
+            option_values = [self._format_option_value(row) for row in cursor.fetchall()]
+
+        items_by_category = {}
+        for item in sorted(items, key=lambda item: item['name']):
+            items_by_category.setdefault(item['category_id'], []).append(item)
+        option_values_by_type = {}
+        for option_value in option_values:
+            option_values_by_type.setdefault(option_value['option_type'], []).append(option_value)
+        log.info('Menu cache loaded: %s items, %s categories, %s option values', len(items), len(categories), len(option_values))
+        return {
+            'items': items,
+            'items_by_id': {item['item_id']: item for item in items},
+            'items_by_category': items_by_category,
+            'categories': categories,
+            'option_values': option_values,
+            'option_values_by_type': option_values_by_type
+        }
+
+    def _cached_items(self, category_id=None) -> List[Dict]:
+        """เมนูจากแคช (ทั้งหมดเรียงตามหมวดหมู่ หรือเฉพาะหมวดหมู่เรียงตามชื่อ)"""
+        catalog = self.menu_cache.snapshot()
+        if not category_id:
+            return catalog['items']
+        try:
+            return catalog['items_by_category'].get(int(category_id), [])
+        except (TypeError, ValueError):
+            return []
+
     def get_menu_categories(self) -> List[Dict]:
         """ดึงหมวดหมู่เมนูทั้งหมด"""
-        print("[DEBUG] get_menu_categories called")
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM menu_categories WHERE is_active = 1 ORDER BY sort_order, name')
-        rows = cursor.fetchall()
-        print(f"[DEBUG] Raw rows from database: {len(rows)}")
-        categories = [dict(row) for row in rows]
-        print(f"[DEBUG] Converted categories: {len(categories)}")
-        if categories:
-            print(f"[DEBUG] First category data: {categories[0]}")
-        conn.close()
-        return categories
+        return [dict(category) for category in self.menu_cache.snapshot()['categories']]
     
     def add_menu_item(self, name: str, price: float, category_id: int, description: str = "", image_url: str = None, is_available: bool = True, preparation_time: int = 15, food_option_type: str = 'none') -> int:
         """เพิ่มเมนูอาหาร"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO menu_items (name, price, category_id, description, image_url, is_available, preparation_time, food_option_type)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (name, price, category_id, description, image_url, is_available, preparation_time, food_option_type))
-            item_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO menu_items (name, price, category_id, description, image_url, is_available, preparation_time, food_option_type)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (name, price, category_id, description, image_url, is_available, preparation_time, food_option_type))
+                item_id = cursor.lastrowid
+            self.menu_cache.invalidate()
             return item_id
         except Exception as e:
-            print(f"Error adding menu item: {e}")
+            log.error('Error adding menu item: %s', e)
             return 0
     
     def get_menu_items(self, category_id: int = None) -> List[Dict]:
         """ดึงเมนูอาหารทั้งหมดหรือตามหมวดหมู่"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        print(f"[DEBUG DB] get_menu_items called with category_id: {category_id}")
-        
-        if category_id:
-            query = '''
-                SELECT mi.*, mc.name as category_name 
-                FROM menu_items mi
-                JOIN menu_categories mc ON mi.category_id = mc.category_id
-                WHERE mi.category_id = ? AND mi.is_available = 1
-                ORDER BY mi.name
-            '''
-            print(f"[DEBUG DB] Executing query with category_id: {query}")
-            cursor.execute(query, (category_id,))
-        else:
-            query = '''
-                SELECT mi.*, mc.name as category_name 
-                FROM menu_items mi
-                JOIN menu_categories mc ON mi.category_id = mc.category_id
-                WHERE mi.is_available = 1
-                ORDER BY mc.category_id, mi.name
-            '''
-            print(f"[DEBUG DB] Executing query without category_id: {query}")
-            cursor.execute(query)
-        
-        rows = cursor.fetchall()
-        print(f"[DEBUG DB] Raw rows fetched: {len(rows)}")
-        if rows:
-            print(f"[DEBUG DB] First row: {dict(rows[0])}")
-        
-        items = [dict(row) for row in rows]
-        print(f"[DEBUG DB] Final items count: {len(items)}")
-        conn.close()
-        return items
+        return [dict(item) for item in self._cached_items(category_id) if item['is_available'] == 1]
     
     def get_all_menu_items(self, category_id: int = None) -> List[Dict]:
         """ดึงเมนูอาหารทั้งหมดรวมถึงที่ปิดการใช้งาน (สำหรับหน้าจัดการเมนู)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        print(f"[DEBUG DB] get_all_menu_items called with category_id: {category_id}")
-        
-        if category_id:
-            query = '''
-                SELECT mi.*, mc.name as category_name 
-                FROM menu_items mi
-                JOIN menu_categories mc ON mi.category_id = mc.category_id
-                WHERE mi.category_id = ?
-                ORDER BY mi.name
-            '''
-            print(f"[DEBUG DB] Executing query with category_id: {query}")
-            cursor.execute(query, (category_id,))
-        else:
-            query = '''
-                SELECT mi.*, mc.name as category_name 
-                FROM menu_items mi
-                JOIN menu_categories mc ON mi.category_id = mc.category_id
-                ORDER BY mc.category_id, mi.name
-            '''
-            print(f"[DEBUG DB] Executing query without category_id: {query}")
-            cursor.execute(query)
-        
-        rows = cursor.fetchall()
-        print(f"[DEBUG DB] Raw rows fetched (all items): {len(rows)}")
-        if rows:
-            print(f"[DEBUG DB] First row: {dict(rows[0])}")
-        
-        items = [dict(row) for row in rows]
-        print(f"[DEBUG DB] Final items count (all items): {len(items)}")
-        conn.close()
-        return items
+        return [dict(item) for item in self._cached_items(category_id)]
         
     def get_menu_item(self, item_id: int) -> Dict:
         """ดึงข้อมูลเมนูอาหารตาม ID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT mi.*, mc.name as category_name 
-            FROM menu_items mi
-            JOIN menu_categories mc ON mi.category_id = mc.category_id
-            WHERE mi.item_id = ?
-        ''', (item_id,))
-        
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row:
-            return dict(row)
-        return None
+        try:
+            item = self.menu_cache.snapshot()['items_by_id'].get(int(item_id))
+        except (TypeError, ValueError):
+            return None
+        return dict(item) if item else None
     
     def update_menu_category(self, category_id: int, name: str, description: str = "") -> bool:
         """อัปเดตหมวดหมู่เมนู"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE menu_categories 
-                SET name = ?, description = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE category_id = ?
-            ''', (name, description, category_id))
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE menu_categories 
+                    SET name = ?, description = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE category_id = ?
+                ''', (name, description, category_id))
+            self.menu_cache.invalidate()
             return cursor.rowcount > 0
         except Exception as e:
-            print(f"Error updating menu category: {e}")
+            log.error('Error updating menu category: %s', e)
             return False
     
     def delete_menu_category(self, category_id: int) -> bool:
         """ลบหมวดหมู่เมนู (soft delete)"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            # ตรวจสอบว่ามีเมนูในหมวดหมู่นี้หรือไม่
-            cursor.execute('SELECT COUNT(*) as count FROM menu_items WHERE category_id = ? AND is_available = 1', (category_id,))
-            count = cursor.fetchone()['count']
-            
-            if count > 0:
-                print(f"Cannot delete category: {count} menu items still exist")
-                return False
-            
-            cursor.execute('''
-                UPDATE menu_categories 
-                SET is_active = 0, updated_at = CURRENT_TIMESTAMP
-                WHERE category_id = ?
-            ''', (category_id,))
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                # ตรวจสอบว่ามีเมนูในหมวดหมู่นี้หรือไม่
+                cursor.execute('SELECT COUNT(*) as count FROM menu_items WHERE category_id = ? AND is_available = 1', (category_id,))
+                count = cursor.fetchone()['count']
+                
+                if count > 0:
+                    log.info('Cannot delete category: %s menu items still exist', count)
+                    return False
+                
+                cursor.execute('''
+                    UPDATE menu_categories 
+                    SET is_active = 0, updated_at = CURRENT_TIMESTAMP
+                    WHERE category_id = ?
+                ''', (category_id,))
+            self.menu_cache.invalidate()
             return cursor.rowcount > 0
         except Exception as e:
-            print(f"Error deleting menu category: {e}")
+            log.error('Error deleting menu category: %s', e)
             return False
     
     def update_category_sort_order(self, category_id: int, new_sort_order: int) -> bool:
         """อัปเดตลำดับการแสดงผลของหมวดหมู่"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE menu_categories 
-                SET sort_order = ?
-                WHERE category_id = ?
-            ''', (new_sort_order, category_id))
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE menu_categories 
+                    SET sort_order = ?
+                    WHERE category_id = ?
+                ''', (new_sort_order, category_id))
+            self.menu_cache.invalidate()
             return cursor.rowcount > 0
         except Exception as e:
-            print(f"Error updating category sort order: {e}")
+            log.error('Error updating category sort order: %s', e)
             return False
     
     def move_category_up(self, category_id: int) -> bool:
         """เลื่อนหมวดหมู่ขึ้น"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # ดึงข้อมูลหมวดหมู่ปัจจุบัน
-            cursor.execute('SELECT sort_order FROM menu_categories WHERE category_id = ?', (category_id,))
-            current_row = cursor.fetchone()
-            if not current_row:
-                return False
-            
-            current_sort_order = current_row['sort_order']
-            
-            # หาหมวดหมู่ที่อยู่ข้างบนที่ใกล้ที่สุด
-            cursor.execute('''
-                SELECT category_id, sort_order 
-                FROM menu_categories 
-                WHERE sort_order < ? AND is_active = 1
-                ORDER BY sort_order DESC 
-                LIMIT 1
-            ''', (current_sort_order,))
-            
-            prev_row = cursor.fetchone()
-            if not prev_row:
-                return False  # ไม่มีหมวดหมู่ข้างบน
-            
-            prev_category_id = prev_row['category_id']
-            prev_sort_order = prev_row['sort_order']
-            
-            # สลับลำดับ
-            cursor.execute('UPDATE menu_categories SET sort_order = ? WHERE category_id = ?', 
-                         (prev_sort_order, category_id))
-            cursor.execute('UPDATE menu_categories SET sort_order = ? WHERE category_id = ?', 
-                         (current_sort_order, prev_category_id))
-            
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                # ดึงข้อมูลหมวดหมู่ปัจจุบัน
+                cursor.execute('SELECT sort_order FROM menu_categories WHERE category_id = ?', (category_id,))
+                current_row = cursor.fetchone()
+                if not current_row:
+                    return False
+                
+                current_sort_order = current_row['sort_order']
+                
+                # หาหมวดหมู่ที่อยู่ข้างบนที่ใกล้ที่สุด
+                cursor.execute('''
+                    SELECT category_id, sort_order 
+                    FROM menu_categories 
+                    WHERE sort_order < ? AND is_active = 1
+                    ORDER BY sort_order DESC 
+                    LIMIT 1
+                ''', (current_sort_order,))
+                
+                prev_row = cursor.fetchone()
+                if not prev_row:
+                    return False  # ไม่มีหมวดหมู่ข้างบน
+                
+                prev_category_id = prev_row['category_id']
+                prev_sort_order = prev_row['sort_order']
+                
+                # สลับลำดับ
+                cursor.execute('UPDATE menu_categories SET sort_order = ? WHERE category_id = ?', 
+                             (prev_sort_order, category_id))
+                cursor.execute('UPDATE menu_categories SET sort_order = ? WHERE category_id = ?', 
+                             (current_sort_order, prev_category_id))
+            self.menu_cache.invalidate()
+                
             return True
         except Exception as e:
-            print(f"Error moving category up: {e}")
+            log.error('Error moving category up: %s', e)
             return False
     
     def move_category_down(self, category_id: int) -> bool:
         """เลื่อนหมวดหมู่ลง"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # ดึงข้อมูลหมวดหมู่ปัจจุบัน
-            cursor.execute('SELECT sort_order FROM menu_categories WHERE category_id = ?', (category_id,))
-            current_row = cursor.fetchone()
-            if not current_row:
-                return False
-            
-            current_sort_order = current_row['sort_order']
-            
-            # หาหมวดหมู่ที่อยู่ข้างล่างที่ใกล้ที่สุด
-            cursor.execute('''
-                SELECT category_id, sort_order 
-                FROM menu_categories 
-                WHERE sort_order > ? AND is_active = 1
-                ORDER BY sort_order ASC 
-                LIMIT 1
-            ''', (current_sort_order,))
-            
-            next_row = cursor.fetchone()
-            if not next_row:
-                return False  # ไม่มีหมวดหมู่ข้างล่าง
-            
-            next_category_id = next_row['category_id']
-            next_sort_order = next_row['sort_order']
-            
-            # สลับลำดับ
-            cursor.execute('UPDATE menu_categories SET sort_order = ? WHERE category_id = ?', 
-                         (next_sort_order, category_id))
-            cursor.execute('UPDATE menu_categories SET sort_order = ? WHERE category_id = ?', 
-                         (current_sort_order, next_category_id))
-            
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                # ดึงข้อมูลหมวดหมู่ปัจจุบัน
+                cursor.execute('SELECT sort_order FROM menu_categories WHERE category_id = ?', (category_id,))
+                current_row = cursor.fetchone()
+                if not current_row:
+                    return False
+                
+                current_sort_order = current_row['sort_order']
+                
+                # หาหมวดหมู่ที่อยู่ข้างล่างที่ใกล้ที่สุด
+                cursor.execute('''
+                    SELECT category_id, sort_order 
+                    FROM menu_categories 
+                    WHERE sort_order > ? AND is_active = 1
+                    ORDER BY sort_order ASC 
+                    LIMIT 1
+                ''', (current_sort_order,))
+                
+                next_row = cursor.fetchone()
+                if not next_row:
+                    return False  # ไม่มีหมวดหมู่ข้างล่าง
+                
+                next_category_id = next_row['category_id']
+                next_sort_order = next_row['sort_order']
+                
+                # สลับลำดับ
+                cursor.execute('UPDATE menu_categories SET sort_order = ? WHERE category_id = ?', 
+                             (next_sort_order, category_id))
+                cursor.execute('UPDATE menu_categories SET sort_order = ? WHERE category_id = ?', 
+                             (current_sort_order, next_category_id))
+            self.menu_cache.invalidate()
+                
             return True
         except Exception as e:
-            print(f"Error moving category down: {e}")
+            log.error('Error moving category down: %s', e)
             return False
     
     def update_menu_item(self, item_id: int, name: str, price: float, category_id: int, description: str = "", image_url: str = None, is_available: bool = True, preparation_time: int = 15, food_option_type: str = 'none') -> bool:
         """อัปเดตเมนูอาหาร"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE menu_items 
-                SET name = ?, price = ?, category_id = ?, description = ?, image_url = ?, 
-                    is_available = ?, preparation_time = ?, food_option_type = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE item_id = ?
-            ''', (name, price, category_id, description, image_url, is_available, preparation_time, food_option_type, item_id))
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE menu_items 
+                    SET name = ?, price = ?, category_id = ?, description = ?, image_url = ?, 
+                        is_available = ?, preparation_time = ?, food_option_type = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE item_id = ?
+                ''', (name, price, category_id, description, image_url, is_available, preparation_time, food_option_type, item_id))
+            self.menu_cache.invalidate()
+            # เวลาที่ควรเสร็จของรายการที่รออยู่ขึ้นกับ preparation_time ของเมนู
+            self._refresh_kitchen_menu_item(item_id)
             return cursor.rowcount > 0
         except Exception as e:
-            print(f"Error updating menu item: {e}")
+            log.error('Error updating menu item: %s', e)
             return False
     
     def delete_menu_item(self, item_id: int) -> bool:
         """ลบเมนูอาหาร (hard delete)"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # ลบ menu item
-            cursor.execute('DELETE FROM menu_items WHERE item_id = ?', (item_id,))
-            
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                # ลบ menu item
+                cursor.execute('DELETE FROM menu_items WHERE item_id = ?', (item_id,))
+            self.menu_cache.invalidate()
+            self._refresh_kitchen_menu_item(item_id)
+                
             return cursor.rowcount > 0
         except Exception as e:
-            print(f"Error deleting menu item: {e}")
+            log.error('Error deleting menu item: %s', e)
             return False
     
     # === Order Management ===
     def create_order(self, table_id: int, session_id: str) -> int:
         """สร้างออเดอร์ใหม่"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            thai_time = get_thai_datetime_string()
-            cursor.execute('''
-                INSERT INTO orders (table_id, session_id, created_at, updated_at)
-                VALUES (?, ?, ?, ?)
-            ''', (table_id, session_id, thai_time, thai_time))
-            order_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                thai_time = get_thai_datetime_string()
+                cursor.execute('''
+                    INSERT INTO orders (table_id, session_id, created_at, updated_at)
+                    VALUES (?, ?, ?, ?)
+                ''', (table_id, session_id, thai_time, thai_time))
+                order_id = cursor.lastrowid
             return order_id
         except Exception as e:
-            print(f"Error creating order: {e}")
+            log.error('Error creating order: %s', e)
             return 0
     
     def add_order_item(self, order_id: int, item_id: int, quantity: int, unit_price: float, customer_request: str = "") -> bool:
+        """เพิ่มรายการอาหารหนึ่งรายการในออเดอร์"""
+        result = self.add_order_items(order_id, [{
+            'item_id': item_id,
+            'quantity': quantity,
+            'unit_price': unit_price,
+            'customer_request': customer_request
+        }])
+        return result['success']
+
+    def add_order_items(self, order_id: int, items: List[Dict], sheets_sync: bool = False) -> Dict:
+        """เพิ่มรายการอาหารหลายรายการในออเดอร์ภายใน transaction เดียว
+
+        items: [{'item_id', 'quantity', 'unit_price', 'customer_request'}]
+        ถ้ามีรายการใดไม่ถูกต้องจะไม่บันทึกเลยสักรายการ และคืนค่า errors ตามลำดับของรายการ
+        sheets_sync=True เพิ่มงานซิงค์ออเดอร์ไปยัง Google Sheets ลง sheets_outbox ใน transaction เดียวกัน
+        คืนค่า {'success': bool, 'added': จำนวนที่เพิ่ม, 'total_amount': ยอดรวมใหม่, 'errors': [...]}
+        """
+        result = {'success': False, 'added': 0, 'total_amount': None, 'errors': []}
+        if not items:
+            result['errors'].append({'index': None, 'item_id': None, 'error': 'No items to add'})
+            return result
         try:
-            print(f"[DEBUG] add_order_item called with: order_id={order_id}, item_id={item_id}, quantity={quantity}, unit_price={unit_price}, customer_request='{customer_request}'")
-            total_price = quantity * unit_price
-            print(f"[DEBUG] add_order_item: calculated total_price={total_price}")
-            
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # ตรวจสอบว่า order_id มีอยู่จริงหรือไม่
-            cursor.execute('SELECT order_id FROM orders WHERE order_id = ?', (order_id,))
-            if not cursor.fetchone():
-                print(f"[ERROR] add_order_item: Order ID {order_id} does not exist")
-                conn.close()
-                return False
-            
-            # ตรวจสอบว่า item_id มีอยู่จริงหรือไม่
-            cursor.execute('SELECT item_id FROM menu_items WHERE item_id = ?', (item_id,))
-            if not cursor.fetchone():
-                print(f"[ERROR] add_order_item: Menu item ID {item_id} does not exist")
-                conn.close()
-                return False
-            
-            print(f"[DEBUG] add_order_item: Inserting into order_items...")
-            thai_time = get_thai_datetime_string()
-            cursor.execute('''
-                INSERT INTO order_items (order_id, item_id, quantity, unit_price, total_price, customer_request, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (order_id, item_id, quantity, unit_price, total_price, customer_request, thai_time))
-            
-            order_item_id = cursor.lastrowid
-            print(f"[DEBUG] add_order_item: Inserted order_item with ID={order_item_id}")
-            
-            # อัปเดตยอดรวมในออเดอร์ (ไม่รวมรายการที่ถูก reject)
-            print(f"[DEBUG] add_order_item: Updating total_amount for order_id={order_id}")
-            cursor.execute('''
-                UPDATE orders 
-                SET total_amount = (
-                    SELECT COALESCE(SUM(total_price), 0) FROM order_items 
-                    WHERE order_id = ? AND (status IS NULL OR status != 'rejected')
-                ), updated_at = ?
-                WHERE order_id = ?
-            ''', (order_id, thai_time, order_id))
-            
-            # ตรวจสอบว่า update สำเร็จหรือไม่
-            rows_affected = cursor.rowcount
-            print(f"[DEBUG] add_order_item: Updated {rows_affected} rows in orders table")
-            
-            conn.commit()
-            print(f"[DEBUG] add_order_item: Transaction committed successfully")
-            conn.close()
-            return True
+            log.debug('add_order_items called with: order_id=%s, %s items', order_id, len(items))
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+
+                # ตรวจสอบว่า order_id มีอยู่จริงหรือไม่
+                cursor.execute('SELECT order_id, table_id, session_id FROM orders WHERE order_id = ?', (order_id,))
+                order_row = cursor.fetchone()
+                if not order_row:
+                    log.error('add_order_items: Order ID %s does not exist', order_id)
+                    result['errors'].append({'index': None, 'item_id': None,
+                                             'error': f'Order ID {order_id} does not exist'})
+                    return result
+
+                # แปลง item_id เป็นตัวเลขก่อน (request อาจส่งมาเป็นสตริง เช่น "1") แล้วตรวจสอบทั้งหมดด้วยคิวรีเดียว
+                parsed_ids = []
+                for item in items:
+                    try:
+                        parsed_ids.append(int(item.get('item_id')))
+                    except (TypeError, ValueError):
+                        parsed_ids.append(None)
+                item_ids = list({item_id for item_id in parsed_ids if item_id is not None})
+                existing_ids = set()
+                if item_ids:
+                    placeholders = ','.join('?' * len(item_ids))
+                    cursor.execute(f'SELECT item_id FROM menu_items WHERE item_id IN ({placeholders})', item_ids)
+                    existing_ids = {row['item_id'] for row in cursor.fetchall()}
+
+                thai_time = get_thai_datetime_string()
+                rows = []
+                for index, item in enumerate(items):
+                    item_id = parsed_ids[index]
+                    if item_id is None:
+                        result['errors'].append({'index': index, 'item_id': item.get('item_id'),
+                                                 'error': f"Invalid menu item ID {item.get('item_id')!r}"})
+                        continue
+                    if item_id not in existing_ids:
+                        result['errors'].append({'index': index, 'item_id': item_id,
+                                                 'error': f'Menu item ID {item_id} does not exist'})
+                        continue
+                    try:
+                        quantity = int(item['quantity'])
+                        unit_price = float(item['unit_price'])
+                    except (KeyError, TypeError, ValueError):
+                        result['errors'].append({'index': index, 'item_id': item_id,
+                                                 'error': 'Invalid quantity or unit_price'})
+                        continue
+                    if quantity <= 0:
+                        result['errors'].append({'index': index, 'item_id': item_id,
+                                                 'error': 'Quantity must be greater than 0'})
+                        continue
+                    rows.append((order_id, item_id, quantity, unit_price, quantity * unit_price,
+                                 item.get('customer_request') or '', thai_time))
+
+                if result['errors']:
+                    for error in result['errors']:
+                        log.error('add_order_items: line %s: %s', error['index'], error['error'])
+                    return result
+
+                cursor.executemany('''
+                    INSERT INTO order_items (order_id, item_id, quantity, unit_price, total_price, customer_request, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+
+                # อัปเดตยอดรวมในออเดอร์ครั้งเดียว (ไม่รวมรายการที่ถูก reject)
+                cursor.execute('''
+                    UPDATE orders 
+                    SET total_amount = (
+                        SELECT COALESCE(SUM(total_price), 0) FROM order_items 
+                        WHERE order_id = ? AND (status IS NULL OR status != 'rejected')
+                    ), updated_at = ?
+                    WHERE order_id = ?
+                ''', (order_id, thai_time, order_id))
+                cursor.execute('SELECT total_amount FROM orders WHERE order_id = ?', (order_id,))
+                result['total_amount'] = cursor.fetchone()['total_amount']
+
+                queued = False
+                if sheets_sync:
+                    # ส่งรายการอาหารทั้งหมดของออเดอร์ (รูปแบบเดียวกับที่ซิงค์หลังสั่งอาหาร)
+                    cursor.execute('''
+                        SELECT mi.name AS item_name, oi.quantity, oi.unit_price,
+                               oi.total_price, oi.customer_request
+                        FROM order_items oi
+                        JOIN menu_items mi ON oi.item_id = mi.item_id
+                        WHERE oi.order_id = ?
+                    ''', (order_id,))
+                    order_items = [dict(row, customer_request=row['customer_request'] or '', special_options='')
+                                   for row in cursor.fetchall()]
+                    order_data = {
+                        'order_id': order_id,
+                        'table_id': order_row['table_id'],
+                        'session_id': order_row['session_id'],
+                        'status': 'รอดำเนินการ',
+                        'created_at': thai_time
+                    }
+                    queued = self._enqueue_sheets_sync(cursor, 'order_created', order_data, order_items)
+
+            if queued:
+                self.sheets_outbox_ready.set()
+            result['success'] = True
+            result['added'] = len(rows)
+            log.debug('add_order_items: Added %s items to order %s, total=%s', len(rows), order_id, result['total_amount'])
+            return result
         except Exception as e:
-            print(f"[ERROR] add_order_item: {e}")
+            log.error('add_order_items: %s', e)
             import traceback
-            print(f"[ERROR] add_order_item traceback: {traceback.format_exc()}")
-            return False
+            log.error('add_order_items traceback: %s', traceback.format_exc())
+            result['errors'].append({'index': None, 'item_id': None, 'error': str(e)})
+            return result
     
+    def place_order(self, table_id: int, session_id: str, items: List[Dict]) -> Dict:
+        """เพิ่มรายการอาหารในออเดอร์ที่ยังเปิดอยู่ของเซสชัน (active / pending) หรือออเดอร์ใหม่ ภายใน transaction เดียว
+
+        ถ้ามีรายการใดไม่ถูกต้องจะไม่บันทึกอะไรเลย (รวมถึงไม่สร้างออเดอร์ใหม่ที่ว่างเปล่า)
+        งานซิงค์ Google Sheets ถูกบันทึกลง sheets_outbox ใน transaction เดียวกัน
+        คืนค่าเหมือน add_order_items พร้อม 'order_id'
+        """
+        result = {'success': False, 'added': 0, 'total_amount': None, 'errors': [], 'order_id': None}
+        try:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT order_id FROM orders 
+                    WHERE table_id = ? AND session_id = ? AND status IN ('active', 'pending')
+                    ORDER BY created_at DESC LIMIT 1
+                ''', (table_id, session_id))
+                existing_order = cursor.fetchone()
+                if existing_order:
+                    order_id = existing_order['order_id']
+                else:
+                    thai_time = get_thai_datetime_string()
+                    cursor.execute('''
+                        INSERT INTO orders (table_id, session_id, created_at, updated_at)
+                        VALUES (?, ?, ?, ?)
+                    ''', (table_id, session_id, thai_time, thai_time))
+                    order_id = cursor.lastrowid
+
+                # add_order_items ใช้ transaction เดียวกันนี้
+                result.update(self.add_order_items(order_id, items, sheets_sync=True))
+                if not result['success']:
+                    raise OrderItemsRejected()
+            result['order_id'] = order_id
+            # ปลุก worker อีกครั้งหลัง commit (add_order_items ปลุกก่อน transaction ด้านนอกจะ commit)
+            self.sheets_outbox_ready.set()
+            return result
+        except OrderItemsRejected:
+            return result
+        except Exception as e:
+            log.error('Error placing order: %s', e)
+            result['success'] = False
+            result['errors'].append({'index': None, 'item_id': None, 'error': str(e)})
+            return result
+
     def get_table_orders(self, table_id: int, session_id: str = None) -> List[Dict]:
         """ดึงออเดอร์ของโต๊ะ (ทุกสถานะ)"""
-        print(f"DEBUG: get_table_orders called with table_id={table_id}, session_id={session_id}")
-        print(f"[DEBUG DETAIL] get_table_orders: session_id type: {type(session_id)}, value: '{session_id}'")
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # ตรวจสอบว่ามี session_id หรือไม่ (ต้องไม่เป็น None และไม่เป็นสตริงว่าง)
-        if session_id is not None and session_id != '':
-            print(f"[DEBUG DETAIL] get_table_orders: Using session_id filter: '{session_id}'")
-            query = '''
-                SELECT o.*, oi.*, mi.name as item_name, oi.status as item_status
-                FROM orders o
-                JOIN order_items oi ON o.order_id = oi.order_id
-                JOIN menu_items mi ON oi.item_id = mi.item_id
-                WHERE o.table_id = ? AND o.session_id = ?
-                ORDER BY oi.created_at
-            '''
-            params = (table_id, session_id)
-            print(f"DEBUG: Executing query with session_id: {query}")
-            print(f"DEBUG: Parameters: {params}")
-            cursor.execute(query, params)
-        else:
-            print(f"[DEBUG DETAIL] get_table_orders: No session_id provided, will return ALL orders for table {table_id}")
-            query = '''
-                SELECT o.*, oi.*, mi.name as item_name, oi.status as item_status
-                FROM orders o
-                JOIN order_items oi ON o.order_id = oi.order_id
-                JOIN menu_items mi ON oi.item_id = mi.item_id
-                WHERE o.table_id = ?
-                ORDER BY oi.created_at
-            '''
-            params = (table_id,)
-            print(f"DEBUG: Executing query without session_id: {query}")
-            print(f"DEBUG: Parameters: {params}")
-            cursor.execute(query, params)
-        
-        raw_results = cursor.fetchall()
-        print(f"DEBUG: Raw query results count: {len(raw_results)}")
-        if raw_results:
-            first_result = dict(raw_results[0])
-            print(f"DEBUG: First result: {first_result}")
-            if 'session_id' in first_result:
-                print(f"[DEBUG DETAIL] First result session_id: '{first_result['session_id']}'")
-        
-        orders = [dict(row) for row in raw_results]
-        print(f"DEBUG: Final orders count: {len(orders)}")
-        
-        # แสดงข้อมูล session_id ของทุกรายการที่ได้
-        if orders:
-            session_ids = set(order.get('session_id') for order in orders if 'session_id' in order)
-            print(f"[DEBUG DETAIL] Orders contain these session_ids: {session_ids}")
-        
-        conn.close()
+        log.debug('get_table_orders called with table_id=%s, session_id=%s', table_id, session_id)
+        log.debug("get_table_orders: session_id type: %s, value: '%s'", type(session_id), session_id)
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            # ตรวจสอบว่ามี session_id หรือไม่ (ต้องไม่เป็น None และไม่เป็นสตริงว่าง)
+            if session_id is not None and session_id != '':
+                log.debug("get_table_orders: Using session_id filter: '%s'", session_id)
+                query = '''
+                    SELECT o.*, oi.*, mi.name as item_name, oi.status as item_status
+                    FROM orders o
+                    JOIN order_items oi ON o.order_id = oi.order_id
+                    JOIN menu_items mi ON oi.item_id = mi.item_id
+                    WHERE o.table_id = ? AND o.session_id = ?
+                    ORDER BY oi.created_at
+                '''
+                params = (table_id, session_id)
+                log.debug('Executing query with session_id: %s', query)
+                log.debug('Parameters: %s', params)
+                cursor.execute(query, params)
+            else:
+                log.debug('get_table_orders: No session_id provided, will return ALL orders for table %s', table_id)
+                query = '''
+                    SELECT o.*, oi.*, mi.name as item_name, oi.status as item_status
+                    FROM orders o
+                    JOIN order_items oi ON o.order_id = oi.order_id
+                    JOIN menu_items mi ON oi.item_id = mi.item_id
+                    WHERE o.table_id = ?
+                    ORDER BY oi.created_at
+                '''
+                params = (table_id,)
+                log.debug('Executing query without session_id: %s', query)
+                log.debug('Parameters: %s', params)
+                cursor.execute(query, params)
+            
+            orders = [dict(row) for row in cursor.fetchall()]
+            
+            # แสดงข้อมูล session_id ของทุกรายการที่ได้ (คำนวณเฉพาะเมื่อเปิด debug)
+            if orders and log.isEnabledFor(logging.DEBUG):
+                session_ids = set(order.get('session_id') for order in orders)
+                log.debug('get_table_orders: %s rows, first: %s, session_ids: %s', len(orders), orders[0], session_ids)
+
         return orders
-    
+
+    def get_floor_plan(self) -> List[Dict]:
+        """ดึงข้อมูลโต๊ะทั้งหมดพร้อมรายการอาหารของเซสชันปัจจุบัน (จัดกลุ่มแล้ว) และยอดรวม ด้วยคิวรีเดียว
+
+        รายการอาหารจัดกลุ่มตามชื่ออาหาร + customer_request + สถานะ เหมือน /api/tables/<id>/orders
+        """
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            # มี MIN() เพียงตัวเดียว คอลัมน์ที่ไม่ได้ aggregate (order_id, item_id, unit_price) จึงมาจากรายการแรกของกลุ่ม
+            cursor.execute('''
+                SELECT t.*,
+                       oi.order_id AS order_id, oi.item_id AS item_id, oi.unit_price AS unit_price,
+                       mi.name AS item_name,
+                       COALESCE(oi.customer_request, '') AS customer_request,
+                       oi.status AS item_status,
+                       SUM(oi.quantity) AS quantity,
+                       SUM(oi.total_price) AS total_price,
+                       MIN(oi.order_item_id) AS first_order_item_id
+                FROM tables t
+                LEFT JOIN orders o ON o.table_id = t.table_id AND o.session_id = t.session_id
+                LEFT JOIN order_items oi ON oi.order_id = o.order_id
+                LEFT JOIN menu_items mi ON mi.item_id = oi.item_id
+                GROUP BY t.table_id, mi.name, COALESCE(oi.customer_request, ''), oi.status
+                ORDER BY t.table_id, first_order_item_id
+            ''')
+            rows = cursor.fetchall()
+
+        item_fields = ('order_id', 'item_id', 'unit_price', 'item_name', 'customer_request',
+                       'item_status', 'quantity', 'total_price', 'first_order_item_id')
+        floor = []
+        tables_by_id = {}
+        for row in rows:
+            row = dict(row)
+            table = tables_by_id.get(row['table_id'])
+            if table is None:
+                table = {key: value for key, value in row.items() if key not in item_fields}
+                table.update({'order_id': None, 'orders': [], 'total_amount': 0, 'order_count': 0})
+                tables_by_id[row['table_id']] = table
+                floor.append(table)
+            # โต๊ะที่ไม่มีรายการอาหาร หรือรายการที่ไม่พบเมนูแล้ว (เหมือน JOIN ใน get_table_orders)
+            if row['first_order_item_id'] is None or row['item_name'] is None:
+                continue
+            if table['order_id'] is None:
+                table['order_id'] = row['order_id']
+            table['orders'].append({
+                'menu_id': row['item_id'],
+                'menu_name': row['item_name'],
+                'quantity': row['quantity'],
+                'price': row['unit_price'],
+                'total': row['total_price'],
+                'customer_request': row['customer_request'],
+                'item_status': row['item_status']
+            })
+            # ไม่รวมราคาของรายการที่ปฏิเสธในยอดรวม
+            if row['item_status'] != 'rejected':
+                table['total_amount'] += row['total_price']
+            table['order_count'] = len(table['orders'])
+        return floor
+
     def complete_payment_transaction(self, table_id: int, session_id: str) -> bool:
-        """ดำเนินการชำระเงินแบบ transaction เดียว - ปิดออเดอร์และอัปเดตสถานะโต๊ะ"""
-        conn = None
+        """ดำเนินการชำระเงินแบบ transaction เดียว - ปิดออเดอร์และอัปเดตสถานะโต๊ะ
+
+        ทำได้เฉพาะเมื่อ session_id ยังเป็นเซสชั่นปัจจุบันของโต๊ะ (ป้องกันการชำระเงินซ้ำหรือชนกับการปิดเซสชั่น)
+        """
         try:
-            conn = self.get_connection()
+            with self.table_state.lock:
+                current = self.table_state.get(table_id)
+                error = self.table_state.check_transition(current, 'needs_clearing', session_id, expected_session_id=session_id)
+                if error:
+                    log.warning('complete_payment_transaction: table %s rejected: %s', table_id, error)
+                    return False
+                completed_orders = self._complete_payment_orders(table_id, session_id, current)
+        except Exception as e:
+            log.error('Error in complete_payment_transaction: %s', e)
+            self.table_state.reload()
+            return False
+        
+        log.debug('complete_payment_transaction: Table %s payment completed, %s orders processed', table_id, len(completed_orders))
+        # งานซิงค์ Google Sheets ถูกบันทึกใน sheets_outbox ภายใน transaction เดียวกันแล้ว
+        if completed_orders:
+            self.sheets_outbox_ready.set()
+        return True
+
+    def _complete_payment_orders(self, table_id: int, session_id: str, current: Dict) -> List[Tuple[Dict, List[Dict]]]:
+        """ปิดออเดอร์ของเซสชั่น ย้ายไปยัง order_history และเปลี่ยนโต๊ะเป็น needs_clearing (เรียกขณะถือ table_state.lock)
+
+        คืนค่า [(order_data, order_items)] ของออเดอร์ที่ปิด (งานซิงค์ Google Sheets ถูกเพิ่มลง sheets_outbox ใน transaction นี้)
+        """
+        with self.transaction() as conn:
             cursor = conn.cursor()
             
-            # เริ่ม transaction
-            cursor.execute('BEGIN TRANSACTION')
-            
             # ดึงออเดอร์ของโต๊ะ
             cursor.execute('''
                 SELECT order_id FROM orders 
@@ -1025,73 +1694,48 @@ class DatabaseManager:
                             ''', (item['order_id'], item['item_id'], item['quantity'], item['unit_price'], 
                                   item['customer_request'], item['status']))
                     else:
-                        print(f"[DEBUG] Order {order_data['order_id']} already exists in order_history, skipping")
+                        log.debug('Order %s already exists in order_history, skipping', order_data['order_id'])
                     
+                    self._enqueue_sheets_sync(cursor, 'order_completed', order_data, order_items)
                     completed_orders.append((order_data, order_items))
             
-            # อัปเดตสถานะโต๊ะเป็นรอเคลียร์โต๊ะ
-            cursor.execute('''
-                UPDATE tables 
-                SET status = 'needs_clearing', updated_at = CURRENT_TIMESTAMP
-                WHERE table_id = ?
-            ''', (table_id,))
-            
-            # Commit transaction
-            conn.commit()
-            print(f"[DEBUG] complete_payment_transaction: Table {table_id} payment completed, {len(completed_orders)} orders processed")
+            # อัปเดตสถานะโต๊ะเป็นรอเคลียร์โต๊ะ (คง session_id เดิม)
+            table_row = self._write_table_status(cursor, current, 'needs_clearing', current['session_id'])
+            if table_row is None:
+                raise sqlite3.IntegrityError('table row changed outside the table state machine')
             
-            # บันทึกลง Google Sheets แบบ background (หลังจาก commit แล้ว)
-            if completed_orders and is_google_sheets_enabled():
-                import threading
-                def sync_to_sheets():
-                    for order_data, order_items in completed_orders:
-                        try:
-                            sync_success = sync_order_to_new_format(order_data, order_items)
-                            if sync_success:
-                                print(f"[Google Sheets] Order {order_data['order_id']} synced successfully")
-                            else:
-                                print(f"[Google Sheets] Failed to sync order {order_data['order_id']}")
-                        except Exception as sheets_error:
-                            print(f"[Google Sheets] Error syncing order {order_data['order_id']}: {sheets_error}")
-                
-                # รันการซิงค์ใน background thread
-                sync_thread = threading.Thread(target=sync_to_sheets, daemon=True)
-                sync_thread.start()
+            # อัปเดตสรุปยอดขายรายวัน (กรณี session ข้ามวัน)
+            self._touch_sales_rollup(cursor, self._order_sales_days(cursor, [row[0] for row in order_rows]))
             
-            return True
-                
-        except Exception as e:
-            if conn:
-                conn.rollback()
-            print(f"Error in complete_payment_transaction: {e}")
-            return False
-        finally:
-            if conn:
-                conn.close()
+        self.table_state.store(table_row)
+        return completed_orders
 
     def complete_order(self, order_id: int) -> bool:
         """ปิดออเดอร์ (เก็บไว้เพื่อ backward compatibility)"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # อัปเดตสถานะออเดอร์
-            cursor.execute('''
-                UPDATE orders 
-                SET status = 'completed', completed_at = CURRENT_TIMESTAMP
-                WHERE order_id = ?
-            ''', (order_id,))
-            
-            # ดึงข้อมูลออเดอร์สำหรับ Google Sheets
-            cursor.execute('''
-                SELECT order_id, table_id, session_id, status, total_amount, 
-                       created_at, completed_at, updated_at
-                FROM orders 
-                WHERE order_id = ?
-            ''', (order_id,))
-            
-            order_row = cursor.fetchone()
-            if order_row:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                # อัปเดตสถานะออเดอร์
+                cursor.execute('''
+                    UPDATE orders 
+                    SET status = 'completed', completed_at = CURRENT_TIMESTAMP
+                    WHERE order_id = ?
+                ''', (order_id,))
+                
+                # ดึงข้อมูลออเดอร์สำหรับ Google Sheets
+                cursor.execute('''
+                    SELECT order_id, table_id, session_id, status, total_amount, 
+                           created_at, completed_at, updated_at
+                    FROM orders 
+                    WHERE order_id = ?
+                ''', (order_id,))
+                
+                order_row = cursor.fetchone()
+                if not order_row:
+                    log.error('Error: Order %s not found', order_id)
+                    return False
+                
                 order_data = {
                     'order_id': order_row[0],
                     'table_id': order_row[1],
@@ -1149,218 +1793,340 @@ class DatabaseManager:
                         ''', (item['order_id'], item['item_id'], item['quantity'], item['unit_price'], 
                               item['customer_request'], item['status']))
                 else:
-                    print(f"[DEBUG] Order {order_data['order_id']} already exists in order_history, skipping")
-                
-                conn.commit()
-                conn.close()
-                
-                # บันทึกลง Google Sheets แบบ background (ไม่ให้ผู้ใช้รอ)
-                if is_google_sheets_enabled():
-                    import threading
-                    def sync_to_sheets():
-                        try:
-                            sync_success = sync_order_to_new_format(order_data, order_items)
-                            if sync_success:
-                                print(f"[Google Sheets] Order {order_id} synced successfully")
-                            else:
-                                print(f"[Google Sheets] Failed to sync order {order_id}")
-                        except Exception as sheets_error:
-                            print(f"[Google Sheets] Error syncing order {order_id}: {sheets_error}")
-                    
-                    # รันการซิงค์ใน background thread
-                    sync_thread = threading.Thread(target=sync_to_sheets, daemon=True)
-                    sync_thread.start()
+                    log.debug('Order %s already exists in order_history, skipping', order_data['order_id'])
                 
-                return True
-            else:
-                conn.close()
-                print(f"Error: Order {order_id} not found")
-                return False
+                # อัปเดตสรุปยอดขายรายวัน
+                self._touch_sales_rollup(cursor, self._order_sales_days(cursor, [order_id]))
+                
+                # บันทึกงานซิงค์ Google Sheets ใน transaction เดียวกัน (ส่งโดย OutboxWorker)
+                queued = self._enqueue_sheets_sync(cursor, 'order_completed', order_data, order_items)
+            
+            if queued:
+                self.sheets_outbox_ready.set()
+            return True
                 
         except Exception as e:
-            print(f"Error completing order: {e}")
+            log.error('Error completing order: %s', e)
             return False
     
     def update_order_status(self, order_id: int, status: str) -> bool:
         """อัปเดตสถานะออเดอร์"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE orders 
-                SET status = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE order_id = ?
-            ''', (status, order_id))
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE orders 
+                    SET status = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE order_id = ?
+                ''', (status, order_id))
+                
+                # สถานะ rejected มีผลต่อยอดขาย อัปเดตสรุปยอดขายรายวัน
+                self._touch_sales_rollup(cursor, self._order_sales_days(cursor, [order_id]))
             return True
         except Exception as e:
-            print(f"Error updating order status: {e}")
+            log.error('Error updating order status: %s', e)
             return False
     
-    def update_order_item_status(self, order_item_id: int, status: str) -> bool:
-        """อัปเดตสถานะรายการออเดอร์ย่อย และอัปเดต total_amount ของออเดอร์"""
+    def reject_order(self, order_id: int) -> bool:
+        """ปฏิเสธออเดอร์: สถานะ rejected และราคาทุกรายการเป็น 0 (อัปเดตสรุปยอดขายของวันที่ปิดแล้วใน transaction เดียวกัน)"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # ดึง order_id ก่อนอัปเดต
-            cursor.execute('SELECT order_id FROM order_items WHERE order_item_id = ?', (order_item_id,))
-            result = cursor.fetchone()
-            if not result:
-                conn.close()
-                return False
-            order_id = result['order_id']
-            
-            # อัปเดตสถานะรายการ
-            cursor.execute('''
-                UPDATE order_items 
-                SET status = ?
-                WHERE order_item_id = ?
-            ''', (status, order_item_id))
-            
-            # อัปเดต total_amount ของออเดอร์โดยรวมเฉพาะรายการที่ไม่ถูกปฏิเสธ
-            cursor.execute('''
-                UPDATE orders 
-                SET total_amount = (
-                    SELECT COALESCE(SUM(total_price), 0) 
-                    FROM order_items 
-                    WHERE order_id = ? AND (status IS NULL OR status != 'rejected')
-                ), updated_at = ?
-                WHERE order_id = ?
-            ''', (order_id, get_thai_datetime_string(), order_id))
-            
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE orders 
+                    SET status = 'rejected', total_amount = 0, updated_at = CURRENT_TIMESTAMP
+                    WHERE order_id = ?
+                ''', (order_id,))
+                if cursor.rowcount == 0:
+                    return False
+                cursor.execute('''
+                    UPDATE order_items 
+                    SET unit_price = 0, total_price = 0
+                    WHERE order_id = ?
+                ''', (order_id,))
+                self._touch_sales_rollup(cursor, self._order_sales_days(cursor, [order_id]))
             return True
         except Exception as e:
-            print(f"Error updating order item status: {e}")
+            log.error('Error rejecting order: %s', e)
             return False
+
+    def replace_session_order_items(self, table_id: int, session_id: str, items: List[Dict]) -> Optional[Dict]:
+        """แทนที่รายการอาหารของออเดอร์ในเซสชันของโต๊ะ (ใช้ออเดอร์แรกของเซสชัน สร้างใหม่ถ้ายังไม่มี ลบออเดอร์ถ้าไม่มีรายการ)
+
+        items: [{'menu_id', 'quantity', 'price', 'total_price', 'customer_request', 'status'}]
+        คืนค่า {'order_id': ออเดอร์ที่ถูกเปลี่ยน (None = ไม่มีการเปลี่ยน), 'deleted': ออเดอร์ถูกลบ} หรือ None ถ้าเกิดข้อผิดพลาด
+        """
+        try:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT order_id FROM orders 
+                    WHERE table_id = ? AND session_id = ?
+                    ORDER BY order_id
+                    LIMIT 1
+                ''', (table_id, session_id))
+                existing_order = cursor.fetchone()
+                
+                if existing_order:
+                    order_id = existing_order['order_id']
+                    # อ่านวันที่ของออเดอร์ก่อนลบ เพื่ออัปเดตสรุปยอดขาย
+                    sales_days = self._order_sales_days(cursor, [order_id])
+                    cursor.execute('DELETE FROM order_items WHERE order_id = ?', (order_id,))
+                    if not items:
+                        cursor.execute('DELETE FROM orders WHERE order_id = ?', (order_id,))
+                        self._touch_sales_rollup(cursor, sales_days)
+                        return {'order_id': order_id, 'deleted': True}
+                elif items:
+                    cursor.execute('''
+                        INSERT INTO orders (table_id, session_id)
+                        VALUES (?, ?)
+                    ''', (table_id, session_id))
+                    order_id = cursor.lastrowid
+                    sales_days = set()
+                else:
+                    return {'order_id': None, 'deleted': False}
+                
+                for index, item in enumerate(items):
+                    menu_id = item.get('menu_id')
+                    quantity = item.get('quantity', 1)
+                    price = item.get('price')
+                    if not menu_id or not price:
+                        log.debug('Skipping order item %s: missing menu_id or price', index)
+                        continue
+                    cursor.execute('''
+                        INSERT INTO order_items (order_id, item_id, quantity, unit_price, total_price, customer_request, status)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', (order_id, menu_id, quantity, price, item.get('total_price', price * quantity),
+                          item.get('customer_request', ''), item.get('status', 'pending')))
+                
+                self._touch_sales_rollup(cursor, sales_days)
+            return {'order_id': order_id, 'deleted': False}
+        except Exception as e:
+            log.error('Error replacing session order items: %s', e)
+            return None
+    
+    def update_order_item_status(self, order_item_id: int, status: str) -> bool:
+        """อัปเดตสถานะรายการออเดอร์ย่อย และอัปเดต total_amount ของออเดอร์"""
+        result = self.update_order_items_status([order_item_id], status)
+        return bool(result and result['updated'])
+
+    def update_order_items_status(self, order_item_ids: List[int], status: str) -> Optional[Dict]:
+        """อัปเดตสถานะรายการออเดอร์ย่อยหลายรายการในธุรกรรมเดียว และคำนวณ total_amount ครั้งเดียวต่อออเดอร์
+
+        คืนค่า {'updated': [order_item_id], 'missing': [order_item_id ที่ไม่พบ], 'order_ids': [ออเดอร์ที่เปลี่ยน]}
+        หรือ None ถ้าเกิดข้อผิดพลาด (ไม่มีรายการใดถูกเปลี่ยน)
+        """
+        order_item_ids = list(dict.fromkeys(order_item_ids))
+        try:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                order_by_item = {}
+                for start in range(0, len(order_item_ids), self.ITEM_BATCH_SIZE):
+                    chunk = order_item_ids[start:start + self.ITEM_BATCH_SIZE]
+                    placeholders = ','.join('?' * len(chunk))
+                    cursor.execute(f'SELECT order_item_id, order_id FROM order_items WHERE order_item_id IN ({placeholders})', chunk)
+                    order_by_item.update((row['order_item_id'], row['order_id']) for row in cursor.fetchall())
+                    cursor.execute(f'UPDATE order_items SET status = ? WHERE order_item_id IN ({placeholders})', [status] + chunk)
+
+                # อัปเดต total_amount ของออเดอร์โดยรวมเฉพาะรายการที่ไม่ถูกปฏิเสธ
+                order_ids = list(dict.fromkeys(order_by_item.values()))
+                updated_at = get_thai_datetime_string()
+                for start in range(0, len(order_ids), self.ITEM_BATCH_SIZE):
+                    chunk = order_ids[start:start + self.ITEM_BATCH_SIZE]
+                    cursor.execute(f'''
+                        UPDATE orders 
+                        SET total_amount = (
+                            SELECT COALESCE(SUM(total_price), 0) 
+                            FROM order_items 
+                            WHERE order_items.order_id = orders.order_id AND (status IS NULL OR status != 'rejected')
+                        ), updated_at = ?
+                        WHERE order_id IN ({','.join('?' * len(chunk))})
+                    ''', [updated_at] + chunk)
+
+                # อัปเดตสรุปยอดขายรายวันถ้าออเดอร์อยู่ในวันที่ปิดแล้ว
+                self._touch_sales_rollup(cursor, self._order_sales_days(cursor, order_ids))
+
+            return {
+                'updated': [item_id for item_id in order_item_ids if item_id in order_by_item],
+                'missing': [item_id for item_id in order_item_ids if item_id not in order_by_item],
+                'order_ids': order_ids
+            }
+        except Exception as e:
+            log.error('Error updating order items status: %s', e)
+            return None
     
     def get_order_items_with_status(self, order_id: int) -> List[Dict]:
         """ดึงรายการออเดอร์ย่อยพร้อมสถานะ"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT oi.order_item_id, oi.order_id, oi.item_id, oi.quantity, 
-                       oi.unit_price, oi.customer_request, oi.status,
-                       mi.name, mi.description
-                FROM order_items oi
-                JOIN menu_items mi ON oi.item_id = mi.item_id
-                WHERE oi.order_id = ?
-                ORDER BY oi.order_item_id
-            ''', (order_id,))
-            
-            items = []
-            for row in cursor.fetchall():
-                items.append({
-                    'order_item_id': row['order_item_id'],
-                    'order_id': row['order_id'],
-                    'item_id': row['item_id'],
-                    'name': row['name'],
-                    'description': row['description'],
-                    'quantity': row['quantity'],
-                    'unit_price': row['unit_price'],
-                    'customer_request': row['customer_request'],
-                    'status': row['status'] or 'pending'
-                })
-            
-            conn.close()
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT oi.order_item_id, oi.order_id, oi.item_id, oi.quantity, 
+                           oi.unit_price, oi.customer_request, oi.status,
+                           mi.name, mi.description
+                    FROM order_items oi
+                    JOIN menu_items mi ON oi.item_id = mi.item_id
+                    WHERE oi.order_id = ?
+                    ORDER BY oi.order_item_id
+                ''', (order_id,))
+                
+                items = []
+                for row in cursor.fetchall():
+                    items.append({
+                        'order_item_id': row['order_item_id'],
+                        'order_id': row['order_id'],
+                        'item_id': row['item_id'],
+                        'name': row['name'],
+                        'description': row['description'],
+                        'quantity': row['quantity'],
+                        'unit_price': row['unit_price'],
+                        'customer_request': row['customer_request'],
+                        'status': row['status'] or 'pending'
+                    })
+                
             return items
         except Exception as e:
-            print(f"Error getting order items with status: {e}")
+            log.error('Error getting order items with status: %s', e)
             return []
     
     def get_orders_by_table(self, table_id: int, status: str = None) -> List[Dict]:
         """ดึงรายการคำสั่งซื้อของโต๊ะตามสถานะ"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # สร้างคำสั่ง SQL ตามเงื่อนไข
-            query = '''
-                SELECT o.order_id, o.table_id, o.session_id, o.status, datetime(o.created_at, 'localtime') as created_at,
-                oi.order_item_id, oi.quantity, oi.unit_price, oi.customer_request,
-                oi.status as item_status,
-                mi.name as menu_name, mi.item_id, oi.unit_price as price
-            FROM orders o
-            JOIN order_items oi ON o.order_id = oi.order_id
-            JOIN menu_items mi ON oi.item_id = mi.item_id
-            WHERE o.table_id = ?
-            '''
-            
-            params = [table_id]
-            
-            # เพิ่มเงื่อนไขสถานะถ้ามีการระบุ
-            if status:
-                query += ' AND oi.status = ?'
-                params.append(status)
-            
-            query += ' ORDER BY o.created_at DESC, oi.order_item_id'
-            
-            cursor.execute(query, params)
-            orders = [dict(row) for row in cursor.fetchall()]
-            conn.close()
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                
+                # สร้างคำสั่ง SQL ตามเงื่อนไข
+                query = '''
+                    SELECT o.order_id, o.table_id, o.session_id, o.status, datetime(o.created_at, 'localtime') as created_at,
+                    oi.order_item_id, oi.quantity, oi.unit_price, oi.customer_request,
+                    oi.status as item_status,
+                    mi.name as menu_name, mi.item_id, oi.unit_price as price
+                FROM orders o
+                JOIN order_items oi ON o.order_id = oi.order_id
+                JOIN menu_items mi ON oi.item_id = mi.item_id
+                WHERE o.table_id = ?
+                '''
+                
+                params = [table_id]
+                
+                # เพิ่มเงื่อนไขสถานะถ้ามีการระบุ
+                if status:
+                    query += ' AND oi.status = ?'
+                    params.append(status)
+                
+                query += ' ORDER BY o.created_at DESC, oi.order_item_id'
+                
+                cursor.execute(query, params)
+                orders = [dict(row) for row in cursor.fetchall()]
             return orders
         except Exception as e:
-            print(f"Error getting orders by table: {e}")
+            log.error('Error getting orders by table: %s', e)
             return []
     
     def delete_orders_by_session(self, table_id: int, session_id: str) -> bool:
         """ลบออเดอร์ทั้งหมดของ session ที่ระบุ"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # ดึงรายการ order_id ที่ต้องลบ
-            cursor.execute('''
-                SELECT order_id FROM orders 
-                WHERE table_id = ? AND session_id = ?
-            ''', (table_id, session_id))
-            
-            order_ids = [row['order_id'] for row in cursor.fetchall()]
-            
-            if order_ids:
-                # ลบ order_items ก่อน
-                placeholders = ','.join('?' * len(order_ids))
-                cursor.execute(f'''
-                    DELETE FROM order_items 
-                    WHERE order_id IN ({placeholders})
-                ''', order_ids)
+            with self.transaction() as conn:
+                cursor = conn.cursor()
                 
-                # ลบ orders
+                # ดึงรายการ order_id ที่ต้องลบ
                 cursor.execute('''
-                    DELETE FROM orders 
+                    SELECT order_id FROM orders 
                     WHERE table_id = ? AND session_id = ?
                 ''', (table_id, session_id))
-            
-            conn.commit()
-            conn.close()
-            print(f"Deleted {len(order_ids)} orders for table {table_id}, session {session_id}")
+                
+                order_ids = [row['order_id'] for row in cursor.fetchall()]
+                
+                if order_ids:
+                    sales_days = self._order_sales_days(cursor, order_ids)
+                    
+                    # ลบ order_items ก่อน
+                    placeholders = ','.join('?' * len(order_ids))
+                    cursor.execute(f'''
+                        DELETE FROM order_items 
+                        WHERE order_id IN ({placeholders})
+                    ''', order_ids)
+                    
+                    # ลบ orders
+                    cursor.execute('''
+                        DELETE FROM orders 
+                        WHERE table_id = ? AND session_id = ?
+                    ''', (table_id, session_id))
+                    
+                    self._touch_sales_rollup(cursor, sales_days)
+                
+            log.info('Deleted %s orders for table %s, session %s', len(order_ids), table_id, session_id)
             return True
             
         except Exception as e:
-            print(f"Error deleting orders by session: {e}")
+            log.error('Error deleting orders by session: %s', e)
             return False
     
+    # จำนวน order_id สูงสุดต่อหนึ่งคิวรี IN (...) (ต่ำกว่าขีดจำกัดตัวแปรของ SQLite รุ่นเก่า)
+    ITEM_BATCH_SIZE = 500
+
+    # คิวรีรายการอาหารแบบเป็นชุด ({join} = JOIN/LEFT JOIN, {placeholders} = ?,?,...)
+    ORDER_ITEMS_BATCH_SQL = '''
+        SELECT oi.order_item_id, oi.order_id, oi.item_id, oi.quantity, oi.unit_price,
+               oi.total_price, oi.customer_request, oi.status, mi.name as item_name
+        FROM order_items oi
+        {join} menu_items mi ON oi.item_id = mi.item_id
+        WHERE oi.order_id IN ({placeholders})
+        ORDER BY oi.order_id, oi.order_item_id
+    '''
+    HISTORY_ITEMS_BATCH_SQL = '''
+        SELECT ohi.history_item_id, ohi.order_id, ohi.menu_item_id, ohi.quantity, ohi.price,
+               ohi.customer_request, ohi.status, mi.name as item_name
+        FROM order_history_items ohi
+        {join} menu_items mi ON ohi.menu_item_id = mi.item_id
+        WHERE ohi.order_id IN ({placeholders})
+        ORDER BY ohi.order_id, ohi.history_item_id
+    '''
+
+    def _fetch_items_by_order(self, cursor, order_ids: List[int], history: bool = False,
+                              require_menu_item: bool = False) -> Dict[int, List[sqlite3.Row]]:
+        """ดึงรายการอาหารของหลายออเดอร์ด้วยคิวรี IN (...) เป็นชุด แล้วจัดกลุ่มตาม order_id"""
+        grouped = {order_id: [] for order_id in order_ids}
+        ids = list(grouped)
+        template = self.HISTORY_ITEMS_BATCH_SQL if history else self.ORDER_ITEMS_BATCH_SQL
+        join = 'JOIN' if require_menu_item else 'LEFT JOIN'
+        for start in range(0, len(ids), self.ITEM_BATCH_SIZE):
+            chunk = ids[start:start + self.ITEM_BATCH_SIZE]
+            cursor.execute(template.format(join=join, placeholders=','.join('?' * len(chunk))), chunk)
+            for item_row in cursor.fetchall():
+                grouped[item_row['order_id']].append(item_row)
+        return grouped
+
+    def get_orders_with_items(self, order_query: str, params=(), history: bool = False,
+                              require_menu_item: bool = False) -> List[Tuple[sqlite3.Row, List[sqlite3.Row]]]:
+        """รันคิวรีออเดอร์ (ต้องมีคอลัมน์ order_id) แล้วดึงรายการอาหารของทุกออเดอร์ในคิวรีเดียว
+
+        คืนค่า [(order_row, [item_row, ...]), ...] ตามลำดับของคิวรีออเดอร์
+        history=True ใช้ order_history_items, require_menu_item=True ตัดรายการที่ไม่มีเมนูแล้ว (INNER JOIN)
+        """
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(order_query, params)
+            order_rows = cursor.fetchall()
+            items_by_order = self._fetch_items_by_order(
+                cursor, [row['order_id'] for row in order_rows], history, require_menu_item)
+        return [(row, items_by_order[row['order_id']]) for row in order_rows]
+
     def get_orders_by_date_range(self, start_date: str, end_date: str) -> List[Dict]:
         """ดึงออเดอร์ตามช่วงวันที่"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
+            date_clause, date_params = date_range_predicate('o.created_at', start_date, end_date)
+            order_rows = self.get_orders_with_items(f'''
                 SELECT o.order_id, o.table_id, o.session_id, o.status, o.total_amount,
                        o.created_at, o.completed_at, t.table_name
                 FROM orders o
                 JOIN tables t ON o.table_id = t.table_id
-                WHERE DATE(o.created_at) BETWEEN ? AND ?
+                WHERE 1=1 {date_clause}
                 ORDER BY o.created_at DESC
-            ''', (start_date, end_date))
+            ''', date_params, require_menu_item=True)
             
             orders = []
-            for row in cursor.fetchall():
+            for row, item_rows in order_rows:
                 order_data = {
                     'order_id': row['order_id'],
                     'table_id': row['table_id'],
@@ -1372,18 +2138,9 @@ class DatabaseManager:
                     'completed_at': row['completed_at']
                 }
                 
-                # ดึงรายการอาหารของแต่ละออเดอร์
-                cursor.execute('''
-                    SELECT oi.order_item_id, oi.item_id, oi.quantity, oi.unit_price, 
-                           oi.total_price, oi.customer_request, oi.status, mi.name as item_name
-                    FROM order_items oi
-                    JOIN menu_items mi ON oi.item_id = mi.item_id
-                    WHERE oi.order_id = ?
-                ''', (row['order_id'],))
-                
                 items = []
                 recalculated_total = 0
-                for item_row in cursor.fetchall():
+                for item_row in item_rows:
                     item_status = item_row['status'] or 'pending'
                     item_data = {
                         'order_item_id': item_row['order_item_id'],
@@ -1405,46 +2162,575 @@ class DatabaseManager:
                 order_data['total_amount'] = recalculated_total
                 order_data['items'] = items
                 orders.append(order_data)
-            
-            conn.close()
+                
             return orders
         except Exception as e:
-            print(f"Error getting orders by date range: {e}")
-            return []
-    
+            log.error('Error getting orders by date range: %s', e)
+            return []
+    
+    # === Sales Rollup ===
+    # คีย์ใน system_config เก็บวันล่าสุดที่สรุปยอดขายของวันที่ปิดแล้วครบ
+    SALES_ROLLUP_CONFIG_KEY = 'sales_rollup_closed_through'
+
+    # ยอดรวมต่อออเดอร์ตามนิยามเดียวกับ get_orders_by_date_range: ออเดอร์ที่มีโต๊ะอยู่จริง ไม่ถูก reject
+    # และรวมเฉพาะรายการที่ไม่ถูก reject (และเมนูยังมีอยู่) ({date_clause} = เงื่อนไขช่วงวันที่เพิ่มเติม)
+    ORDER_TOTALS_SQL = '''
+        SELECT o.order_id, o.table_id, o.created_at,
+               COALESCE((
+                   SELECT SUM(oi.total_price)
+                   FROM order_items oi
+                   JOIN menu_items mi ON oi.item_id = mi.item_id
+                   WHERE oi.order_id = o.order_id
+                   AND (oi.status IS NULL OR oi.status != 'rejected')
+               ), 0) AS total
+        FROM orders o
+        JOIN tables t ON o.table_id = t.table_id
+        WHERE (o.status IS NULL OR o.status != 'rejected')
+        {date_clause}
+    '''
+
+    # รายการอาหารที่นับเป็นยอดขายตามนิยามเดียวกัน (ใช้ต่อท้าย SELECT ... ด้วย .format(date_clause=...))
+    SALES_LINES_SQL = '''
+        FROM order_items oi
+        JOIN menu_items mi ON oi.item_id = mi.item_id
+        JOIN orders o ON oi.order_id = o.order_id
+        JOIN tables t ON o.table_id = t.table_id
+        WHERE (o.status IS NULL OR o.status != 'rejected')
+        AND (oi.status IS NULL OR oi.status != 'rejected')
+        {date_clause}
+    '''
+
+    def _refresh_sales_rollup_days(self, cursor, days):
+        """คำนวณแถวสรุปยอดขายของวันที่ระบุใหม่จากข้อมูลดิบ (เรียกภายใน transaction)"""
+        now = get_thai_datetime_string()
+        for day in sorted(set(days)):
+            lower, upper = day_range_bounds(day, day)
+            cursor.execute('DELETE FROM daily_sales_rollup WHERE sales_date = ?', (day,))
+            day_clause = 'AND o.created_at >= ? AND o.created_at < ?'
+            order_totals = self.ORDER_TOTALS_SQL.format(date_clause=day_clause)
+            sales_lines = self.SALES_LINES_SQL.format(date_clause=day_clause)
+            # ยอดรวมทั้งวัน และจำนวนออเดอร์
+            cursor.execute(f'''
+                INSERT INTO daily_sales_rollup (sales_date, dimension, ref_id, quantity, revenue, order_count, updated_at)
+                SELECT ?, 'day', 0, 0, COALESCE(SUM(total), 0), COUNT(*), ?
+                FROM ({order_totals})
+                HAVING COUNT(*) > 0
+            ''', (day, now, lower, upper))
+            # จำนวนออเดอร์ต่อโต๊ะ (ใช้นับจำนวน session ที่ไม่ซ้ำข้ามหลายวัน)
+            cursor.execute(f'''
+                INSERT INTO daily_sales_rollup (sales_date, dimension, ref_id, quantity, revenue, order_count, updated_at)
+                SELECT ?, 'table', table_id, 0, SUM(total), COUNT(*), ?
+                FROM ({order_totals})
+                GROUP BY table_id
+            ''', (day, now, lower, upper))
+            # จำนวนและยอดขายต่อเมนู
+            cursor.execute(f'''
+                INSERT INTO daily_sales_rollup (sales_date, dimension, ref_id, quantity, revenue, order_count, updated_at)
+                SELECT ?, 'item', oi.item_id, SUM(oi.quantity), SUM(oi.total_price), COUNT(DISTINCT o.order_id), ?
+                {sales_lines}
+                GROUP BY oi.item_id
+            ''', (day, now, lower, upper))
+            # ยอดขายต่อหมวดหมู่
+            cursor.execute(f'''
+                INSERT INTO daily_sales_rollup (sales_date, dimension, ref_id, quantity, revenue, order_count, updated_at)
+                SELECT ?, 'category', mi.category_id, SUM(oi.quantity), SUM(oi.total_price), COUNT(DISTINCT o.order_id), ?
+                {sales_lines}
+                AND mi.category_id IS NOT NULL
+                GROUP BY mi.category_id
+            ''', (day, now, lower, upper))
+
+    def _order_sales_days(self, cursor, order_ids) -> set:
+        """วันที่ (ตาม created_at) ของออเดอร์ที่ระบุ"""
+        order_ids = list(order_ids)
+        if not order_ids:
+            return set()
+        placeholders = ','.join('?' * len(order_ids))
+        cursor.execute(f'''
+            SELECT DISTINCT substr(created_at, 1, 10) AS day FROM orders
+            WHERE order_id IN ({placeholders})
+        ''', order_ids)
+        return {row['day'] for row in cursor.fetchall() if row['day']}
+
+    def _touch_sales_rollup(self, cursor, days):
+        """อัปเดตสรุปยอดขายเมื่อข้อมูลของวันที่ปิดแล้วเปลี่ยน (วันนี้อ่านจากข้อมูลดิบอยู่แล้ว)"""
+        today = get_thai_datetime().strftime('%Y-%m-%d')
+        closed_days = [day for day in days if day < today]
+        if closed_days:
+            self._refresh_sales_rollup_days(cursor, closed_days)
+
+    def ensure_sales_rollup(self) -> str:
+        """สรุปยอดขายของวันที่ปิดแล้วที่ยังไม่ได้สรุป คืนค่าวันล่าสุดที่สรุปครบ"""
+        yesterday = (get_thai_datetime() - timedelta(days=1)).strftime('%Y-%m-%d')
+        closed_through = self.get_config(self.SALES_ROLLUP_CONFIG_KEY)
+        if closed_through and closed_through >= yesterday:
+            return closed_through
+        self.rebuild_sales_rollup(
+            (datetime.strptime(closed_through, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+            if closed_through else None,
+            yesterday)
+        return yesterday
+
+    def rebuild_sales_rollup(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> int:
+        """สร้างสรุปยอดขายรายวันใหม่ในช่วงวันที่ (ไม่ระบุ = ทั้งหมดจนถึงเมื่อวาน) คืนค่าจำนวนวันที่มีออเดอร์"""
+        yesterday = (get_thai_datetime() - timedelta(days=1)).strftime('%Y-%m-%d')
+        end_date = min(end_date or yesterday, yesterday)
+        date_clause, date_params = date_range_predicate('created_at', start_date, end_date)
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT DISTINCT substr(created_at, 1, 10) AS day FROM orders
+                WHERE created_at IS NOT NULL {date_clause}
+            ''', date_params)
+            days = {row['day'] for row in cursor.fetchall()}
+            
+            # ลบแถวเดิมในช่วงนี้ก่อน (รวมวันที่ไม่มีออเดอร์แล้ว เช่น ออเดอร์ถูกลบ)
+            cursor.execute('''
+                DELETE FROM daily_sales_rollup WHERE sales_date >= ? AND sales_date <= ?
+            ''', (start_date or '', end_date))
+            self._refresh_sales_rollup_days(cursor, days)
+            
+            # บันทึกวันล่าสุดที่สรุปครบ เมื่อช่วงที่สร้างต่อเนื่องจากจุดเดิมมาถึงเมื่อวาน
+            closed_through = self.get_config(self.SALES_ROLLUP_CONFIG_KEY)
+            continuous = not start_date or (closed_through and closed_through >= (
+                datetime.strptime(start_date, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d'))
+            if end_date == yesterday and continuous:
+                cursor.execute('''
+                    INSERT OR REPLACE INTO system_config (config_key, config_value, updated_at)
+                    VALUES (?, ?, CURRENT_TIMESTAMP)
+                ''', (self.SALES_ROLLUP_CONFIG_KEY, yesterday))
+        log.info('Sales rollup rebuilt for %s days (%s - %s)', len(days), start_date or 'beginning', end_date)
+        return len(days)
+
+    # === Change Feed ===
+    # คีย์ใน system_config เก็บ seq สูงสุดที่ถูกลบจาก change_log แล้ว (cursor ที่เก่ากว่านี้ต้องโหลดข้อมูลใหม่ทั้งหมด)
+    CHANGE_LOG_FLOOR_CONFIG_KEY = 'change_log_floor'
+    CHANGE_LOG_RETENTION_DAYS = 7
+    CHANGE_LOG_COMPACT_INTERVAL = 600  # วินาที
+    CHANGE_FEED_LIMIT = 1000
+
+    # คิวรีแถวปัจจุบันของแต่ละ entity ที่ถูกเปลี่ยน
+    CHANGE_FEED_QUERIES = {
+        'orders': 'SELECT * FROM orders WHERE order_id IN ({placeholders})',
+        'order_items': '''
+            SELECT oi.*, mi.name AS item_name
+            FROM order_items oi
+            LEFT JOIN menu_items mi ON oi.item_id = mi.item_id
+            WHERE oi.order_item_id IN ({placeholders})
+        ''',
+        'tables': 'SELECT * FROM tables WHERE table_id IN ({placeholders})',
+        'notifications': 'SELECT * FROM notifications WHERE notification_id IN ({placeholders})'
+    }
+
+    def _change_log_floor(self) -> int:
+        """seq สูงสุดที่ถูกลบออกจาก change_log แล้ว"""
+        return int(self.get_config(self.CHANGE_LOG_FLOOR_CONFIG_KEY) or 0)
+
+    def get_data_version(self) -> int:
+        """seq ล่าสุดของ change_log เพิ่มขึ้นทุกครั้งที่ orders / order_items / tables ถูกเขียน (trigger ทำงานทุกเส้นทางการเขียน)"""
+        with self.connection() as conn:
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+        return row['seq'] if row else 0
+
+    def get_change_cursor(self) -> int:
+        """cursor ล่าสุดของ change feed (ใช้เป็นจุดเริ่มต้นหลังโหลดข้อมูลทั้งหมด)"""
+        return max(self.get_data_version(), self._change_log_floor())
+
+    def get_changes(self, since: int, limit: int = None) -> Dict:
+        """แถวของ orders / order_items / tables / notifications ที่ถูกเปลี่ยนหลัง cursor since
+
+        คืนค่า {'cursor': cursor ถัดไป, 'changes': {entity: [แถวปัจจุบัน]}, 'deleted': {entity: [id]},
+                'has_more': ยังมีรายการเหลือ, 'resync': cursor เก่ากว่าข้อมูลที่เก็บไว้ ต้องโหลดข้อมูลทั้งหมดใหม่}
+        แต่ละ entity จะปรากฏครั้งเดียวด้วยข้อมูลล่าสุด แม้จะถูกเปลี่ยนหลายครั้ง
+        """
+        limit = limit or self.CHANGE_FEED_LIMIT
+        self._maybe_compact_change_log()
+        result = {'cursor': since, 'changes': {}, 'deleted': {}, 'has_more': False, 'resync': False}
+        if since < self._change_log_floor():
+            result['cursor'] = self.get_change_cursor()
+            result['resync'] = True
+            return result
+
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT seq, entity, entity_id FROM change_log
+                WHERE seq > ?
+                ORDER BY seq
+                LIMIT ?
+            ''', (since, limit + 1))
+            rows = cursor.fetchall()
+            result['has_more'] = len(rows) > limit
+            rows = rows[:limit]
+            if not rows:
+                return result
+            result['cursor'] = rows[-1]['seq']
+
+            touched = {}
+            for row in rows:
+                touched.setdefault(row['entity'], {})[row['entity_id']] = True
+            # แถวที่อ่านได้อาจใหม่กว่า cursor เล็กน้อย (ถูกแก้ไขระหว่างอ่าน) ซึ่งจะถูกส่งซ้ำในรอบถัดไป ผู้เรียกต้อง upsert ตาม id
+            for entity, key in CHANGE_FEED_TABLES:
+                ids = list(touched.get(entity, ()))
+                if not ids:
+                    continue
+                found = {}
+                for start in range(0, len(ids), self.ITEM_BATCH_SIZE):
+                    chunk = ids[start:start + self.ITEM_BATCH_SIZE]
+                    placeholders = ','.join('?' * len(chunk))
+                    cursor.execute(self.CHANGE_FEED_QUERIES[entity].format(placeholders=placeholders), chunk)
+                    for record in cursor.fetchall():
+                        found[record[key]] = dict(record)
+                if found:
+                    result['changes'][entity] = [found[entity_id] for entity_id in ids if entity_id in found]
+                deleted = [entity_id for entity_id in ids if entity_id not in found]
+                if deleted:
+                    result['deleted'][entity] = deleted
+        return result
+
+    def _maybe_compact_change_log(self):
+        """บีบอัด change_log เป็นระยะ (ไม่เกินทุก CHANGE_LOG_COMPACT_INTERVAL วินาที)"""
+        now = time.monotonic()
+        # ตรวจก่อนโดยไม่ล็อก (เรียกหลังทุก transaction)
+        if now - self._change_log_compacted_at < self.CHANGE_LOG_COMPACT_INTERVAL:
+            return
+        with self._change_log_lock:
+            if now - self._change_log_compacted_at < self.CHANGE_LOG_COMPACT_INTERVAL:
+                return
+            self._change_log_compacted_at = now
+        self.compact_change_log()
+
+    def compact_change_log(self, retention_days: int = None) -> Dict:
+        """บีบอัด change_log: เก็บเฉพาะรายการล่าสุดของแต่ละแถว และลบรายการที่เก่ากว่า retention_days
+
+        การลบรายการซ้ำไม่กระทบผู้เรียก (รายการล่าสุดยังอยู่) ส่วนการลบตามอายุจะเลื่อน floor
+        ทำให้ cursor ที่เก่ากว่านั้นได้ resync = True
+        """
+        retention_days = self.CHANGE_LOG_RETENTION_DAYS if retention_days is None else retention_days
+        # changed_at เป็น CURRENT_TIMESTAMP ของ SQLite (UTC)
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    DELETE FROM change_log
+                    WHERE seq NOT IN (SELECT MAX(seq) FROM change_log GROUP BY entity, entity_id)
+                ''')
+                deduplicated = cursor.rowcount
+                cursor.execute('SELECT MAX(seq) FROM change_log WHERE changed_at < ?', (cutoff,))
+                expired_through = cursor.fetchone()[0]
+                expired = 0
+                if expired_through:
+                    cursor.execute('DELETE FROM change_log WHERE seq <= ?', (expired_through,))
+                    expired = cursor.rowcount
+                    cursor.execute('''
+                        INSERT OR REPLACE INTO system_config (config_key, config_value, updated_at)
+                        VALUES (?, ?, CURRENT_TIMESTAMP)
+                    ''', (self.CHANGE_LOG_FLOOR_CONFIG_KEY, str(max(expired_through, self._change_log_floor()))))
+            if deduplicated or expired:
+                log.info('Change log compacted: %s duplicates, %s expired', deduplicated, expired)
+            return {'deduplicated': deduplicated, 'expired': expired}
+        except Exception as e:
+            log.error('Error compacting change log: %s', e)
+            return {'deduplicated': 0, 'expired': 0}
+
+    # === Kitchen Queue ===
+    KITCHEN_QUEUE_SELECT = '''
+        SELECT oi.order_item_id, oi.order_id, oi.item_id, oi.quantity, oi.customer_request,
+               oi.status, oi.created_at, o.status AS order_status, o.table_id, t.table_name,
+               mi.name AS item_name, mi.preparation_time, mi.category_id, mc.name AS category_name
+        FROM order_items oi
+        JOIN orders o ON oi.order_id = o.order_id
+        LEFT JOIN tables t ON o.table_id = t.table_id
+        LEFT JOIN menu_items mi ON oi.item_id = mi.item_id
+        LEFT JOIN menu_categories mc ON mi.category_id = mc.category_id
+    '''
+
+    def get_kitchen_queue(self, station_id: int = None, status: str = None, limit: int = None) -> List[Dict]:
+        """รายการอาหารที่รอทำ (pending / accepted) เรียงตามเวลาที่ควรเสร็จ (created_at + preparation_time)
+
+        station คือหมวดหมู่เมนู (category_id) คิวอยู่ในหน่วยความจำ และปรับปรุงเฉพาะแถวที่เปลี่ยนจาก change_log
+        จึงครอบคลุมทุกจุดที่แก้ไขออเดอร์ (รวมถึง SQL ตรงใน app.py) โดยไม่ต้อง JOIN และเรียงทั้งครัวทุกครั้ง
+        """
+        try:
+            self._sync_kitchen_queue()
+            return self.kitchen_queue.items(station_id=station_id, status=status, limit=limit)
+        except Exception as e:
+            log.error('Error getting kitchen queue: %s', e)
+            return []
+
+    def get_kitchen_stations(self) -> List[Dict]:
+        """จำนวนรายการที่รอทำแยกตาม station (หมวดหมู่เมนู)"""
+        try:
+            self._sync_kitchen_queue()
+            return self.kitchen_queue.stations()
+        except Exception as e:
+            log.error('Error getting kitchen stations: %s', e)
+            return []
+
+    def _sync_kitchen_queue(self):
+        """ปรับปรุงคิวครัวจาก change_log ตั้งแต่ cursor ล่าสุด (โหลดใหม่ทั้งหมดถ้ายังไม่เคยโหลดหรือ cursor เก่ากว่า floor)"""
+        queue = self.kitchen_queue
+        with queue.lock:
+            if queue.cursor is None or queue.cursor < self._change_log_floor():
+                self._reload_kitchen_queue()
+                return
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT seq, entity, entity_id FROM change_log
+                    WHERE seq > ? AND entity IN ('orders', 'order_items')
+                    ORDER BY seq
+                ''', (queue.cursor,))
+                rows = cursor.fetchall()
+                if not rows:
+                    return
+                item_ids = {row['entity_id'] for row in rows if row['entity'] == 'order_items'}
+                order_ids = [row['entity_id'] for row in rows if row['entity'] == 'orders']
+                # สถานะออเดอร์เปลี่ยน (ชำระเงิน / ปฏิเสธ) มีผลกับทุกรายการในออเดอร์นั้น
+                item_ids.update(queue.order_item_ids(order_ids))
+                for start in range(0, len(order_ids), self.ITEM_BATCH_SIZE):
+                    chunk = order_ids[start:start + self.ITEM_BATCH_SIZE]
+                    cursor.execute(
+                        f"SELECT order_item_id FROM order_items WHERE order_id IN ({','.join('?' * len(chunk))})", chunk)
+                    item_ids.update(row['order_item_id'] for row in cursor.fetchall())
+
+                self._refresh_kitchen_items(cursor, item_ids)
+            queue.cursor = rows[-1]['seq']
+
+    def _refresh_kitchen_items(self, cursor, item_ids):
+        """อ่านรายการอาหารที่ระบุใหม่ลงคิวครัว (รายการที่ไม่พบแล้วจะถูกลบออกจากคิว)"""
+        queue = self.kitchen_queue
+        item_ids = list(item_ids)
+        found = set()
+        for start in range(0, len(item_ids), self.ITEM_BATCH_SIZE):
+            chunk = item_ids[start:start + self.ITEM_BATCH_SIZE]
+            cursor.execute(
+                self.KITCHEN_QUEUE_SELECT + f"WHERE oi.order_item_id IN ({','.join('?' * len(chunk))})", chunk)
+            for record in cursor.fetchall():
+                found.add(record['order_item_id'])
+                queue.upsert(dict(record))
+        for order_item_id in item_ids:
+            if order_item_id not in found:
+                queue.remove(order_item_id)
+
+    def _refresh_kitchen_menu_item(self, item_id: int):
+        """ปรับปรุงรายการในคิวครัวของเมนูที่ถูกแก้ไข (preparation_time / ชื่อ / หมวดหมู่ ไม่ได้อยู่ใน change_log)"""
+        queue = self.kitchen_queue
+        with queue.lock:
+            if queue.cursor is None:
+                return
+            try:
+                item_ids = queue.menu_order_item_ids(item_id)
+                if item_ids:
+                    with self.connection() as conn:
+                        self._refresh_kitchen_items(conn.cursor(), item_ids)
+            except Exception as e:
+                log.error('Error refreshing kitchen queue for menu item %s: %s', item_id, e)
+                # โหลดคิวใหม่ทั้งหมดในการอ่านครั้งถัดไป
+                queue.clear()
+
+    def _reload_kitchen_queue(self):
+        """โหลดคิวครัวใหม่ทั้งหมด (อ่าน cursor ก่อน การเปลี่ยนแปลงระหว่างโหลดจะถูกปรับปรุงซ้ำในรอบถัดไป)"""
+        queue = self.kitchen_queue
+        with queue.lock:
+            change_cursor = self.get_change_cursor()
+            with self.connection() as conn:
+                rows = conn.execute(self.KITCHEN_QUEUE_SELECT + '''
+                    WHERE oi.status IN ({items}) AND o.status IN ({orders})
+                '''.format(items=','.join('?' * len(KITCHEN_ITEM_STATUSES)),
+                           orders=','.join('?' * len(KITCHEN_ORDER_STATUSES))),
+                    KITCHEN_ITEM_STATUSES + KITCHEN_ORDER_STATUSES).fetchall()
+            queue.clear()
+            for row in rows:
+                queue.upsert(dict(row))
+            queue.cursor = change_cursor
+
+    # === Google Sheets Outbox ===
+    SHEETS_OUTBOX_MAX_ATTEMPTS = 8
+    SHEETS_OUTBOX_BASE_DELAY = 5     # วินาที (เพิ่มเป็นสองเท่าทุกครั้งที่ล้มเหลว)
+    SHEETS_OUTBOX_MAX_DELAY = 900    # วินาที
+
+    def _enqueue_sheets_sync(self, cursor, kind: str, order_data: Dict, order_items: List[Dict]) -> bool:
+        """เพิ่มงานซิงค์ออเดอร์ไปยัง Google Sheets ลง sheets_outbox ด้วย cursor ของ transaction ที่แก้ไขออเดอร์
+
+        คืนค่า True ถ้าเพิ่มงาน (ผู้เรียกควรตั้งค่า sheets_outbox_ready หลัง commit) หรือ False ถ้าไม่ได้เปิดใช้ Google Sheets
+        """
+        if not is_google_sheets_enabled():
+            return False
+        cursor.execute('''
+            INSERT INTO sheets_outbox (kind, order_id, payload, next_attempt_at)
+            VALUES (?, ?, ?, ?)
+        ''', (kind, order_data.get('order_id'),
+              json.dumps({'order': order_data, 'items': order_items}, ensure_ascii=False, default=str), time.time()))
+        return True
+
+    def recover_sheets_outbox(self) -> int:
+        """คืนงานที่ค้างสถานะ processing (โปรเซสหยุดระหว่างส่ง) กลับเป็น pending เรียกตอนเริ่มโปรเซส"""
+        try:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute("UPDATE sheets_outbox SET status = 'pending' WHERE status = 'processing'")
+                recovered = cursor.rowcount
+            if recovered:
+                log.info('Sheets outbox: recovered %s in-flight entries', recovered)
+            return recovered
+        except Exception as e:
+            log.error('Error recovering sheets outbox: %s', e)
+            return 0
+
+    def claim_sheets_outbox(self, limit: int = 10) -> List[Dict]:
+        """ดึงงานที่ถึงกำหนดและเปลี่ยนเป็น processing (worker อื่นจะไม่ได้งานซ้ำ)"""
+        try:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT outbox_id, kind, order_id, payload, attempts, created_at FROM sheets_outbox
+                    WHERE status = 'pending' AND next_attempt_at <= ?
+                    ORDER BY next_attempt_at, outbox_id
+                    LIMIT ?
+                ''', (time.time(), limit))
+                entries = [dict(row) for row in cursor.fetchall()]
+                if entries:
+                    ids = [entry['outbox_id'] for entry in entries]
+                    cursor.execute(f"UPDATE sheets_outbox SET status = 'processing' WHERE outbox_id IN ({','.join('?' * len(ids))})", ids)
+            for entry in entries:
+                entry['payload'] = json.loads(entry['payload'])
+            return entries
+        except Exception as e:
+            log.error('Error claiming sheets outbox: %s', e)
+            return []
+
+    def enqueue_sheets_rebuild(self) -> bool:
+        """เพิ่มงานสร้างชีต Orders ใหม่ทั้งหมดลงคิว (ทำโดย worker เดียวกับการซิงค์ออเดอร์ จึงไม่ชนกัน)"""
+        if not is_google_sheets_enabled():
+            return False
+        try:
+            with self.transaction() as conn:
+                conn.execute('''
+                    INSERT INTO sheets_outbox (kind, payload, next_attempt_at) VALUES ('rebuild', '{}', ?)
+                ''', (time.time(),))
+            self.sheets_outbox_ready.set()
+            return True
+        except Exception as e:
+            log.error('Error enqueueing sheets rebuild: %s', e)
+            return False
+
+    def send_sheets_outbox_entry(self, entry: Dict) -> bool:
+        """ส่งงานหนึ่งรายการไปยัง Google Sheets"""
+        if entry['kind'] == 'rebuild':
+            return bool(rebuild_orders_sheet())
+        payload = entry['payload']
+        return bool(sync_order_to_new_format(payload['order'], payload['items']))
+
+    def complete_sheets_outbox(self, outbox_id: int) -> bool:
+        """ลบงานที่ส่งสำเร็จออกจากคิว"""
+        try:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM sheets_outbox WHERE outbox_id = ?', (outbox_id,))
+                return cursor.rowcount > 0
+        except Exception as e:
+            log.error('Error completing sheets outbox entry %s: %s', outbox_id, e)
+            return False
+
+    def fail_sheets_outbox(self, entry: Dict, error: str) -> Optional[str]:
+        """บันทึกความล้มเหลว: นัดลองใหม่แบบ exponential backoff หรือย้ายเป็น dead เมื่อครบ SHEETS_OUTBOX_MAX_ATTEMPTS
+
+        คืนค่าสถานะใหม่ ('pending' / 'dead') หรือ None ถ้าบันทึกไม่สำเร็จ
+        """
+        attempts = entry['attempts'] + 1
+        status = 'dead' if attempts >= self.SHEETS_OUTBOX_MAX_ATTEMPTS else 'pending'
+        delay = min(self.SHEETS_OUTBOX_BASE_DELAY * 2 ** (attempts - 1), self.SHEETS_OUTBOX_MAX_DELAY)
+        try:
+            with self.transaction() as conn:
+                conn.execute('''
+                    UPDATE sheets_outbox
+                    SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?
+                    WHERE outbox_id = ?
+                ''', (status, attempts, time.time() + delay, str(error)[:500], entry['outbox_id']))
+            if status == 'dead':
+                log.error('Sheets outbox entry %s (order %s) moved to dead-letter after %s attempts: %s',
+                          entry['outbox_id'], entry['order_id'], attempts, error)
+            return status
+        except Exception as e:
+            log.error('Error recording sheets outbox failure %s: %s', entry['outbox_id'], e)
+            return None
+
+    def retry_dead_sheets_outbox(self, outbox_ids: List[int] = None) -> int:
+        """นำงานใน dead-letter กลับเข้าคิว (ทั้งหมด หรือเฉพาะ outbox_ids) คืนค่าจำนวนงาน หรือ -1 ถ้าเกิดข้อผิดพลาด"""
+        try:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                query = "UPDATE sheets_outbox SET status = 'pending', attempts = 0, next_attempt_at = ? WHERE status = 'dead'"
+                params = [time.time()]
+                if outbox_ids:
+                    query += f" AND outbox_id IN ({','.join('?' * len(outbox_ids))})"
+                    params += list(outbox_ids)
+                cursor.execute(query, params)
+                retried = cursor.rowcount
+            if retried:
+                self.sheets_outbox_ready.set()
+            return retried
+        except Exception as e:
+            log.error('Error retrying dead sheets outbox entries: %s', e)
+            return -1
+
+    def get_sheets_outbox_stats(self) -> Dict:
+        """ความลึกของคิว (pending / processing / dead), lag ของงานที่เก่าที่สุด (วินาที) และงานที่เคยล้มเหลว"""
+        try:
+            with self.connection() as conn:
+                counts = {row['status']: row['count'] for row in conn.execute(
+                    'SELECT status, COUNT(*) AS count FROM sheets_outbox GROUP BY status').fetchall()}
+                row = conn.execute('''
+                    SELECT MIN(created_at) AS oldest, SUM(attempts > 0) AS retrying FROM sheets_outbox
+                    WHERE status IN ('pending', 'processing')
+                ''').fetchone()
+            lag = 0
+            if row['oldest']:
+                # created_at เป็น CURRENT_TIMESTAMP ของ SQLite (UTC)
+                oldest = datetime.strptime(row['oldest'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+                lag = max((datetime.now(timezone.utc) - oldest).total_seconds(), 0)
+            return {
+                'pending': counts.get('pending', 0),
+                'processing': counts.get('processing', 0),
+                'dead': counts.get('dead', 0),
+                'depth': counts.get('pending', 0) + counts.get('processing', 0),
+                'retrying': row['retrying'] or 0,
+                'lag_seconds': round(lag, 1)
+            }
+        except Exception as e:
+            log.error('Error getting sheets outbox stats: %s', e)
+            return {}
+
     # === System Config ===
     def set_config(self, key: str, value: str) -> bool:
         """ตั้งค่าระบบ"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO system_config (config_key, config_value, updated_at)
-                VALUES (?, ?, CURRENT_TIMESTAMP)
-            ''', (key, value))
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT OR REPLACE INTO system_config (config_key, config_value, updated_at)
+                    VALUES (?, ?, CURRENT_TIMESTAMP)
+                ''', (key, value))
             return True
         except Exception as e:
-            print(f"Error setting config: {e}")
+            log.error('Error setting config: %s', e)
             return False
     
     def get_config(self, key: str) -> str:
         """ดึงค่าการตั้งค่า"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT config_value FROM system_config WHERE config_key = ?', (key,))
-        result = cursor.fetchone()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT config_value FROM system_config WHERE config_key = ?', (key,))
+            result = cursor.fetchone()
         return result['config_value'] if result else ""
     
     def get_all_config(self) -> Dict:
         """ดึงการตั้งค่าทั้งหมด"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT config_key, config_value FROM system_config')
-        config = {row['config_key']: row['config_value'] for row in cursor.fetchall()}
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT config_key, config_value FROM system_config')
+            config = {row['config_key']: row['config_value'] for row in cursor.fetchall()}
         return config
     
     def _insert_sample_data(self):
@@ -1480,494 +2766,578 @@ class DatabaseManager:
             for name, price, cat_id, desc, img, avail, prep_time in sample_items:
                 self.add_menu_item(name, price, cat_id, desc, img, avail, prep_time)
             
-            print("Sample data inserted successfully!")
+            log.info('Sample data inserted successfully!')
             
         except Exception as e:
-            print(f"Error inserting sample data: {e}")
+            log.error('Error inserting sample data: %s', e)
     
     # === Notifications ===
-    def save_notification(self, notification_data: Dict) -> bool:
-        """บันทึกการแจ้งเตือน"""
+    # คีย์ใน system_config สำหรับระยะเก็บการแจ้งเตือนที่อ่านแล้ว (วัน) และวิธีจัดการเมื่อหมดอายุ ('archive' หรือ 'purge')
+    NOTIFICATION_RETENTION_CONFIG_KEY = 'notification_retention_days'
+    NOTIFICATION_RETENTION_MODE_CONFIG_KEY = 'notification_retention_mode'
+    NOTIFICATION_RETENTION_DAYS = 30
+    NOTIFICATION_COMPACT_INTERVAL = 3600  # วินาที
+
+    def save_notification(self, notification_data: Dict) -> int:
+        """บันทึกการแจ้งเตือน คืนค่า notification_id (0 ถ้าไม่สำเร็จ)"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO notifications (table_id, message, type, is_read)
-                VALUES (?, ?, ?, ?)
-            ''', (
-                notification_data.get('table_id'),
-                notification_data.get('message'),
-                notification_data.get('type'),
-                notification_data.get('is_read', False)
-            ))
-            conn.commit()
-            conn.close()
-            return True
+            is_read = bool(notification_data.get('is_read', False))
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO notifications (table_id, message, type, is_read)
+                    VALUES (?, ?, ?, ?)
+                ''', (
+                    notification_data.get('table_id'),
+                    notification_data.get('message'),
+                    notification_data.get('type'),
+                    is_read
+                ))
+                notification_id = cursor.lastrowid
+            if not is_read:
+                self._adjust_unread_count(1)
+            self._maybe_compact_notifications()
+            return notification_id
         except Exception as e:
-            print(f"Error saving notification: {e}")
-            return False
+            log.error('Error saving notification: %s', e)
+            return 0
+
+    @staticmethod
+    def _format_notification(row) -> Dict:
+        """แปลงแถว notifications (JOIN tables) เป็น dict สำหรับ API"""
+        return {
+            'notification_id': row['notification_id'],
+            'table_id': row['table_id'],
+            'table_name': row['table_name'],
+            'message': row['message'],
+            'type': row['type'],
+            'is_read': row['is_read'],
+            'created_at': row['created_at']
+        }
+
+    def get_notification(self, notification_id: int) -> Optional[Dict]:
+        """ดึงการแจ้งเตือนตาม ID"""
+        try:
+            with self.connection() as conn:
+                row = conn.execute('''
+                    SELECT n.notification_id, n.table_id, n.message, n.type, 
+                           n.is_read, n.created_at, t.table_name
+                    FROM notifications n
+                    LEFT JOIN tables t ON n.table_id = t.table_id
+                    WHERE n.notification_id = ?
+                ''', (notification_id,)).fetchone()
+            return self._format_notification(row) if row else None
+        except Exception as e:
+            log.error('Error getting notification: %s', e)
+            return None
     
-    def get_unread_notifications(self) -> List[Dict]:
-        """ดึงการแจ้งเตือนที่ยังไม่ได้อ่าน"""
+    def get_unread_notifications(self, after_id: int = 0, limit: int = None) -> List[Dict]:
+        """ดึงการแจ้งเตือนที่ยังไม่ได้อ่าน (เฉพาะที่ notification_id > after_id ถ้าระบุ) เรียงจากใหม่ไปเก่า"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT n.notification_id, n.table_id, n.message, n.type, 
-                       n.is_read, n.created_at, t.table_name
-                FROM notifications n
-                LEFT JOIN tables t ON n.table_id = t.table_id
-                WHERE n.is_read = 0
-                ORDER BY n.created_at DESC
-            ''')
-            
-            notifications = []
-            for row in cursor.fetchall():
-                notifications.append({
-                    'notification_id': row['notification_id'],
-                    'table_id': row['table_id'],
-                    'table_name': row['table_name'],
-                    'message': row['message'],
-                    'type': row['type'],
-                    'is_read': row['is_read'],
-                    'created_at': row['created_at']
-                })
-            
-            conn.close()
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT n.notification_id, n.table_id, n.message, n.type, 
+                           n.is_read, n.created_at, t.table_name
+                    FROM notifications n
+                    LEFT JOIN tables t ON n.table_id = t.table_id
+                    WHERE n.is_read = 0 AND n.notification_id > ?
+                    ORDER BY n.created_at DESC
+                    LIMIT ?
+                ''', (after_id or 0, limit if limit else -1))
+                
+                notifications = [self._format_notification(row) for row in cursor.fetchall()]
+                
             return notifications
         except Exception as e:
-            print(f"Error getting unread notifications: {e}")
+            log.error('Error getting unread notifications: %s', e)
             return []
-    
+
+    def get_unread_notification_count(self) -> int:
+        """จำนวนการแจ้งเตือนที่ยังไม่อ่าน (จากตัวนับในหน่วยความจำ ไม่ query ฐานข้อมูลหลังครั้งแรก)"""
+        with self._notification_lock:
+            if self._unread_notifications is None:
+                self._unread_notifications = self._count_unread_notifications()
+            return self._unread_notifications
+
+    def _count_unread_notifications(self) -> int:
+        """นับการแจ้งเตือนที่ยังไม่อ่านจากฐานข้อมูล (ใช้ดัชนี is_read, created_at)"""
+        with self.connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM notifications WHERE is_read = 0').fetchone()[0]
+
+    def _adjust_unread_count(self, delta: int):
+        """ปรับตัวนับการแจ้งเตือนที่ยังไม่อ่าน (ถ้ายังไม่เคยนับ จะนับจากฐานข้อมูลเมื่อถูกเรียกครั้งแรก)"""
+        with self._notification_lock:
+            if self._unread_notifications is not None:
+                self._unread_notifications = max(self._unread_notifications + delta, 0)
+
     def mark_notification_read(self, notification_id: int) -> bool:
         """ทำเครื่องหมายการแจ้งเตือนว่าอ่านแล้ว"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE notifications 
-                SET is_read = 1, read_at = CURRENT_TIMESTAMP
-                WHERE notification_id = ?
-            ''', (notification_id,))
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE notifications 
+                    SET is_read = 1, read_at = CURRENT_TIMESTAMP
+                    WHERE notification_id = ? AND is_read = 0
+                ''', (notification_id,))
+                marked = cursor.rowcount
+            self._adjust_unread_count(-marked)
             return True
         except Exception as e:
-            print(f"Error marking notification as read: {e}")
+            log.error('Error marking notification as read: %s', e)
             return False
-    
+
+    def mark_notifications_read(self, up_to_id: int = None) -> int:
+        """ทำเครื่องหมายการแจ้งเตือนที่ยังไม่อ่านทั้งหมด (หรือเฉพาะ notification_id <= up_to_id) ว่าอ่านแล้วใน transaction เดียว
+        
+        คืนค่าจำนวนที่ถูกทำเครื่องหมาย (-1 ถ้าไม่สำเร็จ)
+        """
+        try:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                if up_to_id is None:
+                    cursor.execute('''
+                        UPDATE notifications 
+                        SET is_read = 1, read_at = CURRENT_TIMESTAMP
+                        WHERE is_read = 0
+                    ''')
+                else:
+                    cursor.execute('''
+                        UPDATE notifications 
+                        SET is_read = 1, read_at = CURRENT_TIMESTAMP
+                        WHERE is_read = 0 AND notification_id <= ?
+                    ''', (up_to_id,))
+                marked = cursor.rowcount
+            self._adjust_unread_count(-marked)
+            return marked
+        except Exception as e:
+            log.error('Error marking notifications as read: %s', e)
+            return -1
+
+    def _maybe_compact_notifications(self):
+        """ย้าย/ลบการแจ้งเตือนที่อ่านแล้วและหมดอายุเป็นระยะ (ไม่เกินทุก NOTIFICATION_COMPACT_INTERVAL วินาที)"""
+        now = time.monotonic()
+        with self._notification_lock:
+            if now - self._notifications_compacted_at < self.NOTIFICATION_COMPACT_INTERVAL:
+                return
+            self._notifications_compacted_at = now
+        self.compact_notifications()
+
+    def compact_notifications(self, retention_days: int = None, mode: str = None) -> Dict:
+        """ย้ายการแจ้งเตือนที่อ่านแล้วและเก่ากว่า retention_days ไปยัง notifications_archive (mode='archive') หรือลบทิ้ง (mode='purge')
+        
+        ค่าที่ไม่ระบุจะอ่านจาก system_config (notification_retention_days / notification_retention_mode)
+        retention_days <= 0 หมายถึงเก็บไว้ตลอด
+        """
+        result = {'archived': 0, 'purged': 0}
+        try:
+            if retention_days is None:
+                configured = self.get_config(self.NOTIFICATION_RETENTION_CONFIG_KEY)
+                retention_days = int(configured) if configured else self.NOTIFICATION_RETENTION_DAYS
+            if mode is None:
+                mode = self.get_config(self.NOTIFICATION_RETENTION_MODE_CONFIG_KEY) or 'archive'
+            if mode not in ('archive', 'purge'):
+                raise ValueError(f'Unknown notification retention mode: {mode}')
+            if retention_days <= 0:
+                return result
+            # created_at เป็น CURRENT_TIMESTAMP ของ SQLite (UTC)
+            cutoff = (datetime.now(timezone.utc) - timedelta(days=retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                if mode == 'archive':
+                    cursor.execute('''
+                        INSERT OR REPLACE INTO notifications_archive
+                            (notification_id, table_id, message, type, is_read, created_at, read_at)
+                        SELECT notification_id, table_id, message, type, is_read, created_at, read_at
+                        FROM notifications
+                        WHERE is_read = 1 AND created_at < ?
+                    ''', (cutoff,))
+                    result['archived'] = cursor.rowcount
+                cursor.execute('DELETE FROM notifications WHERE is_read = 1 AND created_at < ?', (cutoff,))
+                if mode == 'purge':
+                    result['purged'] = cursor.rowcount
+            # ลบเฉพาะรายการที่อ่านแล้ว ตัวนับที่ยังไม่อ่านจึงไม่เปลี่ยน (ไม่นับใหม่ เพื่อไม่ให้ทับการปรับค่าจาก save_notification ที่เกิดพร้อมกัน)
+            if result['archived'] or result['purged']:
+                log.info('Notifications compacted: %s archived, %s purged', result['archived'], result['purged'])
+            return result
+        except Exception as e:
+            log.error('Error compacting notifications: %s', e)
+            return result
+
     def get_all_notifications(self, limit: int = 50) -> List[Dict]:
         """ดึงการแจ้งเตือนทั้งหมด"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT n.notification_id, n.table_id, n.message, n.type, 
-                       n.is_read, n.created_at, n.read_at, t.table_name
-                FROM notifications n
-                LEFT JOIN tables t ON n.table_id = t.table_id
-                ORDER BY n.created_at DESC
-                LIMIT ?
-            ''', (limit,))
-            
-            notifications = []
-            for row in cursor.fetchall():
-                notifications.append({
-                    'notification_id': row['notification_id'],
-                    'table_id': row['table_id'],
-                    'table_name': row['table_name'],
-                    'message': row['message'],
-                    'type': row['type'],
-                    'is_read': row['is_read'],
-                    'created_at': row['created_at'],
-                    'read_at': row['read_at']
-                })
-            
-            conn.close()
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT n.notification_id, n.table_id, n.message, n.type, 
+                           n.is_read, n.created_at, n.read_at, t.table_name
+                    FROM notifications n
+                    LEFT JOIN tables t ON n.table_id = t.table_id
+                    ORDER BY n.created_at DESC
+                    LIMIT ?
+                ''', (limit,))
+                
+                notifications = []
+                for row in cursor.fetchall():
+                    notifications.append({
+                        'notification_id': row['notification_id'],
+                        'table_id': row['table_id'],
+                        'table_name': row['table_name'],
+                        'message': row['message'],
+                        'type': row['type'],
+                        'is_read': row['is_read'],
+                        'created_at': row['created_at'],
+                        'read_at': row['read_at']
+                    })
+                
             return notifications
         except Exception as e:
-            print(f"Error getting all notifications: {e}")
+            log.error('Error getting all notifications: %s', e)
             return []
     
     # ฟังก์ชันจัดการค่าตัวเลือก (Option Values)
     def get_option_values(self, option_type: str = None) -> List[Dict]:
         """ดึงค่าตัวเลือกทั้งหมดหรือตามประเภท"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
+            catalog = self.menu_cache.snapshot()
             if option_type:
-                cursor.execute('''
-                    SELECT * FROM option_values 
-                    WHERE option_type = ? AND is_active = 1
-                    ORDER BY sort_order, option_value_id
-                ''', (option_type,))
+                option_values = catalog['option_values_by_type'].get(option_type, [])
             else:
-                cursor.execute('''
-                    SELECT * FROM option_values 
-                    WHERE is_active = 1
-                    ORDER BY option_type, sort_order, option_value_id
-                ''')
-            
-            option_values = []
-            for row in cursor.fetchall():
-                option_values.append({
-                    'option_value_id': row['option_value_id'],
-                    'option_type': row['option_type'],
-                    'name': row['name'],
-                    'additional_price': float(row['additional_price']) if row['additional_price'] else 0,
-                    'is_default': bool(row['is_default']),
-                    'sort_order': row['sort_order'],
-                    'is_active': bool(row['is_active']),
-                    'created_at': row['created_at'],
-                    'updated_at': row['updated_at']
-                })
-            
-            conn.close()
-            return option_values
+                option_values = catalog['option_values']
+            return [dict(option_value) for option_value in option_values]
         except Exception as e:
-            print(f"Error getting option values: {e}")
+            log.error('Error getting option values: %s', e)
             return []
     
     def add_option_value(self, option_type: str, name: str, additional_price: float = 0, is_default: bool = False, sort_order: int = 0) -> bool:
         """เพิ่มค่าตัวเลือกใหม่"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # ถ้าเป็นค่าเริ่มต้น ให้ยกเลิกค่าเริ่มต้นเดิม
-            if is_default:
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                # ถ้าเป็นค่าเริ่มต้น ให้ยกเลิกค่าเริ่มต้นเดิม
+                if is_default:
+                    cursor.execute('''
+                        UPDATE option_values 
+                        SET is_default = 0, updated_at = CURRENT_TIMESTAMP
+                        WHERE option_type = ?
+                    ''', (option_type,))
+                
+                # เพิ่มค่าตัวเลือกใหม่
                 cursor.execute('''
-                    UPDATE option_values 
-                    SET is_default = 0, updated_at = CURRENT_TIMESTAMP
-                    WHERE option_type = ?
-                ''', (option_type,))
-            
-            # เพิ่มค่าตัวเลือกใหม่
-            cursor.execute('''
-                INSERT INTO option_values (option_type, name, additional_price, is_default, sort_order)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (option_type, name, additional_price, is_default, sort_order))
-            
-            conn.commit()
-            conn.close()
+                    INSERT INTO option_values (option_type, name, additional_price, is_default, sort_order)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (option_type, name, additional_price, is_default, sort_order))
+            self.menu_cache.invalidate()
+                
             return True
         except Exception as e:
-            print(f"Error adding option value: {e}")
+            log.error('Error adding option value: %s', e)
             return False
     
     def update_option_value(self, option_value_id: int, name: str = None, additional_price: float = None, is_default: bool = None, sort_order: int = None) -> bool:
         """อัปเดตค่าตัวเลือก"""
         try:
-            print(f"DEBUG DB: Updating option_value_id {option_value_id}, name={name}, additional_price={additional_price}, is_default={is_default}, sort_order={sort_order}")
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # ดึงข้อมูลเดิม
-            cursor.execute('SELECT option_type FROM option_values WHERE option_value_id = ?', (option_value_id,))
-            result = cursor.fetchone()
-            if not result:
-                return False
-            
-            option_type = result['option_type']
-            
-            # ถ้าเป็นค่าเริ่มต้น ให้ยกเลิกค่าเริ่มต้นเดิม
-            if is_default:
-                cursor.execute('''
-                    UPDATE option_values 
-                    SET is_default = 0, updated_at = CURRENT_TIMESTAMP
-                    WHERE option_type = ? AND option_value_id != ?
-                ''', (option_type, option_value_id))
-            
-            # สร้างคำสั่ง UPDATE
-            update_fields = []
-            params = []
-            
-            if name is not None:
-                update_fields.append('name = ?')
-                params.append(name)
-            
-            if additional_price is not None:
-                update_fields.append('additional_price = ?')
-                params.append(additional_price)
-            
-            if is_default is not None:
-                update_fields.append('is_default = ?')
-                params.append(is_default)
-            
-            if sort_order is not None:
-                update_fields.append('sort_order = ?')
-                params.append(sort_order)
-            
-            if update_fields:
-                update_fields.append('updated_at = CURRENT_TIMESTAMP')
-                params.append(option_value_id)
+            log.debug('Updating option_value_id %s, name=%s, additional_price=%s, is_default=%s, sort_order=%s', option_value_id, name, additional_price, is_default, sort_order)
+            with self.transaction() as conn:
+                cursor = conn.cursor()
                 
-                sql_query = f'''
-                    UPDATE option_values 
-                    SET {', '.join(update_fields)}
-                    WHERE option_value_id = ?
-                '''
-                print(f"DEBUG DB: Executing SQL: {sql_query}")
-                print(f"DEBUG DB: With params: {params}")
+                # ดึงข้อมูลเดิม
+                cursor.execute('SELECT option_type FROM option_values WHERE option_value_id = ?', (option_value_id,))
+                result = cursor.fetchone()
+                if not result:
+                    return False
                 
-                cursor.execute(sql_query, params)
+                option_type = result['option_type']
                 
-                # ตรวจสอบว่ามีการอัปเดตจริงหรือไม่
-                rows_affected = cursor.rowcount
-                print(f"DEBUG DB: Rows affected: {rows_affected}")
-            
-            conn.commit()
-            conn.close()
-            print(f"DEBUG DB: Update completed successfully")
+                # ถ้าเป็นค่าเริ่มต้น ให้ยกเลิกค่าเริ่มต้นเดิม
+                if is_default:
+                    cursor.execute('''
+                        UPDATE option_values 
+                        SET is_default = 0, updated_at = CURRENT_TIMESTAMP
+                        WHERE option_type = ? AND option_value_id != ?
+                    ''', (option_type, option_value_id))
+                
+                # สร้างคำสั่ง UPDATE
+                update_fields = []
+                params = []
+                
+                if name is not None:
+                    update_fields.append('name = ?')
+                    params.append(name)
+                
+                if additional_price is not None:
+                    update_fields.append('additional_price = ?')
+                    params.append(additional_price)
+                
+                if is_default is not None:
+                    update_fields.append('is_default = ?')
+                    params.append(is_default)
+                
+                if sort_order is not None:
+                    update_fields.append('sort_order = ?')
+                    params.append(sort_order)
+                
+                if update_fields:
+                    update_fields.append('updated_at = CURRENT_TIMESTAMP')
+                    params.append(option_value_id)
+                    
+                    sql_query = f'''
+                        UPDATE option_values 
+                        SET {', '.join(update_fields)}
+                        WHERE option_value_id = ?
+                    '''
+                    log.debug('Executing SQL: %s', sql_query)
+                    log.debug('With params: %s', params)
+                    
+                    cursor.execute(sql_query, params)
+                    
+                    # ตรวจสอบว่ามีการอัปเดตจริงหรือไม่
+                    rows_affected = cursor.rowcount
+                    log.debug('Rows affected: %s', rows_affected)
+            self.menu_cache.invalidate()
+                
+            log.debug('Update completed successfully')
             return True
         except Exception as e:
-            print(f"Error updating option value: {e}")
+            log.error('Error updating option value: %s', e)
             return False
     
     def delete_option_value(self, option_value_id: int) -> bool:
         """ลบค่าตัวเลือก (soft delete)"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE option_values 
-                SET is_active = 0, updated_at = CURRENT_TIMESTAMP
-                WHERE option_value_id = ?
-            ''', (option_value_id,))
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE option_values 
+                    SET is_active = 0, updated_at = CURRENT_TIMESTAMP
+                    WHERE option_value_id = ?
+                ''', (option_value_id,))
+            self.menu_cache.invalidate()
             return True
         except Exception as e:
-            print(f"Error deleting option value: {e}")
+            log.error('Error deleting option value: %s', e)
             return False
     
     def initialize_default_option_values(self):
         """สร้างค่าตัวเลือกเริ่มต้น"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # ตรวจสอบและเพิ่มประเภทตัวเลือกเริ่มต้น
-            cursor.execute('SELECT COUNT(*) as count FROM option_types')
-            type_count = cursor.fetchone()['count']
-            
-            if type_count == 0:
-                # เพิ่มประเภทตัวเลือกเริ่มต้น
-                default_types = [
-                    ('ระดับความเผ็ด', 'spice', 'ตัวเลือกสำหรับระดับความเผ็ดของอาหาร'),
-                    ('ระดับความหวาน', 'sweet', 'ตัวเลือกสำหรับระดับความหวานของเครื่องดื่ม')
-                ]
-                
-                for name, key, description in default_types:
-                    cursor.execute('''
-                        INSERT INTO option_types (name, key, description, is_active)
-                        VALUES (?, ?, ?, ?)
-                    ''', (name, key, description, True))
-            
-            # ตรวจสอบว่ามีข้อมูล option values อยู่แล้วหรือไม่
-            cursor.execute('SELECT COUNT(*) as count FROM option_values')
-            count = cursor.fetchone()['count']
-            
-            if count == 0:
-                # เพิ่มค่าตัวเลือกความเผ็ด
-                spice_options = [
-                    ('ไม่เผ็ด', True, 1),
-                    ('เผ็ดน้อย', False, 2),
-                    ('เผ็ดปานกลาง', False, 3),
-                    ('เผ็ดมาก', False, 4),
-                    ('เผ็ดมากที่สุด', False, 5)
-                ]
-                
-                for name, is_default, sort_order in spice_options:
-                    cursor.execute('''
-                        INSERT INTO option_values (option_type, name, is_default, sort_order)
-                        VALUES (?, ?, ?, ?)
-                    ''', ('spice', name, is_default, sort_order))
+            with self.transaction() as conn:
+                cursor = conn.cursor()
                 
-                # เพิ่มค่าตัวเลือกความหวาน
-                sweet_options = [
-                    ('ไม่หวาน', False, 1),
-                    ('หวานน้อย', False, 2),
-                    ('หวานปานกลาง', True, 3),
-                    ('หวานมาก', False, 4)
-                ]
+                # ตรวจสอบและเพิ่มประเภทตัวเลือกเริ่มต้น
+                cursor.execute('SELECT COUNT(*) as count FROM option_types')
+                type_count = cursor.fetchone()['count']
                 
-                for name, is_default, sort_order in sweet_options:
-                    cursor.execute('''
-                        INSERT INTO option_values (option_type, name, is_default, sort_order)
-                        VALUES (?, ?, ?, ?)
-                    ''', ('sweet', name, is_default, sort_order))
+                if type_count == 0:
+                    # เพิ่มประเภทตัวเลือกเริ่มต้น
+                    default_types = [
+                        ('ระดับความเผ็ด', 'spice', 'ตัวเลือกสำหรับระดับความเผ็ดของอาหาร'),
+                        ('ระดับความหวาน', 'sweet', 'ตัวเลือกสำหรับระดับความหวานของเครื่องดื่ม')
+                    ]
+                    
+                    for name, key, description in default_types:
+                        cursor.execute('''
+                            INSERT INTO option_types (name, key, description, is_active)
+                            VALUES (?, ?, ?, ?)
+                        ''', (name, key, description, True))
+                
+                # ตรวจสอบว่ามีข้อมูล option values อยู่แล้วหรือไม่
+                cursor.execute('SELECT COUNT(*) as count FROM option_values')
+                count = cursor.fetchone()['count']
+                
+                if count == 0:
+                    # เพิ่มค่าตัวเลือกความเผ็ด
+                    spice_options = [
+                        ('ไม่เผ็ด', True, 1),
+                        ('เผ็ดน้อย', False, 2),
+                        ('เผ็ดปานกลาง', False, 3),
+                        ('เผ็ดมาก', False, 4),
+                        ('เผ็ดมากที่สุด', False, 5)
+                    ]
+                    
+                    for name, is_default, sort_order in spice_options:
+                        cursor.execute('''
+                            INSERT INTO option_values (option_type, name, is_default, sort_order)
+                            VALUES (?, ?, ?, ?)
+                        ''', ('spice', name, is_default, sort_order))
+                    
+                    # เพิ่มค่าตัวเลือกความหวาน
+                    sweet_options = [
+                        ('ไม่หวาน', False, 1),
+                        ('หวานน้อย', False, 2),
+                        ('หวานปานกลาง', True, 3),
+                        ('หวานมาก', False, 4)
+                    ]
+                    
+                    for name, is_default, sort_order in sweet_options:
+                        cursor.execute('''
+                            INSERT INTO option_values (option_type, name, is_default, sort_order)
+                            VALUES (?, ?, ?, ?)
+                        ''', ('sweet', name, is_default, sort_order))
+            self.menu_cache.invalidate()
+                    
                 
-                conn.commit()
-            
-            conn.close()
             return True
         except Exception as e:
-            print(f"Error initializing default option values: {e}")
+            log.error('Error initializing default option values: %s', e)
             return False
     
     def set_default_option_value(self, option_type: str, default_option_id: int) -> bool:
         """ตั้งค่าเริ่มต้นสำหรับตัวเลือก"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # ยกเลิกค่าเริ่มต้นเดิมทั้งหมดในประเภทนี้
-            cursor.execute('''
-                UPDATE option_values 
-                SET is_default = 0, updated_at = CURRENT_TIMESTAMP
-                WHERE option_type = ?
-            ''', (option_type,))
-            
-            # ตั้งค่าเริ่มต้นใหม่
-            cursor.execute('''
-                UPDATE option_values 
-                SET is_default = 1, updated_at = CURRENT_TIMESTAMP
-                WHERE option_value_id = ? AND option_type = ?
-            ''', (default_option_id, option_type))
-            
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                # ยกเลิกค่าเริ่มต้นเดิมทั้งหมดในประเภทนี้
+                cursor.execute('''
+                    UPDATE option_values 
+                    SET is_default = 0, updated_at = CURRENT_TIMESTAMP
+                    WHERE option_type = ?
+                ''', (option_type,))
+                
+                # ตั้งค่าเริ่มต้นใหม่
+                cursor.execute('''
+                    UPDATE option_values 
+                    SET is_default = 1, updated_at = CURRENT_TIMESTAMP
+                    WHERE option_value_id = ? AND option_type = ?
+                ''', (default_option_id, option_type))
+            self.menu_cache.invalidate()
+                
             return True
         except Exception as e:
-            print(f"Error setting default option value: {e}")
+            log.error('Error setting default option value: %s', e)
             return False
     
     # ฟังก์ชันจัดการประเภทตัวเลือก (Option Types)
     def get_option_types(self) -> List[Dict]:
         """ดึงประเภทตัวเลือกทั้งหมด"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT * FROM option_types 
-                WHERE is_active = 1
-                ORDER BY name
-            ''')
-            
-            option_types = []
-            for row in cursor.fetchall():
-                option_types.append({
-                    'option_type_id': row['option_type_id'],
-                    'name': row['name'],
-                    'key': row['key'],
-                    'description': row['description'],
-                    'is_active': bool(row['is_active']),
-                    'created_at': row['created_at'],
-                    'updated_at': row['updated_at']
-                })
-            
-            conn.close()
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    SELECT * FROM option_types 
+                    WHERE is_active = 1
+                    ORDER BY name
+                ''')
+                
+                option_types = []
+                for row in cursor.fetchall():
+                    option_types.append({
+                        'option_type_id': row['option_type_id'],
+                        'name': row['name'],
+                        'key': row['key'],
+                        'description': row['description'],
+                        'is_active': bool(row['is_active']),
+                        'created_at': row['created_at'],
+                        'updated_at': row['updated_at']
+                    })
+                
             return option_types
         except Exception as e:
-            print(f"Error getting option types: {e}")
+            log.error('Error getting option types: %s', e)
             return []
     
     def add_option_type(self, name: str, key: str, description: str = "", is_active: bool = True) -> bool:
         """เพิ่มประเภทตัวเลือกใหม่"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # ตรวจสอบว่า key ซ้ำหรือไม่
-            cursor.execute('SELECT COUNT(*) as count FROM option_types WHERE key = ?', (key,))
-            if cursor.fetchone()['count'] > 0:
-                conn.close()
-                return False
-            
-            cursor.execute('''
-                INSERT INTO option_types (name, key, description, is_active)
-                VALUES (?, ?, ?, ?)
-            ''', (name, key, description, is_active))
-            
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                # ตรวจสอบว่า key ซ้ำหรือไม่
+                cursor.execute('SELECT COUNT(*) as count FROM option_types WHERE key = ?', (key,))
+                if cursor.fetchone()['count'] > 0:
+                    return False
+                
+                cursor.execute('''
+                    INSERT INTO option_types (name, key, description, is_active)
+                    VALUES (?, ?, ?, ?)
+                ''', (name, key, description, is_active))
+                
+            self.menu_cache.invalidate()
             return True
         except Exception as e:
-            print(f"Error adding option type: {e}")
+            log.error('Error adding option type: %s', e)
             return False
     
     def update_option_type(self, option_type_id: int, name: str = None, description: str = None, is_active: bool = None) -> bool:
         """อัปเดตประเภทตัวเลือก"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # สร้างคำสั่ง UPDATE
-            update_fields = []
-            params = []
-            
-            if name is not None:
-                update_fields.append('name = ?')
-                params.append(name)
-            
-            if description is not None:
-                update_fields.append('description = ?')
-                params.append(description)
-            
-            if is_active is not None:
-                update_fields.append('is_active = ?')
-                params.append(is_active)
-            
-            if update_fields:
-                update_fields.append('updated_at = CURRENT_TIMESTAMP')
-                params.append(option_type_id)
+            with self.transaction() as conn:
+                cursor = conn.cursor()
                 
-                cursor.execute(f'''
-                    UPDATE option_types 
-                    SET {', '.join(update_fields)}
-                    WHERE option_type_id = ?
-                ''', params)
-            
-            conn.commit()
-            conn.close()
+                # สร้างคำสั่ง UPDATE
+                update_fields = []
+                params = []
+                
+                if name is not None:
+                    update_fields.append('name = ?')
+                    params.append(name)
+                
+                if description is not None:
+                    update_fields.append('description = ?')
+                    params.append(description)
+                
+                if is_active is not None:
+                    update_fields.append('is_active = ?')
+                    params.append(is_active)
+                
+                if update_fields:
+                    update_fields.append('updated_at = CURRENT_TIMESTAMP')
+                    params.append(option_type_id)
+                    
+                    cursor.execute(f'''
+                        UPDATE option_types 
+                        SET {', '.join(update_fields)}
+                        WHERE option_type_id = ?
+                    ''', params)
+                
+            self.menu_cache.invalidate()
             return True
         except Exception as e:
-            print(f"Error updating option type: {e}")
+            log.error('Error updating option type: %s', e)
             return False
     
     def delete_option_type(self, option_type_id: int) -> bool:
         """ลบประเภทตัวเลือก (soft delete)"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # ตรวจสอบว่ามี option values ที่ใช้ประเภทนี้อยู่หรือไม่
-            cursor.execute('''
-                SELECT ot.key FROM option_types ot
-                WHERE ot.option_type_id = ?
-            ''', (option_type_id,))
-            
-            result = cursor.fetchone()
-            if not result:
-                conn.close()
-                return False
-            
-            option_key = result['key']
-            
-            # ตรวจสอบว่ามี option values ที่ใช้ key นี้อยู่หรือไม่
-            cursor.execute('''
-                SELECT COUNT(*) as count FROM option_values 
-                WHERE option_type = ? AND is_active = 1
-            ''', (option_key,))
-            
-            if cursor.fetchone()['count'] > 0:
-                # มี option values ที่ใช้อยู่ ไม่สามารถลบได้
-                conn.close()
-                return False
-            
-            # ลบประเภทตัวเลือก (soft delete)
-            cursor.execute('''
-                UPDATE option_types 
-                SET is_active = 0, updated_at = CURRENT_TIMESTAMP
-                WHERE option_type_id = ?
-            ''', (option_type_id,))
-            
-            conn.commit()
-            conn.close()
+            with self.transaction() as conn:
+                cursor = conn.cursor()
+                
+                # ตรวจสอบว่ามี option values ที่ใช้ประเภทนี้อยู่หรือไม่
+                cursor.execute('''
+                    SELECT ot.key FROM option_types ot
+                    WHERE ot.option_type_id = ?
+                ''', (option_type_id,))
+                
+                result = cursor.fetchone()
+                if not result:
+                    return False
+                
+                option_key = result['key']
+                
+                # ตรวจสอบว่ามี option values ที่ใช้ key นี้อยู่หรือไม่
+                cursor.execute('''
+                    SELECT COUNT(*) as count FROM option_values 
+                    WHERE option_type = ? AND is_active = 1
+                ''', (option_key,))
+                
+                if cursor.fetchone()['count'] > 0:
+                    # มี option values ที่ใช้อยู่ ไม่สามารถลบได้
+                    return False
+                
+                # ลบประเภทตัวเลือก (soft delete)
+                cursor.execute('''
+                    UPDATE option_types 
+                    SET is_active = 0, updated_at = CURRENT_TIMESTAMP
+                    WHERE option_type_id = ?
+                ''', (option_type_id,))
+                
+            self.menu_cache.invalidate()
             return True
         except Exception as e:
-            print(f"Error deleting option type: {e}")
+            log.error('Error deleting option type: %s', e)
             return False
\ No newline at end of file
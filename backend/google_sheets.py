@@ -10,15 +10,15 @@ import json
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 
+from utils.sheets_client import sheets_client
+
 try:
-    from google.oauth2.credentials import Credentials
-    from google.oauth2.service_account import Credentials as ServiceAccountCredentials
-    from google.auth.transport.requests import Request
-    from google_auth_oauthlib.flow import InstalledAppFlow
-    from googleapiclient.discovery import build
     from googleapiclient.errors import HttpError
-except ImportError as e:
-    print(f"Warning: Google Sheets dependencies not installed: {e}")
+except ImportError:
+    HttpError = Exception
+
+if not sheets_client.available:
+    print("Warning: Google Sheets dependencies not installed")
     print("Run: pip install google-api-python-client google-auth google-auth-oauthlib")
 
 class GoogleSheetsManager:
@@ -39,9 +39,10 @@ class GoogleSheetsManager:
         """
         self.credentials_file = credentials_file
         self.token_file = token_file
-        self.service = None
         self.spreadsheet_id = None
         self.enabled = False
+        self._ready = False
+        self._config_version = None
         
         # โหลดการตั้งค่าจากไฟล์ config
         self.load_config()
@@ -53,16 +54,14 @@ class GoogleSheetsManager:
         """
         โหลดการตั้งค่าจากไฟล์ config
         """
-        config_file = 'google_sheets_config.json'
+        config_file = sheets_client.config_file
+        # sheets_client อ่านไฟล์ใหม่เฉพาะเมื่อไฟล์เปลี่ยน
+        config = sheets_client.config()
+        self._config_version = sheets_client.config_version
         if os.path.exists(config_file):
-            try:
-                with open(config_file, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                    self.spreadsheet_id = config.get('spreadsheet_id')
-                    self.enabled = config.get('enabled', False)
-                    print(f"[Google Sheets] Loaded config: enabled={self.enabled}")
-            except Exception as e:
-                print(f"[Google Sheets] Error loading config: {e}")
+            self.spreadsheet_id = config.get('spreadsheet_id')
+            self.enabled = config.get('enabled', False)
+            print(f"[Google Sheets] Loaded config: enabled={self.enabled}")
         else:
             # สร้างไฟล์ config เริ่มต้น
             self.create_default_config()
@@ -102,18 +101,41 @@ class GoogleSheetsManager:
                 print("[Google Sheets] Please download credentials.json from Google Cloud Console")
                 return False
             
-            # ใช้ service account credentials
-            creds = ServiceAccountCredentials.from_service_account_file(
-                self.credentials_file, scopes=self.SCOPES)
-            
-            # สร้าง service object
-            self.service = build('sheets', 'v4', credentials=creds)
+            # ตรวจสอบ service account credentials (sheets_client แคชไว้ใช้ร่วมกัน และสร้าง service เมื่อใช้งานจริง)
+            sheets_client.credentials(self.credentials_file, refresh=False)
+            self._ready = True
             print("[Google Sheets] Service initialized successfully")
             return True
             
         except Exception as e:
             print(f"[Google Sheets] Error initializing service: {e}")
             return False
+
+    def refresh_config(self):
+        """
+        โหลดการตั้งค่าใหม่ถ้าไฟล์ config เปลี่ยนตั้งแต่โหลดครั้งล่าสุด
+        """
+        if sheets_client.current_config_version() != self._config_version:
+            self._ready = False
+            self.load_config()
+            self.initialize_service()
+
+    @property
+    def ready(self) -> bool:
+        """
+        เปิดใช้งานและมี credentials พร้อมใช้ (ไม่เรียกเครือข่าย)
+        """
+        self.refresh_config()
+        return self.enabled and self._ready
+
+    @property
+    def service(self):
+        """
+        Google Sheets API service ของ thread ปัจจุบันจาก sheets_client (None ถ้ายังไม่พร้อม)
+        """
+        if not self.ready:
+            return None
+        return sheets_client.service(self.credentials_file)
     
     def test_connection(self):
         """
@@ -605,7 +627,7 @@ def is_google_sheets_enabled():
     """
     ตรวจสอบว่า Google Sheets integration เปิดใช้งานหรือไม่
     """
-    return google_sheets_manager.enabled and google_sheets_manager.service is not None
+    return google_sheets_manager.ready
 
 def sync_order_to_sheets(order_data, order_items=None):
     """
@@ -656,8 +678,7 @@ def setup_google_sheets(spreadsheet_id: str):
             json.dump(config, f, indent=2, ensure_ascii=False)
         
         # รีโหลด config
-        google_sheets_manager.spreadsheet_id = spreadsheet_id
-        google_sheets_manager.enabled = True
+        google_sheets_manager.refresh_config()
         
         # ทดสอบการเชื่อมต่อ
         if google_sheets_manager.test_connection():
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+ตัวจัดการ schema migration แบบมีเวอร์ชันสำหรับฐานข้อมูล POS
+และการตรวจสอบ EXPLAIN QUERY PLAN ของคิวรีหลัก
+"""
+
+import sqlite3
+import sys
+from typing import List, Dict, Callable, Tuple
+
+from utils.diagnostics import get_logger
+
+log = get_logger('pos.migrations')
+
+def _column_names(cursor: sqlite3.Cursor, table: str) -> List[str]:
+    """รายชื่อคอลัมน์ของตาราง"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [column[1] for column in cursor.fetchall()]
+
+def _add_column_if_missing(cursor: sqlite3.Cursor, table: str, column: str, definition: str) -> bool:
+    """เพิ่มคอลัมน์ถ้ายังไม่มี (ฐานข้อมูลเก่าบางชุดถูกแก้ด้วยโค้ดเดิมไปแล้ว) คืนค่า True ถ้าเพิ่มใหม่"""
+    if column in _column_names(cursor, table):
+        return False
+    cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    return True
+
+# === Migrations ===
+def _migration_001_menu_food_option_type(cursor: sqlite3.Cursor):
+    """menu_items.food_option_type แทน spice_options / sweetness_options"""
+    if not _add_column_if_missing(cursor, 'menu_items', 'food_option_type', "TEXT DEFAULT 'none'"):
+        return
+    columns = _column_names(cursor, 'menu_items')
+    if 'spice_options' in columns and 'sweetness_options' in columns:
+        # อัปเดตข้อมูลเดิมจาก spice_options และ sweetness_options
+        # (SQLite ไม่รองรับ DROP COLUMN โดยตรง จึงปล่อยคอลัมน์เก่าไว้)
+        cursor.execute('''
+            UPDATE menu_items
+            SET food_option_type = CASE
+                WHEN spice_options IS NOT NULL AND spice_options != '' THEN 'spice'
+                WHEN sweetness_options IS NOT NULL AND sweetness_options != '' THEN 'sweet'
+                ELSE 'none'
+            END
+        ''')
+
+def _migration_002_category_sort_order(cursor: sqlite3.Cursor):
+    """menu_categories.sort_order พร้อมลำดับเริ่มต้นตาม category_id"""
+    if _add_column_if_missing(cursor, 'menu_categories', 'sort_order', 'INTEGER DEFAULT 0'):
+        cursor.execute('''
+            UPDATE menu_categories
+            SET sort_order = category_id * 10
+            WHERE sort_order = 0 OR sort_order IS NULL
+        ''')
+
+def _migration_003_order_bill_status(cursor: sqlite3.Cursor):
+    """orders.bill_status"""
+    if _add_column_if_missing(cursor, 'orders', 'bill_status', "TEXT DEFAULT 'unchecked'"):
+        cursor.execute("UPDATE orders SET bill_status = 'unchecked' WHERE bill_status IS NULL")
+
+def _migration_004_table_checkout_at(cursor: sqlite3.Cursor):
+    """tables.checkout_at สำหรับเก็บเวลาเช็คบิล"""
+    _add_column_if_missing(cursor, 'tables', 'checkout_at', 'TIMESTAMP')
+
+def _migration_005_hot_path_indexes(cursor: sqlite3.Cursor):
+    """ดัชนีสำหรับคิวรีที่ถูกเรียกบ่อย"""
+    # ออเดอร์ของโต๊ะ/เซสชัน (ใช้ได้ทั้ง table_id อย่างเดียว และ table_id + session_id + status)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_orders_table_session_status
+        ON orders(table_id, session_id, status)
+    ''')
+    # รายงานและประวัติตามช่วงเวลา
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at)')
+    # รายการอาหารของออเดอร์
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items(order_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_order_history_items_order_id ON order_history_items(order_id)')
+    # การแจ้งเตือนที่ยังไม่อ่าน เรียงตามเวลา
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_notifications_is_read_created_at
+        ON notifications(is_read, created_at)
+    ''')
+
+def _migration_006_daily_sales_rollup(cursor: sqlite3.Cursor):
+    """ตารางสรุปยอดขายรายวัน (ต่อวัน / ต่อเมนู / ต่อหมวดหมู่ / ต่อโต๊ะ)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_sales_rollup (
+            sales_date TEXT NOT NULL,
+            dimension TEXT NOT NULL,
+            ref_id INTEGER NOT NULL DEFAULT 0,
+            quantity INTEGER DEFAULT 0,
+            revenue REAL DEFAULT 0,
+            order_count INTEGER DEFAULT 0,
+            updated_at TIMESTAMP,
+            PRIMARY KEY (sales_date, dimension, ref_id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_daily_sales_rollup_dimension_date
+        ON daily_sales_rollup(dimension, sales_date)
+    ''')
+
+# ตารางที่บันทึกการเปลี่ยนแปลงลง change_log: (ตาราง, คอลัมน์ primary key)
+CHANGE_FEED_TABLES: List[Tuple[str, str]] = [
+    ('orders', 'order_id'),
+    ('order_items', 'order_item_id'),
+    ('tables', 'table_id'),
+    ('notifications', 'notification_id'),
+]
+
+def _migration_007_change_log(cursor: sqlite3.Cursor):
+    """ลำดับการเปลี่ยนแปลง (change feed) ของออเดอร์ รายการอาหาร โต๊ะ และการแจ้งเตือน บันทึกด้วย trigger"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_change_log_entity
+        ON change_log(entity, entity_id, seq)
+    ''')
+    # trigger ทำงานภายใน transaction เดียวกับการเขียน จึงครอบคลุมทั้งโค้ดใน DatabaseManager และ SQL ตรงใน app.py
+    for table, key in CHANGE_FEED_TABLES:
+        for op, row in (('insert', 'NEW'), ('update', 'NEW'), ('delete', 'OLD')):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_change_{op}
+                AFTER {op.upper()} ON {table}
+                BEGIN
+                    INSERT INTO change_log (entity, entity_id, op) VALUES ('{table}', {row}.{key}, '{op}');
+                END
+            ''')
+
+def _migration_008_notifications_archive(cursor: sqlite3.Cursor):
+    """คลังการแจ้งเตือนที่อ่านแล้วและเก่ากว่าระยะเก็บรักษา (ย้ายออกจาก notifications โดย compact_notifications)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notifications_archive (
+            notification_id INTEGER PRIMARY KEY,
+            table_id INTEGER,
+            message TEXT NOT NULL,
+            type TEXT NOT NULL,
+            is_read BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP,
+            read_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _migration_009_sheets_outbox(cursor: sqlite3.Cursor):
+    """คิว (outbox) งานซิงค์ Google Sheets บันทึกใน transaction เดียวกับการเปลี่ยนแปลงออเดอร์"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sheets_outbox (
+            outbox_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            order_id INTEGER,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sheets_outbox_status_next_attempt
+        ON sheets_outbox(status, next_attempt_at)
+    ''')
+
+def _migration_010_sheets_order_rows(cursor: sqlite3.Cursor):
+    """ตำแหน่งแถวของแต่ละออเดอร์ในชีต Orders ของ Google Sheets สำหรับการส่งออกแบบเพิ่มทีละส่วน"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sheets_order_rows (
+            order_id INTEGER PRIMARY KEY,
+            start_row INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            content_hash TEXT,
+            synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sheets_order_rows_start_row ON sheets_order_rows(start_row)')
+
+# รายการ migration ตามลำดับ (ห้ามแก้ไขหรือเรียงลำดับใหม่หลังจากปล่อยใช้งานแล้ว ให้เพิ่มต่อท้ายเท่านั้น)
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, 'menu_items.food_option_type', _migration_001_menu_food_option_type),
+    (2, 'menu_categories.sort_order', _migration_002_category_sort_order),
+    (3, 'orders.bill_status', _migration_003_order_bill_status),
+    (4, 'tables.checkout_at', _migration_004_table_checkout_at),
+    (5, 'hot path indexes', _migration_005_hot_path_indexes),
+    (6, 'daily_sales_rollup', _migration_006_daily_sales_rollup),
+    (7, 'change_log', _migration_007_change_log),
+    (8, 'notifications_archive', _migration_008_notifications_archive),
+    (9, 'sheets_outbox', _migration_009_sheets_outbox),
+    (10, 'sheets_order_rows', _migration_010_sheets_order_rows),
+]
+
+def ensure_migrations_table(cursor: sqlite3.Cursor):
+    """สร้างตารางเก็บเวอร์ชัน schema"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def get_schema_version(cursor: sqlite3.Cursor) -> int:
+    """เวอร์ชัน schema ล่าสุดที่ถูกใช้แล้ว"""
+    ensure_migrations_table(cursor)
+    cursor.execute('SELECT MAX(version) FROM schema_migrations')
+    row = cursor.fetchone()
+    return row[0] or 0
+
+def run_migrations(conn: sqlite3.Connection) -> List[int]:
+    """รัน migration ที่ยังไม่ได้ใช้ ภายใน transaction ของผู้เรียก คืนค่ารายการเวอร์ชันที่รันใหม่"""
+    cursor = conn.cursor()
+    current = get_schema_version(cursor)
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        migrate(cursor)
+        cursor.execute('''
+            INSERT INTO schema_migrations (version, description)
+            VALUES (?, ?)
+        ''', (version, description))
+        applied.append(version)
+        log.info('Applied migration %03d: %s', version, description)
+    return applied
+
+# === EXPLAIN QUERY PLAN self-check ===
+# คิวรีหลักที่ต้องใช้ดัชนีเสมอ: (ชื่อ, SQL, พารามิเตอร์ตัวอย่าง, ตาราง/alias ที่ห้าม SCAN ทั้งตาราง)
+HOT_QUERIES: List[Tuple[str, str, tuple, Tuple[str, ...]]] = [
+    ('active orders by table session',
+     "SELECT order_id FROM orders WHERE table_id = ? AND session_id = ? AND status = 'active'",
+     (1, 'session'), ('orders',)),
+    ('orders by table',
+     "SELECT order_id FROM orders WHERE table_id = ? AND status != 'completed'",
+     (1,), ('orders',)),
+    ('orders by created_at range',
+     'SELECT order_id FROM orders WHERE created_at >= ? AND created_at < ? ORDER BY created_at DESC',
+     ('2024-01-01 00:00:00', '2024-01-02 00:00:00'), ('orders',)),
+    ('items of order',
+     'SELECT * FROM order_items WHERE order_id = ?',
+     (1,), ('order_items',)),
+    ('items of order join menu',
+     '''SELECT oi.*, mi.name FROM order_items oi
+        JOIN menu_items mi ON oi.item_id = mi.item_id
+        WHERE oi.order_id = ?''',
+     (1,), ('oi', 'mi')),
+    ('floor plan items of current sessions',
+     '''SELECT t.table_id, mi.name, SUM(oi.quantity) FROM tables t
+        LEFT JOIN orders o ON o.table_id = t.table_id AND o.session_id = t.session_id
+        LEFT JOIN order_items oi ON oi.order_id = o.order_id
+        LEFT JOIN menu_items mi ON mi.item_id = oi.item_id
+        GROUP BY t.table_id, mi.name''',
+     (), ('o', 'oi', 'mi')),
+    ('history items of order',
+     'SELECT * FROM order_history_items WHERE order_id = ?',
+     (1,), ('order_history_items',)),
+    ('change feed since cursor',
+     'SELECT seq, entity, entity_id FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?',
+     (0, 100), ('change_log',)),
+    ('unread notifications',
+     'SELECT * FROM notifications WHERE is_read = 0 ORDER BY created_at DESC',
+     (), ('notifications',)),
+    ('unread notifications after id',
+     'SELECT * FROM notifications WHERE is_read = 0 AND notification_id > ? ORDER BY created_at DESC LIMIT ?',
+     (0, 100), ('notifications',)),
+    ('expired read notifications',
+     'SELECT notification_id FROM notifications WHERE is_read = 1 AND created_at < ?',
+     ('2024-01-01 00:00:00',), ('notifications',)),
+    ('due sheets outbox entries',
+     "SELECT outbox_id FROM sheets_outbox WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+     (0, 10), ('sheets_outbox',)),
+    ('sheets rows below order',
+     'SELECT order_id FROM sheets_order_rows WHERE start_row > ?',
+     (2,), ('sheets_order_rows',)),
+]
+
+class QueryPlanRegression(RuntimeError):
+    """คิวรีหลักถูกวางแผนเป็นการ SCAN ทั้งตาราง"""
+
+def _is_full_scan(detail: str, names: Tuple[str, ...]) -> bool:
+    """ตรวจว่าบรรทัดของ query plan เป็นการ SCAN ตาราง (หรือ alias) ที่ระบุโดยไม่ใช้ดัชนี"""
+    words = detail.split()
+    if not words or words[0] != 'SCAN' or 'USING' in words:
+        return False
+    # รูปแบบ: "SCAN orders" / "SCAN oi" หรือ SQLite รุ่นเก่า: "SCAN TABLE order_items AS oi"
+    return any(word in names for word in words[1:] if word not in ('TABLE', 'AS'))
+
+def explain_query_plan(conn: sqlite3.Connection, sql: str, params: tuple = ()) -> List[str]:
+    """คืนรายละเอียดแต่ละขั้นของ query plan"""
+    rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+    return [row[3] for row in rows]
+
+def check_query_plans(conn: sqlite3.Connection) -> List[Dict]:
+    """ตรวจ query plan ของคิวรีหลักทั้งหมด คืนค่ารายการที่ถดถอยเป็นการ SCAN"""
+    regressions = []
+    for name, sql, params, tables in HOT_QUERIES:
+        plan = explain_query_plan(conn, sql, params)
+        scans = [detail for detail in plan if _is_full_scan(detail, tables)]
+        if scans:
+            regressions.append({'query': name, 'plan': plan})
+    return regressions
+
+def assert_query_plans(conn: sqlite3.Connection):
+    """เหมือน check_query_plans แต่ raise QueryPlanRegression ถ้ามีคิวรีที่ SCAN ทั้งตาราง"""
+    regressions = check_query_plans(conn)
+    if regressions:
+        lines = [f"{r['query']}: {' | '.join(r['plan'])}" for r in regressions]
+        raise QueryPlanRegression('Hot queries regressed to full table scans:\n  ' + '\n  '.join(lines))
+
+if __name__ == '__main__':
+    # ใช้งาน: python migrations.py [path/to/pos_database.db]
+    db_path = sys.argv[1] if len(sys.argv) > 1 else 'pos_database.db'
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            run_migrations(conn)
+        print(f"[DB] Schema version: {get_schema_version(conn.cursor())}")
+        assert_query_plans(conn)
+        print('[DB] Query plan check passed')
+    except QueryPlanRegression as e:
+        print(f"[DB] QUERY PLAN CHECK FAILED: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
@@ -5,431 +5,639 @@
 ตามรูปแบบที่ผู้ใช้กำหนด (9 คอลัมน์)
 """
 
+import hashlib
 import json
+import os
+import re
+import sqlite3
+import threading
+from collections import defaultdict
 from datetime import datetime
-from googleapiclient.discovery import build
-from google.oauth2.service_account import Credentials
+
+from utils.diagnostics import get_logger
+from utils.sheets_client import sheets_client
+
+log = get_logger('pos.sheets')
+
+# ฐานข้อมูลเดียวกับที่ app.py ใช้ (โปรเซสรันใน backend/ แต่ไฟล์ฐานข้อมูลอยู่ที่ root ของโปรเจกต์ หรือ POS_DB_PATH)
+DB_PATH = os.environ.get('POS_DB_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pos_database.db')
+SHEET_NAME = 'Orders'
+
+HEADER = [
+    'Order ID',
+    'วันที่-เวลา', 
+    'ชื่อสินค้า',
+    'จำนวน',
+    'ราคาต่อหน่วย (บาท)',
+    'ราคารวม (บาท)',
+    'คำขอพิเศษ',
+    'หมายเหตุ',
+    'สถานะ'
+]
+
+# แปลงสถานะเป็นภาษาไทย
+STATUS_MAPPING = {
+    'active': 'รอดำเนินการ',
+    'pending': 'รอดำเนินการ', 
+    'completed': 'เสร็จสิ้น',
+    'cancelled': 'ยกเลิก'
+}
+
+SPICE_PATTERNS = ['หวานปกติ', 'หวานน้อย', 'หวานมาก', 'เผ็ดน้อย', 'เผ็ดปานกลาง', 'เผ็ดมาก', 'เผ็ดพิเศษ', 'ไม่เผ็ด', 'ปกติ']
+SPECIAL_KEYWORDS = ['ไข่เจียว', 'ไข่ดาว', 'เพิ่มข้าว', 'เพิ่ม ข้าว']
+
+# ชุดสีสำหรับแต่ละ Order (เลือกตาม order_id ให้สีของออเดอร์เดิมไม่เปลี่ยนเมื่อเพิ่มออเดอร์ใหม่)
+COLOR_SETS = [
+    {'light': {'red': 1.0, 'green': 0.9, 'blue': 0.8}, 'dark': {'red': 1.0, 'green': 0.7, 'blue': 0.4}},
+    {'light': {'red': 0.8, 'green': 1.0, 'blue': 0.8}, 'dark': {'red': 0.6, 'green': 0.9, 'blue': 0.6}},
+    {'light': {'red': 0.8, 'green': 0.9, 'blue': 1.0}, 'dark': {'red': 0.6, 'green': 0.8, 'blue': 1.0}},
+    {'light': {'red': 0.95, 'green': 0.8, 'blue': 1.0}, 'dark': {'red': 0.9, 'green': 0.6, 'blue': 1.0}},
+    {'light': {'red': 1.0, 'green': 0.9, 'blue': 0.95}, 'dark': {'red': 1.0, 'green': 0.7, 'blue': 0.8}},
+    {'light': {'red': 1.0, 'green': 1.0, 'blue': 0.8}, 'dark': {'red': 1.0, 'green': 0.9, 'blue': 0.5}}
+]
 
 
 def is_order_already_synced(service, spreadsheet_id, order_id):
     """
     ตรวจสอบว่าออเดอร์นี้ถูก sync ไปยัง Google Sheets แล้วหรือยัง
     
+    ใช้ดัชนีในฐานข้อมูล (sheets_order_rows) แทนการดาวน์โหลดคอลัมน์ Order ID ทั้งคอลัมน์
+    
     Args:
-        service: Google Sheets API service
-        spreadsheet_id: ID ของ spreadsheet
+        service: Google Sheets API service (ไม่ได้ใช้ เก็บไว้เพื่อความเข้ากันได้)
+        spreadsheet_id: ID ของ spreadsheet (ไม่ได้ใช้ เก็บไว้เพื่อความเข้ากันได้)
         order_id: ID ของออเดอร์ที่ต้องการตรวจสอบ
     
     Returns:
         bool: True ถ้าออเดอร์ถูก sync แล้ว, False ถ้ายังไม่ถูก sync
     """
     try:
-        # ดึงข้อมูลจาก Google Sheets
-        result = service.spreadsheets().values().get(
-            spreadsheetId=spreadsheet_id,
-            range='Orders!A:A'  # ดึงเฉพาะคอลัมน์ Order ID
-        ).execute()
-        
-        values = result.get('values', [])
-        
-        # ตรวจสอบว่ามี Order ID นี้อยู่แล้วหรือไม่
-        for row in values[1:]:  # ข้าม header
-            if len(row) > 0 and str(row[0]) == str(order_id):
-                return True
-        
-        return False
+        conn = _connect()
+        try:
+            return conn.execute('SELECT 1 FROM sheets_order_rows WHERE order_id = ?', (order_id,)).fetchone() is not None
+        finally:
+            conn.close()
         
     except Exception as e:
-        print(f"[Google Sheets] Error checking if order {order_id} is synced: {e}")
+        log.error('Error checking if order %s is synced: %s', order_id, e)
         return False  # ถ้าเกิดข้อผิดพลาด ให้ sync ต่อไป
 
 
+def _load_sheets_service():
+    """Google Sheets API service ที่ใช้ร่วมกันจาก sheets_client คืนค่า (service, spreadsheet_id) หรือ (None, None) ถ้าปิดใช้งาน"""
+    config = sheets_client.config()
+    
+    if not config.get('enabled', False):
+        return None, None
+    
+    return sheets_client.service(), config['spreadsheet_id']
+
+
 def sync_order_to_new_format(order_data, order_items=None):
     """
     ฟังก์ชันใหม่สำหรับบันทึกออเดอร์ลง Google Sheets ตามรูปแบบที่ผู้ใช้กำหนด
     
+    เขียนเฉพาะแถวของออเดอร์นี้ (เพิ่มต่อท้าย หรือแก้ไขแถวเดิมตามตำแหน่งใน sheets_order_rows)
+    ข้อมูลในแถวอ่านจากฐานข้อมูล จึงเป็นสถานะล่าสุดของออเดอร์เสมอ
+    
     Args:
-        order_data (Dict): ข้อมูลออเดอร์
-        order_items (List[Dict], optional): รายการอาหารในออเดอร์
+        order_data (Dict): ข้อมูลออเดอร์ (ใช้ order_id)
+        order_items (List[Dict], optional): รายการอาหารในออเดอร์ (เก็บไว้เพื่อความเข้ากันได้)
     """
     try:
-        # โหลดการตั้งค่า
-        with open('google_sheets_config.json', 'r', encoding='utf-8') as f:
-            config = json.load(f)
-        
-        if not config.get('enabled', False):
+        service, spreadsheet_id = _load_sheets_service()
+        if service is None:
             return False
         
-        # เชื่อมต่อ Google Sheets
-        SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
-        credentials = Credentials.from_service_account_file(
-            'credentials.json', scopes=SCOPES)
-        service = build('sheets', 'v4', credentials=credentials)
+        order_id = order_data.get('order_id')
+        if not order_id:
+            return False
         
-        spreadsheet_id = config['spreadsheet_id']
+        result = export_orders(service, spreadsheet_id, [order_id])
+        if result is None:
+            return False
+        log.info('ส่งออกออเดอร์ %s: %s', order_id, result)
+        return True
         
-        # ตรวจสอบว่าออเดอร์นี้ถูก sync ไปแล้วหรือยัง
-        order_id = order_data.get('order_id')
-        # ลบเงื่อนไขการตรวจสอบสถานะ
-        # if is_order_already_synced(service, spreadsheet_id, order_id):
-        #     print(f"[Google Sheets] Order {order_id} already synced, skipping...")
-        #     return True
+    except Exception as e:
+        log.error('เกิดข้อผิดพลาดในการส่งออกออเดอร์: %s', e)
+        return False
+
+
+def rebuild_orders_sheet():
+    """เขียนชีต Orders ใหม่ทั้งหมดจากฐานข้อมูล (เรียกเมื่อต้องการเท่านั้น เช่น ผ่านคิว sheets_outbox)"""
+    try:
+        service, spreadsheet_id = _load_sheets_service()
+        if service is None:
+            return False
+        result = group_and_calculate_totals(service, spreadsheet_id)
+        return result is not None
+    except Exception as e:
+        log.error('เกิดข้อผิดพลาดในการสร้างชีตใหม่: %s', e)
+        return False
+
+
+def _connect():
+    conn = sqlite3.connect(DB_PATH, timeout=5)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def split_customer_request(customer_request):
+    """แยก customer_request เป็น (ระดับความเผ็ด/หวาน, คำขอพิเศษ, หมายเหตุ)"""
+    special_request_text = '-'
+    notes_text = '-'
+    spice_level = None
+    
+    if customer_request and customer_request.strip():
+        # แยกข้อมูลตาม | ก่อน
+        parts = customer_request.split('|')
+        special_requests = []
+        other_notes = []
         
-        # เตรียมข้อมูลสำหรับแต่ละรายการอาหาร
-        if order_items:
-            rows_to_add = []
-            
-            for item in order_items:
-                # คำนวณราคาต่อหน่วย
-                quantity = item.get('quantity', 1)
-                total_price = item.get('total_price', 0)
-                unit_price = total_price / quantity if quantity > 0 else 0
-                
-                # จัดรูปแบบวันที่
-                created_at = order_data.get('created_at', '')
-                if created_at:
-                    try:
-                        dt = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S')
-                        formatted_date = dt.strftime('%d/%m/%Y %H:%M:%S')
-                    except:
-                        formatted_date = created_at
-                else:
-                    formatted_date = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
-                
-                # สร้างแถวข้อมูลตามรูปแบบใหม่ (9 คอลัมน์)
-                row = [
-                    order_data.get('order_id', ''),           # A: Order ID
-                    formatted_date,                           # B: วันที่
-                    item.get('item_name', ''),               # C: ชื่อสินค้า
-                    quantity,                                 # D: จำนวน
-                    unit_price,                              # E: ราคาต่อหน่วย
-                    total_price,                             # F: ราคารวม
-                    item.get('special_options', ''),         # G: ตัวเลือกพิเศษ
-                    item.get('customer_request', ''),        # H: หมายเหตุ
-                    order_data.get('status', 'รอดำเนินการ')   # I: สถานะ
-                ]
+        for part in parts:
+            part = part.strip()
+            if not part:
+                continue
                 
-                rows_to_add.append(row)
+            # ตรวจสอบระดับความเผ็ด/หวาน
+            is_spice = False
+            for pattern in SPICE_PATTERNS:
+                if part == pattern or pattern in part:
+                    if not spice_level:  # เก็บระดับความเผ็ด/หวานแรกที่เจอ
+                        spice_level = pattern
+                    is_spice = True
+                    break
             
-            # เขียนข้อมูลลง Google Sheets
-            if rows_to_add:
-                # หาแถวสุดท้ายที่มีข้อมูล
-                result = service.spreadsheets().values().get(
-                    spreadsheetId=spreadsheet_id,
-                    range='Orders!A:I'
-                ).execute()
-                
-                values = result.get('values', [])
-                next_row = len(values) + 1
-                
-                # เขียนข้อมูลใหม่
-                range_name = f'Orders!A{next_row}:I{next_row + len(rows_to_add) - 1}'
-                
-                body = {
-                    'values': rows_to_add
-                }
-                
-                service.spreadsheets().values().update(
-                    spreadsheetId=spreadsheet_id,
-                    range=range_name,
-                    valueInputOption='USER_ENTERED',
-                    body=body
-                ).execute()
-                
-                print(f"[Google Sheets] เพิ่มข้อมูล {len(rows_to_add)} รายการสำเร็จ")
-                
-                # จัดกลุ่มและคำนวณยอดรวม
-                group_and_calculate_totals(service, spreadsheet_id)
+            if is_spice:
+                continue
+            
+            # แยกคำขอพิเศษและหมายเหตุในแต่ละส่วน
+            sub_parts = part.split(',')
+            for sub_part in sub_parts:
+                sub_part = sub_part.strip()
+                if not sub_part:
+                    continue
+                    
+                is_special = False
+                for keyword in SPECIAL_KEYWORDS:
+                    if keyword in sub_part:
+                        special_requests.append(sub_part)
+                        is_special = True
+                        break
                 
-                return True
+                # ถ้าไม่ใช่คำขอพิเศษแกะกับความเผ็ด/หวาน และไม่ใช่ "ไม่เพิ่ม" ให้ใส่ในหมายเหตุ
+                if not is_special and sub_part not in ['ไม่เพิ่ม', 'ปกติ'] and not any(spice in sub_part for spice in SPICE_PATTERNS):
+                    other_notes.append(sub_part)
         
-        return False
+        special_request_text = ', '.join(special_requests) if special_requests else '-'
+        notes_text = ', '.join(other_notes) if other_notes else '-'
+    
+    return spice_level, special_request_text, notes_text
+
+
+def build_order_rows(cursor, order_ids=None):
+    """
+    สร้างแถวในชีตของแต่ละออเดอร์ (แถวรายการอาหาร + แถวสรุปยอด) จากฐานข้อมูล
+    
+    Args:
+        cursor: cursor ของฐานข้อมูล
+        order_ids (List[int], optional): ออเดอร์ที่ต้องการ (None = ทุกออเดอร์)
+    
+    Returns:
+        Dict[int, List[List[str]]]: {order_id: แถว} ออเดอร์ที่ไม่มีรายการอาหารจะไม่อยู่ในผลลัพธ์
+    """
+    query = '''
+        SELECT o.order_id, o.created_at as order_date, mi.name, oi.quantity, 
+               oi.unit_price, oi.total_price, oi.customer_request, o.status,
+               oi.created_at as item_created_at
+        FROM orders o
+        JOIN order_items oi ON o.order_id = oi.order_id
+        JOIN menu_items mi ON oi.item_id = mi.item_id
+    '''
+    params = []
+    if order_ids is not None:
+        order_ids = list(order_ids)
+        if not order_ids:
+            return {}
+        query += f" WHERE o.order_id IN ({','.join('?' * len(order_ids))})"
+        params = order_ids
+    cursor.execute(query + ' ORDER BY o.order_id ASC, oi.created_at ASC', params)
+    
+    # จัดกลุ่มข้อมูลตาม Order ID
+    orders_grouped = defaultdict(list)
+    for item in cursor.fetchall():
+        orders_grouped[item[0]].append(item)
+    
+    order_rows = {}
+    for order_id, items in orders_grouped.items():
+        rows = []
+        total_quantity = 0
+        total_amount = 0
         
-    except Exception as e:
-        print(f"[Google Sheets] เกิดข้อผิดพลาด: {e}")
-        return False
+        for item in items:
+            order_date = datetime.strptime(item[1], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y %H:%M:%S')
+            item_name = item[2]
+            quantity = item[3]
+            unit_price = int(item[4])
+            item_total = int(item[5])
+            status = STATUS_MAPPING.get(item[7], item[7])  # สถานะจริงของ order
+            spice_level, special_request_text, notes_text = split_customer_request(item[6] or '')
+            
+            # เพิ่มระดับความเผ็ดในวงเล็บหลังชื่อสินค้า
+            if spice_level:
+                item_name = f"{item_name} ({spice_level})"
+            
+            rows.append([
+                str(order_id),
+                order_date, 
+                item_name,
+                str(quantity),
+                str(unit_price),
+                str(item_total),
+                special_request_text,
+                notes_text,
+                status
+            ])
+            total_quantity += quantity
+            total_amount += item_total
+        
+        # เพิ่มแถวสรุปยอดสำหรับแต่ละ Order
+        rows.append([
+            f'สรุป Order {order_id}',
+            '',
+            f'รวม {len(items)} รายการ',
+            str(total_quantity),
+            '',
+            str(int(total_amount)),
+            '',
+            '',
+            ''
+        ])
+        order_rows[order_id] = rows
+    
+    return order_rows
 
-def group_and_calculate_totals(service, spreadsheet_id):
+
+def _rows_hash(rows):
+    return hashlib.sha1(json.dumps(rows, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+_sheet_ids = {}
+
+def _get_sheet_id(service, spreadsheet_id):
+    """sheetId (ตัวเลข) ของชีต Orders สำหรับ batchUpdate (แคชไว้ต่อ spreadsheet)"""
+    if spreadsheet_id not in _sheet_ids:
+        result = service.spreadsheets().get(
+            spreadsheetId=spreadsheet_id,
+            fields='sheets.properties(sheetId,title)'
+        ).execute()
+        for sheet in result.get('sheets', []):
+            if sheet['properties']['title'] == SHEET_NAME:
+                _sheet_ids[spreadsheet_id] = sheet['properties']['sheetId']
+                break
+        else:
+            raise ValueError(f'ไม่พบชีต {SHEET_NAME}')
+    return _sheet_ids[spreadsheet_id]
+
+
+def _updated_start_row(updated_range):
+    """แถวแรกจาก updatedRange ที่ values.append คืนมา เช่น Orders!A120:I123 หรือ 'Orders'!A120:K123 -> 120
+
+    คืนค่า None ถ้าอ่านไม่ได้ (ชื่อชีตอาจมีเครื่องหมาย ! ในเครื่องหมายคำพูด จึงใช้ ! ตัวสุดท้าย)
     """
-    จัดกลุ่มข้อมูลตาม Order ID พร้อมใส่สีและจัดรูปแบบ
+    if not updated_range or '!' not in updated_range:
+        return None
+    match = re.match(r'\$?[A-Za-z]*\$?(\d+)(?::|$)', updated_range.rsplit('!', 1)[1])
+    return int(match.group(1)) if match else None
+
+
+# ส่งออกทีละครั้งต่อโปรเซส ตำแหน่งแถวใน sheets_order_rows จะไม่ถูกเลื่อนซ้อนกันเมื่อมีหลาย worker
+_export_lock = threading.Lock()
+
+def export_orders(service, spreadsheet_id, order_ids):
     """
-    import sqlite3
-    import gspread
-    from google.oauth2.service_account import Credentials
-    from datetime import datetime
-    from collections import defaultdict
+    ส่งออกเฉพาะออเดอร์ที่ระบุแบบเพิ่มทีละส่วน โดยใช้ตำแหน่งแถวใน sheets_order_rows
+    
+    - ออเดอร์ใหม่: เพิ่มต่อท้ายชีต
+    - ออเดอร์เดิมที่ข้อมูลเปลี่ยน: แก้ไขแถวเดิม (แทรก/ลบแถวถ้าจำนวนรายการเปลี่ยน แล้วเลื่อนตำแหน่งของออเดอร์ด้านล่าง)
+    - ออเดอร์ที่ไม่มีรายการแล้ว: ลบแถวออกจากชีต
+    ถ้ายังไม่เคยส่งออก (ไม่มีข้อมูลใน sheets_order_rows) จะสร้างชีตใหม่ทั้งหมดครั้งแรก
     
+    ออเดอร์ใหม่ใช้ values.append แบบ INSERT_ROWS ให้เซิร์ฟเวอร์เลือกแถวต่อท้าย แล้วบันทึกตำแหน่งจาก updatedRange
+    จึงไม่ต้องอ่านทั้งคอลัมน์เพื่อหาแถวว่างหรือตรวจสอบออเดอร์ซ้ำ (ใช้ sheets_order_rows เป็นดัชนี)
+    
+    Returns:
+        Dict: จำนวนออเดอร์ที่ appended / updated / resized / removed / unchanged
+              และ format_requests / format_calls ถ้ามีการจัดรูปแบบ
+    """
+    with _export_lock:
+        conn = _connect()
+        try:
+            empty = conn.execute('SELECT 1 FROM sheets_order_rows LIMIT 1').fetchone() is None
+        finally:
+            conn.close()
+        if empty:
+            return _rebuild_orders(service, spreadsheet_id)
+        return _export_orders(service, spreadsheet_id, order_ids)
+
+
+def _export_orders(service, spreadsheet_id, order_ids):
+    """export_orders ส่วนที่ทำงานภายใต้ _export_lock"""
+    stats = {'appended': 0, 'updated': 0, 'resized': 0, 'removed': 0, 'unchanged': 0}
+    conn = _connect()
     try:
-        # เชื่อมต่อฐานข้อมูล
-        conn = sqlite3.connect('pos_database.db')
         cursor = conn.cursor()
+        order_ids = list(dict.fromkeys(order_ids))
+        new_rows = build_order_rows(cursor, order_ids)
+        mapped = {}
+        placeholders = ','.join('?' * len(order_ids))
+        for row in cursor.execute(f'''
+            SELECT order_id, start_row, row_count, content_hash FROM sheets_order_rows
+            WHERE order_id IN ({placeholders})
+        ''', order_ids).fetchall():
+            mapped[row['order_id']] = dict(row)
         
-        # ดึงข้อมูลจากฐานข้อมูล (ทุกสถานะ ไม่เฉพาะ completed)
-        cursor.execute('''
-            SELECT o.order_id, o.created_at as order_date, mi.name, oi.quantity, 
-                   oi.unit_price, oi.total_price, oi.customer_request, o.status,
-                   oi.created_at as item_created_at
-            FROM orders o
-            JOIN order_items oi ON o.order_id = oi.order_id
-            JOIN menu_items mi ON oi.item_id = mi.item_id
-            ORDER BY o.order_id DESC, oi.created_at ASC
-        ''')
-        
-        all_items = cursor.fetchall()
-        conn.close()
-        
-        if not all_items:
-            print("[Google Sheets] ไม่พบข้อมูลที่จะจัดกลุ่ม")
-            return
+        # ขั้นที่ 1: แทรก/ลบแถวของออเดอร์ที่จำนวนแถวเปลี่ยน ทำจากล่างขึ้นบนให้ตำแหน่งของคำขอถัดไปยังถูกต้อง
+        sheet_id = None
+        structure_requests = []
+        resized = set()
+        for order_id in sorted(mapped, key=lambda oid: mapped[oid]['start_row'], reverse=True):
+            entry = mapped[order_id]
+            rows = new_rows.get(order_id)
+            new_count = len(rows) if rows else 0
+            if new_count == entry['row_count']:
+                continue
+            if sheet_id is None:
+                sheet_id = _get_sheet_id(service, spreadsheet_id)
+            start = entry['start_row'] - 1  # index เริ่มที่ 0
+            if new_count > entry['row_count']:
+                structure_requests.append({'insertDimension': {
+                    'range': {'sheetId': sheet_id, 'dimension': 'ROWS',
+                              'startIndex': start + entry['row_count'], 'endIndex': start + new_count},
+                    'inheritFromBefore': True
+                }})
+            else:
+                structure_requests.append({'deleteDimension': {
+                    'range': {'sheetId': sheet_id, 'dimension': 'ROWS',
+                              'startIndex': start + new_count, 'endIndex': start + entry['row_count']}
+                }})
+            delta = new_count - entry['row_count']
+            cursor.execute('UPDATE sheets_order_rows SET start_row = start_row + ? WHERE start_row > ?',
+                           (delta, entry['start_row']))
+            if new_count:
+                cursor.execute('UPDATE sheets_order_rows SET row_count = ?, content_hash = NULL WHERE order_id = ?',
+                               (new_count, order_id))
+                resized.add(order_id)
+            else:
+                cursor.execute('DELETE FROM sheets_order_rows WHERE order_id = ?', (order_id,))
+                stats['removed'] += 1
+        if structure_requests:
+            service.spreadsheets().batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={'requests': structure_requests}
+            ).execute()
+        conn.commit()
         
-        # จัดกลุ่มข้อมูลตาม Order ID
-        orders_grouped = defaultdict(list)
-        for item in all_items:
-            order_id = item[0]
-            orders_grouped[order_id].append(item)
+        # ขั้นที่ 2: เขียนค่าของออเดอร์ที่เปลี่ยนในคำขอเดียว และเพิ่มออเดอร์ใหม่ต่อท้ายในคำขอเดียว
+        positions = {row['order_id']: row['start_row'] for row in cursor.execute(f'''
+            SELECT order_id, start_row FROM sheets_order_rows WHERE order_id IN ({placeholders})
+        ''', order_ids).fetchall()}
+        data = []
+        written = []
+        appended = []
+        for order_id in order_ids:
+            rows = new_rows.get(order_id)
+            if not rows:
+                continue
+            content_hash = _rows_hash(rows)
+            if order_id not in positions:
+                appended.append((order_id, rows, content_hash))
+                continue
+            if order_id not in resized and mapped[order_id]['content_hash'] == content_hash:
+                stats['unchanged'] += 1
+                continue
+            start_row = positions[order_id]
+            stats['resized' if order_id in resized else 'updated'] += 1
+            data.append({
+                'range': f'{SHEET_NAME}!A{start_row}:I{start_row + len(rows) - 1}',
+                'values': rows
+            })
+            written.append((order_id, start_row, rows, content_hash))
         
-        # สร้าง header
-        header = [
-            'Order ID',
-            'วันที่-เวลา', 
-            'ชื่อสินค้า',
-            'จำนวน',
-            'ราคาต่อหน่วย (บาท)',
-            'ราคารวม (บาท)',
-            'คำขอพิเศษ',
-            'หมายเหตุ',
-            'สถานะ'
-        ]
+        if data:
+            service.spreadsheets().values().batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={'valueInputOption': 'USER_ENTERED', 'data': data}
+            ).execute()
         
-        # สร้างข้อมูลที่จัดรูปแบบแล้ว
-        formatted_data = [header]
+        if appended:
+            result = service.spreadsheets().values().append(
+                spreadsheetId=spreadsheet_id,
+                range=f'{SHEET_NAME}!A:I',
+                valueInputOption='USER_ENTERED',
+                insertDataOption='INSERT_ROWS',
+                body={'values': [row for _, rows, _ in appended for row in rows]}
+            ).execute()
+            updated_range = result.get('updates', {}).get('updatedRange')
+            start_row = _updated_start_row(updated_range)
+            if start_row is None:
+                # ไม่ทราบตำแหน่งของแถวที่เพิ่ม สร้างชีตใหม่ทั้งหมดแทนการบันทึกตำแหน่งที่อาจผิด
+                log.warning('อ่านตำแหน่งแถวจาก updatedRange ไม่ได้ (%s) สร้างชีตใหม่ทั้งหมด', updated_range)
+                conn.close()
+                conn = None
+                return _rebuild_orders(service, spreadsheet_id)
+            for order_id, rows, content_hash in appended:
+                written.append((order_id, start_row, rows, content_hash))
+                start_row += len(rows)
+                stats['appended'] += 1
         
-        # เรียงลำดับ Order ID จากใหม่ไปเก่า
-        for order_id in sorted(orders_grouped.keys(), reverse=True):
-            items = orders_grouped[order_id]
-            
-            # เพิ่มรายการสินค้าในแต่ละ Order
-            total_quantity = 0
-            total_amount = 0
-            
-            for item in items:
-                order_date = datetime.strptime(item[1], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y %H:%M:%S')
-                item_name = item[2]
-                quantity = item[3]
-                unit_price = int(item[4])
-                item_total = int(item[5])
-                customer_request = item[6] or ''
-                order_status = item[7]  # สถานะจริงของ order
-                
-                # แปลงสถานะเป็นภาษาไทย
-                status_mapping = {
-                    'active': 'รอดำเนินการ',
-                    'pending': 'รอดำเนินการ', 
-                    'completed': 'เสร็จสิ้น',
-                    'cancelled': 'ยกเลิก'
-                }
-                status = status_mapping.get(order_status, order_status)
-                
-                # แยกข้อมูลจาก customer_request
-                special_request_text = '-'
-                notes_text = '-'
-                spice_level = None
-                
-                if customer_request and customer_request.strip():
-                    # แยกข้อมูลตาม | ก่อน
-                    parts = customer_request.split('|')
-                    
-                    # ตรวจหาระดับความเผ็ด/หวาน
-                    spice_patterns = ['หวานปกติ', 'หวานน้อย', 'หวานมาก', 'เผ็ดน้อย', 'เผ็ดปานกลาง', 'เผ็ดมาก', 'เผ็ดพิเศษ', 'ไม่เผ็ด', 'ปกติ']
-                    special_requests = []
-                    other_notes = []
-                    
-                    for part in parts:
-                        part = part.strip()
-                        if not part:
-                            continue
-                            
-                        # ตรวจสอบระดับความเผ็ด/หวาน
-                        is_spice = False
-                        for pattern in spice_patterns:
-                            if part == pattern or pattern in part:
-                                if not spice_level:  # เก็บระดับความเผ็ด/หวานแรกที่เจอ
-                                    spice_level = pattern
-                                is_spice = True
-                                break
-                        
-                        if is_spice:
-                            continue
-                            
-                        # ตรวจหาคำขอพิเศษ (ไข่เจียว, ไข่ดาว, เพิ่มข้าว)
-                        special_keywords = ['ไข่เจียว', 'ไข่ดาว', 'เพิ่มข้าว', 'เพิ่ม ข้าว']
-                        
-                        # แยกคำขอพิเศษและหมายเหตุในแต่ละส่วน
-                        sub_parts = part.split(',')
-                        for sub_part in sub_parts:
-                            sub_part = sub_part.strip()
-                            if not sub_part:
-                                continue
-                                
-                            is_special = False
-                            for keyword in special_keywords:
-                                if keyword in sub_part:
-                                    special_requests.append(sub_part)
-                                    is_special = True
-                                    break
-                            
-                            # ถ้าไม่ใช่คำขอพิเศษแกะกับความเผ็ด/หวาน และไม่ใช่ "ไม่เพิ่ม" ให้ใส่ในหมายเหตุ
-                            if not is_special and sub_part not in ['ไม่เพิ่ม', 'ปกติ'] and not any(spice in sub_part for spice in spice_patterns):
-                                other_notes.append(sub_part)
-                    
-                    special_request_text = ', '.join(special_requests) if special_requests else '-'
-                    notes_text = ', '.join(other_notes) if other_notes else '-'
-                
-                # เพิ่มระดับความเผ็ดในวงเล็บหลังชื่อสินค้า
-                if spice_level:
-                    item_name = f"{item_name} ({spice_level})"
-                
-                new_row = [
-                    str(order_id),
-                    order_date, 
-                    item_name,
-                    str(quantity),
-                    str(unit_price),
-                    str(item_total),
-                    special_request_text,
-                    notes_text,
-                    status
-                ]
-                
-                formatted_data.append(new_row)
-                total_quantity += quantity
-                total_amount += item_total
-            
-            # เพิ่มแถวสรุปยอดสำหรับแต่ละ Order
-            summary_row = [
-                f'สรุป Order {order_id}',
-                '',
-                f'รวม {len(items)} รายการ',
-                str(total_quantity),
-                '',
-                str(int(total_amount)),
-                '',
-                '',
-                ''
-            ]
-            formatted_data.append(summary_row)
+        if written:
+            cursor.executemany('''
+                INSERT OR REPLACE INTO sheets_order_rows (order_id, start_row, row_count, content_hash, synced_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', [(order_id, start_row, len(rows), content_hash) for order_id, start_row, rows, content_hash in written])
+            conn.commit()
         
-        # ล้างข้อมูลเก่าและเขียนข้อมูลใหม่
-        service.spreadsheets().values().clear(
-            spreadsheetId=spreadsheet_id,
-            range='Orders!A:I'
-        ).execute()
+        # จัดรูปแบบเฉพาะช่วงแถวที่เพิ่มหรือเปลี่ยนขนาด (แถวที่แก้ไขในที่เดิมคงรูปแบบเดิมไว้)
+        blocks = [(order_id, start_row, rows) for order_id, start_row, rows, _ in written
+                  if order_id in resized or order_id not in mapped]
+        if blocks:
+            formatted = format_order_rows(service, spreadsheet_id, blocks)
+            stats['format_requests'] = formatted['requests']
+            stats['format_calls'] = formatted['batch_calls']
+        return stats
+    except Exception:
+        if conn is not None:
+            conn.rollback()
+        raise
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+# จำนวนคำขอ repeatCell สูงสุดต่อการเรียก batchUpdate หนึ่งครั้ง (แบ่งเป็นหลายครั้งเพื่อไม่ให้ payload ใหญ่เกินขีดจำกัดของ API)
+FORMAT_BATCH_SIZE = 500
+
+# สถิติการจัดรูปแบบตั้งแต่เริ่มโปรเซส (จำนวนการเรียก batchUpdate และจำนวนคำขอ repeatCell)
+format_stats = {'batch_calls': 0, 'requests': 0}
+
+HEADER_FORMAT = {
+    'textFormat': {
+        'bold': True,
+        'fontSize': 12
+    },
+    'backgroundColor': {
+        'red': 0.2, 
+        'green': 0.6, 
+        'blue': 0.9
+    },
+    'horizontalAlignment': 'CENTER',
+    'verticalAlignment': 'MIDDLE'
+}
+
+
+def _repeat_cell(sheet_id, start_row, end_row, cell_format):
+    """คำขอ repeatCell สำหรับแถว start_row ถึง end_row (นับจาก 1 รวมแถวสุดท้าย) คอลัมน์ A:I"""
+    return {'repeatCell': {
+        'range': {'sheetId': sheet_id, 'startRowIndex': start_row - 1, 'endRowIndex': end_row,
+                  'startColumnIndex': 0, 'endColumnIndex': len(HEADER)},
+        'cell': {'userEnteredFormat': cell_format},
+        # แก้ไขเฉพาะคุณสมบัติที่กำหนด (เหมือน gspread format)
+        'fields': f"userEnteredFormat({','.join(cell_format)})"
+    }}
+
+
+def build_format_requests(sheet_id, blocks, header=False):
+    """
+    สร้างคำขอ repeatCell สำหรับใส่สีแถวของออเดอร์ (คำนวณในเครื่องทั้งหมด ไม่เรียก API)
+    
+    แถวรายการอาหารของออเดอร์เดียวกันใช้รูปแบบเดียวกัน จึงใช้คำขอเดียวต่อช่วง + อีกหนึ่งคำขอสำหรับแถวสรุป
+    
+    Args:
+        sheet_id: sheetId ของชีต Orders
+        blocks (List[Tuple[int, int, List]]): [(order_id, แถวเริ่มต้นในชีต, แถวของออเดอร์)] แถวสุดท้ายคือแถวสรุป
+        header (bool): จัดรูปแบบแถว header ด้วย
+    """
+    requests = []
+    if header:
+        requests.append(_repeat_cell(sheet_id, 1, 1, HEADER_FORMAT))
+    for order_id, start_row, rows in blocks:
+        colors = COLOR_SETS[order_id % len(COLOR_SETS)]
+        summary_row = start_row + len(rows) - 1
+        if summary_row > start_row:
+            # แถวข้อมูล (สีอ่อน + ไม่หนา + ชิดซ้าย)
+            requests.append(_repeat_cell(sheet_id, start_row, summary_row - 1, {
+                'textFormat': {
+                    'bold': False,
+                    'fontSize': 10
+                },
+                'backgroundColor': colors['light'],
+                'horizontalAlignment': 'LEFT'
+            }))
+        # แถวสรุปยอด (สีเข้ม + ตัวหนา + กึ่งกลาง)
+        requests.append(_repeat_cell(sheet_id, summary_row, summary_row, {
+            'textFormat': {
+                'bold': True,
+                'fontSize': 11
+            },
+            'backgroundColor': colors['dark'],
+            'horizontalAlignment': 'CENTER'
+        }))
+    return requests
+
+
+def format_order_rows(service, spreadsheet_id, blocks, header=False):
+    """
+    ใส่สีและจัดรูปแบบแถวของออเดอร์ด้วย spreadsheets.batchUpdate (แบ่งชุดละ FORMAT_BATCH_SIZE คำขอ)
+    
+    Returns:
+        Dict: {'batch_calls': จำนวนการเรียก API, 'requests': จำนวนคำขอ repeatCell}
+    """
+    result = {'batch_calls': 0, 'requests': 0}
+    try:
+        requests = build_format_requests(_get_sheet_id(service, spreadsheet_id), blocks, header)
+        for start in range(0, len(requests), FORMAT_BATCH_SIZE):
+            chunk = requests[start:start + FORMAT_BATCH_SIZE]
+            service.spreadsheets().batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={'requests': chunk}
+            ).execute()
+            result['batch_calls'] += 1
+            result['requests'] += len(chunk)
         
-        service.spreadsheets().values().update(
-            spreadsheetId=spreadsheet_id,
-            range='Orders!A1',
-            valueInputOption='USER_ENTERED',
-            body={'values': formatted_data}
-        ).execute()
+        log.info('จัดกลุ่มและใส่สีเสร็จสิ้น (%s คำขอ / %s ครั้ง)', result['requests'], result['batch_calls'])
         
-        # จัดรูปแบบและใส่สี
+    except Exception as format_error:
+        log.error('เกิดข้อผิดพลาดในการจัดรูปแบบ: %s', format_error)
+    
+    format_stats['batch_calls'] += result['batch_calls']
+    format_stats['requests'] += result['requests']
+    return result
+
+
+def group_and_calculate_totals(service, spreadsheet_id):
+    """
+    สร้างชีต Orders ใหม่ทั้งหมด (ดู _rebuild_orders) ไม่ทำงานซ้อนกับ export_orders
+    """
+    with _export_lock:
+        return _rebuild_orders(service, spreadsheet_id)
+
+
+def _rebuild_orders(service, spreadsheet_id):
+    """
+    สร้างชีต Orders ใหม่ทั้งหมด: จัดกลุ่มข้อมูลตาม Order ID (เก่าไปใหม่) พร้อมใส่สีและจัดรูปแบบ
+    และบันทึกตำแหน่งแถวของทุกออเดอร์ลง sheets_order_rows สำหรับ export_orders
+    
+    อ่านข้อมูลทั้งหมดและเขียนทั้งชีต จึงควรเรียกเมื่อต้องการเท่านั้น (rebuild_orders_sheet)
+    
+    Returns:
+        Dict: {'rebuilt': จำนวนออเดอร์} หรือ None ถ้าเกิดข้อผิดพลาด
+    """
+    try:
+        conn = _connect()
         try:
-            # เชื่อมต่อ gspread สำหรับการจัดรูปแบบ
-            creds = Credentials.from_service_account_file(
-                'credentials.json',
-                scopes=['https://www.googleapis.com/auth/spreadsheets']
-            )
-            client = gspread.authorize(creds)
-            sheet = client.open_by_key(spreadsheet_id).worksheet('Orders')
+            cursor = conn.cursor()
             
-            # จัดรูปแบบ header
-            sheet.format('A1:I1', {
-                'textFormat': {
-                    'bold': True,
-                    'fontSize': 12
-                },
-                'backgroundColor': {
-                    'red': 0.2, 
-                    'green': 0.6, 
-                    'blue': 0.9
-                },
-                'horizontalAlignment': 'CENTER',
-                'verticalAlignment': 'MIDDLE'
-            })
-            
-            # กำหนดชุดสีสำหรับแต่ละ Order
-            color_sets = [
-                {'light': {'red': 1.0, 'green': 0.9, 'blue': 0.8}, 'dark': {'red': 1.0, 'green': 0.7, 'blue': 0.4}},
-                {'light': {'red': 0.8, 'green': 1.0, 'blue': 0.8}, 'dark': {'red': 0.6, 'green': 0.9, 'blue': 0.6}},
-                {'light': {'red': 0.8, 'green': 0.9, 'blue': 1.0}, 'dark': {'red': 0.6, 'green': 0.8, 'blue': 1.0}},
-                {'light': {'red': 0.95, 'green': 0.8, 'blue': 1.0}, 'dark': {'red': 0.9, 'green': 0.6, 'blue': 1.0}},
-                {'light': {'red': 1.0, 'green': 0.9, 'blue': 0.95}, 'dark': {'red': 1.0, 'green': 0.7, 'blue': 0.8}},
-                {'light': {'red': 1.0, 'green': 1.0, 'blue': 0.8}, 'dark': {'red': 1.0, 'green': 0.9, 'blue': 0.5}}
-            ]
+            # ดึงข้อมูลจากฐานข้อมูล (ทุกสถานะ ไม่เฉพาะ completed)
+            order_rows = build_order_rows(cursor)
             
-            # ติดตามสีที่ใช้สำหรับแต่ละ Order
-            order_colors = {}
-            color_index = 0
+            # สร้างข้อมูลที่จัดรูปแบบแล้ว เรียงลำดับ Order ID จากเก่าไปใหม่ (ออเดอร์ใหม่ต่อท้ายได้โดยไม่เลื่อนแถวเดิม)
+            formatted_data = [HEADER]
+            blocks = []
+            for order_id in sorted(order_rows):
+                rows = order_rows[order_id]
+                blocks.append((order_id, len(formatted_data) + 1, rows))
+                formatted_data.extend(rows)
             
-            # กำหนดสีให้แต่ละ Order (เรียงตาม Order ID จากมากไปน้อย)
-            sorted_orders = sorted(orders_grouped.keys(), reverse=True)
-            for order_id in sorted_orders:
-                order_colors[order_id] = color_sets[color_index % len(color_sets)]
-                color_index += 1
+            # ล้างข้อมูลเก่าและเขียนข้อมูลใหม่
+            service.spreadsheets().values().clear(
+                spreadsheetId=spreadsheet_id,
+                range=f'{SHEET_NAME}!A:I'
+            ).execute()
             
-            # จัดรูปแบบสีสำหรับแต่ละแถว
-            current_order_id = None
-            for i, row in enumerate(formatted_data[1:], start=2):  # เริ่มจากแถว 2 (ข้าม header)
-                if len(row) > 0:
-                    # ตรวจสอบว่าเป็นแถวสรุปหรือไม่
-                    if row[0].startswith('สรุป Order'):
-                        # แยก Order ID จากข้อความสรุป
-                        order_id = int(row[0].replace('สรุป Order ', ''))
-                        if order_id in order_colors:
-                            # จัดรูปแบบแถวสรุปยอด (สีเข้ม + ตัวหนา + กึ่งกลาง)
-                            sheet.format(f'A{i}:I{i}', {
-                                'textFormat': {
-                                    'bold': True,
-                                    'fontSize': 11
-                                },
-                                'backgroundColor': order_colors[order_id]['dark'],
-                                'horizontalAlignment': 'CENTER'
-                            })
-                    elif row[0] and row[0] != "":
-                        # แถวข้อมูลสินค้า - ดึง Order ID จากคอลัมน์แรก
-                        try:
-                            order_id = int(row[0])
-                            current_order_id = order_id
-                            if order_id in order_colors:
-                                # จัดรูปแบบแถวข้อมูล (สีอ่อน + ไม่หนา + ชิดซ้าย)
-                                sheet.format(f'A{i}:I{i}', {
-                                    'textFormat': {
-                                        'bold': False,
-                                        'fontSize': 10
-                                    },
-                                    'backgroundColor': order_colors[order_id]['light'],
-                                    'horizontalAlignment': 'LEFT'
-                                })
-                        except ValueError:
-                            # ถ้าไม่สามารถแปลงเป็น int ได้ ใช้สีของ Order ปัจจุบัน
-                            if current_order_id and current_order_id in order_colors:
-                                # จัดรูปแบบแถวข้อมูลต่อเนื่อง (สีอ่อน + ไม่หนา + ชิดซ้าย)
-                                sheet.format(f'A{i}:I{i}', {
-                                    'textFormat': {
-                                        'bold': False,
-                                        'fontSize': 10
-                                    },
-                                    'backgroundColor': order_colors[current_order_id]['light'],
-                                    'horizontalAlignment': 'LEFT'
-                                })
+            service.spreadsheets().values().update(
+                spreadsheetId=spreadsheet_id,
+                range=f'{SHEET_NAME}!A1',
+                valueInputOption='USER_ENTERED',
+                body={'values': formatted_data}
+            ).execute()
             
-            print(f"[Google Sheets] จัดกลุ่มและใส่สีเสร็จสิ้น")
-            
-        except Exception as format_error:
-            print(f"[Google Sheets] เกิดข้อผิดพลาดในการจัดรูปแบบ: {format_error}")
+            cursor.execute('DELETE FROM sheets_order_rows')
+            cursor.executemany('''
+                INSERT INTO sheets_order_rows (order_id, start_row, row_count, content_hash)
+                VALUES (?, ?, ?, ?)
+            ''', [(order_id, start_row, len(rows), _rows_hash(rows)) for order_id, start_row, rows in blocks])
+            conn.commit()
+        finally:
+            conn.close()
+        
+        # จัดรูปแบบและใส่สี
+        formatted = format_order_rows(service, spreadsheet_id, blocks, header=True)
         
-        print(f"[Google Sheets] จัดกลุ่มข้อมูลเสร็จสิ้น - {len(orders_grouped)} orders")
+        log.info('จัดกลุ่มข้อมูลเสร็จสิ้น - %s orders', len(blocks))
+        return {'rebuilt': len(blocks), 'format_requests': formatted['requests'], 'format_calls': formatted['batch_calls']}
         
     except Exception as e:
-        print(f"[Google Sheets] เกิดข้อผิดพลาดในการจัดกลุ่ม: {e}")
-
+        log.error('เกิดข้อผิดพลาดในการจัดกลุ่ม: %s', e)
+        return None
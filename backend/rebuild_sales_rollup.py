@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""
+สร้างตารางสรุปยอดขายรายวัน (daily_sales_rollup) ใหม่จากข้อมูลออเดอร์
+
+ใช้งาน: python rebuild_sales_rollup.py [start_date] [end_date]   (YYYY-MM-DD, ไม่ระบุ = ทั้งหมดจนถึงเมื่อวาน)
+"""
+
+import os
+import sys
+
+from database import DatabaseManager
+
+if __name__ == '__main__':
+    start_date = sys.argv[1] if len(sys.argv) > 1 else None
+    end_date = sys.argv[2] if len(sys.argv) > 2 else None
+    db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pos_database.db')
+    db = DatabaseManager(db_path)
+    days = db.rebuild_sales_rollup(start_date, end_date)
+    print(f"Rebuilt sales rollup for {days} days")
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+ตั้งค่าสภาพแวดล้อมของการทดสอบให้เหมือนตอนรันจริง (gunicorn --chdir backend)
+
+- backend/ อยู่ใน sys.path โมดูลจึงถูก import แบบ top-level (import database, import app)
+- working directory เป็นโฟลเดอร์ชั่วคราว (ไฟล์ google_sheets_config.json / credentials.json อ้างอิงจาก cwd)
+- ใช้สำเนาของ pos_database.db ผ่าน POS_DB_PATH ไม่แก้ไขไฟล์ฐานข้อมูลจริง
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+from fake_sheets import FakeSheetsService
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(BACKEND_DIR)
+
+WORK_DIR = tempfile.mkdtemp(prefix='pos-tests-')
+shutil.copy(os.path.join(REPO_DIR, 'pos_database.db'), os.path.join(WORK_DIR, 'pos_database.db'))
+os.environ['POS_DB_PATH'] = os.path.join(WORK_DIR, 'pos_database.db')
+os.chdir(WORK_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+@pytest.fixture(scope='session')
+def pos_app():
+    """โมดูล app (สร้าง db / event_bus / worker ตอน import) โดยหยุด worker ของ outbox ไว้ให้การทดสอบเรียก run_once เอง"""
+    import app as pos_app
+    pos_app.sheets_outbox_worker.stop(timeout=5)
+    return pos_app
+
+@pytest.fixture
+def client(pos_app):
+    return pos_app.app.test_client()
+
+@pytest.fixture
+def db(pos_app):
+    return pos_app.db
+
+@pytest.fixture
+def open_order(client, db):
+    """สร้างออเดอร์ใหม่บนโต๊ะที่มีอยู่จริง คืนค่า function(table_id, items) -> order_id"""
+    def create(table_id=1, items=None):
+        session_id = client.get(f'/api/tables/{table_id}/qr').get_json()['data']['session_id']
+        order_id = db.create_order(table_id, session_id)
+        db.add_order_items(order_id, items or [{'item_id': 1, 'quantity': 1, 'unit_price': 10}])
+        return order_id
+    return create
+
+@pytest.fixture
+def sheets(pos_app, db, monkeypatch):
+    """เปิดใช้ Google Sheets กับ service จำลอง (แทนเฉพาะการเชื่อมต่อ Google) และเริ่มจากคิว / ตำแหน่งแถวว่าง"""
+    import database
+    import new_google_sheets_sync
+
+    service = FakeSheetsService()
+    monkeypatch.setattr(database, 'is_google_sheets_enabled', lambda: True)
+    monkeypatch.setattr(new_google_sheets_sync, '_load_sheets_service', lambda: (service, 'sheet-id'))
+    with db.transaction() as conn:
+        conn.execute('DELETE FROM sheets_outbox')
+        conn.execute('DELETE FROM sheets_order_rows')
+    return service
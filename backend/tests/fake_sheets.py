@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Google Sheets API service จำลองในหน่วยความจำ (เฉพาะคำสั่งที่ new_google_sheets_sync ใช้) สำหรับการทดสอบ
+"""
+
+import re
+
+class _Call:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def execute(self):
+        return self._fn()
+
+def _first_row(a1: str) -> int:
+    match = re.search(r'![A-Z]+(\d+)', a1)
+    return int(match.group(1)) if match else 1
+
+class FakeSheetsService:
+    """ชีต Orders หนึ่งชีต เก็บแถวเป็น list และนับจำนวนการเรียก API แยกตามชนิด
+
+    updated_range คือรูปแบบของ updatedRange ที่ values.append คืนมา ({start} / {end} คือแถว)
+    """
+
+    SHEET_ID = 7
+
+    def __init__(self, updated_range: str = "Orders!A{start}:I{end}"):
+        self.rows = []
+        self.calls = {}
+        self.updated_range = updated_range
+
+    def _count(self, name: str):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def _write(self, start: int, values):
+        while len(self.rows) < start - 1 + len(values):
+            self.rows.append([])
+        for index, row in enumerate(values):
+            self.rows[start - 1 + index] = list(row)
+
+    def get(self, spreadsheetId=None, fields=None, range=None):
+        self._count('get')
+        if fields:
+            return _Call(lambda: {'sheets': [{'properties': {'sheetId': self.SHEET_ID, 'title': 'Orders'}}]})
+        return _Call(lambda: {'values': [list(row) for row in self.rows]})
+
+    def clear(self, spreadsheetId=None, range=None):
+        self._count('clear')
+        return _Call(lambda: self.rows.clear())
+
+    def update(self, spreadsheetId=None, range=None, valueInputOption=None, body=None):
+        self._count('update')
+        return _Call(lambda: self._write(_first_row(range), body['values']))
+
+    def append(self, spreadsheetId=None, range=None, valueInputOption=None, insertDataOption=None, body=None):
+        self._count('append')
+
+        def run():
+            while self.rows and not self.rows[-1]:
+                self.rows.pop()
+            start = len(self.rows) + 1
+            self._write(start, body['values'])
+            end = start + len(body['values']) - 1
+            return {'updates': {'updatedRange': self.updated_range.format(start=start, end=end)}}
+        return _Call(run)
+
+    def batchUpdate(self, spreadsheetId=None, body=None):
+        if 'data' in body:
+            self._count('values.batchUpdate')
+            return _Call(lambda: [self._write(_first_row(item['range']), item['values']) for item in body['data']])
+        self._count('batchUpdate')
+
+        def run():
+            for request in body['requests']:
+                if 'insertDimension' in request:
+                    span = request['insertDimension']['range']
+                    for _ in range(span['endIndex'] - span['startIndex']):
+                        self.rows.insert(span['startIndex'], [])
+                elif 'deleteDimension' in request:
+                    span = request['deleteDimension']['range']
+                    del self.rows[span['startIndex']:span['endIndex']]
+            return {}
+        return _Call(run)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""change feed (/api/changes): cursor, รายการที่ถูกลบ, resync เมื่อ cursor เก่ากว่า floor และการบีบอัด change_log"""
+
+def changes(client, since=None, limit=None):
+    query = {}
+    if since is not None:
+        query['since'] = since
+    if limit is not None:
+        query['limit'] = limit
+    response = client.get('/api/changes', query_string=query)
+    assert response.status_code == 200
+    return response.get_json()['data']
+
+def log_entries(db, entity, entity_id):
+    with db.connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM change_log WHERE entity = ? AND entity_id = ?',
+                            (entity, entity_id)).fetchone()[0]
+
+def item_ids(db, order_id):
+    with db.connection() as conn:
+        return [row[0] for row in conn.execute('SELECT order_item_id FROM order_items WHERE order_id = ?', (order_id,))]
+
+def test_cursor_returns_each_change_once(client, db, open_order):
+    cursor = changes(client)['cursor']
+    order_id = open_order(3)
+
+    data = changes(client, cursor)
+    assert data['resync'] is False and data['has_more'] is False
+    assert [row['order_id'] for row in data['changes']['orders']] == [order_id]
+    assert [row['order_item_id'] for row in data['changes']['order_items']] == item_ids(db, order_id)
+    assert data['cursor'] > cursor
+
+    # cursor ล่าสุดไม่มีอะไรเปลี่ยน
+    assert changes(client, data['cursor']) == dict(data, changes={}, deleted={}, cursor=data['cursor'])
+
+def test_limit_pages_through_changes(client, open_order):
+    cursor = changes(client)['cursor']
+    open_order(3, [{'item_id': 1, 'quantity': 1, 'unit_price': 10}, {'item_id': 2, 'quantity': 1, 'unit_price': 20}])
+
+    seen = 0
+    while True:
+        data = changes(client, cursor, limit=1)
+        assert data['cursor'] >= cursor
+        if data['cursor'] == cursor:
+            break
+        seen += 1
+        cursor = data['cursor']
+        if not data['has_more']:
+            break
+    assert seen >= 3
+
+def test_deleted_rows_are_reported(client, db, open_order):
+    # เริ่มเซสชันใหม่ ออเดอร์นี้จึงเป็นออเดอร์แรกของเซสชันที่ update-orders แก้ไข
+    session_id = db.get_table_session(3)['session_id']
+    if session_id:
+        assert client.post('/api/tables/3/close-session', json={'session_id': session_id}).status_code == 200
+    order_id = open_order(3)
+    items = item_ids(db, order_id)
+    cursor = changes(client)['cursor']
+    session_id = db.get_table_session(3)['session_id']
+
+    # ลบรายการทั้งหมด -> ออเดอร์ถูกลบ
+    assert client.post('/api/tables/3/update-orders', json={'session_id': session_id, 'orders': []}).status_code == 200
+
+    data = changes(client, cursor)
+    assert data['deleted']['orders'] == [order_id]
+    assert sorted(data['deleted']['order_items']) == sorted(items)
+
+def test_cursor_older_than_floor_requires_resync(client, db, open_order):
+    open_order(3)
+    current = changes(client)['cursor']
+    # ทำให้ทุกรายการจนถึง cursor ปัจจุบันหมดอายุ -> floor เลื่อนมาที่ cursor นี้
+    with db.transaction() as conn:
+        conn.execute("UPDATE change_log SET changed_at = '2000-01-01 00:00:00' WHERE seq <= ?", (current,))
+    assert db.compact_change_log()['expired'] > 0
+
+    stale = changes(client, current - 1)
+    assert stale['resync'] is True
+    assert stale['cursor'] == db.get_change_cursor() == current
+    assert changes(client, current)['resync'] is False
+
+def test_writes_compact_change_log_without_change_feed_reads(db, open_order, monkeypatch):
+    order_id = open_order(3)
+    [order_item_id] = item_ids(db, order_id)
+    for quantity in (2, 3, 4):
+        with db.transaction() as conn:
+            conn.execute('UPDATE order_items SET quantity = ? WHERE order_item_id = ?', (quantity, order_item_id))
+    assert log_entries(db, 'order_items', order_item_id) > 1
+
+    # ครบรอบการบีบอัด: การเขียนครั้งถัดไปต้องบีบอัดเองโดยไม่มีใครเรียก get_changes
+    monkeypatch.setattr(db, '_change_log_compacted_at', float('-inf'))
+    assert db.update_order_status(order_id, 'accepted')
+    assert log_entries(db, 'order_items', order_item_id) == 1
+    assert log_entries(db, 'orders', order_id) == 1
+    assert db._change_log_compacted_at != float('-inf')
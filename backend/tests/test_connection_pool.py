@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""พูลการเชื่อมต่อ SQLite (database.ConnectionPool)"""
+
+import sqlite3
+
+import pytest
+
+from database import ConnectionPool
+
+class FailingRollbackConnection(sqlite3.Connection):
+    """การเชื่อมต่อที่ rollback ไม่สำเร็จ (เช่น ไฟล์ฐานข้อมูลเสียระหว่าง transaction)"""
+
+    def rollback(self):
+        raise sqlite3.OperationalError('disk I/O error')
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), max_size=2)
+    yield pool
+    pool.close_all()
+
+def test_release_returns_clean_connection_to_pool(pool):
+    conn = pool.acquire()
+    conn.execute('CREATE TABLE t (x INTEGER)')
+    conn.execute('INSERT INTO t VALUES (1)')
+    pool.release(conn)
+    assert pool.stats()['idle'] == 1
+    reused = pool.acquire()
+    assert reused is conn
+    assert not reused.in_transaction
+    assert reused.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 0
+    pool.release(reused)
+
+def test_release_closes_connection_when_rollback_fails(pool):
+    conn = sqlite3.connect(pool.db_path, factory=FailingRollbackConnection, check_same_thread=False)
+    conn.execute('CREATE TABLE t (x INTEGER)')
+    conn.execute('INSERT INTO t VALUES (1)')
+    assert conn.in_transaction
+
+    pool.release(conn)
+    stats = pool.stats()
+    assert stats['idle'] == 0
+    assert stats['discarded'] == 1
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute('SELECT 1')
+    # การปิดการเชื่อมต่อยกเลิก transaction ที่ค้างอยู่ การเชื่อมต่อใหม่เขียนได้ทันที
+    fresh = pool.acquire()
+    fresh.execute('CREATE TABLE u (x INTEGER)')
+    fresh.commit()
+    pool.release(fresh)
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""พารามิเตอร์วันที่ที่รูปแบบไม่ถูกต้องต้องได้ 400 ไม่ใช่ 500"""
+
+import pytest
+
+@pytest.mark.parametrize('path', [
+    '/api/current-orders?start_date=2024-13-40',
+    '/api/order-history?end_date=yesterday',
+    '/api/dashboard-data?start=2024/01/01&end=2024-01-07',
+    '/api/sales-summary/custom?startDate=2024-01-01&endDate=not-a-date',
+])
+def test_malformed_date_returns_400(client, path):
+    response = client.get(path)
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body['success'] is False
+    assert 'YYYY-MM-DD' in body['error']
+
+@pytest.mark.parametrize('path', [
+    '/api/current-orders?start_date=2024-01-01&end_date=2024-01-07',
+    '/api/order-history?start_date=2024-01-01',
+    '/api/dashboard-data?start=2024-01-01&end=2024-01-07',
+    '/api/sales-summary/custom?startDate=2024-01-01&endDate=2024-01-07',
+])
+def test_valid_date_is_accepted(client, path):
+    assert client.get(path).status_code == 200
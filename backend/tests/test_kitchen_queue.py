@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""คิวครัวในหน่วยความจำต้องตรงกับข้อมูลเมนูปัจจุบัน"""
+
+from utils.kitchen_queue import due_at
+
+def queued(db, order_id):
+    return [entry for entry in db.get_kitchen_queue() if entry['order_id'] == order_id]
+
+def update_preparation_time(db, item, minutes):
+    assert db.update_menu_item(item['item_id'], item['name'], item['price'], item['category_id'],
+                               item.get('description') or '', item.get('image_url'), item['is_available'],
+                               minutes, item.get('food_option_type') or 'none')
+
+def test_menu_preparation_time_change_rekeys_queued_items(client, db, open_order):
+    order_id = open_order(2, [{'item_id': 1, 'quantity': 1, 'unit_price': 10}])
+    [entry] = queued(db, order_id)
+    item = db.get_menu_item(1)
+    original = item['preparation_time']
+
+    update_preparation_time(db, item, (original or 0) + 45)
+    try:
+        [entry_after] = queued(db, order_id)
+        assert entry_after['preparation_time'] == (original or 0) + 45
+        assert entry_after['due_at'] == due_at(entry['created_at'], (original or 0) + 45)
+        # ลำดับในคิวใช้ due_at ใหม่ด้วย
+        keys = [(e['due_at'], e['order_item_id']) for e in db.get_kitchen_queue()]
+        assert keys == sorted(keys)
+    finally:
+        update_preparation_time(db, item, original)
+    [entry_restored] = queued(db, order_id)
+    assert entry_restored['due_at'] == entry['due_at']
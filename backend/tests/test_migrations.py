@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""schema migration ของฐานข้อมูล (migrations.run_migrations)"""
+
+import logging
+import os
+import shutil
+import sqlite3
+
+from conftest import REPO_DIR
+from migrations import MIGRATIONS, get_schema_version, run_migrations
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+def test_run_migrations_logs_through_diagnostics(tmp_path, capsys):
+    db_path = str(tmp_path / 'pos_database.db')
+    shutil.copy(os.path.join(REPO_DIR, 'pos_database.db'), db_path)
+    handler = RecordingHandler()
+    logger = logging.getLogger('pos.migrations')
+    logger.addHandler(handler)
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            applied = run_migrations(conn)
+        assert applied == [version for version, _, _ in MIGRATIONS]
+        assert get_schema_version(conn.cursor()) == MIGRATIONS[-1][0]
+        with conn:
+            assert run_migrations(conn) == []
+    finally:
+        conn.close()
+        logger.removeHandler(handler)
+
+    assert handler.messages == [f'Applied migration {version:03d}: {description}'
+                                for version, description, _ in MIGRATIONS]
+    assert capsys.readouterr().out == ''
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""การแจ้งเตือน: ตัวนับที่ยังไม่อ่าน การทำเครื่องหมายว่าอ่านแล้ว และการย้าย/ลบรายการที่หมดอายุ"""
+
+import pytest
+
+def unread_in_db(db):
+    with db.connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM notifications WHERE is_read = 0').fetchone()[0]
+
+def unread_count(client):
+    response = client.get('/api/notifications/unread-count')
+    assert response.status_code == 200
+    return response.get_json()['data']['unread_count']
+
+def notify(db, message='test'):
+    notification_id = db.save_notification({'table_id': 1, 'message': message, 'type': 'order'})
+    assert notification_id
+    return notification_id
+
+def old_read_notification(db, message):
+    """การแจ้งเตือนที่อ่านแล้วและเก่ากว่าระยะเก็บรักษา"""
+    with db.transaction() as conn:
+        cursor = conn.execute('''
+            INSERT INTO notifications (table_id, message, type, is_read, created_at, read_at)
+            VALUES (1, ?, 'order', 1, '2000-01-01 00:00:00', '2000-01-01 00:00:00')
+        ''', (message,))
+        return cursor.lastrowid
+
+def test_counter_tracks_saves_and_reads(client, db):
+    base = unread_count(client)
+    assert base == unread_in_db(db)
+    first = notify(db)
+    second = notify(db)
+    third = notify(db)
+    assert unread_count(client) == base + 3
+
+    assert client.post(f'/api/notifications/{first}/read').status_code == 200
+    # อ่านซ้ำไม่ลดตัวนับอีก
+    assert client.post(f'/api/notifications/{first}/read').status_code == 200
+    assert unread_count(client) == base + 2
+
+    response = client.post('/api/notifications/read', json={'up_to_id': second})
+    assert response.status_code == 200
+    assert response.get_json()['data']['marked'] == base + 1
+    assert unread_count(client) == unread_in_db(db) == 1
+
+    response = client.post('/api/notifications/read', json={})
+    assert response.get_json()['data'] == {'marked': 1, 'unread_count': 0}
+    assert unread_in_db(db) == 0
+    with db.connection() as conn:
+        assert conn.execute('SELECT is_read FROM notifications WHERE notification_id = ?', (third,)).fetchone()[0] == 1
+
+@pytest.mark.parametrize('mode', ['archive', 'purge'])
+def test_compaction_moves_only_expired_read_notifications(client, db, mode):
+    expired = old_read_notification(db, f'expired {mode}')
+    unread = notify(db, f'unread {mode}')
+    count = unread_count(client)
+
+    response = client.post('/api/notifications/compact', json={'retention_days': 30, 'mode': mode})
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert data['archived' if mode == 'archive' else 'purged'] >= 1
+    with db.connection() as conn:
+        remaining = {row[0] for row in conn.execute('SELECT notification_id FROM notifications')}
+        archived = {row[0] for row in conn.execute('SELECT notification_id FROM notifications_archive')}
+    assert expired not in remaining and unread in remaining
+    assert (expired in archived) == (mode == 'archive')
+    assert unread_count(client) == count == unread_in_db(db)
+
+def test_compaction_does_not_overwrite_counter(db, monkeypatch):
+    notify(db)
+    count = db.get_unread_notification_count()
+    # การนับใหม่หลังบีบอัดอาจทับการปรับค่าจาก save_notification ที่เกิดพร้อมกัน
+    monkeypatch.setattr(db, '_count_unread_notifications', lambda: pytest.fail('compaction must not recount'))
+    old_read_notification(db, 'expired')
+    assert db.compact_notifications(retention_days=30, mode='purge')['purged'] >= 1
+    assert db.get_unread_notification_count() == count
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""เปลี่ยนสถานะรายการอาหารหลายรายการในคำขอเดียว (POST /api/order-items/status)"""
+
+import time
+
+import pytest
+
+@pytest.fixture
+def counted_transactions(db, monkeypatch):
+    """นับจำนวน transaction ที่เปิด (ไม่ให้การบีบอัด change_log เปิด transaction เพิ่มระหว่างทดสอบ)"""
+    monkeypatch.setattr(db, '_change_log_compacted_at', time.monotonic())
+    opened = []
+    transaction = db.transaction
+
+    def counting_transaction():
+        opened.append(True)
+        return transaction()
+    monkeypatch.setattr(db, 'transaction', counting_transaction)
+    return opened
+
+def item_rows(db, order_id):
+    with db.connection() as conn:
+        return [dict(row) for row in conn.execute(
+            'SELECT order_item_id, status, total_price FROM order_items WHERE order_id = ? ORDER BY order_item_id', (order_id,))]
+
+def order_total(db, order_id):
+    with db.connection() as conn:
+        return conn.execute('SELECT total_amount FROM orders WHERE order_id = ?', (order_id,)).fetchone()[0]
+
+def order_writes_since(db, since, order_ids):
+    """จำนวนครั้งที่แถวของ orders ถูกเขียนหลัง seq since (จาก trigger ของ change_log)"""
+    with db.connection() as conn:
+        rows = conn.execute("SELECT entity_id FROM change_log WHERE entity = 'orders' AND seq > ?", (since,)).fetchall()
+    return {order_id: sum(1 for row in rows if row[0] == order_id) for order_id in order_ids}
+
+def post_status(client, order_item_ids, status):
+    return client.post('/api/order-items/status', json={'order_item_ids': order_item_ids, 'status': status})
+
+def test_bulk_status_updates_in_one_transaction(client, db, open_order, counted_transactions):
+    first = open_order(4, [{'item_id': 1, 'quantity': 1, 'unit_price': 10}, {'item_id': 2, 'quantity': 2, 'unit_price': 20}])
+    second = open_order(5, [{'item_id': 1, 'quantity': 1, 'unit_price': 30}])
+    first_items = [row['order_item_id'] for row in item_rows(db, first)]
+    [second_item] = [row['order_item_id'] for row in item_rows(db, second)]
+    since = db.get_data_version()
+    counted_transactions.clear()
+
+    response = post_status(client, [first_items[0], second_item, 999999, first_items[0]], 'rejected')
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert data['updated'] == [first_items[0], second_item]
+    assert data['missing'] == [999999]
+    assert data['order_ids'] == [first, second]
+    assert len(counted_transactions) == 1
+    # คำนวณ total_amount ครั้งเดียวต่อออเดอร์
+    assert order_writes_since(db, since, [first, second]) == {first: 1, second: 1}
+
+    # รายการที่ถูกปฏิเสธไม่นับในยอดรวม
+    assert [row['status'] for row in item_rows(db, first)] == ['rejected', 'pending']
+    assert order_total(db, first) == 40
+    assert order_total(db, second) == 0
+
+    # ข้อมูลล่าสุดของออเดอร์ในรูปแบบเดียวกับ /api/orders
+    orders = {order['order_id']: order for order in data['orders']}
+    assert set(orders) == {first, second}
+    statuses = {item['order_item_id']: item['status'] for item in orders[first]['items']}
+    assert statuses[first_items[0]] == 'rejected'
+    assert statuses[first_items[1]] == 'pending'
+
+def test_unknown_ids_write_nothing(client, db, counted_transactions):
+    version = db.get_data_version()
+    response = post_status(client, [999998, 999999], 'accepted')
+    assert response.status_code == 200
+    assert response.get_json()['data'] == {'updated': [], 'missing': [999998, 999999], 'order_ids': [], 'orders': []}
+    assert db.get_data_version() == version
+
+@pytest.mark.parametrize('body', [
+    {'order_item_ids': [1], 'status': 'eaten'},
+    {'order_item_ids': [], 'status': 'accepted'},
+    {'order_item_ids': ['1'], 'status': 'accepted'},
+    {'order_item_ids': [True], 'status': 'accepted'},
+    {'status': 'accepted'},
+])
+def test_invalid_request_is_rejected(client, db, body):
+    version = db.get_data_version()
+    assert client.post('/api/order-items/status', json=body).status_code == 400
+    assert db.get_data_version() == version
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""การสั่งอาหาร (POST /api/orders) และการเพิ่มรายการอาหารหลายรายการ (add_order_items)"""
+
+import uuid
+
+def session_orders(db, session_id):
+    with db.connection() as conn:
+        return [dict(row) for row in conn.execute(
+            'SELECT order_id, total_amount FROM orders WHERE session_id = ?', (session_id,))]
+
+def order_lines(db, order_id):
+    with db.connection() as conn:
+        return [tuple(row) for row in conn.execute(
+            'SELECT item_id, quantity, unit_price FROM order_items WHERE order_id = ? ORDER BY order_item_id', (order_id,))]
+
+def test_string_ids_from_request_are_accepted(client, db):
+    session_id = str(uuid.uuid4())
+    response = client.post('/api/orders', json={
+        'table_id': '1', 'session_id': session_id,
+        'items': [{'item_id': '1', 'quantity': '2', 'price': '25'}]
+    })
+    assert response.status_code == 200, response.get_json()
+    order_id = response.get_json()['data']['order_id']
+    assert order_lines(db, order_id) == [(1, 2, 25.0)]
+    assert session_orders(db, session_id) == [{'order_id': order_id, 'total_amount': 50.0}]
+
+def test_add_order_items_reports_bad_values_per_line(db, open_order):
+    order_id = open_order(1)
+    before = order_lines(db, order_id)
+    result = db.add_order_items(order_id, [
+        {'item_id': '1', 'quantity': 1, 'unit_price': 10},
+        {'item_id': 'abc', 'quantity': 1, 'unit_price': 10},
+        {'item_id': 1, 'quantity': 'many', 'unit_price': 10},
+        {'item_id': 999999, 'quantity': 1, 'unit_price': 10}
+    ])
+    assert result['success'] is False
+    assert [error['index'] for error in result['errors']] == [1, 2, 3]
+    assert order_lines(db, order_id) == before
+
+    assert db.add_order_items(order_id, [{'item_id': '2', 'quantity': '3', 'unit_price': '5'}])['success']
+    assert order_lines(db, order_id)[-1] == (2, 3, 5.0)
+
+def test_mixed_cart_writes_nothing(client, db):
+    session_id = str(uuid.uuid4())
+    # รายการแรกถูกต้อง รายการที่สองจำนวนเป็น 0
+    response = client.post('/api/orders', json={
+        'table_id': 1, 'session_id': session_id,
+        'items': [{'item_id': 1, 'quantity': 1}, {'item_id': 2, 'quantity': 0}]
+    })
+    assert response.status_code == 400
+    assert [error['index'] for error in response.get_json()['errors']] == [1]
+    assert session_orders(db, session_id) == []
+
+    # เมนูที่ไม่มีอยู่ในตะกร้า -> ไม่บันทึกรายการที่ถูกต้องด้วย
+    response = client.post('/api/orders', json={
+        'table_id': 1, 'session_id': session_id,
+        'items': [{'item_id': 1, 'quantity': 1}, {'item_id': 999999, 'quantity': 1}]
+    })
+    assert response.status_code == 400
+    assert session_orders(db, session_id) == []
+
+def test_rejected_cart_keeps_existing_order_unchanged(client, db):
+    session_id = str(uuid.uuid4())
+    response = client.post('/api/orders', json={'table_id': 1, 'session_id': session_id,
+                                                'items': [{'item_id': 1, 'quantity': 1, 'price': 10}]})
+    order_id = response.get_json()['data']['order_id']
+
+    response = client.post('/api/orders', json={'table_id': 1, 'session_id': session_id,
+                                                'items': [{'item_id': 2, 'quantity': 1}, {'item_id': 1, 'quantity': -1}]})
+    assert response.status_code == 400
+    assert session_orders(db, session_id) == [{'order_id': order_id, 'total_amount': 10.0}]
+    assert order_lines(db, order_id) == [(1, 1, 10.0)]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""การรวมคำขอ GET ที่เหมือนกัน (coalesce_get) ต้องไม่คืนข้อมูลก่อนการเขียน"""
+
+import pytest
+
+@pytest.fixture
+def long_window(pos_app):
+    """ขยาย window ให้ผลลัพธ์ถูกใช้ซ้ำแน่นอนระหว่างการทดสอบ"""
+    window = pos_app.read_coalescer.window
+    pos_app.read_coalescer.window = 60
+    yield pos_app.read_coalescer
+    pos_app.read_coalescer.window = window
+
+def endpoint_stats(coalescer, name):
+    return dict(coalescer.stats()['endpoints'].get(name, {}))
+
+@pytest.mark.parametrize('path, name', [('/api/orders', 'orders'), ('/api/floor', 'floor')])
+def test_write_without_event_invalidates_coalesced_reads(client, db, open_order, long_window, path, name):
+    order_id = open_order(8, [{'item_id': 1, 'quantity': 1, 'unit_price': 10}])
+    first = client.get(path).get_data()
+    before = endpoint_stats(long_window, name)
+    assert client.get(path).get_data() == first
+    assert endpoint_stats(long_window, name)['reused'] == before['reused'] + 1
+
+    # เขียนตรงผ่าน SQL โดยไม่ส่ง event (เหมือน route ที่ไม่ได้ publish)
+    with db.transaction() as conn:
+        conn.execute('UPDATE order_items SET quantity = 7, total_price = 70 WHERE order_id = ?', (order_id,))
+    after = client.get(path).get_data()
+    assert after != first
+    assert endpoint_stats(long_window, name)['executed'] == before['executed'] + 1
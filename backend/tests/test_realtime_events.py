@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""event ที่ส่งไปยังหน้า admin (SSE) เมื่อมีการแก้ไขออเดอร์หรือโต๊ะ"""
+
+import pytest
+
+@pytest.fixture
+def subscription(pos_app):
+    subscription = pos_app.event_bus.subscribe()
+    yield subscription
+    subscription.close()
+
+def received(subscription, event_type):
+    """event ชนิดที่ระบุที่ได้รับแล้วทั้งหมด"""
+    events = []
+    while True:
+        event = subscription.get(timeout=0)
+        if event is None:
+            return events
+        if event['type'] == event_type:
+            events.append(event['data'])
+
+def test_update_orders_publishes_order_snapshot(client, db, open_order, subscription):
+    order_id = open_order(6)
+    session_id = db.get_table_session(6)['session_id']
+    received(subscription, 'order_updated')
+
+    response = client.post('/api/tables/6/update-orders', json={
+        'session_id': session_id,
+        'orders': [{'menu_id': 2, 'quantity': 3, 'price': 39, 'status': 'accepted'}]
+    })
+    assert response.status_code == 200
+    events = received(subscription, 'order_updated')
+    assert [event['order_id'] for event in events] == [order_id]
+    items = events[0]['order']['items']
+    assert [(item['quantity'], item['status']) for item in items] == [(3, 'accepted')]
+
+    # ลบรายการทั้งหมด -> ออเดอร์ถูกลบ ส่ง order เป็น None
+    response = client.post('/api/tables/6/update-orders', json={'session_id': session_id, 'orders': []})
+    assert response.status_code == 200
+    events = received(subscription, 'order_updated')
+    assert events == [{'order_id': order_id, 'order_item_id': None, 'order': None}]
+
+def test_table_state_changes_publish_table_updated(client, db, open_order, subscription):
+    open_order(7)
+    session_id = db.get_table_session(7)['session_id']
+    received(subscription, 'table_updated')
+
+    assert client.post('/api/tables/7/close-session', json={'session_id': session_id}).status_code == 200
+    assert received(subscription, 'table_updated') == [{'table_id': 7, 'status': 'available', 'session_id': None}]
+
+    assert client.get('/api/tables/7/qr').status_code == 200
+    new_session = db.get_table_session(7)['session_id']
+    assert received(subscription, 'table_updated') == [{'table_id': 7, 'status': 'occupied', 'session_id': new_session}]
+
+    assert client.put('/api/tables/7/status', json={'status': 'waiting_payment', 'session_id': new_session}).status_code == 200
+    assert received(subscription, 'table_updated') == [{'table_id': 7, 'status': 'waiting_payment', 'session_id': new_session}]
+
+    assert client.post('/api/tables/7/clear').status_code == 200
+    assert received(subscription, 'table_updated') == [{'table_id': 7, 'status': 'available', 'session_id': None}]
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""สรุปยอดขายรายวัน (daily_sales_rollup) ต้องตรงกับข้อมูลดิบหลังแก้ไขออเดอร์ของวันที่ปิดแล้ว"""
+
+from datetime import timedelta
+
+import pytest
+
+from database import get_thai_datetime
+
+@pytest.fixture
+def closed_day():
+    return (get_thai_datetime() - timedelta(days=1)).strftime('%Y-%m-%d')
+
+def backdate(db, order_id, day):
+    with db.transaction() as conn:
+        conn.execute('UPDATE orders SET created_at = ? WHERE order_id = ?', (f'{day} 12:00:00', order_id))
+    db.rebuild_sales_rollup(day, day)
+
+def rollup_rows(db, day):
+    with db.connection() as conn:
+        rows = conn.execute('''
+            SELECT dimension, ref_id, quantity, revenue, order_count FROM daily_sales_rollup
+            WHERE sales_date = ? ORDER BY dimension, ref_id
+        ''', (day,)).fetchall()
+    return [tuple(row) for row in rows]
+
+def day_revenue(db, day):
+    return sum(row[3] for row in rollup_rows(db, day) if row[0] == 'day')
+
+def assert_rollup_matches_raw_data(db, day):
+    current = rollup_rows(db, day)
+    db.rebuild_sales_rollup(day, day)
+    assert current == rollup_rows(db, day)
+
+def test_rejecting_closed_day_order_updates_rollup(client, db, open_order, closed_day):
+    order_id = open_order(9, [{'item_id': 1, 'quantity': 2, 'unit_price': 50}])
+    backdate(db, order_id, closed_day)
+    before = day_revenue(db, closed_day)
+
+    response = client.post(f'/api/orders/{order_id}/reject')
+    assert response.status_code == 200
+    assert day_revenue(db, closed_day) == before - 100
+    assert_rollup_matches_raw_data(db, closed_day)
+
+def test_update_orders_on_closed_day_order_updates_rollup(client, db, open_order, closed_day):
+    order_id = open_order(10, [{'item_id': 1, 'quantity': 1, 'unit_price': 50}])
+    session_id = db.get_table_session(10)['session_id']
+    backdate(db, order_id, closed_day)
+    before = day_revenue(db, closed_day)
+
+    response = client.post('/api/tables/10/update-orders', json={
+        'session_id': session_id,
+        'orders': [{'menu_id': 1, 'quantity': 3, 'price': 50}]
+    })
+    assert response.status_code == 200
+    assert day_revenue(db, closed_day) == before + 100
+    assert_rollup_matches_raw_data(db, closed_day)
+
+    # ลบรายการทั้งหมด -> ออเดอร์ถูกลบ ต้องหายจากสรุปยอดขายด้วย
+    response = client.post('/api/tables/10/update-orders', json={'session_id': session_id, 'orders': []})
+    assert response.status_code == 200
+    assert day_revenue(db, closed_day) == before - 50
+    assert_rollup_matches_raw_data(db, closed_day)
+
+def test_reject_unknown_order_returns_404(client):
+    assert client.post('/api/orders/999999/reject').status_code == 404
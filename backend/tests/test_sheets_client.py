@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""Google Sheets API client ที่ใช้ร่วมกัน (utils.sheets_client)"""
+
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from google.auth import credentials as google_credentials
+
+from utils import sheets_client as sheets_client_module
+from utils.sheets_client import SheetsClientProvider, sheets_client
+
+class FakeCredentials(google_credentials.Credentials):
+    """credentials ที่ refresh โดยไม่เรียกเครือข่าย"""
+
+    def __init__(self):
+        super().__init__()
+        self.refreshes = 0
+
+    def refresh(self, request):
+        self.refreshes += 1
+        self.token = f'token-{self.refreshes}'
+        self.expiry = datetime.utcnow() + timedelta(hours=1)
+
+@pytest.fixture
+def fake_credentials(monkeypatch):
+    """แทนการอ่านไฟล์ service account ด้วย FakeCredentials (สร้างใหม่ทุกครั้งที่โหลดไฟล์)"""
+    loaded = []
+
+    def from_service_account_file(path, scopes=None):
+        loaded.append(FakeCredentials())
+        return loaded[-1]
+    monkeypatch.setattr(sheets_client_module.Credentials, 'from_service_account_file', from_service_account_file)
+    return loaded
+
+def write_json(path, data, bump=0):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    # ให้ mtime เปลี่ยนแน่นอนแม้เขียนซ้ำภายในช่วงเวลาสั้นๆ
+    mtime = os.path.getmtime(path) + bump
+    os.utime(path, (mtime, mtime))
+
+def test_provider_reuses_credentials_and_service_per_thread(tmp_path, fake_credentials):
+    credentials_file = tmp_path / 'credentials.json'
+    write_json(credentials_file, {})
+    provider = SheetsClientProvider(str(tmp_path / 'config.json'), str(credentials_file))
+
+    service = provider.service()
+    assert provider.service() is service
+    other = []
+    thread = threading.Thread(target=lambda: other.append(provider.service()))
+    thread.start()
+    thread.join()
+    assert other[0] is not service
+
+    stats = provider.stats()
+    assert stats['credential_loads'] == 1
+    assert stats['services_built'] == 2
+    assert stats['token_refreshes'] == 1
+
+def test_provider_refreshes_token_before_expiry(tmp_path, fake_credentials):
+    credentials_file = tmp_path / 'credentials.json'
+    write_json(credentials_file, {})
+    provider = SheetsClientProvider(str(tmp_path / 'config.json'), str(credentials_file), refresh_margin=300)
+
+    creds = provider.credentials()
+    assert creds.refreshes == 1
+    provider.credentials()
+    assert creds.refreshes == 1
+    creds.expiry = datetime.utcnow() + timedelta(seconds=60)
+    assert provider.credentials() is creds
+    assert creds.refreshes == 2
+
+def test_provider_reloads_config_and_credentials_when_files_change(tmp_path, fake_credentials):
+    config_file = tmp_path / 'config.json'
+    credentials_file = tmp_path / 'credentials.json'
+    write_json(credentials_file, {})
+    provider = SheetsClientProvider(str(config_file), str(credentials_file))
+
+    assert provider.config() == {}
+    write_json(config_file, {'enabled': True, 'spreadsheet_id': 'a'})
+    assert provider.config()['spreadsheet_id'] == 'a'
+    version = provider.config_version
+    assert provider.current_config_version() == version
+    write_json(config_file, {'enabled': True, 'spreadsheet_id': 'b'}, bump=1)
+    assert provider.config()['spreadsheet_id'] == 'b'
+    assert provider.config_version == version + 1
+
+    service = provider.service()
+    write_json(credentials_file, {}, bump=1)
+    assert provider.service() is not service
+    assert len(fake_credentials) == 2
+
+def test_sheets_modules_share_one_client(pos_app, fake_credentials):
+    import database
+    import google_sheets
+    import new_google_sheets_sync
+    from utils.google_sheets import GoogleSheetsManager
+
+    config_file = sheets_client.config_file
+    with open(config_file, encoding='utf-8') as f:
+        original = json.load(f)
+    write_json('credentials.json', {})
+    write_json(config_file, dict(original, enabled=True, spreadsheet_id='sheet-id'), bump=1)
+    try:
+        # ตรวจสถานะโดยไม่ refresh token หรือสร้าง service (เรียกภายใน transaction ของฐานข้อมูล)
+        assert database.is_google_sheets_enabled()
+        assert fake_credentials[-1].refreshes == 0
+
+        service, spreadsheet_id = new_google_sheets_sync._load_sheets_service()
+        assert spreadsheet_id == 'sheet-id'
+        assert google_sheets.google_sheets_manager.service is service
+        assert GoogleSheetsManager().service is service
+        assert len(fake_credentials) == 1
+    finally:
+        write_json(config_file, original, bump=2)
+        os.remove('credentials.json')
+    assert not database.is_google_sheets_enabled()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""การวางแถวของออเดอร์ใหม่ด้วย values.append และตำแหน่งแถวใน sheets_order_rows"""
+
+import logging
+
+import pytest
+
+import new_google_sheets_sync
+from new_google_sheets_sync import _updated_start_row, export_orders, group_and_calculate_totals
+from fake_sheets import FakeSheetsService
+
+@pytest.mark.parametrize('updated_range, expected', [
+    ('Orders!A5:I7', 5),
+    ("'Orders'!A5:K7", 5),
+    ("'Q1!Orders'!$A$12:$I$13", 12),
+    ('Orders!A9', 9),
+    ('Orders!5:7', 5),
+    ('Orders!A:I', None),
+    ('Orders', None),
+    ('', None),
+    (None, None),
+])
+def test_updated_start_row(updated_range, expected):
+    assert _updated_start_row(updated_range) == expected
+
+def mapped_start(db, order_id):
+    with db.connection() as conn:
+        row = conn.execute('SELECT start_row FROM sheets_order_rows WHERE order_id = ?', (order_id,)).fetchone()
+    return row['start_row'] if row else None
+
+def rebuilt_rows():
+    expected = FakeSheetsService()
+    group_and_calculate_totals(expected, 'sheet-id')
+    return expected.rows
+
+def test_append_with_quoted_sheet_name_records_position(db, sheets, open_order):
+    sheets.updated_range = "'Orders'!A{start}:K{end}"
+    group_and_calculate_totals(sheets, 'sheet-id')
+    order_id = open_order(4)
+
+    sheets.calls.clear()
+    stats = export_orders(sheets, 'sheet-id', [order_id])
+    assert stats['appended'] == 1
+    assert sheets.calls.get('append') == 1 and 'get' not in sheets.calls
+    assert str(sheets.rows[mapped_start(db, order_id) - 1][0]) == str(order_id)
+    assert new_google_sheets_sync.is_order_already_synced(None, None, order_id)
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+def test_unparseable_updated_range_falls_back_to_full_rebuild(db, sheets, open_order, capsys):
+    group_and_calculate_totals(sheets, 'sheet-id')
+    order_id = open_order(5)
+
+    sheets.updated_range = 'Orders'
+    handler = RecordingHandler()
+    logging.getLogger('pos.sheets').addHandler(handler)
+    try:
+        stats = export_orders(sheets, 'sheet-id', [order_id])
+    finally:
+        logging.getLogger('pos.sheets').removeHandler(handler)
+    # บันทึกผ่าน logger ของระบบ (ระดับ / sampling / trace id) ไม่ใช่ print
+    assert [record.levelno for record in handler.records if 'updatedRange' in record.getMessage()] == [logging.WARNING]
+    assert capsys.readouterr().out == ''
+    assert 'rebuilt' in stats
+    assert sheets.rows == rebuilt_rows()
+    assert str(sheets.rows[mapped_start(db, order_id) - 1][0]) == str(order_id)
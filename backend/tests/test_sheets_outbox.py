@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""คิวซิงค์ Google Sheets (sheets_outbox) เมื่อ import database แบบเดียวกับแอป"""
+
+from fake_sheets import FakeSheetsService
+
+def test_database_binds_real_sheets_functions(pos_app):
+    import database
+    import google_sheets
+    import new_google_sheets_sync
+
+    assert database.is_google_sheets_enabled is google_sheets.is_google_sheets_enabled
+    assert database.sync_order_to_new_format is new_google_sheets_sync.sync_order_to_new_format
+    assert database.rebuild_orders_sheet is new_google_sheets_sync.rebuild_orders_sheet
+
+def drain_outbox(pos_app):
+    while pos_app.sheets_outbox_worker.run_once():
+        pass
+
+def mapped_rows(db, order_id):
+    with db.connection() as conn:
+        return conn.execute('SELECT start_row, row_count FROM sheets_order_rows WHERE order_id = ?', (order_id,)).fetchone()
+
+def full_rebuild():
+    import new_google_sheets_sync
+    expected = FakeSheetsService()
+    new_google_sheets_sync.group_and_calculate_totals(expected, 'sheet-id')
+    return expected.rows
+
+def test_created_orders_flow_through_outbox_to_incremental_export(pos_app, client, db, sheets):
+    def place_order(table_id, quantity):
+        response = client.post('/api/orders', json={'table_id': table_id, 'items': [{'item_id': 1, 'quantity': quantity}]})
+        assert response.status_code == 200
+        return response.get_json()['data']['order_id']
+
+    first = place_order(2, 1)
+    with db.connection() as conn:
+        queued = conn.execute('SELECT kind, order_id FROM sheets_outbox').fetchall()
+    assert [tuple(row) for row in queued] == [('order_created', first)]
+
+    # งานแรกสร้างชีตทั้งหมดและบันทึกตำแหน่งแถวของทุกออเดอร์
+    drain_outbox(pos_app)
+    assert db.get_sheets_outbox_stats()['depth'] == 0
+    start_row, row_count = mapped_rows(db, first)
+    assert str(sheets.rows[start_row - 1][0]) == str(first)
+
+    # ออเดอร์ถัดไปเพิ่มต่อท้ายด้วย values.append ครั้งเดียว ไม่อ่านหรือเขียนทั้งชีตใหม่
+    sheets.calls.clear()
+    second = place_order(3, 2)
+    drain_outbox(pos_app)
+    assert sheets.calls.get('append') == 1
+    assert 'get' not in sheets.calls and 'clear' not in sheets.calls
+    start_row, row_count = mapped_rows(db, second)
+    assert str(sheets.rows[start_row - 1][0]) == str(second)
+    assert start_row - 1 + row_count == len(sheets.rows)
+
+    # ปิดออเดอร์ -> แก้ไขแถวเดิม ผลลัพธ์ต้องตรงกับการสร้างชีตใหม่ทั้งหมด
+    assert client.post(f'/api/orders/{first}/complete').status_code == 200
+    drain_outbox(pos_app)
+    assert sheets.rows == full_rebuild()
+
+def test_outbox_status_reports_formatting_stats(client, sheets):
+    import new_google_sheets_sync
+
+    def formatting():
+        response = client.get('/api/settings/sheets/outbox')
+        assert response.status_code == 200
+        return response.get_json()['data']['formatting']
+
+    before = formatting()
+    result = new_google_sheets_sync.format_order_rows(sheets, 'sheet-id', [(1, 2, [[], [], []])], header=True)
+    assert result == {'batch_calls': 1, 'requests': 3}
+    assert formatting() == {'batch_calls': before['batch_calls'] + 1, 'requests': before['requests'] + 3}
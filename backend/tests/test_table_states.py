@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""การเปลี่ยนสถานะโต๊ะตาม TABLE_TRANSITIONS (compare-and-set) และรหัสตอบกลับ 404 / 409"""
+
+import pytest
+
+TABLE_ID = 2
+
+@pytest.fixture
+def fresh_table(client, db):
+    """โต๊ะที่เพิ่งเปิดเซสชันใหม่ (occupied) คืนค่า session_id"""
+    assert client.post(f'/api/tables/{TABLE_ID}/clear').status_code == 200
+    assert db.get_table_session(TABLE_ID)['status'] == 'available'
+    session_id = client.get(f'/api/tables/{TABLE_ID}/qr').get_json()['data']['session_id']
+    assert table_state(db) == ('occupied', session_id)
+    return session_id
+
+def put_status(client, status, session_id, table_id=TABLE_ID):
+    return client.put(f'/api/tables/{table_id}/status', json={'status': status, 'session_id': session_id})
+
+def table_state(db):
+    table = db.get_table_session(TABLE_ID)
+    return table['status'], table['session_id']
+
+def test_legal_transitions_keep_session(client, db, fresh_table):
+    for status in ('calling', 'occupied', 'waiting_payment', 'calling', 'needs_clearing', 'occupied'):
+        response = put_status(client, status, fresh_table)
+        assert response.status_code == 200, (status, response.get_json())
+        assert table_state(db) == (status, fresh_table)
+
+    assert client.post(f'/api/tables/{TABLE_ID}/call').status_code == 200
+    assert table_state(db) == ('calling', fresh_table)
+    assert client.post(f'/api/tables/{TABLE_ID}/clear').status_code == 200
+    assert table_state(db) == ('available', None)
+
+@pytest.mark.parametrize('start, status', [
+    ('needs_clearing', 'calling'),
+    ('needs_clearing', 'waiting_payment'),
+])
+def test_illegal_transition_returns_409(client, db, fresh_table, start, status):
+    assert put_status(client, start, fresh_table).status_code == 200
+    response = put_status(client, status, fresh_table)
+    assert response.status_code == 409
+    assert response.get_json()['success'] is False
+    assert table_state(db) == (start, fresh_table)
+
+def test_calling_staff_needs_open_session(client, db, fresh_table):
+    assert client.post(f'/api/tables/{TABLE_ID}/clear').status_code == 200
+    response = client.post(f'/api/tables/{TABLE_ID}/call')
+    assert response.status_code == 409
+    assert table_state(db) == ('available', None)
+
+def test_invalid_status_and_unknown_table(client, db, fresh_table):
+    assert put_status(client, 'bogus', fresh_table).status_code == 400
+    # สถานะเดิมของระบบรุ่นก่อน อ่านได้แต่เปลี่ยนเข้าไม่ได้
+    assert put_status(client, 'checkout', fresh_table).status_code == 409
+    # โต๊ะว่างต้องไม่มี session_id
+    assert put_status(client, 'available', fresh_table).status_code == 409
+    assert table_state(db) == ('occupied', fresh_table)
+
+    assert put_status(client, 'occupied', 'x', table_id=999999).status_code == 404
+    assert client.post('/api/tables/999999/call').status_code == 404
+
+def test_session_mismatch_is_rejected(client, db, fresh_table):
+    response = client.post(f'/api/tables/{TABLE_ID}/close-session', json={'session_id': 'stale-session'})
+    assert response.status_code == 403
+    assert table_state(db) == ('occupied', fresh_table)
+
+    result = db.close_table_session(TABLE_ID, 'stale-session')
+    assert result['success'] is False and result['conflict'] is True
+
+    result = db.transition_table(TABLE_ID, 'waiting_payment', expected_session_id='stale-session')
+    assert result['success'] is False and result['conflict'] is True
+    assert table_state(db) == ('occupied', fresh_table)
+
+def test_stale_expected_status_is_a_conflict(db, fresh_table):
+    result = db.transition_table(TABLE_ID, 'waiting_payment', expected_status='calling')
+    assert result['success'] is False
+    assert result['conflict'] is True
+    assert result['previous']['status'] == 'occupied'
+    assert table_state(db) == ('occupied', fresh_table)
+
+    result = db.transition_table(TABLE_ID, 'waiting_payment', expected_status='occupied', expected_session_id=fresh_table)
+    assert result['success'] is True
+    assert result['table']['status'] == 'waiting_payment'
+
+def test_row_changed_outside_state_machine_is_a_conflict(db, fresh_table):
+    # แถวในฐานข้อมูลถูกแก้โดยไม่ผ่าน TableStateMachine: compare-and-set ต้องไม่เขียนทับ
+    with db.transaction() as conn:
+        conn.execute("UPDATE tables SET status = 'calling' WHERE table_id = ?", (TABLE_ID,))
+    result = db.transition_table(TABLE_ID, 'waiting_payment', expected_status='occupied')
+    assert result['success'] is False and result['conflict'] is True
+    # โหลดแถวใหม่จากฐานข้อมูลแล้ว
+    assert table_state(db) == ('calling', fresh_table)
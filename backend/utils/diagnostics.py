@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+ระบบ logging และการวินิจฉัยสำหรับระบบ POS
+รองรับระดับ log, การสุ่มเก็บ log (sampling) และ trace id ต่อคำขอที่เปิดได้เฉพาะโต๊ะหรือเซสชัน
+
+ตั้งค่าผ่าน environment variables:
+    POS_LOG_LEVEL        ระดับ log (DEBUG/INFO/WARNING/ERROR) ค่าเริ่มต้น INFO
+    POS_LOG_SAMPLE_RATE  สัดส่วนคำขอที่เก็บ log ระดับต่ำกว่า WARNING (0.0 - 1.0) ค่าเริ่มต้น 1.0
+    POS_TRACE_TABLES     table_id ที่ต้องการ trace คั่นด้วยจุลภาค
+    POS_TRACE_SESSIONS   session_id ที่ต้องการ trace คั่นด้วยจุลภาค
+"""
+
+import logging
+import os
+import random
+import threading
+import uuid
+from typing import Dict, Iterable, Optional
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s [%(trace_id)s] %(message)s'
+
+class DiagnosticsConfig:
+    """ค่าตั้งค่าปัจจุบันของ logging (แก้ไขได้ขณะรันผ่าน configure_logging)"""
+
+    def __init__(self):
+        self.level = logging.INFO
+        self.sample_rate = 1.0
+        self.trace_tables = set()
+        self.trace_sessions = set()
+
+    def to_dict(self) -> Dict:
+        return {
+            'level': logging.getLevelName(self.level),
+            'sample_rate': self.sample_rate,
+            'trace_tables': sorted(self.trace_tables),
+            'trace_sessions': sorted(self.trace_sessions)
+        }
+
+config = DiagnosticsConfig()
+_local = threading.local()
+_lock = threading.Lock()
+_handler = None
+
+def _parse_level(value) -> int:
+    """แปลงชื่อหรือตัวเลขระดับ log เป็น int"""
+    if isinstance(value, int):
+        return value
+    level = logging.getLevelName(str(value).strip().upper())
+    if not isinstance(level, int):
+        raise ValueError(f'Unknown log level: {value}')
+    return level
+
+def _parse_ids(values) -> set:
+    """แปลงรายการ id (list หรือสตริงคั่นด้วยจุลภาค) เป็น set ของสตริง"""
+    if isinstance(values, str):
+        values = values.split(',')
+    return {str(value).strip() for value in values if str(value).strip()}
+
+# === Trace ต่อคำขอ ===
+def begin_request(table_id=None, session_id=None, force_trace: bool = False) -> str:
+    """เริ่มบริบทของคำขอ สร้าง trace id และตัดสินว่าคำขอนี้ถูก trace/sample หรือไม่"""
+    _local.trace_id = uuid.uuid4().hex[:12]
+    _local.traced = bool(force_trace
+                         or (table_id is not None and str(table_id) in config.trace_tables)
+                         or (session_id and str(session_id) in config.trace_sessions))
+    _local.sampled = config.sample_rate >= 1 or random.random() < config.sample_rate
+    return _local.trace_id
+
+def end_request():
+    """ล้างบริบทของคำขอ"""
+    _local.trace_id = None
+    _local.traced = False
+    _local.sampled = True
+
+def current_trace_id() -> Optional[str]:
+    """trace id ของคำขอปัจจุบัน (None ถ้าไม่ได้อยู่ในคำขอ)"""
+    return getattr(_local, 'trace_id', None)
+
+def is_traced() -> bool:
+    """คำขอปัจจุบันถูกเปิด trace (log ทุกระดับ) หรือไม่"""
+    return getattr(_local, 'traced', False)
+
+def has_trace_targets() -> bool:
+    """มีการตั้งค่าโต๊ะหรือเซสชันที่ต้องการ trace หรือไม่"""
+    return bool(config.trace_tables or config.trace_sessions)
+
+# === Logger ===
+class DiagnosticLogger(logging.Logger):
+    """Logger ที่เปิด log ทุกระดับสำหรับคำขอที่ถูก trace และสุ่มเก็บ log ระดับต่ำกว่า WARNING
+
+    การตัดสินเกิดใน isEnabledFor ก่อนสร้าง LogRecord จึงไม่มีการจัดรูปแบบข้อความถ้าไม่ได้ใช้
+    """
+
+    def isEnabledFor(self, level: int) -> bool:
+        if level >= logging.WARNING:
+            return super().isEnabledFor(level)
+        if getattr(_local, 'traced', False):
+            return True
+        return getattr(_local, 'sampled', True) and super().isEnabledFor(level)
+
+class TraceIdFilter(logging.Filter):
+    """เติม trace_id ลงใน LogRecord"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = getattr(_local, 'trace_id', None) or '-'
+        return True
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger ของระบบ POS (ชื่อควรขึ้นต้นด้วย 'pos.')"""
+    manager = logging.Logger.manager
+    with _lock:
+        previous = manager.loggerClass
+        manager.loggerClass = DiagnosticLogger
+        try:
+            logger = logging.getLogger(name)
+        finally:
+            manager.loggerClass = previous
+    _ensure_handler()
+    return logger
+
+def _ensure_handler():
+    """ติดตั้ง handler ของ logger 'pos' ครั้งเดียว"""
+    global _handler
+    with _lock:
+        if _handler is not None:
+            return
+        _handler = logging.StreamHandler()
+        _handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        _handler.addFilter(TraceIdFilter())
+        root = logging.getLogger('pos')
+        root.addHandler(_handler)
+        root.propagate = False
+        root.setLevel(config.level)
+
+def configure_logging(level=None, sample_rate: float = None,
+                      trace_tables: Iterable = None, trace_sessions: Iterable = None) -> Dict:
+    """ตั้งค่า logging (ค่าที่ไม่ระบุจะคงค่าเดิม) คืนค่าการตั้งค่าปัจจุบัน"""
+    if level is not None:
+        config.level = _parse_level(level)
+    if sample_rate is not None:
+        config.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+    if trace_tables is not None:
+        config.trace_tables = _parse_ids(trace_tables)
+    if trace_sessions is not None:
+        config.trace_sessions = _parse_ids(trace_sessions)
+    _ensure_handler()
+    logging.getLogger('pos').setLevel(config.level)
+    return config.to_dict()
+
+def configure_from_env() -> Dict:
+    """ตั้งค่า logging จาก environment variables"""
+    return configure_logging(
+        level=os.getenv('POS_LOG_LEVEL', 'INFO'),
+        sample_rate=os.getenv('POS_LOG_SAMPLE_RATE', '1.0'),
+        trace_tables=os.getenv('POS_TRACE_TABLES', ''),
+        trace_sessions=os.getenv('POS_TRACE_SESSIONS', '')
+    )
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Event Bus ภายในโปรเซสสำหรับส่งการเปลี่ยนแปลง (ออเดอร์ / การแจ้งเตือน / สถานะโต๊ะ) ไปยังหน้า admin
+ผ่าน Server-Sent Events หรือ long-poll แทนการ polling ข้อมูลทั้งหมดซ้ำๆ
+
+หมายเหตุ: event bus อยู่ในหน่วยความจำของโปรเซส จึงต้องรัน gunicorn แบบ worker เดียว (ใช้ threads แทน)
+"""
+
+import json
+import queue
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+class Subscription:
+    """ผู้รับ event หนึ่งราย (หนึ่งการเชื่อมต่อ SSE / long-poll)"""
+
+    def __init__(self, bus: 'EventBus', max_queue: int):
+        self._bus = bus
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    def push(self, event: Dict):
+        """ใส่ event ลงคิว ถ้าคิวเต็ม (ผู้รับช้าเกินไป) จะตั้งค่า overflowed ให้ผู้รับโหลดข้อมูลใหม่ทั้งหมด"""
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout: float) -> Optional[Dict]:
+        """รอ event ถัดไป คืนค่า None ถ้าหมดเวลา"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._bus.unsubscribe(self)
+
+class EventBus:
+    """กระจาย event ไปยังผู้รับทุกราย พร้อมเก็บ event ล่าสุดไว้สำหรับเชื่อมต่อใหม่ด้วย Last-Event-ID"""
+
+    def __init__(self, history_size: int = 500, max_queue: int = 1000):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._history = deque(maxlen=history_size)
+        self._condition = threading.Condition(self._lock)
+        self._max_queue = max_queue
+        self.last_event_id = 0
+        self.published = 0
+
+    def publish(self, event_type: str, data: Dict) -> Dict:
+        """ส่ง event ไปยังผู้รับทุกราย คืนค่า event ที่ส่ง"""
+        with self._lock:
+            self.last_event_id += 1
+            self.published += 1
+            event = {
+                'id': self.last_event_id,
+                'type': event_type,
+                'data': data,
+                'timestamp': time.time()
+            }
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+            self._condition.notify_all()
+        for subscription in subscribers:
+            subscription.push(event)
+        return event
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> Subscription:
+        """สมัครรับ event ถ้าระบุ last_event_id จะส่ง event ที่พลาดไปให้ก่อน
+
+        ถ้า event ที่พลาดไปเก่ากว่าที่เก็บไว้ จะตั้งค่า overflowed ให้ผู้รับโหลดข้อมูลใหม่ทั้งหมด
+        """
+        subscription = Subscription(self, self._max_queue)
+        with self._lock:
+            if last_event_id is not None:
+                missed = [event for event in self._history if event['id'] > last_event_id]
+                oldest = self._history[0]['id'] if self._history else self.last_event_id + 1
+                if last_event_id < oldest - 1:
+                    subscription.overflowed = True
+                for event in missed:
+                    subscription.push(event)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def events_after(self, last_event_id: int, timeout: float = 0) -> Dict:
+        """สำหรับ long-poll: รอจนมี event ใหม่กว่า last_event_id หรือหมดเวลา
+
+        คืนค่า {'events': [...], 'last_event_id': id ล่าสุด, 'resync': True ถ้า event ที่พลาดไปถูกลบจากประวัติแล้ว}
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self.last_event_id <= last_event_id:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            oldest = self._history[0]['id'] if self._history else self.last_event_id + 1
+            return {
+                'events': [event for event in self._history if event['id'] > last_event_id],
+                'last_event_id': self.last_event_id,
+                'resync': last_event_id < oldest - 1 and last_event_id < self.last_event_id
+            }
+
+    def stats(self) -> Dict:
+        """สถิติของ event bus"""
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'published': self.published,
+                'last_event_id': self.last_event_id,
+                'history': len(self._history)
+            }
+
+def format_sse(event: Dict) -> str:
+    """แปลง event เป็นข้อความรูปแบบ Server-Sent Events"""
+    payload = json.dumps(event['data'], ensure_ascii=False, default=str)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {payload}\n\n"
@@ -4,16 +4,13 @@ Google Sheets Integration สำหรับระบบ POS
 """
 
 import os
-import json
 from datetime import datetime, timezone, timedelta
 from typing import List, Dict, Optional
 
-try:
-    from googleapiclient.discovery import build
-    from google.oauth2.service_account import Credentials
-    GOOGLE_AVAILABLE = True
-except ImportError:
-    GOOGLE_AVAILABLE = False
+from utils.sheets_client import sheets_client
+
+GOOGLE_AVAILABLE = sheets_client.available
+if not GOOGLE_AVAILABLE:
     print("Warning: Google API libraries not installed. Google Sheets integration will be disabled.")
 
 class GoogleSheetsManager:
@@ -21,10 +18,11 @@ class GoogleSheetsManager:
     
     def __init__(self, credentials_file: str = "credentials.json"):
         self.credentials_file = credentials_file
-        self.service = None
         self.sheet_id = None
         self.sheet_name = "ยอดขาย"
         self.enabled = False
+        self._ready = False
+        self._config_version = None
         
         # โหลดการตั้งค่าจากไฟล์ config
         self._load_config()
@@ -36,16 +34,14 @@ class GoogleSheetsManager:
         """
         โหลดการตั้งค่าจากไฟล์ config
         """
-        config_file = 'google_sheets_config.json'
+        config_file = sheets_client.config_file
+        # sheets_client อ่านไฟล์ใหม่เฉพาะเมื่อไฟล์เปลี่ยน
+        config = sheets_client.config()
+        self._config_version = sheets_client.config_version
         if os.path.exists(config_file):
-            try:
-                with open(config_file, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                    self.sheet_id = config.get('spreadsheet_id')
-                    self.enabled = config.get('enabled', False)
-                    print(f"[Google Sheets] Loaded config: enabled={self.enabled}, sheet_id={self.sheet_id}")
-            except Exception as e:
-                print(f"[Google Sheets] Error loading config: {e}")
+            self.sheet_id = config.get('spreadsheet_id')
+            self.enabled = config.get('enabled', False)
+            print(f"[Google Sheets] Loaded config: enabled={self.enabled}, sheet_id={self.sheet_id}")
         else:
             print(f"[Google Sheets] Config file not found: {config_file}")
     
@@ -58,21 +54,29 @@ class GoogleSheetsManager:
                 print(f"Credentials file not found: {self.credentials_file}")
                 return
             
-            # กำหนด scope ที่ต้องการ
-            scopes = ['https://www.googleapis.com/auth/spreadsheets']
-            
-            # สร้าง credentials
-            credentials = Credentials.from_service_account_file(
-                self.credentials_file, scopes=scopes
-            )
-            
-            # สร้าง service
-            self.service = build('sheets', 'v4', credentials=credentials)
+            # ตรวจสอบ credentials (sheets_client แคชไว้ใช้ร่วมกัน และสร้าง service เมื่อใช้งานจริง)
+            sheets_client.credentials(self.credentials_file, refresh=False)
+            self._ready = True
             print("Google Sheets service initialized successfully")
             
         except Exception as e:
             print(f"Error initializing Google Sheets service: {e}")
-            self.service = None
+            self._ready = False
+
+    @property
+    def service(self):
+        """
+        Google Sheets API service ของ thread ปัจจุบันจาก sheets_client (None ถ้ายังไม่พร้อม)
+        โหลดการตั้งค่าใหม่ก่อนถ้าไฟล์ config เปลี่ยน
+        """
+        if sheets_client.current_config_version() != self._config_version:
+            self._ready = False
+            self._load_config()
+            if GOOGLE_AVAILABLE and self.enabled:
+                self._initialize_service()
+        if not self._ready:
+            return None
+        return sheets_client.service(self.credentials_file)
     
     def set_sheet_config(self, sheet_id: str, sheet_name: str = "ยอดขาย"):
         """
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+คิวรายการอาหารสำหรับหน้าจอครัว เรียงตามเวลาที่ควรเสร็จ (created_at + preparation_time)
+
+เก็บเฉพาะรายการที่ยังต้องทำ (pending / accepted) ในหน่วยความจำ
+DatabaseManager เป็นผู้ปรับปรุงคิวแบบเพิ่มทีละส่วนจาก change_log (ดู DatabaseManager.get_kitchen_queue)
+และเมื่อแก้ไขเมนู (ดู DatabaseManager._refresh_kitchen_menu_item)
+"""
+
+import bisect
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+# สถานะของรายการอาหารและออเดอร์ที่ยังต้องแสดงในครัว
+KITCHEN_ITEM_STATUSES = ('pending', 'accepted')
+KITCHEN_ORDER_STATUSES = ('active', 'pending', 'accepted')
+DEFAULT_PREPARATION_TIME = 15  # นาที
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def is_kitchen_item(row: Dict) -> bool:
+    """รายการนี้ยังต้องแสดงในคิวครัวหรือไม่"""
+    return row['status'] in KITCHEN_ITEM_STATUSES and row['order_status'] in KITCHEN_ORDER_STATUSES
+
+def due_at(created_at: str, preparation_time: Optional[int]) -> str:
+    """เวลาที่ควรเสร็จ = created_at + preparation_time นาที (รูปแบบเดียวกับ created_at)"""
+    try:
+        created = datetime.strptime(str(created_at)[:19], TIMESTAMP_FORMAT)
+    except (TypeError, ValueError):
+        return str(created_at or '')
+    minutes = preparation_time if preparation_time is not None else DEFAULT_PREPARATION_TIME
+    return (created + timedelta(minutes=minutes)).strftime(TIMESTAMP_FORMAT)
+
+class KitchenQueue:
+    """รายการอาหารที่รอทำ เรียงตาม (due_at, order_item_id) ด้วย list ที่เรียงไว้แล้ว (bisect)
+
+    upsert / remove ทำงานเฉพาะรายการที่เปลี่ยน การอ่านคิวจึงไม่ต้องเรียงหรือ JOIN ใหม่ทั้งหมด
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._keys = []      # [(due_at, order_item_id)] เรียงจากเร็วไปช้า
+        self._entries = {}   # order_item_id -> entry
+        self.cursor = None   # seq ของ change_log ที่ใช้ปรับปรุงคิวล่าสุด (None = ยังไม่ได้โหลด)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        with self.lock:
+            self._keys = []
+            self._entries = {}
+            self.cursor = None
+
+    def upsert(self, row: Dict):
+        """เพิ่มหรือปรับปรุงรายการ (row จาก DatabaseManager.KITCHEN_QUEUE_SELECT) ถ้าไม่ต้องแสดงในครัวแล้วจะถูกลบ"""
+        with self.lock:
+            self.remove(row['order_item_id'])
+            if not is_kitchen_item(row):
+                return
+            entry = {
+                'order_item_id': row['order_item_id'],
+                'order_id': row['order_id'],
+                'table_id': row['table_id'],
+                'table_name': row['table_name'],
+                'item_id': row['item_id'],
+                'name': row['item_name'],
+                'quantity': row['quantity'],
+                'customer_request': row['customer_request'] or '',
+                'status': row['status'],
+                'station_id': row['category_id'],
+                'station': row['category_name'],
+                'preparation_time': row['preparation_time'],
+                'created_at': row['created_at'],
+                'due_at': due_at(row['created_at'], row['preparation_time'])
+            }
+            key = (entry['due_at'], entry['order_item_id'])
+            bisect.insort(self._keys, key)
+            self._entries[entry['order_item_id']] = entry
+
+    def remove(self, order_item_id: int):
+        with self.lock:
+            entry = self._entries.pop(order_item_id, None)
+            if entry is None:
+                return
+            key = (entry['due_at'], order_item_id)
+            index = bisect.bisect_left(self._keys, key)
+            if index < len(self._keys) and self._keys[index] == key:
+                del self._keys[index]
+
+    def order_item_ids(self, order_ids) -> List[int]:
+        """order_item_id ในคิวที่เป็นของออเดอร์ที่ระบุ"""
+        order_ids = set(order_ids)
+        with self.lock:
+            return [item_id for item_id, entry in self._entries.items() if entry['order_id'] in order_ids]
+
+    def menu_order_item_ids(self, item_id: int) -> List[int]:
+        """order_item_id ในคิวที่เป็นเมนูที่ระบุ"""
+        with self.lock:
+            return [order_item_id for order_item_id, entry in self._entries.items() if entry['item_id'] == item_id]
+
+    def items(self, station_id: int = None, status: str = None, limit: int = None) -> List[Dict]:
+        """รายการในคิวเรียงตามเวลาที่ควรเสร็จ กรองตาม station (หมวดหมู่เมนู) และสถานะได้"""
+        result = []
+        with self.lock:
+            for _, order_item_id in self._keys:
+                entry = self._entries[order_item_id]
+                if station_id is not None and entry['station_id'] != station_id:
+                    continue
+                if status is not None and entry['status'] != status:
+                    continue
+                result.append(dict(entry))
+                if limit and len(result) >= limit:
+                    break
+        return result
+
+    def stations(self) -> List[Dict]:
+        """จำนวนรายการที่รอทำแยกตาม station"""
+        counts = {}
+        with self.lock:
+            for entry in self._entries.values():
+                key = (entry['station_id'], entry['station'])
+                counts[key] = counts.get(key, 0) + 1
+        return [{'station_id': station_id, 'station': station, 'count': count}
+                for (station_id, station), count in sorted(counts.items(), key=lambda item: (item[0][0] is None, item[0][0] or 0))]
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Worker สำหรับประมวลผลคิว outbox ที่เก็บใน SQLite (เช่น งานซิงค์ Google Sheets)
+
+ใช้ thread จำนวนจำกัดชุดเดียวดึงงานที่ถึงกำหนดจากฐานข้อมูล งานที่ล้มเหลวจะถูกลองใหม่แบบ exponential backoff
+และย้ายไป dead-letter เมื่อครบจำนวนครั้ง (ดู DatabaseManager.fail_sheets_outbox) งานจึงไม่หายเมื่อรีสตาร์ทโปรเซส
+"""
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from utils.diagnostics import get_logger
+
+log = get_logger('pos.outbox')
+
+class OutboxWorker:
+    """ดึงงานด้วย claim(limit) ส่งด้วย handle(entry) -> bool แล้วบันทึกผลด้วย complete(id) / fail(entry, error)
+
+    wakeup คือ threading.Event ที่ผู้เขียนคิวตั้งค่าหลังเพิ่มงาน ถ้าไม่มีการปลุก worker จะตรวจคิวทุก poll_interval วินาที
+    """
+
+    def __init__(self, claim: Callable[[int], List[Dict]], handle: Callable[[Dict], bool],
+                 complete: Callable[[int], bool], fail: Callable[[Dict, str], Optional[str]],
+                 wakeup: threading.Event = None, workers: int = 1, batch_size: int = 10,
+                 poll_interval: float = 5.0, name: str = 'outbox'):
+        self._claim = claim
+        self._handle = handle
+        self._complete = complete
+        self._fail = fail
+        self.wakeup = wakeup or threading.Event()
+        self.workers = max(workers, 1)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.name = name
+        self._threads = []
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {'processed': 0, 'failed': 0, 'dead_lettered': 0, 'last_error': None, 'last_error_at': None}
+
+    def start(self):
+        """เริ่ม thread ของ worker (เรียกซ้ำได้ จะไม่สร้าง thread เพิ่ม)"""
+        with self._lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'{self.name}-worker-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        self.wakeup.set()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.run_once()
+            except Exception as e:
+                log.error('%s worker error: %s', self.name, e)
+                processed = 0
+            if processed == 0:
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+
+    def run_once(self) -> int:
+        """ประมวลผลงานที่ถึงกำหนดหนึ่งชุด คืนค่าจำนวนงานที่ดึงมา"""
+        entries = self._claim(self.batch_size)
+        for entry in entries:
+            try:
+                ok = self._handle(entry)
+                error = None if ok else 'handler returned False'
+            except Exception as e:
+                error = str(e) or e.__class__.__name__
+            if error is None:
+                self._complete(entry['outbox_id'])
+                self._count('processed')
+                continue
+            status = self._fail(entry, error)
+            log.warning('%s entry %s failed (attempt %s): %s', self.name, entry['outbox_id'], entry['attempts'] + 1, error)
+            with self._lock:
+                self._stats['failed'] += 1
+                self._stats['last_error'] = error
+                self._stats['last_error_at'] = time.time()
+                if status == 'dead':
+                    self._stats['dead_lettered'] += 1
+        return len(entries)
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self) -> Dict:
+        """สถิติของ worker ตั้งแต่เริ่มโปรเซส"""
+        with self._lock:
+            return dict(self._stats, workers=self.workers, running=bool(self._threads))
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Sales Report สำหรับระบบ POS
+คำนวณยอดขาย จำนวนออเดอร์ และจำนวนโต๊ะด้วย GROUP BY ใน SQL แทนการโหลดออเดอร์ทั้งหมดมาบวกใน Python
+วันที่ปิดแล้วอ่านจากตาราง daily_sales_rollup ส่วนวันนี้อ่านจากข้อมูลดิบ
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from database import day_range_bounds, date_range_predicate, get_thai_datetime
+
+class SalesReportGenerator:
+    """คลาสสำหรับสร้างรายงานยอดขายจากฐานข้อมูล"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def window_totals(self, windows: Dict[str, Tuple[str, str]]) -> Dict[str, Dict]:
+        """
+        คำนวณยอดขายของหลายช่วงวันที่ที่ซ้อนกันได้ในคิวรีเดียว
+
+        Args:
+            windows: {ชื่อช่วง: (start_date, end_date)} รูปแบบ YYYY-MM-DD รวมวันสุดท้าย
+
+        Returns:
+            {ชื่อช่วง: {'total': ยอดขาย, 'orders': จำนวนออเดอร์, 'sessions': จำนวนโต๊ะที่ไม่ซ้ำ}}
+        """
+        if not windows:
+            return {}
+        names = list(windows)
+        bounds = [day_range_bounds(*windows[name]) for name in names]
+
+        # สแกนช่วงที่ครอบคลุมทุก window ครั้งเดียว แล้วแยกยอดด้วย CASE
+        date_clause = ''
+        params = []
+        lowers = [lower for lower, _ in bounds]
+        uppers = [upper for _, upper in bounds]
+        if all(lowers):
+            date_clause += ' AND o.created_at >= ?'
+            params.append(min(lowers))
+        if all(uppers):
+            date_clause += ' AND o.created_at < ?'
+            params.append(max(uppers))
+
+        # แต่ละ window ได้ 3 คอลัมน์: ยอดขาย จำนวนออเดอร์ จำนวนโต๊ะ
+        columns = []
+        select_params = []
+        for lower, upper in bounds:
+            condition = '1=1'
+            if lower:
+                condition += ' AND created_at >= ?'
+            if upper:
+                condition += ' AND created_at < ?'
+            columns.append(f'COALESCE(SUM(CASE WHEN {condition} THEN total END), 0)')
+            columns.append(f'COUNT(CASE WHEN {condition} THEN 1 END)')
+            columns.append(f'COUNT(DISTINCT CASE WHEN {condition} THEN table_id END)')
+            select_params.extend([value for value in (lower, upper) if value] * 3)
+
+        query = f'''
+            WITH order_totals AS ({self.db.ORDER_TOTALS_SQL.format(date_clause=date_clause)})
+            SELECT {', '.join(columns)}
+            FROM order_totals
+        '''
+        with self.db.connection() as conn:
+            row = conn.execute(query, params + select_params).fetchone()
+
+        result = {}
+        for index, name in enumerate(names):
+            result[name] = {
+                'total': row[index * 3],
+                'orders': row[index * 3 + 1],
+                'sessions': row[index * 3 + 2]
+            }
+        return result
+
+    def daily_sales(self, start_date: str, end_date: str) -> Dict[str, Dict]:
+        """ยอดขายรายวันในช่วงวันที่ {YYYY-MM-DD: {'sales': ยอดขาย, 'orders': จำนวนออเดอร์}}"""
+        date_clause, params = date_range_predicate('o.created_at', start_date, end_date)
+        query = f'''
+            WITH order_totals AS ({self.db.ORDER_TOTALS_SQL.format(date_clause=date_clause)})
+            SELECT substr(created_at, 1, 10) AS day, SUM(total) AS sales, COUNT(*) AS orders
+            FROM order_totals
+            GROUP BY day
+            ORDER BY day DESC
+        '''
+        with self.db.connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return {row['day']: {'sales': row['sales'], 'orders': row['orders']} for row in rows}
+
+    def top_items(self, start_date: str, end_date: str, limit: int = 5) -> List[Dict]:
+        """เมนูขายดีตามจำนวนในช่วงวันที่"""
+        date_clause, params = date_range_predicate('o.created_at', start_date, end_date)
+        with self.db.connection() as conn:
+            rows = conn.execute(f"""
+                SELECT mi.name, SUM(oi.quantity) as total_quantity, SUM(oi.total_price) as total_sales
+                FROM order_items oi
+                JOIN menu_items mi ON oi.item_id = mi.item_id
+                JOIN orders o ON oi.order_id = o.order_id
+                WHERE o.status != 'rejected'
+                {date_clause}
+                GROUP BY mi.item_id, mi.name
+                ORDER BY total_quantity DESC
+                LIMIT ?
+            """, params + [limit]).fetchall()
+        return [{
+            'name': row['name'],
+            'quantity': int(row['total_quantity']),
+            'sales': float(row['total_sales']) if row['total_sales'] else 0
+        } for row in rows]
+
+    # === Rollup + ข้อมูลวันนี้ ===
+    def _split_range(self, start_date: Optional[str], end_date: Optional[str]):
+        """แบ่งช่วงวันที่เป็นส่วนที่อ่านจาก rollup (วันที่สรุปแล้ว) และส่วนที่อ่านจากข้อมูลดิบ (หลังจากนั้น)
+
+        คืนค่า (closed_range, live_range) แต่ละส่วนเป็น (start, end) หรือ None ถ้าไม่มี
+        """
+        closed_through = self.db.ensure_sales_rollup()
+        live_from = (datetime.strptime(closed_through, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        closed = live = None
+        if not start_date or start_date <= closed_through:
+            closed = (start_date, min(end_date, closed_through) if end_date else closed_through)
+        if not end_date or end_date >= live_from:
+            live = (max(start_date, live_from) if start_date else live_from, end_date)
+        return closed, live
+
+    def _rollup_totals(self, dimension: str, closed_range) -> Dict[int, Dict]:
+        """รวมแถว rollup ตาม ref_id ในช่วงวันที่ปิดแล้ว"""
+        if not closed_range:
+            return {}
+        start_date, end_date = closed_range
+        with self.db.connection() as conn:
+            rows = conn.execute('''
+                SELECT ref_id, SUM(quantity) AS quantity, SUM(revenue) AS revenue, SUM(order_count) AS orders
+                FROM daily_sales_rollup
+                WHERE dimension = ? AND sales_date >= ? AND sales_date <= ?
+                GROUP BY ref_id
+            ''', (dimension, start_date or '', end_date)).fetchall()
+        return {row['ref_id']: {'quantity': row['quantity'], 'revenue': row['revenue'], 'orders': row['orders']}
+                for row in rows}
+
+    def _live_line_totals(self, group_column: str, live_range) -> Dict[int, Dict]:
+        """รวมรายการอาหารดิบตามคอลัมน์ (oi.item_id / mi.category_id) ในช่วงที่ยังไม่ได้สรุป"""
+        if not live_range:
+            return {}
+        date_clause, params = date_range_predicate('o.created_at', *live_range)
+        with self.db.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {group_column} AS ref_id, SUM(oi.quantity) AS quantity, SUM(oi.total_price) AS revenue
+                {self.db.SALES_LINES_SQL.format(date_clause=date_clause)}
+                AND {group_column} IS NOT NULL
+                GROUP BY {group_column}
+            ''', params).fetchall()
+        return {row['ref_id']: {'quantity': row['quantity'], 'revenue': row['revenue']} for row in rows}
+
+    @staticmethod
+    def _merge(*parts: Dict[int, Dict]) -> Dict[int, Dict]:
+        """รวมผลจาก rollup และข้อมูลดิบตาม ref_id"""
+        merged = {}
+        for part in parts:
+            for ref_id, values in part.items():
+                target = merged.setdefault(ref_id, {'quantity': 0, 'revenue': 0})
+                target['quantity'] += values['quantity'] or 0
+                target['revenue'] += values['revenue'] or 0
+        return merged
+
+    def sales_chart(self, start_date: str, end_date: Optional[str] = None) -> List[Dict]:
+        """ยอดขายรายวันสำหรับกราฟ [{'date': YYYY-MM-DD, 'total': ยอดขาย}] เรียงตามวันที่"""
+        closed, live = self._split_range(start_date, end_date)
+        daily = {}
+        if closed:
+            with self.db.connection() as conn:
+                rows = conn.execute('''
+                    SELECT sales_date, revenue FROM daily_sales_rollup
+                    WHERE dimension = 'day' AND sales_date >= ? AND sales_date <= ?
+                ''', (closed[0] or '', closed[1])).fetchall()
+            daily.update({row['sales_date']: row['revenue'] for row in rows})
+        if live:
+            daily.update({day: values['sales'] for day, values in self.daily_sales(*live).items()})
+        return [{'date': day, 'total': float(daily[day]) if daily[day] else 0} for day in sorted(daily)]
+
+    def item_sales(self, limit: int = 5, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict]:
+        """เมนูขายดีตามจำนวน (ไม่ระบุวันที่ = ทั้งหมด)"""
+        closed, live = self._split_range(start_date, end_date)
+        merged = self._merge(self._rollup_totals('item', closed), self._live_line_totals('oi.item_id', live))
+        if not merged:
+            return []
+        names = self._names('menu_items', 'item_id', merged)
+        ranked = sorted((ref_id for ref_id in merged if ref_id in names),
+                        key=lambda ref_id: merged[ref_id]['quantity'], reverse=True)
+        return [{
+            'name': names[ref_id],
+            'quantity': int(merged[ref_id]['quantity']),
+            'sales': float(merged[ref_id]['revenue']) if merged[ref_id]['revenue'] else 0
+        } for ref_id in ranked[:limit]]
+
+    def category_sales(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict]:
+        """ยอดขายตามหมวดหมู่ เรียงจากมากไปน้อย (ไม่ระบุวันที่ = ทั้งหมด)"""
+        closed, live = self._split_range(start_date, end_date)
+        merged = self._merge(self._rollup_totals('category', closed), self._live_line_totals('mi.category_id', live))
+        if not merged:
+            return []
+        names = self._names('menu_categories', 'category_id', merged)
+        ranked = sorted((ref_id for ref_id in merged if ref_id in names),
+                        key=lambda ref_id: merged[ref_id]['revenue'], reverse=True)
+        return [{
+            'category': names[ref_id],
+            'sales': float(merged[ref_id]['revenue']) if merged[ref_id]['revenue'] else 0
+        } for ref_id in ranked]
+
+    def range_summary(self, start_date: str, end_date: str) -> Dict:
+        """ยอดขายรวมและจำนวนโต๊ะที่ไม่ซ้ำในช่วงวันที่ {'total': ยอดขาย, 'sessions': จำนวนโต๊ะ}"""
+        closed, live = self._split_range(start_date, end_date)
+        tables = self._rollup_totals('table', closed)
+        total = sum(values['revenue'] or 0 for values in tables.values())
+        table_ids = set(tables)
+        if live:
+            date_clause, params = date_range_predicate('o.created_at', *live)
+            with self.db.connection() as conn:
+                rows = conn.execute(f'''
+                    SELECT table_id, SUM(total) AS total
+                    FROM ({self.db.ORDER_TOTALS_SQL.format(date_clause=date_clause)})
+                    GROUP BY table_id
+                ''', params).fetchall()
+            total += sum(row['total'] or 0 for row in rows)
+            table_ids.update(row['table_id'] for row in rows)
+        return {'total': total, 'sessions': len(table_ids)}
+
+    def _names(self, table: str, id_column: str, ref_ids) -> Dict[int, str]:
+        """ชื่อปัจจุบันของเมนู/หมวดหมู่ตาม id"""
+        ids = list(ref_ids)
+        placeholders = ','.join('?' * len(ids))
+        with self.db.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {id_column} AS ref_id, name FROM {table}
+                WHERE {id_column} IN ({placeholders})
+            ''', ids).fetchall()
+        return {row['ref_id']: row['name'] for row in rows}
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+ผู้ให้บริการ Google Sheets API client ที่ใช้ร่วมกันทั้งโปรเซส
+
+- โหลด google_sheets_config.json ใหม่เฉพาะเมื่อไฟล์เปลี่ยน (ตรวจจาก mtime)
+- โหลด credentials ครั้งเดียวต่อไฟล์ และ refresh token ล่วงหน้าก่อนหมดอายุ
+- แคช discovery document ของ Sheets v4 (ไม่ต้องสร้างใหม่ทุกครั้งที่ซิงค์)
+- service ของ googleapiclient ใช้ http ที่ไม่ thread-safe จึงสร้างแยกต่อ thread (สร้างครั้งเดียวแล้วใช้ซ้ำ)
+"""
+
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict
+
+from utils.diagnostics import get_logger
+
+try:
+    from google.auth.transport.requests import Request
+    from google.oauth2.service_account import Credentials
+    from googleapiclient.discovery import build, build_from_document
+    from googleapiclient.discovery_cache import get_static_doc
+    GOOGLE_AVAILABLE = True
+except ImportError:
+    GOOGLE_AVAILABLE = False
+
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+
+log = get_logger('pos.sheets')
+
+class SheetsClientProvider:
+    """สร้างและแคช config / credentials / service ของ Google Sheets แบบ lazy และ thread-safe"""
+
+    def __init__(self, config_file: str = 'google_sheets_config.json',
+                 credentials_file: str = 'credentials.json', refresh_margin: int = 300):
+        self.config_file = config_file
+        self.credentials_file = credentials_file
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._config = {}
+        self._config_mtime = None
+        self.config_version = 0
+        self._credentials = {}   # path -> (mtime, credentials)
+        self._discovery = None
+        self._stats = {'config_loads': 0, 'credential_loads': 0, 'token_refreshes': 0, 'services_built': 0}
+
+    @property
+    def available(self) -> bool:
+        return GOOGLE_AVAILABLE
+
+    def config(self) -> Dict:
+        """การตั้งค่าจาก google_sheets_config.json (อ่านไฟล์ใหม่เมื่อ mtime เปลี่ยน, {} ถ้าไม่มีไฟล์)"""
+        try:
+            mtime = os.path.getmtime(self.config_file)
+        except OSError:
+            mtime = None
+        with self._lock:
+            if mtime != self._config_mtime:
+                config = {}
+                if mtime is not None:
+                    try:
+                        with open(self.config_file, 'r', encoding='utf-8') as f:
+                            config = json.load(f)
+                    except (OSError, ValueError) as e:
+                        log.error('Error loading Google Sheets config %s: %s', self.config_file, e)
+                self._config = config
+                self._config_mtime = mtime
+                self.config_version += 1
+                self._stats['config_loads'] += 1
+                log.info('Google Sheets config loaded (version %s, enabled=%s)', self.config_version, config.get('enabled', False))
+            return dict(self._config)
+
+    def current_config_version(self) -> int:
+        """เวอร์ชันของ config (เพิ่มขึ้นทุกครั้งที่ไฟล์เปลี่ยน) สำหรับให้ผู้ใช้แคชการตั้งค่าของตัวเอง"""
+        self.config()
+        return self.config_version
+
+    def credentials(self, credentials_file: str = None, refresh: bool = True):
+        """credentials ของ service account (ใช้ร่วมกัน) refresh ล่วงหน้า refresh_margin ก่อน token หมดอายุ
+
+        refresh=False ใช้ตรวจว่าไฟล์ credentials ใช้ได้โดยไม่เรียกเครือข่าย
+        """
+        if not GOOGLE_AVAILABLE:
+            raise RuntimeError('Google API libraries not installed')
+        path = credentials_file or self.credentials_file
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            cached = self._credentials.get(path)
+            if cached is None or cached[0] != mtime:
+                cached = (mtime, Credentials.from_service_account_file(path, scopes=SCOPES))
+                self._credentials[path] = cached
+                self._stats['credential_loads'] += 1
+                log.info('Google Sheets credentials loaded from %s', path)
+            creds = cached[1]
+            # expiry ของ google-auth เป็นเวลา UTC แบบไม่มี timezone
+            if refresh and (not creds.valid or (creds.expiry and creds.expiry - datetime.utcnow() < self.refresh_margin)):
+                creds.refresh(Request())
+                self._stats['token_refreshes'] += 1
+                log.debug('Google Sheets access token refreshed (expires %s)', creds.expiry)
+            return creds
+
+    def _discovery_document(self):
+        """discovery document ของ Sheets v4 (แปลงครั้งเดียวแล้วใช้ซ้ำ)"""
+        with self._lock:
+            if self._discovery is None:
+                document = get_static_doc('sheets', 'v4')
+                self._discovery = json.loads(document) if document else None
+            return self._discovery
+
+    def service(self, credentials_file: str = None):
+        """Google Sheets API service ของ thread ปัจจุบัน (สร้างใหม่เมื่อไฟล์ credentials เปลี่ยนเท่านั้น)"""
+        creds = self.credentials(credentials_file)
+        cached = getattr(self._local, 'services', None)
+        if cached is None:
+            cached = self._local.services = {}
+        entry = cached.get(id(creds))
+        if entry is None or entry[0] is not creds:
+            document = self._discovery_document()
+            if document is not None:
+                service = build_from_document(document, credentials=creds)
+            else:
+                service = build('sheets', 'v4', credentials=creds)
+            entry = cached[id(creds)] = (creds, service)
+            with self._lock:
+                self._stats['services_built'] += 1
+        return entry[1]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats, config_version=self.config_version)
+
+# instance ที่ใช้ร่วมกันทั้งโปรเซส (ไฟล์ config / credentials อ้างอิงจาก working directory เหมือนเดิม)
+sheets_client = SheetsClientProvider()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+รวมคำขออ่านที่เหมือนกันซึ่งเข้ามาพร้อมกัน (single-flight) ให้คำนวณครั้งเดียวแล้วใช้ผลลัพธ์ร่วมกัน
+
+คำขอแรกของแต่ละ key เป็นผู้คำนวณ คำขอที่ตามมาระหว่างนั้นจะรอผลลัพธ์เดียวกัน
+และผลลัพธ์จะถูกใช้ซ้ำต่ออีก window วินาที (ผู้เรียกควรใส่เวอร์ชันข้อมูลไว้ใน key เพื่อไม่ให้ได้ข้อมูลเก่าหลังการแก้ไข)
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Hashable
+
+class _Flight:
+    """การคำนวณหนึ่งครั้งของ key หนึ่ง"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished_at = None
+
+class SingleFlight:
+    """ตัวรวมคำขอที่เหมือนกัน พร้อมสถิติแยกตามชื่อ endpoint"""
+
+    def __init__(self, window: float = 0.25, max_entries: int = 256):
+        self.window = window
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = {}
+
+    def do(self, name: str, key: Hashable, fn: Callable, shareable: Callable = None):
+        """คืนผลลัพธ์ของ fn() สำหรับ key ถ้ามีการคำนวณที่กำลังทำหรือเพิ่งเสร็จภายใน window จะใช้ผลลัพธ์นั้นแทน
+
+        shareable(result) คืนค่า False ถ้าผลลัพธ์ไม่ควรเก็บไว้ใช้ซ้ำ (เช่น response ที่ผิดพลาด)
+        """
+        key = (name, key)
+        with self._lock:
+            stats = self._stats.setdefault(name, {'requests': 0, 'executed': 0, 'coalesced': 0, 'reused': 0})
+            stats['requests'] += 1
+            flight = self._flights.get(key)
+            if flight is not None and flight.finished_at is not None \
+                    and time.monotonic() - flight.finished_at > self.window:
+                del self._flights[key]
+                flight = None
+            if flight is None:
+                self._prune()
+                flight = self._flights[key] = _Flight()
+                leader = True
+                stats['executed'] += 1
+            else:
+                leader = False
+                stats['coalesced' if flight.finished_at is None else 'reused'] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is None:
+                return flight.result
+            # ผู้คำนวณล้มเหลว ให้คำขอนี้คำนวณเอง
+            return fn()
+
+        try:
+            flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                flight.finished_at = time.monotonic()
+                keep = flight.error is None and self.window > 0 and (shareable is None or shareable(flight.result))
+                if not keep and self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    def _prune(self):
+        """ลบผลลัพธ์ที่หมดอายุเมื่อจำนวน key เกิน max_entries (เรียกขณะถือ lock)"""
+        if len(self._flights) < self._max_entries:
+            return
+        now = time.monotonic()
+        for key, flight in list(self._flights.items()):
+            if flight.finished_at is not None and now - flight.finished_at > self.window:
+                del self._flights[key]
+
+    def stats(self) -> Dict:
+        """สถิติแยกตามชื่อ: requests, executed (คำนวณจริง), coalesced (รอผลที่กำลังคำนวณ), reused (ใช้ผลภายใน window)"""
+        with self._lock:
+            return {
+                'window_ms': int(self.window * 1000),
+                'in_flight': sum(1 for flight in self._flights.values() if flight.finished_at is None),
+                'endpoints': {name: dict(stats) for name, stats in self._stats.items()}
+            }
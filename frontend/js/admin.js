@@ -37,13 +37,10 @@ document.addEventListener('DOMContentLoaded', function() {
     // Setup notification sound
     setupNotificationSound();
     
-    // Setup auto-refresh with order checking (ลบการเรียก checkForNewNotifications ออกจาก checkForNewOrders)
-    setInterval(checkForNewOrders, 5000); // Check every 5 seconds
+    // รับการเปลี่ยนแปลงของออเดอร์/การแจ้งเตือนแบบ push (SSE) ถ้าใช้ไม่ได้จะกลับไปใช้ polling
+    startEventStream();
     setInterval(refreshData, 30000); // Refresh all data every 30 seconds
     
-    // เริ่มต้น notification polling แยกต่างหาก
-    startNotificationPolling();
-    
     // Setup form handlers
     setupFormHandlers();
     
@@ -622,41 +619,17 @@ async function loadTables() {
     try {
         // เพิ่ม cache busting parameter เพื่อป้องกันการ cache
         const timestamp = new Date().getTime();
-        const response = await fetch(`/api/tables?_t=${timestamp}`);
-        
+        // /api/floor ส่งโต๊ะทั้งหมดพร้อมรายการอาหารที่จัดกลุ่มแล้วและ order_count ในคำขอเดียว
+        const response = await fetch(`/api/floor?_t=${timestamp}`);
+
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
-        
+
         const data = await response.json();
-        
-        // API ส่งข้อมูลเป็น array โดยตรง
-        tables = Array.isArray(data) ? data : [];
-        
-        // โหลดข้อมูลรายการอาหารสำหรับแต่ละโต๊ะที่มี session_id
-        for (let table of tables) {
-            if (table.session_id) {
-                try {
-                    const orderResponse = await fetch(`/api/tables/${table.table_id}/orders?session_id=${table.session_id}&_t=${timestamp}`);
-                    if (orderResponse.ok) {
-                        const orderData = await orderResponse.json();
-                        if (orderData.success && orderData.data.orders) {
-                            table.order_count = orderData.data.orders.length;
-                        } else {
-                            table.order_count = 0;
-                        }
-                    } else {
-                        table.order_count = 0;
-                    }
-                } catch (orderError) {
-                    console.error(`Error loading orders for table ${table.table_id}:`, orderError);
-                    table.order_count = 0;
-                }
-            } else {
-                table.order_count = 0;
-            }
-        }
-        
+
+        tables = data.success && Array.isArray(data.data) ? data.data : [];
+
         renderTables();
     } catch (error) {
         console.error('Error loading tables:', error);
@@ -4130,22 +4103,32 @@ async function acceptAllTableOrders(tableId) {
     }
     
     try {
-        // ใช้ order_item_id แทน order_id
-        for (const item of pendingItems) {
-            await fetch(`/api/order-items/${item.order_item_id}/accept`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' }
-            });
-        }
-        
+        // เปลี่ยนสถานะทุกรายการในคำขอเดียว
+        await updateOrderItemsStatus(pendingItems.map(item => item.order_item_id), 'accepted');
         showAlert('รับรายการทั้งหมดเรียบร้อยแล้ว', 'success');
-        loadOrders();
     } catch (error) {
         console.error('Error accepting all table orders:', error);
         showAlert('เกิดข้อผิดพลาดในการรับรายการ', 'danger');
     }
 }
 
+// เปลี่ยนสถานะรายการออเดอร์ย่อยหลายรายการในคำขอเดียว แล้วใช้ข้อมูลออเดอร์ที่ได้กลับมาแทนการโหลดใหม่ทั้งหมด
+async function updateOrderItemsStatus(orderItemIds, status) {
+    const response = await fetch('/api/order-items/status', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ order_item_ids: orderItemIds, status: status })
+    });
+    const result = await response.json();
+    if (!result.success) {
+        throw new Error(result.error);
+    }
+    const visible = new Set(result.data.orders.map(order => order.order_id));
+    result.data.orders.forEach(upsertOrder);
+    removeOrders(order => result.data.order_ids.includes(order.order_id) && !visible.has(order.order_id));
+    return result.data;
+}
+
 async function completeAllTableOrders(tableId) {
     // หารายการ order items ที่ยังไม่เสร็จสิ้นในโต๊ะนี้
     const acceptedItems = [];
@@ -4167,15 +4150,8 @@ async function completeAllTableOrders(tableId) {
     }
     
     try {
-        for (const item of acceptedItems) {
-            await fetch(`http://localhost:5000/api/order-items/${item.order_item_id}/complete`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' }
-            });
-        }
-        
+        await updateOrderItemsStatus(acceptedItems.map(item => item.order_item_id), 'completed');
         showAlert('ทำเครื่องหมายรายการทั้งหมดเป็นเสร็จสิ้นแล้ว', 'success');
-        loadOrders();
     } catch (error) {
         console.error('Error completing all table orders:', error);
         showAlert('เกิดข้อผิดพลาดในการทำเครื่องหมายรายการ', 'danger');
@@ -4720,9 +4696,32 @@ function setupNotificationSound() {
     }
 }
 
+// cursor ของ change feed (/api/changes) ที่ใช้ตอน polling
+let changeCursor = null;
+
+// ตรวจว่ามีออเดอร์/รายการอาหารเปลี่ยนหลัง cursor ล่าสุดหรือไม่ (คิวรีเบาๆ แทนการโหลดออเดอร์ทั้งหมด)
+async function hasOrderChanges() {
+    const url = changeCursor === null ? '/api/changes' : `/api/changes?since=${changeCursor}`;
+    const response = await fetch(url);
+    const data = await response.json();
+    if (!data.success) {
+        return true;
+    }
+    const first = changeCursor === null;
+    changeCursor = data.data.cursor;
+    const changes = data.data.changes;
+    const deleted = data.data.deleted;
+    return first || data.data.resync || data.data.has_more ||
+        Boolean(changes.orders || changes.order_items || deleted.orders || deleted.order_items);
+}
+
 // Check for new orders
 async function checkForNewOrders() {
     try {
+        if (!(await hasOrderChanges())) {
+            return;
+        }
+        
         // ตรวจสอบออเดอร์ใหม่
         const response = await fetch('/api/orders');
         const data = await response.json();
@@ -5455,7 +5454,8 @@ async function exportData() {
 function refreshData() {
     if (currentSection === 'tables') {
         refreshTables();
-    } else if (currentSection === 'orders') {
+    } else if (currentSection === 'orders' && !isEventStreamConnected()) {
+        // ถ้าเชื่อมต่อ event stream อยู่ รายการออเดอร์จะอัปเดตจาก event แล้ว
         refreshOrders();
     } else if (currentSection === 'dashboard') {
         // ใช้ฟังก์ชันรีเฟรชที่ไม่รีเซ็ตสถานะของกราฟ
@@ -6495,7 +6495,8 @@ const thaiTime = new Date(now.toLocaleString('en-US', { timeZone: 'Asia/Bangkok'
 // ฟังก์ชันสำหรับตรวจสอบการแจ้งเตือนใหม่จากฐานข้อมูล
 async function checkForNewNotifications() {
     try {
-        const response = await fetch('/api/notifications');
+        // ดึงเฉพาะการแจ้งเตือนที่ใหม่กว่ารายการล่าสุดที่แสดงแล้ว
+        const response = await fetch(`/api/notifications?after_id=${lastNotificationId}`);
         const data = await response.json();
         
         if (data.success && data.data.length > 0) {
@@ -6508,25 +6509,35 @@ async function checkForNewNotifications() {
             }
             
             // แสดงการแจ้งเตือนใหม่
-            data.data.forEach(notification => {
-                // ตรวจสอบว่าการแจ้งเตือนนี้ยังไม่ได้แสดงอยู่และยังไม่ได้ประมวลผล
-                const existingNotification = document.getElementById(`notification-${notification.notification_id}`);
-                if (!existingNotification && !processedNotifications.has(notification.notification_id)) {
-                    processedNotifications.add(notification.notification_id);
-                    addNotificationToList(notification);
-                    
-                    // เล่นเสียงแจ้งเตือน
-                    if (notificationSound) {
-                        notificationSound.play().catch(e => console.log('Could not play notification sound'));
-                    }
-                }
-            });
+            data.data.forEach(handleIncomingNotification);
         }
     } catch (error) {
         console.error('Error checking for new notifications:', error);
     }
 }
 
+// แสดงการแจ้งเตือนหนึ่งรายการ (จาก polling หรือ event stream) ถ้ายังไม่เคยแสดง
+function handleIncomingNotification(notification) {
+    // ตรวจสอบว่าการแจ้งเตือนนี้ยังไม่ได้แสดงอยู่และยังไม่ได้ประมวลผล
+    const existingNotification = document.getElementById(`notification-${notification.notification_id}`);
+    lastNotificationId = Math.max(lastNotificationId, notification.notification_id || 0);
+    if (existingNotification || processedNotifications.has(notification.notification_id)) {
+        return;
+    }
+    processedNotifications.add(notification.notification_id);
+    
+    const noNotifications = document.getElementById('no-notifications');
+    if (noNotifications) {
+        noNotifications.style.display = 'none';
+    }
+    addNotificationToList(notification);
+    
+    // เล่นเสียงแจ้งเตือน
+    if (notificationSound) {
+        notificationSound.play().catch(e => console.log('Could not play notification sound'));
+    }
+}
+
 // ฟังก์ชันสำหรับเพิ่มการแจ้งเตือนลงในรายการ
 function addNotificationToList(notification) {
     const notificationsList = document.getElementById('notifications-list');
@@ -6666,6 +6677,31 @@ async function markNotificationRead(notificationId) {
     }
 }
 
+// ทำเครื่องหมายการแจ้งเตือนทั้งหมดที่แสดงอยู่ว่าอ่านแล้วในคำขอเดียว
+async function markAllNotificationsRead() {
+    try {
+        const response = await fetch('/api/notifications/read', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ up_to_id: lastNotificationId })
+        });
+        
+        const data = await response.json();
+        
+        if (data.success) {
+            const notificationsList = document.getElementById('notifications-list');
+            notificationsList.querySelectorAll('.notification-item').forEach(item => item.remove());
+            const noNotifications = document.getElementById('no-notifications');
+            if (noNotifications) {
+                noNotifications.style.display = 'block';
+            }
+        }
+    } catch (error) {
+        console.error('Error marking all notifications as read:', error);
+        showAlert('ไม่สามารถทำเครื่องหมายการแจ้งเตือนได้', 'danger');
+    }
+}
+
 // เพิ่มฟังก์ชันสำหรับตรวจสอบการแจ้งเตือนใหม่ (polling)
 let notificationPollingInterval;
 
@@ -6685,6 +6721,8 @@ function stopNotificationPolling() {
 
 // เก็บ ID ของการแจ้งเตือนที่ประมวลผลแล้ว
 let processedNotifications = new Set();
+// notification_id ล่าสุดที่ได้รับแล้ว (ใช้กับ /api/notifications?after_id=)
+let lastNotificationId = 0;
 
 // ปิด event listener สำหรับการแจ้งเตือนจาก localStorage เพื่อป้องกันการแจ้งเตือนซ้ำซ้อน
 // การแจ้งเตือนจะถูกจัดการผ่าน startNotificationPolling() เท่านั้น
@@ -6707,9 +6745,127 @@ function checkLocalStorageNotifications() {
 // ลบการ polling localStorage ออกเพื่อป้องกันการแสดงซ้ำ
 // การแจ้งเตือนจะถูกจัดการผ่าน startNotificationPolling() และ window.addEventListener เท่านั้น
 
-// หยุด polling เมื่อออกจากหน้า
+// === Event stream (Server-Sent Events) ===
+let eventSource = null;
+let orderPollingInterval = null;
+
+function startEventStream() {
+    if (!window.EventSource) {
+        startPollingFallback();
+        return;
+    }
+    
+    eventSource = new EventSource('/api/events');
+    
+    eventSource.addEventListener('hello', () => {
+        // เชื่อมต่อสำเร็จ (หรือเชื่อมต่อใหม่) หยุด polling ถ้ากำลังทำงานอยู่
+        stopPollingFallback();
+    });
+    eventSource.addEventListener('order_created', event => {
+        const data = JSON.parse(event.data);
+        if (data.order) {
+            upsertOrder(data.order);
+            showOrderNotification(1, [data.order]);
+            if (notificationSound) {
+                notificationSound.play().catch(e => console.log('Could not play sound'));
+            }
+        }
+    });
+    eventSource.addEventListener('order_updated', event => {
+        const data = JSON.parse(event.data);
+        if (data.order) {
+            upsertOrder(data.order);
+        } else {
+            removeOrders(order => order.order_id === data.order_id);
+        }
+    });
+    eventSource.addEventListener('notification', event => {
+        handleIncomingNotification(JSON.parse(event.data));
+    });
+    eventSource.addEventListener('table_updated', event => {
+        const data = JSON.parse(event.data);
+        // /api/orders แสดงเฉพาะออเดอร์ของเซสชันปัจจุบันของโต๊ะ (เคลียร์ / ปิดเซสชัน / ลบโต๊ะ จะซ่อนออเดอร์เดิม)
+        removeOrders(order => order.table_id === data.table_id && order.session_id !== data.session_id);
+        if (currentSection === 'tables') {
+            refreshTables();
+        }
+    });
+    eventSource.addEventListener('table_paid', event => {
+        const data = JSON.parse(event.data);
+        removeOrders(order => order.table_id === data.table_id && order.session_id === data.session_id);
+        if (currentSection === 'tables') {
+            refreshTables();
+        }
+    });
+    eventSource.addEventListener('resync', () => {
+        // พลาด event บางส่วน โหลดข้อมูลทั้งหมดใหม่ครั้งเดียว
+        loadOrders();
+        checkForNewNotifications();
+    });
+    eventSource.onerror = () => {
+        // EventSource จะเชื่อมต่อใหม่เอง (พร้อม Last-Event-ID) ถ้ายังเชื่อมต่อไม่ได้ภายใน 10 วินาทีจึงใช้ polling แทน
+        setTimeout(() => {
+            if (!isEventStreamConnected()) {
+                startPollingFallback();
+            }
+        }, 10000);
+    };
+}
+
+function startPollingFallback() {
+    if (orderPollingInterval) {
+        return;
+    }
+    orderPollingInterval = setInterval(checkForNewOrders, 5000); // Check every 5 seconds
+    startNotificationPolling();
+}
+
+function stopPollingFallback() {
+    if (orderPollingInterval) {
+        clearInterval(orderPollingInterval);
+        orderPollingInterval = null;
+        // โหลดข้อมูลล่าสุดหลังเชื่อมต่อใหม่
+        loadOrders();
+        checkForNewNotifications();
+    }
+    stopNotificationPolling();
+}
+
+function isEventStreamConnected() {
+    return eventSource !== null && eventSource.readyState === EventSource.OPEN;
+}
+
+// เพิ่มหรือแทนที่ออเดอร์ในรายการ (เรียงออเดอร์ล่าสุดไว้บนสุดเหมือน /api/orders)
+function upsertOrder(order) {
+    const index = orders.findIndex(existing => existing.order_id === order.order_id);
+    if (index >= 0) {
+        orders[index] = order;
+    } else {
+        orders.unshift(order);
+    }
+    lastOrderCount = orders.length;
+    if (currentSection === 'orders') {
+        renderOrders();
+    }
+}
+
+function removeOrders(predicate) {
+    const remaining = orders.filter(order => !predicate(order));
+    if (remaining.length !== orders.length) {
+        orders = remaining;
+        lastOrderCount = orders.length;
+        if (currentSection === 'orders') {
+            renderOrders();
+        }
+    }
+}
+
+// หยุด polling และ event stream เมื่อออกจากหน้า
 window.addEventListener('beforeunload', function() {
     stopNotificationPolling();
+    if (eventSource) {
+        eventSource.close();
+    }
 });
 
 // ฟังก์ชันแสดงประวัติคำสั่งซื้อ
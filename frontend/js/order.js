@@ -1435,29 +1435,37 @@ function checkSessionStatus(tableId, sessionId) {
     fetch(`http://localhost:5000/api/tables/${tableId}/session/check?session_id=${sessionId}`)
         .then(response => response.json())
         .then(data => {
-            if (data.success && !data.session_valid) {
-                // เซสชั่นไม่ถูกต้อง เปลี่ยนเส้นทางไปยังหน้า error
-                let errorMessage = 'เซสชั่นของคุณได้ถูกปิดแล้ว';
-                let errorTitle = 'เซสชั่นหมดอายุ';
-                
-                if (data.table_status === 'checkout') {
-                    errorMessage = 'QR Code นี้ไม่สามารถใช้งานได้แล้ว เนื่องจากโต๊ะได้ทำการเช็คบิลแล้ว กรุณาติดต่อพนักงานเพื่อขอ QR Code ใหม่';
-                    errorTitle = 'QR Code หมดอายุ';
-                } else {
-                    errorMessage = 'เซสชั่นของคุณได้ถูกปิดโดยร้าน กรุณาติดต่อพนักงานเพื่อขอ QR Code ใหม่';
-                }
-                
-                // เปลี่ยนเส้นทางไปยังหน้า error
-                window.location.href = `/error?title=${encodeURIComponent(errorTitle)}&message=${encodeURIComponent(errorMessage)}`;
-            } else if (data.success && data.table_status === 'waiting_payment') {
-                // โต๊ะอยู่ในสถานะรอชำระเงิน แสดงหน้ารอเช็คบิล
-                showWaitingForCheckoutState();
+            if (data.success) {
+                handleSessionState(data);
             }
         })
         .catch(error => {
             console.error('Error checking session status:', error);
         });
 }
+
+// จัดการสถานะเซสชั่น ({session_valid, table_status}) จากการตรวจสอบหรือจาก event stream
+function handleSessionState(data) {
+    if (!data.session_valid) {
+        // เซสชั่นไม่ถูกต้อง เปลี่ยนเส้นทางไปยังหน้า error
+        let errorMessage = 'เซสชั่นของคุณได้ถูกปิดแล้ว';
+        let errorTitle = 'เซสชั่นหมดอายุ';
+        
+        if (data.table_status === 'checkout') {
+            errorMessage = 'QR Code นี้ไม่สามารถใช้งานได้แล้ว เนื่องจากโต๊ะได้ทำการเช็คบิลแล้ว กรุณาติดต่อพนักงานเพื่อขอ QR Code ใหม่';
+            errorTitle = 'QR Code หมดอายุ';
+        } else {
+            errorMessage = 'เซสชั่นของคุณได้ถูกปิดโดยร้าน กรุณาติดต่อพนักงานเพื่อขอ QR Code ใหม่';
+        }
+        
+        // เปลี่ยนเส้นทางไปยังหน้า error
+        window.location.href = `/error?title=${encodeURIComponent(errorTitle)}&message=${encodeURIComponent(errorMessage)}`;
+    } else if (data.table_status === 'waiting_payment') {
+        // โต๊ะอยู่ในสถานะรอชำระเงิน แสดงหน้ารอเช็คบิล
+        showWaitingForCheckoutState();
+    }
+}
+
 // Edit menu function
 function editMenu() {
     if (!currentTable || !currentTable.id) {
@@ -1955,17 +1963,39 @@ function getItemStatusBadge(status) {
     }
 }
 
-// ตัวแปรสำหรับเก็บ interval ของการตรวจสอบเซสชั่น
+// ตัวแปรสำหรับเก็บ interval ของการตรวจสอบเซสชั่น (ใช้เมื่อเชื่อมต่อ event stream ไม่ได้)
 let sessionCheckInterval = null;
+// event stream ของสถานะเซสชั่นโต๊ะ
+let sessionEventSource = null;
 
-// เริ่มการตรวจสอบสถานะเซสชั่นเป็นระยะ ๆ
+// เริ่มติดตามสถานะเซสชั่น: รับการแจ้งเตือนจากเซิร์ฟเวอร์ (SSE) ถ้าใช้ไม่ได้จะตรวจสอบเป็นระยะ ๆ
 function startSessionMonitoring() {
     const tableId = getQueryParam('table');
     const sessionId = getQueryParam('session');
     
     if (!tableId || !sessionId) return;
     
-    // ตรวจสอบทุก 5 วินาที
+    if (!window.EventSource) {
+        startSessionPolling(tableId, sessionId);
+        return;
+    }
+    
+    sessionEventSource = new EventSource(`/api/tables/${tableId}/session/events?session_id=${encodeURIComponent(sessionId)}`);
+    sessionEventSource.addEventListener('session', event => {
+        handleSessionState(JSON.parse(event.data));
+    });
+    sessionEventSource.onerror = () => {
+        // เบราว์เซอร์จะเชื่อมต่อใหม่เอง ยกเว้นเมื่อเซิร์ฟเวอร์ปฏิเสธ (CLOSED) ให้กลับไปตรวจสอบเป็นระยะ
+        if (sessionEventSource && sessionEventSource.readyState === EventSource.CLOSED) {
+            sessionEventSource = null;
+            startSessionPolling(tableId, sessionId);
+        }
+    };
+}
+
+// ตรวจสอบสถานะเซสชั่นทุก 5 วินาที
+function startSessionPolling(tableId, sessionId) {
+    if (sessionCheckInterval) return;
     sessionCheckInterval = setInterval(() => {
         checkSessionStatus(tableId, sessionId);
     }, 5000);
@@ -1973,6 +2003,10 @@ function startSessionMonitoring() {
 
 // หยุดการตรวจสอบสถานะเซสชั่น
 function stopSessionMonitoring() {
+    if (sessionEventSource) {
+        sessionEventSource.close();
+        sessionEventSource = null;
+    }
     if (sessionCheckInterval) {
         clearInterval(sessionCheckInterval);
         sessionCheckInterval = null;